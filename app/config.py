@@ -39,6 +39,17 @@ class Settings(BaseSettings):
         description="URL базы данных",
     )
 
+    # Пул соединений (Postgres; для SQLite не используется)
+    DB_POOL_SIZE: int = Field(default=10, description="Постоянных соединений в пуле")
+    DB_MAX_OVERFLOW: int = Field(default=10, description="Дополнительных соединений сверх пула при пиках")
+    DB_POOL_TIMEOUT: float = Field(default=10.0, description="Ожидание свободного соединения, сек")
+    DB_POOL_RECYCLE: int = Field(default=1800, description="Пересоздавать соединение старше N сек")
+
+    # SQLite: журнал и режим синхронизации (PRAGMA на каждое соединение)
+    SQLITE_JOURNAL_MODE: str = Field(default="WAL", description="PRAGMA journal_mode")
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL", description="PRAGMA synchronous")
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=5000, description="PRAGMA busy_timeout, мс")
+
     # Timezone
     TZ: str = Field(default="Europe/Moscow", description="Часовой пояс")
 
@@ -1,23 +1,64 @@
 """Настройка базы данных."""
 
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 from .config import settings
 
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """Размер пула для серверных БД (у SQLite пул по умолчанию, очередь — на блокировке файла)."""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_pragmas(dbapi_connection, _record) -> None:
+    """WAL: читатели не ждут писателя; synchronous=NORMAL — fsync на checkpoint, а не на каждый commit."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def _async_url(url: str) -> str:
+    # Только URL без драйвера: "sqlite+aiosqlite://" тоже содержит "sqlite://"
+    for plain, driver in (("sqlite://", "sqlite+aiosqlite://"), ("postgresql://", "postgresql+psycopg://")):
+        if url.startswith(plain):
+            return driver + url[len(plain):]
+    return url
+
+
+SYNC_DATABASE_URL = settings.DATABASE_URL.replace("+aiosqlite", "")
+ASYNC_DATABASE_URL = _async_url(settings.DATABASE_URL)
+
 # Синхронный движок для Alembic и синхронных операций
-engine = create_engine(settings.DATABASE_URL, future=True)
+engine = create_engine(SYNC_DATABASE_URL, future=True, **_engine_options(SYNC_DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 # Асинхронный движок для основного приложения
 async_engine = create_async_engine(
-    settings.DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://").replace("postgresql://", "postgresql+psycopg://"),
+    ASYNC_DATABASE_URL,
     echo=settings.DEBUG,
     future=True,
+    **_engine_options(ASYNC_DATABASE_URL),
 )
 
+if SYNC_DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
 # Создание фабрики асинхронных сессий
 async_session = sessionmaker(
     async_engine,
@@ -8,6 +8,14 @@ from loguru import logger
 
 from app.config import get_settings
 from app.db import init_db
+from app.services.bitrix_changes import shutdown_change_feed, startup_change_feed
+from app.services.bitrix_events import bitrix_events
+from app.services.bitrix_mirror import shutdown_bitrix_mirror, startup_bitrix_mirror
+from app.services.bitrix_metrics import render_prometheus
+from app.services.bitrix_shift_index import shutdown_shift_index, startup_shift_index
+from app.services.http_client import shutdown_http_client, startup_http_client
+from app.services.lpa_convert import shutdown_lpa_converter, startup_lpa_converter
+from app.services.lpa_render_pool import shutdown_lpa_renderer
 from app.services.scheduler import scheduler_service
 from app.telegram.bot import gpo_bot, dp
 from app.handlers.menu import router as menu_router
@@ -27,6 +35,24 @@ async def lifespan():
     await init_db()
     logger.info("Database initialized")
     
+    # Общий пул HTTP-соединений к Bitrix24
+    await startup_http_client()
+    logger.info("HTTP client pool started")
+    
+    # Лента изменений Bitrix (опрос updatedTime → шина изменений)
+    await startup_change_feed()
+    logger.info("Bitrix change feed started")
+    
+    # Индекс смен (объект, дата) — строится в фоне, дальше живёт по шине изменений
+    await startup_shift_index()
+    logger.info("Shift index build started")
+    
+    # Зеркало смарт-процессов в БД (BITRIX_MIRROR=1): загрузка в фоне, дальше по шине изменений
+    await startup_bitrix_mirror()
+    
+    # Пул LibreOffice для ЛПА (DOCX → PDF без холодного старта soffice)
+    await startup_lpa_converter()
+    
     # Запуск планировщика
     await scheduler_service.start()
     logger.info("Scheduler started")
@@ -39,6 +65,16 @@ async def lifespan():
     
     await gpo_bot.stop()
     logger.info("Bot stopped")
+    
+    await shutdown_lpa_renderer()
+    await shutdown_lpa_converter()
+    await shutdown_bitrix_mirror()
+    await shutdown_shift_index()
+    await shutdown_change_feed()
+    logger.info("Bitrix change feed stopped")
+    
+    await shutdown_http_client()
+    logger.info("HTTP client pool closed")
 
 
 async def create_app() -> web.Application:
@@ -66,6 +102,9 @@ async def create_app() -> web.Application:
     # Добавляем маршруты для PDF
     app.router.add_get("/health", health_check)
     app.router.add_get("/", root_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    # Исходящие события Bitrix24 (ONCRMDYNAMICITEM*) → шина изменений
+    app.router.add_post("/bitrix/events", bitrix_events.handle)
     
     return app
 
@@ -79,6 +118,14 @@ async def health_check(request: web.Request) -> web.Response:
     })
 
 
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Метрики вызовов Bitrix24 в текстовом формате Prometheus."""
+    return web.Response(
+        body=render_prometheus().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
 async def root_handler(request: web.Request) -> web.Response:
     """Обработчик корневого маршрута."""
     return web.json_response({
@@ -1,6 +1,6 @@
 """Модели базы данных."""
 
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from enum import Enum
 from typing import Optional
@@ -8,6 +8,7 @@ from typing import Optional
 from sqlalchemy import (
     BigInteger,
     Boolean,
+    Date,
     DateTime,
     Enum as SQLEnum,
     ForeignKey,
@@ -139,7 +140,7 @@ class Shift(Base):
     eff_user: Mapped[Optional[Decimal]] = mapped_column(Numeric(5, 2), nullable=True)
     eff_final: Mapped[Optional[Decimal]] = mapped_column(Numeric(5, 2), nullable=True)
     status: Mapped[ShiftStatus] = mapped_column(SQLEnum(ShiftStatus), default=ShiftStatus.OPEN)
-    bitrix_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # ID смены в Bitrix24
+    bitrix_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)  # ID смены в Bitrix24
     created_by: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
@@ -149,9 +150,13 @@ class Shift(Base):
     resources: Mapped[list["Resource"]] = relationship("Resource", back_populates="shift")
     timesheets: Mapped[list["Timesheet"]] = relationship("Timesheet", back_populates="shift")
 
-    # Индексы
+    # Индексы (миграции: migrations/versions)
     __table_args__ = (
         Index("ix_shifts_object_date_type", "object_id", "date", "type"),
+        # Последняя открытая/закрытая смена объекта: object_id + status, сортировка по id
+        Index("ix_shifts_object_status_id", "object_id", "status", "id"),
+        # Планировщик: смены за день в нужном статусе
+        Index("ix_shifts_date_status", "date", "status"),
     )
 
 
@@ -161,7 +166,7 @@ class Resource(Base):
     __tablename__ = "resources"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    shift_id: Mapped[int] = mapped_column(Integer, ForeignKey("shifts.id"), nullable=False)
+    shift_id: Mapped[int] = mapped_column(Integer, ForeignKey("shifts.id"), nullable=False, index=True)
     kind: Mapped[ResourceKind] = mapped_column(SQLEnum(ResourceKind), nullable=False)
     name: Mapped[str] = mapped_column(String(500), nullable=False)
     qty: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
@@ -180,7 +185,7 @@ class Timesheet(Base):
     __tablename__ = "timesheets"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    shift_id: Mapped[int] = mapped_column(Integer, ForeignKey("shifts.id"), nullable=False)
+    shift_id: Mapped[int] = mapped_column(Integer, ForeignKey("shifts.id"), nullable=False, index=True)
     crew: Mapped[str] = mapped_column(String(500), nullable=False)
     hours: Mapped[Decimal] = mapped_column(Numeric(5, 2), nullable=False)
     rate: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 2), nullable=True)
@@ -197,3 +202,77 @@ class Param(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     key: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
     value_json: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+# --- Зеркало смарт-процессов Bitrix24 (app.services.bitrix_mirror) ---
+# Строки ключуются bitrix_id; data — элемент crm.item.get целиком (читатели
+# получают тот же словарь, что и из портала), остальные колонки —
+# денормализация для выборок. synced_at — когда строка сверена с порталом.
+
+
+class MirrorObject(Base):
+    """Объект из Bitrix24 (СПА 1046)."""
+
+    __tablename__ = "bx_objects"
+
+    bitrix_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    title: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    updated_time: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    synced_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class MirrorShift(Base):
+    """Смена из Bitrix24 (СПА 1050): план/факт JSON, итоги и объект раскрыты в колонки."""
+
+    __tablename__ = "bx_shifts"
+
+    bitrix_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    object_bitrix_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    shift_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    shift_type: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    status: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    plan_json: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    fact_json: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    plan_total: Mapped[Optional[Decimal]] = mapped_column(Numeric(14, 2), nullable=True)
+    fact_total: Mapped[Optional[Decimal]] = mapped_column(Numeric(14, 2), nullable=True)
+    eff_final: Mapped[Optional[Decimal]] = mapped_column(Numeric(7, 2), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    updated_time: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    synced_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_bx_shifts_object_date", "object_bitrix_id", "shift_date"),
+        Index("ix_bx_shifts_date", "shift_date"),
+    )
+
+
+class MirrorResource(Base):
+    """Ресурс смены из Bitrix24 (СПА 1056)."""
+
+    __tablename__ = "bx_resources"
+
+    bitrix_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    shift_bitrix_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    resource_type: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    updated_time: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    synced_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class MirrorTimesheet(Base):
+    """Строка табеля смены из Bitrix24 (СПА 1060)."""
+
+    __tablename__ = "bx_timesheets"
+
+    bitrix_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    shift_bitrix_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    worker: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    hours: Mapped[Optional[Decimal]] = mapped_column(Numeric(7, 2), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    updated_time: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    synced_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, default=False)
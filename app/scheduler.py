@@ -9,6 +9,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.services.w6_alerts import list_subscribers, build_daily_report
 from app.services.authz import list_by_role
 from app.services.insights import collect_kpis, generate_insights
+from app.services.bitrix_metrics import run_as_caller
+from app.services.bitrix_ratelimit import Lane, run_in_lane
 
 log = logging.getLogger("gpo.scheduler")
 
@@ -19,6 +21,8 @@ def setup_scheduler(bot_send_func):
     """
     sched = AsyncIOScheduler()
 
+    @run_in_lane(Lane.REPORT)
+    @run_as_caller("w6")
     async def job_morning(send_time: str):
         """Утренняя сводка за вчера."""
         yesterday = dt.date.today() - timedelta(days=1)
@@ -71,6 +75,8 @@ def setup_scheduler(bot_send_func):
                 except Exception as e:
                     log.error(f"Error sending morning report to subscriber {chat_id}: {e}")
 
+    @run_in_lane(Lane.REPORT)
+    @run_as_caller("w6")
     async def job_evening(send_time: str):
         """Вечерняя сводка за сегодня."""
         today = dt.date.today()
@@ -121,6 +127,8 @@ def setup_scheduler(bot_send_func):
                 except Exception as e:
                     log.error(f"Error sending evening report to subscriber {chat_id}: {e}")
 
+    @run_in_lane(Lane.REPORT)
+    @run_as_caller("insights")
     async def job_insights(send_time: str):
         """Ежедневные AI-инсайты для владельца."""
         try:
@@ -1,5 +1,13 @@
-import os, asyncio, logging, httpx
+import os, asyncio, logging, time
+import httpx
 from app.config import get_settings
+from app.services.bitrix_breaker import bitrix_breakers, breaker_enabled
+from app.services.bitrix_cache import bitrix_cache
+from app.services.bitrix_changes import publish_write
+from app.services.bitrix_metrics import bitrix_metrics
+from app.services.bitrix_ratelimit import bitrix_limiter
+from app.services.bitrix_timeouts import attempt_timeout, can_wait
+from app.services.http_client import BitrixTimeout, BitrixUnavailable, acquire_slot, http_request
 
 log = logging.getLogger("bx")
 settings = get_settings()
@@ -8,29 +16,106 @@ TOK = settings.BITRIX_TOKEN
 
 log.debug("Bitrix config: BASE=%s, TOK=%s", BASE, TOK)
 
-async def _try(http_call, url, **kw):
-    for i in range(5):
-        try:
-            r = await http_call(url, **kw)
-            r.raise_for_status()
-            return r.json()
-        except Exception:
-            if i == 4:
+async def _try(method_http, url, **kw):
+    # Метод для метрик: последний сегмент URL без ".json"
+    method = url.rsplit("/", 1)[-1].removesuffix(".json")
+    breaker = bitrix_breakers.get(method) if breaker_enabled() else None
+    started = time.monotonic()
+    queue_wait = 0.0
+    bytes_out = bytes_in = 0
+    outcome = "exception"
+    i = 0
+    try:
+        for i in range(5):
+            if breaker is not None and not breaker.allow():
+                outcome = "circuit_open"
+                raise BitrixUnavailable(method, breaker.retry_after())
+            outcome = "exception"
+            try:
+                try:
+                    queue_wait += await acquire_slot(method)
+                except BaseException:
+                    # Дедлайн или отмена в очереди лимитера — проба не состоялась
+                    if breaker is not None:
+                        breaker.release_probe()
+                    raise
+                timeout, capped = attempt_timeout(method)
+                if timeout <= 0:
+                    if breaker is not None:
+                        breaker.release_probe()
+                    outcome = "deadline"
+                    raise BitrixTimeout(method)
+                sent = time.monotonic()
+                try:
+                    r = await http_request(method_http, url, timeout=timeout, **kw)
+                except httpx.TimeoutException:
+                    if capped:
+                        if breaker is not None:
+                            breaker.release_probe()
+                        outcome = "deadline"
+                        raise BitrixTimeout(method) from None
+                    if breaker is not None:
+                        breaker.record_failure()
+                    raise
+                except httpx.TransportError:
+                    if breaker is not None:
+                        breaker.record_failure()
+                    raise
+                except BaseException:
+                    if breaker is not None:
+                        breaker.release_probe()
+                    raise
+                bytes_out += len(r.request.content)
+                bytes_in += len(r.content)
+                outcome = f"http_{r.status_code}"
+                if breaker is not None:
+                    if r.status_code >= 500:
+                        breaker.record_failure()
+                    elif r.status_code == 429:
+                        breaker.release_probe()
+                    else:
+                        breaker.record_success()
+                r.raise_for_status()
+                bitrix_limiter.on_success()
+                bitrix_metrics.observe_attempt(method, time.monotonic() - sent)
+                data = r.json()
+                outcome = "ok"
+                return data
+            except BitrixTimeout:
                 raise
-            await asyncio.sleep(0.7 * (2**i))
+            except Exception as e:
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (429, 503):
+                    bitrix_limiter.on_throttled()
+                if i == 4 or not can_wait(0.7 * (2**i)):
+                    raise
+                await asyncio.sleep(0.7 * (2**i))
+    finally:
+        bitrix_metrics.observe(
+            method,
+            status=outcome,
+            retries=i,
+            bytes_out=bytes_out,
+            bytes_in=bytes_in,
+            queue_wait=queue_wait,
+            latency=time.monotonic() - started,
+        )
 
 async def bx_get(method: str, **params):
     if not BASE or not TOK:
         raise ValueError("BITRIX_BASE and BITRIX_TOKEN must be configured")
-    async with httpx.AsyncClient(timeout=60) as x:
-        log.debug("GET %s %s", method, params)
-        url = f"{BASE.rstrip('/')}/rest/{TOK}/{method}.json"
-        return await _try(x.get, url, params=params)
+    log.debug("GET %s %s", method, params)
+    url = f"{BASE.rstrip('/')}/rest/{TOK}/{method}.json"
+    return await _try("GET", url, params=params)
 
 async def bx_post(method: str, payload: dict):
     if not BASE or not TOK:
         raise ValueError("BITRIX_BASE and BITRIX_TOKEN must be configured")
-    async with httpx.AsyncClient(timeout=60) as x:
-        log.debug("POST %s keys=%s", method, list(payload.keys()))
-        url = f"{BASE.rstrip('/')}/rest/{TOK}/{method}.json"
-        return await _try(x.post, url, json=payload)
+    log.debug("POST %s keys=%s", method, list(payload.keys()))
+    url = f"{BASE.rstrip('/')}/rest/{TOK}/{method}.json"
+    try:
+        result = await _try("POST", url, json=payload)
+    finally:
+        # Запись через BASE/TOKEN тоже сбрасывает кэш чтений bx
+        bitrix_cache.invalidate_write(method, payload)
+    await publish_write(method, payload, result)
+    return result
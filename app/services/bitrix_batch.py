@@ -0,0 +1,204 @@
+"""Склейка параллельных вызовов Bitrix24 в REST-метод batch.
+
+Чтения, выпущенные почти одновременно внутри явного ``async with bx_batch():``
+(или в пределах окна BITRIX_BATCH_WINDOW_MS, если оно задано), упаковываются
+в один запрос ``batch`` по ``BATCH_MAX_COMMANDS`` команд. Результат или
+ошибка каждой команды возвращается ровно тому вызову, который её поставил
+в очередь. Одиночные чтения вне bx_batch() по умолчанию не ждут окна.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+log = logging.getLogger("gpo.bitrix_batch")
+
+# Лимит Bitrix24 на количество команд в одном batch
+BATCH_MAX_COMMANDS = 50
+
+# Только идемпотентные чтения: запись внутри batch меняет семантику ошибок и ретраев
+BATCHABLE_METHODS = frozenset({
+    "crm.item.get",
+    "crm.item.list",
+    "crm.item.fields",
+    "crm.item.userfield.list",
+    "crm.type.list",
+    "disk.file.get",
+})
+
+# Ошибки отдельных команд, которые стоит повторить обычным вызовом
+RETRYABLE_COMMAND_ERRORS = frozenset({"QUERY_LIMIT_EXCEEDED", "OPERATION_TIME_LIMIT"})
+
+# Окно (в секундах) внутри явного bx_batch(); None — склейка вне scope
+_batch_window: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "bitrix_batch_window", default=None
+)
+
+
+def _default_window() -> float:
+    """Окно автоматической склейки из BITRIX_BATCH_WINDOW_MS (0 — выключено, по умолчанию)."""
+    try:
+        return max(0.0, float(os.getenv("BITRIX_BATCH_WINDOW_MS", "0"))) / 1000.0
+    except ValueError:
+        return 0.0
+
+
+def current_window() -> Optional[float]:
+    """Окно склейки для текущего контекста или None, если склейка выключена."""
+    scoped = _batch_window.get()
+    if scoped is not None:
+        return scoped
+    window = _default_window()
+    return window if window > 0 else None
+
+
+@asynccontextmanager
+async def bx_batch(window_ms: float = 5.0):
+    """Явно включить склейку для всех вызовов bx внутри блока.
+
+    Пример::
+
+        async with bx_batch():
+            shift, resources = await asyncio.gather(
+                bx("crm.item.get", {...}),
+                bx("crm.item.list", {...}),
+            )
+    """
+    token = _batch_window.set(max(0.0, window_ms) / 1000.0)
+    try:
+        yield
+    finally:
+        _batch_window.reset(token)
+
+
+def encode_command(method: str, payload: Dict[str, Any]) -> str:
+    """Закодировать вызов в строку команды batch (формат PHP http_build_query)."""
+    pairs: List[Tuple[str, str]] = []
+
+    def walk(prefix: str, value: Any) -> None:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                walk(f"{prefix}[{k}]" if prefix else str(k), v)
+        elif isinstance(value, (list, tuple)):
+            for i, v in enumerate(value):
+                walk(f"{prefix}[{i}]", v)
+        elif value is None:
+            pairs.append((prefix, ""))
+        elif isinstance(value, bool):
+            pairs.append((prefix, "1" if value else "0"))
+        else:
+            pairs.append((prefix, str(value)))
+
+    walk("", payload or {})
+    query = "&".join(f"{quote(k, safe='[]')}={quote(v, safe='')}" for k, v in pairs)
+    return f"{method}?{query}" if query else method
+
+
+class _Pending:
+    __slots__ = ("method", "payload", "retries", "future")
+
+    def __init__(self, method: str, payload: Dict[str, Any], retries: int, future: asyncio.Future):
+        self.method = method
+        self.payload = payload
+        self.retries = retries
+        self.future = future
+
+
+class BatchCoalescer:
+    """Очередь вызовов, которая сбрасывается пачками в batch.
+
+    send(method, payload, retries=N) — обычный вызов Bitrix (с ретраями),
+    возвращающий data["result"]. Одиночная команда отправляется напрямую,
+    без batch, со своим retries; batch повторяется с наибольшим retries
+    среди склеенных вызовов — как если бы каждый шёл отдельно.
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Any]],
+        *,
+        max_commands: int = BATCH_MAX_COMMANDS,
+    ):
+        self._send = send
+        self._max = max(1, min(max_commands, BATCH_MAX_COMMANDS))
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {"calls": 0, "requests": 0, "batches": 0}
+
+    async def submit(self, method: str, payload: Dict[str, Any], window: float, retries: int = 3) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(method, payload, retries, future))
+        self.stats["calls"] += 1
+
+        if len(self._pending) >= self._max:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            chunk, self._pending = self._pending[: self._max], self._pending[self._max:]
+            asyncio.ensure_future(self._run(chunk))
+
+    async def _run(self, chunk: List[_Pending]) -> None:
+        self.stats["requests"] += 1
+        if len(chunk) == 1:
+            item = chunk[0]
+            try:
+                _resolve(item.future, result=await self._send(item.method, item.payload, retries=item.retries))
+            except BaseException as e:
+                _resolve(item.future, error=e)
+            return
+
+        self.stats["batches"] += 1
+        cmd = {f"c{i}": encode_command(p.method, p.payload) for i, p in enumerate(chunk)}
+        try:
+            data = await self._send("batch", {"halt": 0, "cmd": cmd}, retries=max(p.retries for p in chunk))
+        except BaseException as e:
+            for p in chunk:
+                _resolve(p.future, error=e)
+            return
+
+        results = (data or {}).get("result") or {}
+        errors = (data or {}).get("result_error") or {}
+        retry: List[_Pending] = []
+        for key, p in zip(cmd, chunk, strict=True):
+            if isinstance(errors, dict) and key in errors:
+                err = errors[key] or {}
+                code = err.get("error") if isinstance(err, dict) else str(err)
+                if code in RETRYABLE_COMMAND_ERRORS:
+                    retry.append(p)
+                    continue
+                desc = (err.get("error_description") if isinstance(err, dict) else None) or code
+                _resolve(p.future, error=_bitrix_error(f"{p.method}: {desc}"))
+            elif isinstance(results, dict) and key in results:
+                _resolve(p.future, result=results[key])
+            else:
+                _resolve(p.future, error=_bitrix_error(f"{p.method}: no result in batch response"))
+
+        if retry:
+            log.info("batch: %d commands hit limits, retrying individually", len(retry))
+            await asyncio.gather(*(self._run([p]) for p in retry))
+
+
+def _resolve(future: asyncio.Future, *, result: Any = None, error: Optional[BaseException] = None) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def _bitrix_error(message: str) -> Exception:
+    from app.services.http_client import BitrixError
+    return BitrixError(message)
@@ -0,0 +1,191 @@
+"""Circuit breaker по методам Bitrix24 REST.
+
+Когда портал деградирует (таймауты, 5xx), без предохранителя каждый вызов
+ждёт до 40–60 секунд и несколько раз повторяется, а хендлеры копятся в
+event loop. Breaker считает долю ошибок в скользящем окне последних
+вызовов метода; при превышении порога он «размыкается» и следующие вызовы
+сразу получают ошибку. Через ``open_seconds`` breaker переходит в
+half-open и пропускает ограниченное число пробных запросов: успех замыкает
+его, ошибка снова размыкает.
+
+Ответы 429 breaker не учитывает — это зона лимитера (bitrix_ratelimit),
+ошибки приложения Bitrix (NOT_FOUND и т.п.) считаются успешными ответами.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+from app.utils.env import env_float, env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Breaker одного метода.
+
+    Args:
+        name: Имя метода (метка в метриках)
+        window: Сколько последних вызовов учитывать
+        min_calls: Минимум вызовов в окне, прежде чем breaker может разомкнуться
+        error_rate: Доля ошибок, при которой breaker размыкается
+        open_seconds: Сколько держать breaker разомкнутым до пробы
+        half_open_probes: Сколько пробных запросов пропускать одновременно
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: int = 20,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        open_seconds: float = 15.0,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._results: Deque[bool] = deque(maxlen=max(window, self.min_calls))
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected_total = 0
+        self.transitions: Dict[Tuple[str, str], int] = {}
+
+    def _transition(self, new_state: str) -> None:
+        old = self.state
+        if old == new_state:
+            return
+        self.state = new_state
+        self.transitions[(old, new_state)] = self.transitions.get((old, new_state), 0) + 1
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+            log.warning("Bitrix breaker %s: %s -> open", self.name, old)
+        else:
+            log.info("Bitrix breaker %s: %s -> %s", self.name, old, new_state)
+        if new_state != HALF_OPEN:
+            self._probes = 0
+        if new_state == CLOSED:
+            self._results.clear()
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов (в half-open — занимает слот пробы)."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected_total += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected_total += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+                return
+            self._results.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            self._results.append(False)
+            calls = len(self._results)
+            if self.state == CLOSED and calls >= self.min_calls:
+                failures = calls - sum(self._results)
+                if failures / calls >= self.error_rate:
+                    self._transition(OPEN)
+
+    def release_probe(self) -> None:
+        """Пробный вызов завершился без вердикта (429, отмена) — вернуть слот."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+
+class BreakerRegistry:
+    """Breaker-ы по методам с общими настройками из .env."""
+
+    def __init__(self, **options):
+        self.options = options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, method: str) -> CircuitBreaker:
+        breaker = self._breakers.get(method)
+        if breaker is None:
+            breaker = self._breakers.setdefault(method, CircuitBreaker(method, **self.options))
+        return breaker
+
+    def reset(self) -> None:
+        self._breakers.clear()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {
+            name: {"state": b.state, "rejected_total": b.rejected_total, "retry_after": round(b.retry_after(), 3)}
+            for name, b in self._breakers.items()
+        }
+
+    def render(self) -> List[str]:
+        """Состояние и переходы breaker-ов в формате Prometheus."""
+        lines = [
+            "# HELP bitrix_breaker_state Circuit breaker state per method (0=closed, 1=half_open, 2=open).",
+            "# TYPE bitrix_breaker_state gauge",
+        ]
+        for name, b in sorted(self._breakers.items()):
+            lines.append(f'bitrix_breaker_state{{method="{name}"}} {_STATE_CODES[b.state]}')
+        lines += [
+            "# HELP bitrix_breaker_transitions_total Circuit breaker state transitions.",
+            "# TYPE bitrix_breaker_transitions_total counter",
+        ]
+        for name, b in sorted(self._breakers.items()):
+            for (old, new), n in sorted(b.transitions.items()):
+                lines.append(f'bitrix_breaker_transitions_total{{method="{name}",from="{old}",to="{new}"}} {n}')
+        lines += [
+            "# HELP bitrix_breaker_rejected_total Calls rejected by an open circuit breaker.",
+            "# TYPE bitrix_breaker_rejected_total counter",
+        ]
+        for name, b in sorted(self._breakers.items()):
+            lines.append(f'bitrix_breaker_rejected_total{{method="{name}"}} {b.rejected_total}')
+        return lines
+
+
+def breaker_enabled() -> bool:
+    return os.getenv("BITRIX_BREAKER", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+# Общие breaker-ы процесса
+bitrix_breakers = BreakerRegistry(
+    window=env_int("BITRIX_BREAKER_WINDOW", 20),
+    min_calls=env_int("BITRIX_BREAKER_MIN_CALLS", 10),
+    error_rate=env_float("BITRIX_BREAKER_ERROR_RATE", 0.5),
+    open_seconds=env_float("BITRIX_BREAKER_OPEN_SECONDS", 15.0),
+    half_open_probes=env_int("BITRIX_BREAKER_PROBES", 1),
+)
@@ -0,0 +1,161 @@
+"""Read-through кэш чтений crm.item.get / crm.item.list.
+
+Короткоживущий LRU на время пользовательской сессии (план → отчёт →
+ресурсы → ЛПА). Ключ — entityTypeId + id/фильтр + select (нормализованный
+payload). У каждого смарт-процесса свой TTL; запись через bx/bx_post
+(crm.item.add/update/delete) автоматически сбрасывает затронутые ключи.
+"""
+
+import copy
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.bitrix_ids import OBJECT_ETID, RESOURCE_ETID, SHIFT_ETID, TIMESHEET_ETID
+from app.services.bitrix_singleflight import request_key
+from app.utils.env import env_float, env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_cache")
+
+CACHED_METHODS = frozenset({"crm.item.get", "crm.item.list"})
+WRITE_METHODS = frozenset({"crm.item.add", "crm.item.update", "crm.item.delete"})
+
+# TTL по умолчанию (секунды): объекты меняются редко, смены и ресурсы — в течение дня
+DEFAULT_TTLS: Dict[int, float] = {
+    OBJECT_ETID: 300.0,
+    SHIFT_ETID: 30.0,
+    RESOURCE_ETID: 30.0,
+    TIMESHEET_ETID: 30.0,
+}
+
+
+def _entity_of(payload: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(payload.get("entityTypeId"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _item_of(payload: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(payload.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BitrixCache:
+    """LRU с TTL по entityTypeId, счётчиками попаданий и инвалидацией по записи."""
+
+    def __init__(self, max_entries: int = 2000, default_ttl: float = 30.0, ttls: Optional[Dict[int, float]] = None):
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        # key -> (expires_at, entity, item_id, value)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[int], Optional[int], Any]]" = OrderedDict()
+        self._by_entity: Dict[Optional[int], Set[str]] = {}
+        # Поколение сущности растёт при каждой записи: чтение, начатое до записи, не попадёт в кэш
+        self._generation: Dict[Optional[int], int] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def ttl_for(self, entity: Optional[int]) -> float:
+        if entity is None:
+            return self.default_ttl
+        return self.ttls.get(entity, self.default_ttl)
+
+    def generation(self, payload: Dict[str, Any]) -> int:
+        return self._generation.get(_entity_of(payload), 0)
+
+    def get(self, method: str, payload: Dict[str, Any]) -> Tuple[bool, Any]:
+        key = request_key(method, payload)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return False, None
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            self.stats["misses"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        # Копия: вызывающий код может менять результат, кэш при этом не портится
+        return True, copy.deepcopy(entry[3])
+
+    def put(self, method: str, payload: Dict[str, Any], value: Any, generation: int) -> None:
+        entity = _entity_of(payload)
+        if self._generation.get(entity, 0) != generation:
+            return
+        ttl = self.ttl_for(entity)
+        if ttl <= 0:
+            return
+        key = request_key(method, payload)
+        item_id = _item_of(payload) if method == "crm.item.get" else None
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, entity, item_id, copy.deepcopy(value))
+        self._by_entity.setdefault(entity, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, entity: Optional[int], item_id: Optional[int] = None) -> int:
+        """Сбросить списки сущности и карточку item_id (или всю сущность)."""
+        self._generation[entity] = self._generation.get(entity, 0) + 1
+        dropped = 0
+        for key in list(self._by_entity.get(entity, ())):
+            entry = self._entries.get(key)
+            # Карточки других элементов не трогаем — изменился только item_id
+            if entry is not None and item_id is not None and entry[2] is not None and entry[2] != item_id:
+                continue
+            self._drop(key)
+            dropped += 1
+        self.stats["invalidations"] += 1
+        log.debug("cache invalidated entity=%s item=%s dropped=%d", entity, item_id, dropped)
+        return dropped
+
+    def invalidate_write(self, method: str, payload: Dict[str, Any]) -> None:
+        """Инвалидация по вызову записи (crm.item.add/update/delete)."""
+        if method in WRITE_METHODS:
+            self.invalidate(_entity_of(payload or {}), _item_of(payload or {}))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_entity.clear()
+        self._generation.clear()
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_entity.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+
+    def snapshot(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats["size"] = len(self._entries)
+        return stats
+
+
+def _build_cache() -> BitrixCache:
+    ttls = {
+        etid: env_float(f"BITRIX_CACHE_TTL_{etid}", ttl)
+        for etid, ttl in DEFAULT_TTLS.items()
+    }
+    return BitrixCache(
+        max_entries=env_int("BITRIX_CACHE_MAX_ENTRIES", 2000),
+        default_ttl=env_float("BITRIX_CACHE_TTL", 30.0),
+        ttls=ttls,
+    )
+
+
+def cache_enabled() -> bool:
+    return os.getenv("BITRIX_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+# Общий кэш процесса
+bitrix_cache = _build_cache()
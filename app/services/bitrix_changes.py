@@ -0,0 +1,416 @@
+"""Лента изменений Bitrix24: шина событий и опрос по updatedTime.
+
+Вместо того чтобы на каждый запрос пересматривать последние 200 смен или
+60 дней, фоновый опросчик раз в ``BITRIX_CHANGES_INTERVAL`` секунд
+спрашивает у портала только элементы с ``updatedTime`` не раньше
+сохранённой отметки (watermark) — по каждой сущности: смены, ресурсы,
+табель, объекты. Первые страницы всех сущностей уходят одновременно и
+склеиваются коалесцером в один batch, поэтому спокойная минута стоит одного
+HTTP-вызова независимо от объёма данных.
+
+Отметка — время последнего увиденного изменения плюс id элементов с этим
+временем (updatedTime с точностью до секунды, изменения в ту же секунду не
+теряются и не дублируются). Когда отметка старше ``settle_seconds`` (запас
+на расхождение часов с порталом), в её секунду изменений уже не будет и
+опрос идёт по строгому ``>updatedTime``. Отметки сохраняются в JSON-файл.
+
+Изменения публикуются в шину процесса (change_bus); подписчики — кэш чтений
+(bitrix_cache), индексы и отчёты. Удаления опросом не видны — их приносит
+входящий вебхук событий Bitrix, который публикует в ту же шину.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from dotenv import load_dotenv
+
+from app.services.bitrix_batch import bx_batch
+from app.services.bitrix_cache import bitrix_cache
+from app.services.bitrix_ids import OBJECT_ETID, RESOURCE_ETID, SHIFT_ETID, TIMESHEET_ETID
+from app.services.bitrix_metrics import bitrix_caller
+from app.services.bitrix_ratelimit import Lane, bitrix_lane
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_changes")
+
+WATCHED_ENTITIES = (SHIFT_ETID, RESOURCE_ETID, TIMESHEET_ETID, OBJECT_ETID)
+
+# Поля, без которых событие не построить; подписчики добавляют свои через want_fields
+BASE_FIELDS = ("id", "createdTime", "updatedTime")
+
+PAGE_SIZE = 50
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """Изменение элемента смарт-процесса.
+
+    Args:
+        entity_type_id: entityTypeId смарт-процесса
+        item_id: ID элемента
+        action: add / update / delete
+        source: poll (опрос updatedTime), webhook (событие Bitrix) или local (своя запись)
+        updated_time: updatedTime элемента, если известно
+        item: Поля элемента из опроса (id, даты и поля из want_fields)
+    """
+
+    entity_type_id: int
+    item_id: int
+    action: str
+    source: str
+    updated_time: Optional[str] = None
+    item: Optional[Dict[str, Any]] = field(default=None, compare=False, hash=False)
+
+
+Subscriber = Callable[[ChangeEvent], Union[None, Awaitable[None]]]
+
+
+class ChangeBus:
+    """Шина изменений внутри процесса.
+
+    Подписчик — функция или корутина от ChangeEvent; ошибка одного
+    подписчика логируется и не мешает остальным.
+    """
+
+    def __init__(self):
+        self._subscribers: List[tuple] = []
+        self.stats: Dict[str, int] = {"published": 0, "delivered": 0, "errors": 0}
+
+    def subscribe(self, callback: Subscriber, entities: Optional[Iterable[int]] = None) -> Callable[[], None]:
+        """Подписаться на изменения (entities=None — на все сущности). Возвращает отписку."""
+        entry = (frozenset(entities) if entities is not None else None, callback)
+        self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            if entry in self._subscribers:
+                self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    async def publish(self, event: ChangeEvent) -> None:
+        self.stats["published"] += 1
+        for entities, callback in list(self._subscribers):
+            if entities is not None and event.entity_type_id not in entities:
+                continue
+            try:
+                result = callback(event)
+                if inspect.isawaitable(result):
+                    await result
+                self.stats["delivered"] += 1
+            except Exception:
+                self.stats["errors"] += 1
+                log.exception("Change subscriber %r failed on %s", callback, event)
+
+    async def publish_many(self, events: Iterable[ChangeEvent]) -> None:
+        for event in events:
+            await self.publish(event)
+
+
+def detached_task(coro: Awaitable[Any]) -> asyncio.Task:
+    """Фоновая задача в чистом контексте.
+
+    asyncio.create_task копирует contextvars вызывающего: задача, запущенная
+    из хендлера или вебхука, унаследовала бы его дедлайн (bitrix_timeouts),
+    полосу INTERACTIVE и caller и умерла бы вместе с его бюджетом. Полосу и
+    caller задача выставляет сама.
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+
+def _invalidate_cache(event: ChangeEvent) -> None:
+    bitrix_cache.invalidate(event.entity_type_id, event.item_id)
+
+
+# Общая шина процесса; кэш чтений подписан всегда
+change_bus = ChangeBus()
+change_bus.subscribe(_invalidate_cache)
+
+WRITE_ACTIONS = {"crm.item.add": "add", "crm.item.update": "update", "crm.item.delete": "delete"}
+
+
+async def publish_write(method: str, payload: Dict[str, Any], result: Any) -> None:
+    """Опубликовать собственную успешную запись (bx/bx_post), не дожидаясь опроса.
+
+    Индексы видят свои же изменения сразу (read-your-writes); элемент в
+    событии не передаётся — подписчик сам решает, перечитывать ли его.
+    """
+    action = WRITE_ACTIONS.get(method)
+    if action is None:
+        return
+    try:
+        etid = int(payload.get("entityTypeId"))
+    except (TypeError, ValueError):
+        return
+    if etid not in WATCHED_ENTITIES:
+        return
+    body = result.get("result") if isinstance(result, dict) and "result" in result else result
+    item_id = payload.get("id")
+    if item_id is None and isinstance(body, dict):
+        item_id = (body.get("item") or {}).get("id")
+    try:
+        item_id = int(item_id)
+    except (TypeError, ValueError):
+        return
+    await change_bus.publish(ChangeEvent(entity_type_id=etid, item_id=item_id, action=action, source="local"))
+
+
+@dataclass
+class Watermark:
+    """Последнее увиденное изменение сущности: updatedTime и id элементов с этим временем."""
+
+    time: str
+    ids: Set[int] = field(default_factory=set)
+
+    def seen(self, item: Dict[str, Any]) -> bool:
+        return item.get("updatedTime") == self.time and int(item["id"]) in self.ids
+
+    def settled(self, settle_seconds: float) -> bool:
+        """Секунда отметки давно прошла — новых изменений с этим updatedTime не будет."""
+        try:
+            at = datetime.fromisoformat(self.time)
+        except ValueError:
+            return False
+        now = datetime.now(timezone.utc) if at.tzinfo else datetime.now()
+        return now - at > timedelta(seconds=settle_seconds)
+
+    def advance(self, item: Dict[str, Any]) -> None:
+        updated = item.get("updatedTime") or self.time
+        if updated != self.time:
+            self.time, self.ids = updated, set()
+        self.ids.add(int(item["id"]))
+
+
+def _items(result: Any) -> List[Dict[str, Any]]:
+    items = result.get("items") if isinstance(result, dict) else result
+    return items if isinstance(items, list) else []
+
+
+class ChangeFeedPoller:
+    """Опрос crm.item.list по updatedTime с сохраняемыми отметками.
+
+    Args:
+        entities: entityTypeId, за которыми следим
+        bus: Куда публиковать изменения
+        state_path: JSON-файл с отметками
+        interval: Пауза между опросами, сек
+        settle_seconds: Через сколько секунд отметка считается «закрытой»
+    """
+
+    def __init__(
+        self,
+        entities: Iterable[int] = WATCHED_ENTITIES,
+        *,
+        bus: ChangeBus = change_bus,
+        state_path: Union[str, Path] = "bitrix_watermarks.json",
+        interval: float = 60.0,
+        settle_seconds: float = 120.0,
+    ):
+        self.entities = tuple(entities)
+        self.bus = bus
+        self.state_path = Path(state_path)
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.watermarks: Dict[int, Watermark] = {}
+        self._fields: Dict[int, Set[str]] = {e: set(BASE_FIELDS) for e in self.entities}
+        self._task: Optional[asyncio.Task] = None
+        # Когда (time.time() начала опроса) изменения сущности последний раз
+        # успешно дочитаны и доставлены — всё, что было до этого, подписчики видели
+        self.confirmed_at: Dict[int, float] = {}
+        self.stats: Dict[str, int] = {"polls": 0, "events": 0, "failures": 0}
+        self._load()
+
+    # --- отметки ---
+
+    def _load(self) -> None:
+        if not self.state_path.exists():
+            return
+        try:
+            raw = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.watermarks = {
+                int(etid): Watermark(wm["time"], {int(i) for i in wm.get("ids", [])})
+                for etid, wm in raw.items()
+            }
+        except Exception as e:
+            log.warning("Could not read %s, starting from current state: %s", self.state_path, e)
+
+    def _save(self) -> None:
+        data = {str(etid): {"time": wm.time, "ids": sorted(wm.ids)} for etid, wm in self.watermarks.items()}
+        tmp = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def want_fields(self, entity_type_id: int, *fields: str) -> None:
+        """Запрашивать в опросе дополнительные поля (для подписчиков, которым нужен элемент)."""
+        self._fields.setdefault(entity_type_id, set(BASE_FIELDS)).update(f for f in fields if f)
+
+    # --- опрос ---
+
+    async def _list(self, etid: int, flt: Dict[str, Any], order: Dict[str, str]) -> List[Dict[str, Any]]:
+        from app.services.http_client import bx
+
+        payload = {
+            "entityTypeId": etid,
+            "select": sorted(self._fields.get(etid, BASE_FIELDS)),
+            "filter": flt,
+            "order": order,
+            "start": -1,
+        }
+        return _items(await bx("crm.item.list", payload, cache=False))
+
+    async def _init_watermark(self, etid: int) -> Watermark:
+        """Первая отметка — самое свежее изменение: историю не переигрываем."""
+        from app.services.http_client import bx_iter
+
+        items = await self._list(etid, {}, {"updatedTime": "DESC", "id": "DESC"})
+        if not items:
+            return Watermark("1970-01-01T00:00:00")
+        wm = Watermark(items[0]["updatedTime"])
+        # Все элементы, изменённые в ту же секунду (обычно одна короткая страница)
+        async for item in bx_iter("crm.item.list", {
+            "entityTypeId": etid,
+            "select": ["id"],
+            "filter": {"=updatedTime": wm.time},
+        }):
+            wm.ids.add(int(item["id"]))
+        log.info("Change feed %s starts at %s", etid, wm.time)
+        return wm
+
+    async def _poll_entity(self, etid: int) -> Tuple[List[ChangeEvent], Watermark]:
+        """Изменения сущности и сдвинутая по ним копия отметки.
+
+        Сохранённая отметка не трогается: если упадёт следующая страница
+        или доставка, изменения перечитаются в следующем проходе.
+        """
+        if etid not in self.watermarks:
+            return [], await self._init_watermark(etid)
+        current = self.watermarks[etid]
+        wm = Watermark(current.time, set(current.ids))
+        events: List[ChangeEvent] = []
+        strict = wm.settled(self.settle_seconds)
+        while True:
+            op = ">updatedTime" if strict else ">=updatedTime"
+            page = await self._list(etid, {op: wm.time}, {"updatedTime": "ASC", "id": "ASC"})
+            strict = False
+            fresh = [i for i in page if not wm.seen(i)]
+            for item in fresh:
+                events.append(self._event(etid, item))
+                wm.advance(item)
+            if len(page) < PAGE_SIZE:
+                break
+            if not fresh:
+                # Полная страница изменений в одну секунду, все уже видели — дочитываем по id
+                from app.services.http_client import bx_iter
+
+                async for item in bx_iter("crm.item.list", {
+                    "entityTypeId": etid,
+                    "select": sorted(self._fields.get(etid, BASE_FIELDS)),
+                    "filter": {"=updatedTime": wm.time, ">id": max(wm.ids)},
+                }):
+                    events.append(self._event(etid, item))
+                    wm.advance(item)
+                strict = True
+        return events, wm
+
+    @staticmethod
+    def _event(etid: int, item: Dict[str, Any]) -> ChangeEvent:
+        created, updated = item.get("createdTime"), item.get("updatedTime")
+        return ChangeEvent(
+            entity_type_id=etid,
+            item_id=int(item["id"]),
+            action="add" if created and created == updated else "update",
+            source="poll",
+            updated_time=updated,
+            item=item,
+        )
+
+    async def poll_once(self) -> List[ChangeEvent]:
+        """Один проход по всем сущностям: публикует изменения и сохраняет отметки."""
+        started = time.time()
+        with bitrix_lane(Lane.BULK), bitrix_caller("changes"):
+            # Спокойный проход по всем сущностям — один запрос batch
+            async with bx_batch():
+                results = await asyncio.gather(
+                    *(self._poll_entity(etid) for etid in self.entities),
+                    return_exceptions=True,
+                )
+        events: List[ChangeEvent] = []
+        polled: Dict[int, Watermark] = {}
+        for etid, result in zip(self.entities, results, strict=True):
+            if isinstance(result, BaseException):
+                self.stats["failures"] += 1
+                log.warning("Change feed poll failed for entity %s: %s", etid, result)
+                continue
+            entity_events, polled[etid] = result
+            events.extend(entity_events)
+        self.stats["polls"] += 1
+        self.stats["events"] += len(events)
+        # Сначала доставка, потом отметка: при падении изменения придут ещё раз
+        await self.bus.publish_many(events)
+        for etid, wm in polled.items():
+            self.watermarks[etid] = wm
+            self.confirmed_at[etid] = started
+        self._save()
+        if events:
+            log.info("Change feed: %d changes", len(events))
+        return events
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Change feed poll failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.interval <= 0:
+            log.info("Change feed disabled (BITRIX_CHANGES_INTERVAL=0)")
+            return None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+def _build_poller() -> ChangeFeedPoller:
+    try:
+        interval = float(os.getenv("BITRIX_CHANGES_INTERVAL", "60"))
+    except ValueError:
+        interval = 60.0
+    return ChangeFeedPoller(
+        state_path=os.getenv("BITRIX_CHANGES_STATE", "bitrix_watermarks.json"),
+        interval=interval,
+        settle_seconds=float(os.getenv("BITRIX_CHANGES_SETTLE", "120")),
+    )
+
+
+# Общий опросчик процесса (запускается startup_change_feed)
+change_poller = _build_poller()
+
+
+async def startup_change_feed() -> None:
+    change_poller.start()
+
+
+async def shutdown_change_feed() -> None:
+    await change_poller.stop()
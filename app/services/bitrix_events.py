@@ -0,0 +1,136 @@
+"""Приём исходящих событий Bitrix24 (ONCRMDYNAMICITEMADD/UPDATE/DELETE).
+
+Bitrix отправляет событие POST-запросом с телом в формате формы::
+
+    event=ONCRMDYNAMICITEMUPDATE
+    data[FIELDS][ID]=123
+    data[FIELDS][ENTITY_TYPE_ID]=1050
+    ts=1731700000
+    auth[application_token]=...
+
+Событие проверяется по application_token (BITRIX_EVENT_TOKEN — токен из
+настроек исходящего вебхука), повторы отбрасываются, а изменение
+публикуется в ту же шину, что и опрос updatedTime (bitrix_changes), —
+кэш и индексы обновляются за доли секунды, удаления тоже видны.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from app.services.bitrix_changes import WATCHED_ENTITIES, ChangeEvent, change_bus, detached_task
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_events")
+
+EVENT_ACTIONS = {
+    "ONCRMDYNAMICITEMADD": "add",
+    "ONCRMDYNAMICITEMUPDATE": "update",
+    "ONCRMDYNAMICITEMDELETE": "delete",
+}
+
+
+class EventDeduper:
+    """Недавно виденные события (Bitrix может прислать одно событие повторно)."""
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Tuple[Any, ...], float]" = OrderedDict()
+
+    def first_time(self, key: Tuple[Any, ...]) -> bool:
+        now = time.monotonic()
+        while self._seen:
+            oldest, at = next(iter(self._seen.items()))
+            if now - at <= self.ttl and len(self._seen) < self.max_entries:
+                break
+            self._seen.pop(oldest)
+        if key in self._seen:
+            return False
+        self._seen[key] = now
+        return True
+
+
+def parse_event(form: Mapping[str, str]) -> Optional[ChangeEvent]:
+    """ChangeEvent из формы события (None — событие не про наши смарт-процессы)."""
+    action = EVENT_ACTIONS.get(str(form.get("event", "")).upper())
+    if action is None:
+        return None
+    try:
+        item_id = int(form["data[FIELDS][ID]"])
+        etid = int(form["data[FIELDS][ENTITY_TYPE_ID]"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if etid not in WATCHED_ENTITIES:
+        return None
+    return ChangeEvent(entity_type_id=etid, item_id=item_id, action=action, source="webhook")
+
+
+def token_valid(form: Mapping[str, str], expected: Optional[str]) -> bool:
+    if not expected:
+        return False
+    got = str(form.get("auth[application_token]", ""))
+    return hmac.compare_digest(got.encode("utf-8"), expected.encode("utf-8"))
+
+
+class BitrixEventReceiver:
+    """Проверка, дедупликация и публикация событий в шину изменений."""
+
+    def __init__(self, token: Optional[str] = None, *, bus=change_bus, deduper: Optional[EventDeduper] = None):
+        self.token = token
+        self.bus = bus
+        self.deduper = deduper or EventDeduper()
+        self.stats: Dict[str, int] = {"accepted": 0, "duplicate": 0, "ignored": 0, "unauthorized": 0}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _publish(self, event: ChangeEvent) -> None:
+        # Ответ Bitrix не ждёт подписчиков: индексы могут сами ходить в портал
+        task = detached_task(self.bus.publish(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def receive(self, form: Mapping[str, str]) -> str:
+        """Обработать событие; возвращает итог (accepted/duplicate/ignored/unauthorized)."""
+        if not token_valid(form, self.token):
+            result = "unauthorized"
+        else:
+            event = parse_event(form)
+            if event is None:
+                result = "ignored"
+            elif form.get("ts") and not self.deduper.first_time(
+                (str(form.get("event")).upper(), event.entity_type_id, event.item_id, form.get("ts"))
+            ):
+                # Повтор того же события (та же отметка ts); без ts повторы не распознать
+                result = "duplicate"
+            else:
+                self._publish(event)
+                result = "accepted"
+        self.stats[result] += 1
+        return result
+
+    async def drain(self) -> None:
+        """Дождаться доставки уже принятых событий (для тестов и остановки)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """aiohttp-хендлер: POST формы события от Bitrix24."""
+        form = await request.post()
+        result = self.receive({k: str(v) for k, v in form.items()})
+        if result == "unauthorized":
+            log.warning("Rejected Bitrix event from %s: bad application_token", request.remote)
+            return web.json_response({"status": result}, status=403)
+        log.debug("Bitrix event %s: %s", form.get("event"), result)
+        return web.json_response({"status": result})
+
+
+# Общий приёмник процесса (маршрут /bitrix/events в app/main.py)
+bitrix_events = BitrixEventReceiver(os.getenv("BITRIX_EVENT_TOKEN") or None)
@@ -0,0 +1,391 @@
+"""Метрики вызовов Bitrix24 REST и их отдача в формате Prometheus.
+
+Каждый вызов через http_client._call и bitrix._try записывается с меткой
+метода и «вызывающего» (caller): потока бота plan/report/resources/
+timesheet/lpa/w6 или фоновой задачи. Считаются статус, число повторов,
+байты запроса/ответа, ожидание в лимитере и полная задержка. Задержки и
+ожидание — гистограммы, поэтому p50/p95/p99 по методу и потоку получаются
+в Prometheus через histogram_quantile.
+
+Отдельно по методу хранится скользящее окно задержек успешных попыток —
+по нему клиент считает точные перцентили «на лету» (задержка хеджирования).
+
+Метка caller задаётся контекстом (как полоса лимитера), см. bitrix_caller.
+"""
+
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+log = logging.getLogger("gpo.bitrix_metrics")
+
+# Границы гистограмм (секунды и байты)
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+WAIT_BUCKETS: Tuple[float, ...] = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+BYTES_BUCKETS: Tuple[float, ...] = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current_caller: contextvars.ContextVar[str] = contextvars.ContextVar("bitrix_caller", default="other")
+
+
+def current_caller() -> str:
+    """Метка вызывающего для текущей задачи."""
+    return _current_caller.get()
+
+
+@contextmanager
+def bitrix_caller(tag: str):
+    """Выполнить блок (и порождённые в нём задачи) с меткой caller=tag."""
+    token = _current_caller.set(tag)
+    try:
+        yield
+    finally:
+        _current_caller.reset(token)
+
+
+def run_as_caller(tag: str):
+    """Декоратор корутины: все вызовы Bitrix внутри помечаются caller=tag."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with bitrix_caller(tag):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+    """Кумулятивная гистограмма с фиксированными границами."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины (для логов и отладки)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        # Корзина +Inf (последний счётчик) границы не имеет — её не перебираем
+        for bound, n in zip(self.bounds, self.counts[:-1], strict=True):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class LatencyWindow:
+    """Скользящее окно последних задержек для точных перцентилей."""
+
+    __slots__ = ("samples",)
+
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+        return ordered[idx]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values, strict=True)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class BitrixMetrics:
+    """Счётчики и гистограммы по (method, caller)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.retries: Dict[Tuple[str, str], int] = {}
+        self.bytes_out: Dict[Tuple[str, str], int] = {}
+        self.bytes_in: Dict[Tuple[str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queue_wait: Dict[Tuple[str, str], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.attempts: Dict[str, LatencyWindow] = {}
+        self.hedges: Dict[Tuple[str, str], int] = {}
+
+    def observe(
+        self,
+        method: str,
+        *,
+        status: str,
+        retries: int,
+        bytes_out: int,
+        bytes_in: int,
+        queue_wait: float,
+        latency: float,
+        caller: Optional[str] = None,
+    ) -> None:
+        """Записать один логический вызов (со всеми повторами)."""
+        caller = caller or current_caller()
+        key = (method, caller)
+        with self._lock:
+            rkey = (method, caller, status)
+            self.requests[rkey] = self.requests.get(rkey, 0) + 1
+            self.retries[key] = self.retries.get(key, 0) + max(0, retries)
+            self.bytes_out[key] = self.bytes_out.get(key, 0) + bytes_out
+            self.bytes_in[key] = self.bytes_in.get(key, 0) + bytes_in
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(latency)
+            self.queue_wait.setdefault(key, Histogram(WAIT_BUCKETS)).observe(queue_wait)
+            self.response_size.setdefault(key, Histogram(BYTES_BUCKETS)).observe(bytes_in)
+        log.debug(
+            "bitrix %s caller=%s status=%s retries=%d out=%d in=%d wait=%.3f latency=%.3f",
+            method, caller, status, retries, bytes_out, bytes_in, queue_wait, latency,
+        )
+
+    def observe_attempt(self, method: str, latency: float) -> None:
+        """Задержка одной успешной HTTP-попытки (без ожидания лимитера)."""
+        with self._lock:
+            self.attempts.setdefault(method, LatencyWindow()).observe(latency)
+
+    def attempt_percentile(self, method: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            window = self.attempts.get(method)
+            return window.percentile(q, min_samples) if window else None
+
+    def observe_hedge(self, method: str, event: str) -> None:
+        """Хеджирование: fired — отправлен второй запрос, won — он ответил первым."""
+        with self._lock:
+            key = (method, event)
+            self.hedges[key] = self.hedges.get(key, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            for d in (self.requests, self.retries, self.bytes_out, self.bytes_in,
+                      self.latency, self.queue_wait, self.response_size, self.attempts, self.hedges):
+                d.clear()
+
+    def summary(self) -> Dict[str, Dict[str, object]]:
+        """Краткая сводка по методам: вызовы, p50/p95/p99 задержки (оценка по корзинам)."""
+        out: Dict[str, Dict[str, object]] = {}
+        with self._lock:
+            for (method, caller), h in self.latency.items():
+                out[f"{method}|{caller}"] = {
+                    "count": h.count,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+        return out
+
+    def render(self) -> List[str]:
+        """Строки метрик в текстовом формате Prometheus."""
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP bitrix_requests_total Bitrix REST calls by method, caller and final status.",
+                "# TYPE bitrix_requests_total counter",
+            ]
+            for (method, caller, status), n in sorted(self.requests.items()):
+                lines.append(f"bitrix_requests_total{_labels(('method', 'caller', 'status'), (method, caller, status))} {n}")
+            for name, help_text, data in (
+                ("bitrix_retries_total", "Retried attempts of Bitrix REST calls.", self.retries),
+                ("bitrix_request_bytes_total", "Bytes sent to Bitrix REST.", self.bytes_out),
+                ("bitrix_response_bytes_total", "Bytes received from Bitrix REST.", self.bytes_in),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, caller), n in sorted(data.items()):
+                    lines.append(f"{name}{_labels(('method', 'caller'), (method, caller))} {n}")
+            for name, help_text, data in (
+                ("bitrix_request_duration_seconds", "Total latency of Bitrix REST calls incl. retries.", self.latency),
+                ("bitrix_queue_wait_seconds", "Time spent waiting for the Bitrix rate limiter.", self.queue_wait),
+                ("bitrix_response_size_bytes", "Size of Bitrix REST responses.", self.response_size),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, caller), h in sorted(data.items()):
+                    names, values = ("method", "caller"), (method, caller)
+                    cumulative = 0
+                    for bound, n in zip(h.bounds + (float("inf"),), h.counts, strict=True):
+                        cumulative += n
+                        le = 'le="%s"' % _fmt(bound)
+                        lines.append(f"{name}_bucket{_labels(names, values, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(names, values)} {_fmt(round(h.sum, 6))}")
+                    lines.append(f"{name}_count{_labels(names, values)} {h.count}")
+            lines += [
+                "# HELP bitrix_hedged_requests_total Hedged Bitrix reads (fired, won).",
+                "# TYPE bitrix_hedged_requests_total counter",
+            ]
+            for (method, event), n in sorted(self.hedges.items()):
+                lines.append(f"bitrix_hedged_requests_total{_labels(('method', 'event'), (method, event))} {n}")
+        return lines
+
+
+def _sample_lines(
+    kind: str, name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]],
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_fmt(value)}")
+    return lines
+
+
+def _gauge_lines(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    return _sample_lines("gauge", name, help_text, samples)
+
+
+def _counter_lines(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Монотонный счётчик: имя с суффиксом _total, чтобы rate() учитывал сбросы."""
+    return _sample_lines("counter", name, help_text, samples)
+
+
+def _snapshot_lines(
+    name: str, help_text: str, snapshot: Dict[str, float], counters: Iterable[str],
+) -> List[str]:
+    """snapshot() сервиса: накопительные ключи — в {name}_total, мгновенные (размер, возраст) — в gauge {name}."""
+    counters = set(counters)
+    lines = _counter_lines(
+        f"{name}_total", f"{help_text} Counters.",
+        [({"counter": k}, v) for k, v in sorted(snapshot.items()) if k in counters],
+    )
+    gauges = [({"gauge": k}, v) for k, v in sorted(snapshot.items()) if k not in counters]
+    if gauges:
+        lines += _gauge_lines(name, f"{help_text} Current values.", gauges)
+    return lines
+
+
+def render_prometheus() -> str:
+    """Полная страница /metrics: вызовы Bitrix + состояние лимитера, кэша, пула и breaker-ов."""
+    # Импорт внутри: http_client сам импортирует этот модуль
+    from app.services.bitrix_breaker import bitrix_breakers
+    from app.services.bitrix_cache import bitrix_cache
+    from app.services.bitrix_changes import change_bus, change_poller
+    from app.services.bitrix_events import bitrix_events
+    from app.services.bitrix_mirror import bitrix_mirror
+    from app.services.bitrix_ratelimit import bitrix_limiter
+    from app.services.bitrix_select import PROJECTIONS, select_for, select_stats
+    from app.services.bitrix_shift_index import shift_index
+    from app.services.http_client import batch_stats, pool_stats, singleflight_stats
+    from app.services.lpa_convert import soffice_pool
+    from app.services.lpa_render_pool import render_pool
+
+    lines = bitrix_metrics.render()
+    limiter = bitrix_limiter.stats()
+    lines += _gauge_lines("bitrix_limiter_rate", "Current Bitrix client rate, req/s.", [({}, limiter["rate"])])
+    lines += _counter_lines(
+        "bitrix_limiter_throttled_total", "429/QUERY_LIMIT_EXCEEDED responses seen.", [({}, limiter["throttled_total"])],
+    )
+    lines += _gauge_lines(
+        "bitrix_limiter_queue_depth",
+        "Requests waiting for a Bitrix token by lane.",
+        [({"lane": lane}, ls["queue_depth"]) for lane, ls in limiter["lanes"].items()],
+    )
+    # Ожидание по полосам: рост wait_seconds_total/acquired_total у bulk — голодание, max — старение
+    lines += _counter_lines(
+        "bitrix_limiter_lane_acquired_total",
+        "Bitrix tokens granted by lane.",
+        [({"lane": lane}, ls["acquired_total"]) for lane, ls in limiter["lanes"].items()],
+    )
+    lines += _counter_lines(
+        "bitrix_limiter_lane_wait_seconds_total",
+        "Time spent waiting for a Bitrix token by lane.",
+        [({"lane": lane}, ls["wait_seconds_total"]) for lane, ls in limiter["lanes"].items()],
+    )
+    lines += _gauge_lines(
+        "bitrix_limiter_lane_max_wait_seconds",
+        "Longest wait for a Bitrix token by lane since start.",
+        [({"lane": lane}, ls["max_wait_seconds"]) for lane, ls in limiter["lanes"].items()],
+    )
+    cache = bitrix_cache.snapshot()
+    lines += _counter_lines(
+        "bitrix_cache_events_total", "Bitrix read cache hits, misses, evictions and invalidations.",
+        [({"event": k}, v) for k, v in sorted(cache.items()) if k in bitrix_cache.stats],
+    )
+    lines += _gauge_lines("bitrix_cache_entries", "Entries in the Bitrix read cache.", [({}, cache["size"])])
+    lines += _counter_lines(
+        "bitrix_http_pool_total", "Pooled HTTP client: requests, TCP connects, TLS handshakes, handshakes saved.",
+        [({"counter": k}, v) for k, v in sorted(pool_stats().items())],
+    )
+    lines += bitrix_breakers.render()
+    # Склейка в batch и single-flight: сколько вызовов bx не стали отдельными запросами
+    lines += _counter_lines(
+        "bitrix_batch_total", "bx calls routed through the batch coalescer: calls, HTTP requests, batch requests.",
+        [({"counter": k}, v) for k, v in sorted(batch_stats().items())],
+    )
+    lines += _counter_lines(
+        "bitrix_singleflight_total", "Identical Bitrix reads: calls, executed requests, shared results.",
+        [({"counter": k}, v) for k, v in sorted(singleflight_stats().items())],
+    )
+    # Узкие select: размер полей потребителя и выигрыш против полного select
+    sites = select_stats.snapshot()
+    lines += _gauge_lines(
+        "bitrix_select_fields", "Fields in the minimal select of each consumer.",
+        [({"consumer": c}, len(select_for(c))) for c in sorted(PROJECTIONS)],
+    )
+    lines += _counter_lines(
+        "bitrix_select_total", "Projected reads by consumer: calls, items, full-select fallbacks.",
+        [
+            ({"consumer": c, "counter": k}, site[k])
+            for c, site in sorted(sites.items()) for k in ("calls", "items", "fallbacks")
+        ],
+    )
+    lines += _counter_lines(
+        "bitrix_select_bytes_total", "Projected response bytes by consumer: received and saved against full select.",
+        [
+            ({"consumer": c, "kind": kind}, site[k])
+            for c, site in sorted(sites.items()) for kind, k in (("received", "bytes"), ("saved", "bytes_saved"))
+        ],
+    )
+    lines += _counter_lines(
+        "bitrix_change_feed_total", "Bitrix change feed: poller, inbound events and change bus counters.",
+        [({"source": "poll", "counter": k}, v) for k, v in sorted(change_poller.stats.items())]
+        + [({"source": "webhook", "counter": k}, v) for k, v in sorted(bitrix_events.stats.items())]
+        + [({"source": "bus", "counter": k}, v) for k, v in sorted(change_bus.stats.items())],
+    )
+    lines += _snapshot_lines(
+        "bitrix_shift_index", "Shift (object, date) index: size, age and updates.",
+        shift_index.snapshot(), shift_index.stats,
+    )
+    lines += _snapshot_lines(
+        "bitrix_mirror", "Local mirror of Bitrix smart processes: sync and age per entity.",
+        bitrix_mirror.snapshot(), bitrix_mirror.stats,
+    )
+    lines += _snapshot_lines(
+        "lpa_soffice_pool", "LibreOffice pool for LPA DOCX to PDF: workers, queue and conversions.",
+        soffice_pool.snapshot(), soffice_pool.stats,
+    )
+    lines += _snapshot_lines(
+        "lpa_render_pool", "Process pool rendering LPA DOCX: processes and renders.",
+        render_pool.snapshot(), render_pool.stats,
+    )
+    return "\n".join(lines) + "\n"
+
+
+# Общие метрики процесса
+bitrix_metrics = BitrixMetrics()
@@ -0,0 +1,559 @@
+"""Зеркало смарт-процессов Bitrix24 в базе приложения.
+
+Объекты (1046), смены (1050), ресурсы (1056) и табель (1060) копируются в
+таблицы bx_objects / bx_shifts / bx_resources / bx_timesheets (app.models):
+элемент целиком в data плюс раскрытые колонки для выборок — у смены это
+объект, дата, тип, статус, разобранные UF_PLAN_JSON / UF_FACT_JSON и итоги,
+у ресурса и табеля — привязка к смене. Отчёты, сбор данных ЛПА и поиск
+смены читают отсюда, а не ходят в портал.
+
+Синхронизация:
+
+* полная загрузка (bx_iter, полоса BULK) при старте и раз в
+  BITRIX_MIRROR_RELOAD секунд; строки, которых в портале больше нет,
+  помечаются deleted;
+* дальше — шина изменений (bitrix_changes): опрос updatedTime приносит
+  элемент целиком (want_fields "*", "ufCrm%") и он сразу записывается;
+  события вебхука и собственные записи приходят без полей — элемент
+  перечитывается crm.item.get в фоне (полоса BULK, чистый контекст —
+  без дедлайна и полосы хендлера или вебхука, которые его породили),
+  чтения дожидаются этих перечитываний не дольше остатка своего дедлайна;
+  удаление помечает строку deleted.
+
+Свежесть. Строка сверена с порталом в synced_at; вся сущность сверена на
+момент последней полной загрузки или последнего успешного опроса
+(ChangeFeedPoller.confirmed_at) — изменения до этого момента зеркало уже
+видело. Чтение отдаёт данные, только если этот момент не старше
+BITRIX_MIRROR_MAX_AGE секунд; иначе (и пока первая загрузка не закончена,
+и при BITRIX_MIRROR=0) возвращает None, и вызывающий идёт в портал.
+
+Записи в портал по-прежнему идут только через bx/bx_post: зеркало —
+производная копия, локальные таблицы смен (shifts, plans) оно не трогает.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.bitrix_changes import (
+    ChangeBus,
+    ChangeEvent,
+    ChangeFeedPoller,
+    change_bus,
+    change_poller,
+    detached_task,
+)
+from app.services.bitrix_ids import (
+    OBJECT_ETID,
+    RESOURCE_ETID,
+    SHIFT_ETID,
+    TIMESHEET_ETID,
+    UF_DATE,
+    UF_EFF_FINAL,
+    UF_FACT_TOTAL,
+    UF_OBJECT_LINK,
+    UF_PLAN_TOTAL,
+    UF_RESOURCE_TYPE,
+    UF_SHIFT_ID,
+    UF_STATUS,
+    UF_TS_HOURS,
+    UF_TS_SHIFT_ID,
+    UF_TS_WORKER,
+    UF_TYPE,
+)
+from app.services.bitrix_metrics import bitrix_caller
+from app.services.bitrix_ratelimit import Lane, bitrix_lane
+from app.services.bitrix_select import FULL_SELECT, _resolved_camel
+from app.services.bitrix_timeouts import remaining
+from app.services.shift_client import _normalize_date, _plan_meta_object_id
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_mirror")
+
+MIRRORED_ENTITIES = (OBJECT_ETID, SHIFT_ETID, RESOURCE_ETID, TIMESHEET_ETID)
+
+# Известные коды полей на случай, если в bitrix_field_map.json их нет
+UF_PLAN_JSON = "ufCrm7UfPlanJson"
+UF_FACT_JSON = "ufCrm7UfFactJson"
+
+
+def mirror_enabled() -> bool:
+    return os.getenv("BITRIX_MIRROR", "0").strip().lower() not in ("0", "false", "no", "off", "")
+
+
+# --- разбор элемента в колонки ---
+
+
+@lru_cache(maxsize=None)
+def _code(entity: int, logical: str) -> Optional[str]:
+    # Маппинг читается один раз на поле, а не на каждый элемент полной загрузки
+    return _resolved_camel(entity, logical)
+
+
+def _field(item: Dict[str, Any], entity: int, logical: str, known: str) -> Any:
+    """Значение поля: код из маппинга (camelCase), затем известный код."""
+    for code in (_code(entity, logical), known):
+        if code and item.get(code) not in (None, ""):
+            return item[code]
+    return None
+
+
+def _first(value: Any) -> Any:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _int(value: Any) -> Optional[int]:
+    value = _first(value)
+    if isinstance(value, str) and value.startswith("D_"):
+        value = value[2:]
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(value: Any) -> Optional[Decimal]:
+    value = _first(value)
+    if value in (None, ""):
+        return None
+    if isinstance(value, str):
+        # Денежные поля: "1500.00|RUB"
+        value = value.split("|", 1)[0]
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _text(value: Any, limit: int) -> Optional[str]:
+    value = _first(value)
+    return str(value)[:limit] if value not in (None, "") else None
+
+
+def _json(value: Any) -> Optional[dict]:
+    value = _first(value)
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else None
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def _object_columns(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {"title": _text(item.get("title"), 500)}
+
+
+def _shift_columns(item: Dict[str, Any]) -> Dict[str, Any]:
+    plan_raw = _field(item, SHIFT_ETID, "UF_PLAN_JSON", UF_PLAN_JSON)
+    object_id = _plan_meta_object_id(plan_raw)
+    if object_id is None:
+        object_id = _int(_field(item, SHIFT_ETID, "UF_OBJECT_LINK", UF_OBJECT_LINK))
+    return {
+        "object_bitrix_id": object_id,
+        "shift_date": _normalize_date(_first(_field(item, SHIFT_ETID, "UF_DATE", UF_DATE))),
+        "shift_type": _text(_field(item, SHIFT_ETID, "UF_TYPE", UF_TYPE), 32),
+        "status": _text(_field(item, SHIFT_ETID, "UF_STATUS", UF_STATUS), 64),
+        "plan_json": _json(plan_raw),
+        "fact_json": _json(_field(item, SHIFT_ETID, "UF_FACT_JSON", UF_FACT_JSON)),
+        "plan_total": _decimal(_field(item, SHIFT_ETID, "UF_PLAN_TOTAL", UF_PLAN_TOTAL)),
+        "fact_total": _decimal(_field(item, SHIFT_ETID, "UF_FACT_TOTAL", UF_FACT_TOTAL)),
+        "eff_final": _decimal(_field(item, SHIFT_ETID, "UF_EFF_FINAL", UF_EFF_FINAL)),
+    }
+
+
+def _resource_columns(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "shift_bitrix_id": _int(_field(item, RESOURCE_ETID, "UF_SHIFT_ID", UF_SHIFT_ID)),
+        "resource_type": _text(_field(item, RESOURCE_ETID, "UF_RESOURCE_TYPE", UF_RESOURCE_TYPE), 32),
+    }
+
+
+def _timesheet_columns(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "shift_bitrix_id": _int(_field(item, TIMESHEET_ETID, "UF_SHIFT_ID", UF_TS_SHIFT_ID)),
+        "worker": _text(_field(item, TIMESHEET_ETID, "UF_WORKER", UF_TS_WORKER), 500),
+        "hours": _decimal(_field(item, TIMESHEET_ETID, "UF_HOURS", UF_TS_HOURS)),
+    }
+
+
+@dataclass(frozen=True)
+class MirrorSpec:
+    """Таблица зеркала и разбор элемента в её колонки."""
+
+    model_name: str
+    columns: Callable[[Dict[str, Any]], Dict[str, Any]]
+
+    @property
+    def model(self):
+        import app.models as models
+
+        return getattr(models, self.model_name)
+
+
+SPECS: Dict[int, MirrorSpec] = {
+    OBJECT_ETID: MirrorSpec("MirrorObject", _object_columns),
+    SHIFT_ETID: MirrorSpec("MirrorShift", _shift_columns),
+    RESOURCE_ETID: MirrorSpec("MirrorResource", _resource_columns),
+    TIMESHEET_ETID: MirrorSpec("MirrorTimesheet", _timesheet_columns),
+}
+
+
+def _row(etid: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    row = SPECS[etid].columns(item)
+    row.update({"bitrix_id": int(item["id"]), "data": item, "updated_time": item.get("updatedTime"), "deleted": False})
+    return row
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class BitrixMirror:
+    """Синхронизация таблиц bx_* с порталом и чтение из них.
+
+    Args:
+        bus: Шина изменений, на которую подписывается зеркало
+        poller: Опросчик: у него заказываются поля, по нему подтверждается свежесть
+        session_factory: Фабрика синхронных сессий (по умолчанию app.db.SessionLocal)
+        max_age: Граница устаревания для чтений, сек
+        reload_seconds: Период полной перезагрузки (0 — только при старте)
+        batch_size: Строк в одной транзакции полной загрузки
+    """
+
+    def __init__(
+        self,
+        *,
+        bus: ChangeBus = change_bus,
+        poller: Optional[ChangeFeedPoller] = change_poller,
+        session_factory=None,
+        max_age: float = 300.0,
+        reload_seconds: float = 6 * 3600,
+        batch_size: int = 200,
+        entities: Iterable[int] = MIRRORED_ENTITIES,
+    ):
+        self.bus = bus
+        self.poller = poller
+        self._session_factory = session_factory
+        self.max_age = max_age
+        self.reload_seconds = reload_seconds
+        self.batch_size = batch_size
+        self.entities = tuple(entities)
+        # Начало последней полной загрузки сущности (time.time()): всё, что было раньше, в зеркале
+        self.loaded_at: Dict[int, float] = {}
+        self._pending: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._load_task: Optional[asyncio.Task] = None
+        self._unsubscribe = None
+        self.stats: Dict[str, int] = {
+            "loads": 0, "loaded_rows": 0, "upserts": 0, "deletes": 0, "refetches": 0,
+            "hits": 0, "stale": 0,
+        }
+
+    def _session(self):
+        if self._session_factory is None:
+            from app.db import SessionLocal
+
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    # --- запись (синхронно, в потоке) ---
+
+    def _upsert_sync(self, etid: int, items: List[Dict[str, Any]], snapshot_at: Optional[datetime] = None) -> int:
+        """Записать элементы; возвращает число записанных строк.
+
+        Более старая версия (по updatedTime) не затирает новую. snapshot_at —
+        начало полной загрузки: строки, удалённые после него, не воскрешаются.
+        """
+        model = SPECS[etid].model
+        now = datetime.utcnow()
+        written = 0
+        with self._session() as s:
+            for item in items:
+                row = _row(etid, item)
+                obj = s.get(model, row["bitrix_id"])
+                if obj is None:
+                    s.add(model(**row, synced_at=now))
+                    written += 1
+                    continue
+                if snapshot_at is not None and obj.deleted and obj.synced_at >= snapshot_at:
+                    continue
+                if obj.updated_time and row["updated_time"] and row["updated_time"] < obj.updated_time:
+                    obj.synced_at = now
+                    continue
+                for key, value in row.items():
+                    setattr(obj, key, value)
+                obj.synced_at = now
+                written += 1
+            s.commit()
+        return written
+
+    def _mark_deleted_sync(self, etid: int, item_id: int) -> None:
+        model = SPECS[etid].model
+        with self._session() as s:
+            obj = s.get(model, item_id)
+            if obj is not None:
+                obj.deleted = True
+                obj.synced_at = datetime.utcnow()
+                s.commit()
+
+    def _reconcile_sync(self, etid: int, snapshot_at: datetime) -> int:
+        """Строки, не встреченные полной загрузкой, — удалены в портале."""
+        model = SPECS[etid].model
+        with self._session() as s:
+            n = (
+                s.query(model)
+                .filter(model.deleted.is_(False), model.synced_at < snapshot_at)
+                .update({model.deleted: True, model.synced_at: datetime.utcnow()}, synchronize_session=False)
+            )
+            s.commit()
+        return n
+
+    # --- полная загрузка ---
+
+    async def load(self, etid: int) -> None:
+        """Полный проход по сущности (фон: полоса BULK)."""
+        from app.services.http_client import bx_iter
+
+        started = time.time()
+        snapshot_at = datetime.utcnow()
+        batch: List[Dict[str, Any]] = []
+        scanned = 0
+        with bitrix_lane(Lane.BULK), bitrix_caller("mirror"):
+            async for item in bx_iter("crm.item.list", {"entityTypeId": etid, "select": list(FULL_SELECT)}):
+                batch.append(item)
+                scanned += 1
+                if len(batch) >= self.batch_size:
+                    await asyncio.to_thread(self._upsert_sync, etid, batch, snapshot_at)
+                    batch = []
+        if batch:
+            await asyncio.to_thread(self._upsert_sync, etid, batch, snapshot_at)
+        removed = await asyncio.to_thread(self._reconcile_sync, etid, snapshot_at)
+        self.loaded_at[etid] = started
+        self.stats["loads"] += 1
+        self.stats["loaded_rows"] += scanned
+        log.info(
+            "Mirror %s loaded: %d items, %d marked deleted in %.1fs",
+            etid, scanned, removed, time.time() - started,
+        )
+
+    async def load_all(self) -> None:
+        for etid in self.entities:
+            try:
+                await self.load(etid)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Mirror load of entity %s failed", etid)
+
+    async def _run(self) -> None:
+        while True:
+            await self.load_all()
+            if self.reload_seconds <= 0:
+                return
+            await asyncio.sleep(self.reload_seconds)
+
+    # --- обновления ---
+
+    async def on_change(self, event: ChangeEvent) -> None:
+        """Подписчик шины изменений."""
+        etid = event.entity_type_id
+        if etid not in SPECS:
+            return
+        if event.action == "delete":
+            await self._after_pending(etid, event.item_id)
+            await asyncio.to_thread(self._mark_deleted_sync, etid, event.item_id)
+            self.stats["deletes"] += 1
+        elif event.source == "poll" and event.item is not None and self.poller is not None:
+            # Опрос приносит элемент целиком (want_fields в start)
+            await self._after_pending(etid, event.item_id)
+            self.stats["upserts"] += await asyncio.to_thread(self._upsert_sync, etid, [event.item])
+        else:
+            self._schedule_refetch(etid, event.item_id)
+
+    async def _after_pending(self, etid: int, item_id: int) -> None:
+        task = self._pending.get((etid, item_id))
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _schedule_refetch(self, etid: int, item_id: int) -> None:
+        key = (etid, item_id)
+        previous = self._pending.get(key)
+        task = detached_task(self._refetch(etid, item_id, previous))
+        self._pending[key] = task
+
+        def done(t: asyncio.Task) -> None:
+            if self._pending.get(key) is t:
+                del self._pending[key]
+
+        task.add_done_callback(done)
+
+    async def _refetch(self, etid: int, item_id: int, previous: Optional[asyncio.Task]) -> None:
+        from app.services.http_client import BitrixError, bx
+
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        self.stats["refetches"] += 1
+        try:
+            with bitrix_lane(Lane.BULK), bitrix_caller("mirror"):
+                result = await bx("crm.item.get", {"entityTypeId": etid, "id": item_id}, cache=False)
+        except BitrixError as e:
+            message = str(e).lower().replace("_", " ")
+            if "not found" in message or "could not find" in message:
+                await asyncio.to_thread(self._mark_deleted_sync, etid, item_id)
+                self.stats["deletes"] += 1
+            else:
+                log.warning("Mirror: refetch of %s/%s failed: %s", etid, item_id, e)
+            return
+        item = result.get("item") if isinstance(result, dict) else None
+        if isinstance(item, dict) and item.get("id"):
+            self.stats["upserts"] += await asyncio.to_thread(self._upsert_sync, etid, [item])
+
+    # --- свежесть ---
+
+    def confirmed_at(self, etid: int) -> Optional[float]:
+        """Момент, до которого зеркало сущности полное (None — ещё не загружено)."""
+        loaded = self.loaded_at.get(etid)
+        if loaded is None:
+            return None
+        polled = self.poller.confirmed_at.get(etid, 0.0) if self.poller is not None else 0.0
+        return max(loaded, polled)
+
+    def _fresh(self, etid: int) -> bool:
+        at = self.confirmed_at(etid)
+        return at is not None and time.time() - at <= self.max_age
+
+    async def _ready(self, etid: int) -> bool:
+        """Дождаться перечитываний сущности и проверить свежесть."""
+        if self._unsubscribe is None or etid not in self.entities or etid not in self.loaded_at:
+            self.stats["stale"] += 1
+            return False
+        pending = [t for (e, _), t in self._pending.items() if e == etid]
+        if pending:
+            # Перечитывания идут в полосе BULK — ждём их не дольше остатка дедлайна вызывающего
+            budget = remaining()
+            _, still = await asyncio.wait(pending, timeout=None if budget is None else max(0.0, budget))
+            if still:
+                return False
+        return True
+
+    # --- чтение ---
+
+    async def get(self, etid: int, item_id: int) -> Optional[Dict[str, Any]]:
+        """Элемент как из crm.item.get; None — нет в зеркале или устарел."""
+        if not await self._ready(etid):
+            return None
+        model = SPECS[etid].model
+        entity_at = self.confirmed_at(etid) or 0.0
+
+        def read() -> Optional[Dict[str, Any]]:
+            with self._session() as s:
+                obj = s.get(model, int(item_id))
+                if obj is None or obj.deleted:
+                    return None
+                if time.time() - max(_epoch(obj.synced_at), entity_at) > self.max_age:
+                    return None
+                return obj.data
+
+        data = await asyncio.to_thread(read)
+        self.stats["hits" if data is not None else "stale"] += 1
+        return data
+
+    async def _select(self, etid: int, criteria: Callable[[Any], List[Any]]) -> Optional[List[Dict[str, Any]]]:
+        if not await self._ready(etid) or not self._fresh(etid):
+            self.stats["stale"] += 1
+            return None
+        model = SPECS[etid].model
+
+        def read() -> List[Dict[str, Any]]:
+            with self._session() as s:
+                rows = s.query(model).filter(model.deleted.is_(False), *criteria(model)).order_by(model.bitrix_id)
+                return [r.data for r in rows]
+
+        items = await asyncio.to_thread(read)
+        self.stats["hits"] += 1
+        return items
+
+    async def shifts_on(self, day: date, object_bitrix_id: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Смены за дату (и объект); None — зеркало не готово или устарело."""
+        def criteria(m):
+            out = [m.shift_date == day]
+            if object_bitrix_id is not None:
+                out.append(m.object_bitrix_id == int(object_bitrix_id))
+            return out
+
+        return await self._select(SHIFT_ETID, criteria)
+
+    async def by_shift(self, etid: int, shift_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Ресурсы (RESOURCE_ETID) или строки табеля (TIMESHEET_ETID) смены."""
+        return await self._select(etid, lambda m: [m.shift_bitrix_id == int(shift_id)])
+
+    # --- жизненный цикл ---
+
+    def start(self) -> asyncio.Task:
+        """Подписаться на изменения и загрузить зеркало в фоне."""
+        if self._unsubscribe is None:
+            self._unsubscribe = self.bus.subscribe(self.on_change, entities=self.entities)
+            if self.poller is not None:
+                for etid in self.entities:
+                    self.poller.want_fields(etid, *FULL_SELECT)
+        if self._load_task is None or self._load_task.done():
+            self._load_task = detached_task(self._run())
+        return self._load_task
+
+    async def stop(self) -> None:
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        tasks = [t for t in [self._load_task, *self._pending.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._load_task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats["pending"] = len(self._pending)
+        now = time.time()
+        for etid in self.entities:
+            at = self.confirmed_at(etid)
+            stats[f"age_seconds_{etid}"] = round(now - at, 1) if at is not None else -1
+        return stats
+
+
+def _build_mirror() -> BitrixMirror:
+    try:
+        max_age = float(os.getenv("BITRIX_MIRROR_MAX_AGE", "300"))
+    except ValueError:
+        max_age = 300.0
+    try:
+        reload_seconds = float(os.getenv("BITRIX_MIRROR_RELOAD", str(6 * 3600)))
+    except ValueError:
+        reload_seconds = 6 * 3600.0
+    return BitrixMirror(max_age=max_age, reload_seconds=reload_seconds)
+
+
+# Общее зеркало процесса (запускается startup_bitrix_mirror)
+bitrix_mirror = _build_mirror()
+
+
+async def startup_bitrix_mirror() -> None:
+    if mirror_enabled():
+        bitrix_mirror.start()
+    else:
+        log.info("Bitrix mirror disabled (BITRIX_MIRROR=0)")
+
+
+async def shutdown_bitrix_mirror() -> None:
+    await bitrix_mirror.stop()
@@ -2,12 +2,15 @@
 
 import base64
 import logging
+import time
 from typing import List, Optional, Tuple
 from pathlib import Path
 from io import BytesIO
 from PIL import Image
 
-from app.services.http_client import bx
+from app.services.bitrix_metrics import bitrix_metrics
+from app.services.bitrix_timeouts import attempt_timeout
+from app.services.http_client import bx, http_request
 from app.bitrix_field_map import resolve_code, upper_to_camel
 
 log = logging.getLogger("gpo.bitrix_photos")
@@ -63,7 +66,6 @@ async def get_shift_photos(shift_bitrix_id: int, max_photos: int = 5) -> List[Tu
         
         # Скачиваем фото
         photos = []
-        import httpx
         
         for i, photo_data in enumerate(photos_raw):
             try:
@@ -96,12 +98,17 @@ async def get_shift_photos(shift_bitrix_id: int, max_photos: int = 5) -> List[Tu
                 # Скачиваем файл через downloadUrl
                 if download_url:
                     try:
-                        async with httpx.AsyncClient(timeout=30) as client:
-                            response = await client.get(download_url)
-                            if response.status_code == 200:
-                                file_bytes = response.content
-                                photos.append((file_name, file_bytes))
-                                continue
+                        timeout, _ = attempt_timeout("disk.download")
+                        if timeout <= 0:
+                            log.warning("Deadline exhausted, skipping remaining photos of shift %s", shift_bitrix_id)
+                            break
+                        started = time.monotonic()
+                        response = await http_request("GET", download_url, timeout=timeout)
+                        if response.status_code == 200:
+                            bitrix_metrics.observe_attempt("disk.download", time.monotonic() - started)
+                            file_bytes = response.content
+                            photos.append((file_name, file_bytes))
+                            continue
                     except Exception as e:
                         log.warning(f"Could not download from URL {download_url}: {e}")
                 
@@ -0,0 +1,278 @@
+"""Клиентский лимитер запросов к Bitrix24 REST (token bucket).
+
+Bitrix24 ограничивает портал «дырявым ведром»: ~2 запроса в секунду при
+запасе ~50 запросов. Вместо того чтобы выжигать этот запас и потом ловить
+429/503, все точки входа (http_client.bx, bitrix._try, скрипты) берут
+токен у общего лимитера. Скорость адаптивная: каждый 429 вдвое снижает
+темп, а серия успешных ответов постепенно возвращает его к настроенному.
+
+Токены раздаются по полосам приоритета (Lane): сначала интерактивные
+запросы из хендлеров, затем плановые отчёты, затем массовые/сервисные
+задачи. Ожидающий запрос каждые ``aging`` секунд поднимается на полосу
+выше, поэтому нижние полосы не голодают дольше нескольких таких шагов.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.env import env_float
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_ratelimit")
+
+
+class Lane(IntEnum):
+    """Полоса приоритета запросов к Bitrix24 (меньше — важнее)."""
+
+    INTERACTIVE = 0  # Хендлеры бота: прораб ждёт ответа
+    REPORT = 1  # Плановые сводки 09:30/18:30, инсайты
+    BULK = 2  # Массовые выгрузки, синхронизация, сервисные скрипты
+
+
+_current_lane: contextvars.ContextVar[Lane] = contextvars.ContextVar(
+    "bitrix_lane", default=Lane.INTERACTIVE
+)
+
+
+def current_lane() -> Lane:
+    """Полоса, в которой выполняется текущая задача."""
+    return _current_lane.get()
+
+
+@contextmanager
+def bitrix_lane(lane: Lane):
+    """Выполнить блок (и порождённые в нём задачи) в указанной полосе."""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def run_in_lane(lane: Lane):
+    """Декоратор корутины: все вызовы Bitrix внутри идут в полосе lane."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with bitrix_lane(lane):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Waiter:
+    __slots__ = ("lane", "seq", "started", "future")
+
+    def __init__(self, lane: Lane, seq: int, started: float, future: asyncio.Future):
+        self.lane = lane
+        self.seq = seq
+        self.started = started
+        self.future = future
+
+
+class TokenBucket:
+    """Token bucket с AIMD-адаптацией к ответам 429.
+
+    Args:
+        rate: Пополнение, токенов в секунду (допустимый темп портала)
+        burst: Ёмкость ведра (сколько запросов можно сделать подряд)
+        min_rate: Нижняя граница темпа после серии 429
+        recover_after: Сколько успешных ответов подряд нужно для шага вверх
+        aging: Через сколько секунд ожидания запрос поднимается на полосу выше
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        *,
+        min_rate: float = 0.2,
+        recover_after: int = 20,
+        aging: float = 2.0,
+    ):
+        self.max_rate = max(rate, 0.01)
+        self.rate = self.max_rate
+        self.min_rate = min(min_rate, self.max_rate)
+        self.burst = max(burst, 1.0)
+        self.recover_after = max(recover_after, 1)
+        self.aging = max(aging, 0.01)
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._state_lock = threading.Lock()
+        self._successes = 0
+
+        # Очередь ожидающих и «ворота»: токен выдаётся одному запросу за раз
+        self._waiters: List[_Waiter] = []
+        self._busy = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = itertools.count()
+
+        self.queue_depth = 0
+        self.acquired_total = 0
+        self.waited_total = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+        self.throttled_total = 0
+        self.lanes: Dict[Lane, Dict[str, float]] = {
+            lane: {"queue_depth": 0, "acquired_total": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+            for lane in Lane
+        }
+
+    # --- учёт токенов ---
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Забрать токен; вернуть, сколько нужно подождать до его появления."""
+        with self._state_lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def _record_wait(self, waited: float, lane: Optional[Lane] = None) -> None:
+        self.acquired_total += 1
+        if waited > 0:
+            self.waited_total += 1
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if lane is not None:
+            ls = self.lanes[lane]
+            ls["acquired_total"] += 1
+            ls["wait_seconds_total"] += waited
+            ls["max_wait_seconds"] = max(ls["max_wait_seconds"], waited)
+
+    def _bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Очередь живёт в одном event loop; новый цикл (asyncio.run в скриптах) начинает с чистой
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = []
+            self._busy = False
+
+    def _effective_rank(self, w: _Waiter, now: float) -> int:
+        return max(0, int(w.lane) - int((now - w.started) / self.aging))
+
+    def _wake(self) -> None:
+        """Открыть ворота самому приоритетному ожидающему."""
+        if self._busy:
+            return
+        now = time.monotonic()
+        while self._waiters:
+            w = min(self._waiters, key=lambda x: (self._effective_rank(x, now), x.seq))
+            self._waiters.remove(w)
+            if w.future.done():
+                continue
+            self._busy = True
+            w.future.set_result(None)
+            return
+
+    # --- API ---
+
+    async def acquire(self) -> float:
+        """Дождаться токена с учётом полосы. Возвращает время ожидания в секундах."""
+        loop = asyncio.get_running_loop()
+        self._bind_loop(loop)
+        lane = current_lane()
+        w = _Waiter(lane, next(self._seq), time.monotonic(), loop.create_future())
+        self._waiters.append(w)
+        self.queue_depth += 1
+        self.lanes[lane]["queue_depth"] += 1
+        self._wake()
+        try:
+            await w.future
+            delay = self._reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self.queue_depth -= 1
+            self.lanes[lane]["queue_depth"] -= 1
+            if w.future.done() and not w.future.cancelled():
+                # Мы держали ворота — передаём следующему
+                self._busy = False
+            elif w in self._waiters:
+                self._waiters.remove(w)
+            self._wake()
+        waited = time.monotonic() - w.started
+        self._record_wait(waited, lane)
+        return waited
+
+    def acquire_sync(self) -> float:
+        """Блокирующий вариант для синхронных скриптов."""
+        started = time.monotonic()
+        self.queue_depth += 1
+        try:
+            delay = self._reserve()
+            if delay > 0:
+                time.sleep(delay)
+        finally:
+            self.queue_depth -= 1
+        waited = time.monotonic() - started
+        self._record_wait(waited)
+        return waited
+
+    def on_throttled(self) -> None:
+        """Портал ответил 429/QUERY_LIMIT_EXCEEDED: снижаем темп и сбрасываем запас."""
+        with self._state_lock:
+            self.throttled_total += 1
+            self._successes = 0
+            old = self.rate
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+        log.warning("Bitrix throttled: rate %.2f -> %.2f req/s", old, self.rate)
+
+    def on_success(self) -> None:
+        """Успешный ответ: после серии успехов понемногу возвращаем темп."""
+        if self.rate >= self.max_rate:
+            return
+        with self._state_lock:
+            self._successes += 1
+            if self._successes >= self.recover_after:
+                self._successes = 0
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+                log.info("Bitrix rate recovered to %.2f req/s", self.rate)
+
+    def stats(self) -> Dict[str, object]:
+        """Метрики лимитера: темп, глубина очереди и время ожидания (всего и по полосам)."""
+        with self._state_lock:
+            self._refill(time.monotonic())
+            tokens = self._tokens
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "tokens": round(max(tokens, 0.0), 3),
+            "queue_depth": self.queue_depth,
+            "acquired_total": self.acquired_total,
+            "waited_total": self.waited_total,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "throttled_total": self.throttled_total,
+            "lanes": {
+                lane.name.lower(): {k: round(v, 3) if isinstance(v, float) else v for k, v in ls.items()}
+                for lane, ls in self.lanes.items()
+            },
+        }
+
+
+# Общий лимитер процесса: настройки из .env (BITRIX_RATE_LIMIT, BITRIX_RATE_BURST)
+bitrix_limiter = TokenBucket(
+    rate=env_float("BITRIX_RATE_LIMIT", 2.0),
+    burst=env_float("BITRIX_RATE_BURST", 50.0),
+    min_rate=env_float("BITRIX_RATE_MIN", 0.2),
+    aging=env_float("BITRIX_LANE_AGING", 2.0),
+)
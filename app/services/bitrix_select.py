@@ -0,0 +1,279 @@
+"""Реестр полей, которые читает каждый потребитель смарт-процессов.
+
+Вместо ``select: ["id", "*", "ufCrm%"]`` (все поля, включая большие JSON и
+файлы) каждый потребитель объявляет логические поля, которые он реально
+читает. Из них через bitrix_field_map строится минимальный select; к нему
+добавляются известные camelCase-коды (bitrix_ids и коды, зашитые в
+потребителях), поэтому проекция работает и без bitrix_field_map.json.
+
+Поля-привязки и файлы при узком select Bitrix иногда отдаёт строкой
+"Array" — только в этом случае элемент перечитывается с полным select.
+По каждому месту вызова копятся байты ответа и оценка сэкономленного
+объёма (относительно среднего размера элемента при полном select).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.bitrix_field_map import resolve_code, upper_to_camel
+from app.services.bitrix_ids import (
+    OBJECT_ETID,
+    RESOURCE_ETID,
+    SHIFT_ETID,
+    TIMESHEET_ETID,
+    UF_DATE,
+    UF_EFF_FINAL,
+    UF_EQUIP_HOURS,
+    UF_EQUIP_TYPE,
+    UF_FACT_TOTAL,
+    UF_MAT_PRICE,
+    UF_MAT_QTY,
+    UF_MAT_TYPE,
+    UF_MAT_UNIT,
+    UF_OBJECT_ADDRESS,
+    UF_OBJECT_LINK,
+    UF_PLAN_TOTAL,
+    UF_RES_COMMENT,
+    UF_RESOURCE_TYPE,
+    UF_SHIFT_ID,
+    UF_STATUS,
+    UF_TS_HOURS,
+    UF_TS_RATE,
+    UF_TS_SHIFT_ID,
+    UF_TS_WORKER,
+    UF_TYPE,
+)
+
+log = logging.getLogger("gpo.bitrix_select")
+
+FULL_SELECT = ["id", "*", "ufCrm%"]
+
+# Название СПА в bitrix_field_map.json по entityTypeId
+SPA_NAMES: Dict[int, str] = {
+    OBJECT_ETID: "Объект",
+    SHIFT_ETID: "Смена",
+    RESOURCE_ETID: "Ресурс",
+    TIMESHEET_ETID: "Табель",
+}
+
+# Сколько полных ответов на сущность учитываем в среднем размере элемента
+_FULL_SAMPLES_MAX = 50
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Поля одного потребителя.
+
+    Args:
+        entity: entityTypeId смарт-процесса
+        standard: Стандартные поля (id, title, stageId, ...)
+        logical: Логические UF-коды (UF_PLAN_JSON), резолвятся через bitrix_field_map
+        known: Известные camelCase-коды, которые потребитель читает напрямую
+    """
+
+    entity: int
+    standard: Tuple[str, ...] = ("id",)
+    logical: Tuple[str, ...] = ()
+    known: Tuple[str, ...] = ()
+
+
+PROJECTIONS: Dict[str, Projection] = {
+    # lpa_data._fetch_shift_item / collect_lpa_data
+    "lpa.shift": Projection(
+        SHIFT_ETID,
+        standard=("id", "title", "stageId", "statusId"),
+        logical=("UF_PLAN_JSON", "UF_FACT_JSON", "UF_DATE", "UF_SHIFT_TYPE", "UF_SHIFT_PHOTOS", "UF_OBJECT_LINK"),
+        known=(
+            "ufCrm7UfPlanJson", "ufCrm7UfFactJson", UF_DATE, "ufCrm7UfShiftType",
+            UF_TYPE, "ufCrm7UfShiftPhotos", UF_OBJECT_LINK,
+        ),
+    ),
+    # lpa_data._fetch_resources: техника и материалы смены
+    "lpa.resources": Projection(
+        RESOURCE_ETID,
+        logical=(
+            "UF_SHIFT_ID", "UF_RESOURCE_TYPE", "UF_EQUIP_TYPE", "UF_EQUIP_HOURS",
+            "UF_RES_COMMENT", "UF_MAT_TYPE", "UF_MAT_QTY", "UF_MAT_UNIT", "UF_MAT_PRICE",
+        ),
+        known=(
+            UF_SHIFT_ID, UF_RESOURCE_TYPE, UF_EQUIP_TYPE, UF_EQUIP_HOURS, UF_RES_COMMENT,
+            UF_MAT_TYPE, UF_MAT_QTY, UF_MAT_UNIT, UF_MAT_PRICE,
+        ),
+    ),
+    # lpa_data._fetch_timesheet: строки табеля
+    "lpa.timesheet": Projection(
+        TIMESHEET_ETID,
+        logical=("UF_SHIFT_ID", "UF_WORKER", "UF_HOURS", "UF_RATE"),
+        known=(UF_TS_SHIFT_ID, UF_TS_WORKER, UF_TS_HOURS, UF_TS_RATE),
+    ),
+    # lpa_data._fetch_object_item: название и адрес объекта
+    # (ufCrmAddress и address — запасные поля адреса, которые читает lpa_data)
+    "lpa.object": Projection(
+        OBJECT_ETID,
+        standard=("id", "title"),
+        logical=("UF_ADDRESS",),
+        known=(UF_OBJECT_ADDRESS, "ufCrmAddress", "address"),
+    ),
+    # w6_alerts.list_shifts_by_date → сводки, инсайты, /status
+    "w6.shifts": Projection(
+        SHIFT_ETID,
+        standard=("id", "title"),
+        logical=("UF_DATE", "UF_OBJECT_LINK", "UF_PLAN_JSON", "UF_FACT_JSON", "UF_PLAN_TOTAL", "UF_FACT_TOTAL"),
+        known=(UF_DATE, UF_OBJECT_LINK, "ufCrm7UfPlanJson", "ufCrm7UfFactJson", UF_PLAN_TOTAL, UF_FACT_TOTAL),
+    ),
+    # flow_lpa: поиск смен объекта для ЛПА
+    "lpa.object_search": Projection(
+        SHIFT_ETID,
+        standard=("id", "title"),
+        logical=(
+            "UF_DATE", "UF_OBJECT_LINK", "UF_STATUS", "UF_PLAN_TOTAL", "UF_FACT_TOTAL",
+            "UF_EFF_FINAL", "UF_PLAN_JSON", "UF_FACT_JSON",
+        ),
+        known=(
+            UF_DATE, UF_OBJECT_LINK, UF_STATUS, UF_PLAN_TOTAL, UF_FACT_TOTAL, UF_EFF_FINAL,
+            "ufCrm7UfPlanJson", "ufCrm7UfFactJson",
+        ),
+    ),
+}
+
+
+def _resolved_camel(entity: int, logical_code: str) -> Optional[str]:
+    spa = SPA_NAMES.get(entity)
+    if not spa:
+        return None
+    code = resolve_code(spa, logical_code)
+    # Нерезолвленный код возвращается как есть ("UF_DATE") — такого поля у СПА нет
+    if not code or not code.startswith("UF_CRM_"):
+        return None
+    return upper_to_camel(code)
+
+
+def select_for(consumer: str, *extra: str) -> List[str]:
+    """Минимальный select для потребителя (неизвестный потребитель — полный select)."""
+    proj = PROJECTIONS.get(consumer)
+    if proj is None:
+        log.warning("select_for: unknown consumer %s, using full select", consumer)
+        return list(FULL_SELECT)
+    fields: List[str] = list(proj.standard)
+    for logical_code in proj.logical:
+        camel = _resolved_camel(proj.entity, logical_code)
+        if camel:
+            fields.append(camel)
+    fields.extend(proj.known)
+    fields.extend(f for f in extra if f)
+    # Порядок сохраняем, дубли убираем
+    return list(dict.fromkeys(fields))
+
+
+def has_array_collapse(item: Any) -> bool:
+    """Bitrix вернул множественное поле строкой "Array" — нужен полный select."""
+    if not isinstance(item, dict):
+        return False
+    return any(isinstance(v, str) and v.lower() == "array" for v in item.values())
+
+
+def _json_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SelectStats:
+    """Байты ответов по местам вызова и оценка экономии против полного select."""
+
+    def __init__(self):
+        # entity -> [элементов, байт] по полным ответам
+        self._full: Dict[int, List[int]] = {}
+        self.sites: Dict[str, Dict[str, int]] = {}
+
+    def observe_full(self, entity: int, items: List[Any]) -> None:
+        if not items:
+            return
+        acc = self._full.setdefault(entity, [0, 0])
+        if acc[0] >= _FULL_SAMPLES_MAX:
+            return
+        acc[0] += len(items)
+        acc[1] += sum(_json_size(i) for i in items)
+
+    def observe_response(self, method: str, payload: Dict[str, Any], result: Any) -> None:
+        """Учесть ответ crm.item.get/list, если он был с полным select ("*")."""
+        if method not in ("crm.item.get", "crm.item.list"):
+            return
+        select = (payload or {}).get("select") or []
+        if "*" not in select:
+            return
+        try:
+            entity = int(payload.get("entityTypeId"))
+        except (TypeError, ValueError):
+            return
+        self.observe_full(entity, _items_of(result))
+
+    def full_item_bytes(self, entity: int) -> Optional[float]:
+        acc = self._full.get(entity)
+        if not acc or not acc[0]:
+            return None
+        return acc[1] / acc[0]
+
+    def record(self, consumer: str, entity: int, items: List[Any], *, fallback: bool = False) -> None:
+        site = self.sites.setdefault(
+            consumer, {"calls": 0, "items": 0, "bytes": 0, "bytes_saved": 0, "fallbacks": 0}
+        )
+        size = sum(_json_size(i) for i in items)
+        site["calls"] += 1
+        site["items"] += len(items)
+        site["bytes"] += size
+        if fallback:
+            site["fallbacks"] += 1
+            return
+        avg_full = self.full_item_bytes(entity)
+        if avg_full is not None:
+            site["bytes_saved"] += max(0, int(avg_full * len(items)) - size)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(site) for name, site in self.sites.items()}
+
+
+select_stats = SelectStats()
+
+
+def _items_of(result: Any) -> List[Any]:
+    if isinstance(result, dict):
+        if "items" in result:
+            items = result.get("items")
+            return items if isinstance(items, list) else []
+        item = result.get("item")
+        return [item] if isinstance(item, dict) else []
+    return result if isinstance(result, list) else []
+
+
+async def bx_projected(method: str, payload: Dict[str, Any], consumer: str, *extra: str) -> Any:
+    """
+    crm.item.get / crm.item.list с select из реестра потребителя.
+
+    Если в ответе есть поле, схлопнутое в "Array", запрос повторяется с
+    полным select и возвращается полный ответ.
+
+    Args:
+        method: crm.item.get или crm.item.list
+        payload: Payload без select (entityTypeId, id/filter, order, ...)
+        consumer: Имя потребителя в PROJECTIONS
+        extra: Дополнительные поля для этого вызова
+    """
+    from app.services.http_client import bx
+
+    entity = PROJECTIONS[consumer].entity if consumer in PROJECTIONS else payload.get("entityTypeId")
+    result = await bx(method, {**payload, "select": select_for(consumer, *extra)})
+    items = _items_of(result)
+    if any(has_array_collapse(i) for i in items):
+        log.info("[SELECT] %s: 'Array' in projected %s, refetching with full select", consumer, method)
+        result = await bx(method, {**payload, "select": list(FULL_SELECT)})
+        items = _items_of(result)
+        select_stats.record(consumer, entity, items, fallback=True)
+        return result
+    select_stats.record(consumer, entity, items)
+    return result
@@ -0,0 +1,341 @@
+"""Индекс смен: (object_bitrix_id, дата смены) → смены-кандидаты.
+
+bitrix_get_shift_for_object_and_date раньше на каждое действие (отчёт,
+ресурсы, табель, ЛПА) читал смены из портала и разбирал UF_PLAN_JSON
+каждой. Индекс строится один раз полным постраничным проходом по сменам и
+дальше поддерживается шиной изменений (bitrix_changes):
+
+* опрос updatedTime приносит элемент с нужными полями (want_fields) — он
+  сразу переиндексируется;
+* события вебхука и собственные записи (bx/bx_post) приходят без полей —
+  смена перечитывается crm.item.get в фоне, а поиск дожидается этих
+  перечитываний (не дольше остатка дедлайна взаимодействия), поэтому
+  только что сохранённый план виден сразу;
+* удаление убирает смену из индекса.
+
+Для каждой смены хранится только то, что нужно _score_shift и ответу:
+id, дата, UF_PLAN_JSON и UF_PLAN_TOTAL. Пока индекс не построен (или
+выключен BITRIX_SHIFT_INDEX=0), поиск возвращает None и вызывающий идёт в
+портал напрямую. Раз в BITRIX_SHIFT_INDEX_REBUILD секунд индекс
+перестраивается в фоне — на случай пропущенных событий.
+
+Построение и перечитывания — фоновые задачи в чистом контексте
+(detached_task): перестройка, запущенная поиском из хендлера, не живёт
+под его 30-секундным дедлайном.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.bitrix_changes import (
+    ChangeBus,
+    ChangeEvent,
+    ChangeFeedPoller,
+    change_bus,
+    change_poller,
+    detached_task,
+)
+from app.services.bitrix_ids import SHIFT_ETID
+from app.services.bitrix_metrics import bitrix_caller
+from app.services.bitrix_ratelimit import Lane, bitrix_lane
+from app.services.bitrix_timeouts import remaining
+from app.services.shift_client import _normalize_date, _plan_meta_object_id, _shift_field_camel
+
+load_dotenv()
+
+log = logging.getLogger("gpo.shift_index")
+
+Key = Tuple[int, date]
+
+# Пауза перед повтором перестройки после ошибки: иначе каждый поиск запускал бы новый полный проход
+BUILD_RETRY_SECONDS = 300.0
+
+
+def shift_index_enabled() -> bool:
+    return os.getenv("BITRIX_SHIFT_INDEX", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class ShiftIndex:
+    """Индекс смен по (объект, дата) в памяти процесса.
+
+    Args:
+        bus: Шина изменений, на которую подписывается индекс
+        poller: Опросчик, у которого заказываются поля смены
+        rebuild_seconds: Возраст индекса, после которого он перестраивается (0 — никогда)
+    """
+
+    def __init__(
+        self,
+        *,
+        bus: ChangeBus = change_bus,
+        poller: Optional[ChangeFeedPoller] = change_poller,
+        rebuild_seconds: float = 6 * 3600,
+    ):
+        self.bus = bus
+        self.poller = poller
+        self.rebuild_seconds = rebuild_seconds
+        self._by_key: Dict[Key, Dict[int, Dict[str, Any]]] = {}
+        self._key_of: Dict[int, Key] = {}
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._changed_during_build: Optional[Set[int]] = None
+        self._build_task: Optional[asyncio.Task] = None
+        self._unsubscribe = None
+        self._codes: Optional[Tuple[Optional[str], Optional[str], Optional[str]]] = None
+        self.built_at: Optional[float] = None
+        self._retry_at = 0.0
+        self.stats: Dict[str, int] = {
+            "builds": 0, "build_failures": 0, "lookups": 0, "misses": 0, "updates": 0, "removals": 0,
+            "refetches": 0, "refetch_timeouts": 0,
+        }
+
+    # --- поля ---
+
+    def fields(self) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """camelCase-коды UF_DATE, UF_PLAN_JSON, UF_PLAN_TOTAL."""
+        if self._codes is None:
+            self._codes = (
+                _shift_field_camel("UF_DATE"),
+                _shift_field_camel("UF_PLAN_JSON"),
+                _shift_field_camel("UF_PLAN_TOTAL"),
+            )
+        return self._codes
+
+    def _select(self) -> List[str]:
+        return ["id", *(f for f in self.fields() if f)]
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def __len__(self) -> int:
+        return len(self._key_of)
+
+    # --- содержимое ---
+
+    def _entry(self, item: Dict[str, Any]) -> Optional[Tuple[Key, Dict[str, Any]]]:
+        f_date, f_plan_json, f_plan_total = self.fields()
+        object_id = _plan_meta_object_id(item.get(f_plan_json))
+        shift_date = _normalize_date(item.get(f_date))
+        if object_id is None or shift_date is None:
+            return None
+        entry = {"id": int(item["id"]), f_date: item.get(f_date), f_plan_json: item.get(f_plan_json)}
+        if f_plan_total:
+            entry[f_plan_total] = item.get(f_plan_total)
+        return (object_id, shift_date), entry
+
+    def _remove(self, shift_id: int) -> None:
+        key = self._key_of.pop(shift_id, None)
+        if key is None:
+            return
+        bucket = self._by_key.get(key)
+        if bucket is not None:
+            bucket.pop(shift_id, None)
+            if not bucket:
+                del self._by_key[key]
+        self.stats["removals"] += 1
+
+    def _put(self, item: Dict[str, Any]) -> None:
+        """Переиндексировать смену (объект или дата в плане могли смениться)."""
+        shift_id = int(item["id"])
+        self._remove(shift_id)
+        indexed = self._entry(item)
+        if indexed is None:
+            return
+        key, entry = indexed
+        self._by_key.setdefault(key, {})[shift_id] = entry
+        self._key_of[shift_id] = key
+        self.stats["updates"] += 1
+
+    # --- построение ---
+
+    async def build(self) -> None:
+        """Полный проход по сменам (фон: полоса BULK)."""
+        from app.services.http_client import bx_iter
+
+        f_date, f_plan_json, _ = self.fields()
+        if not f_date or not f_plan_json:
+            log.error("Shift index disabled: UF_DATE/UF_PLAN_JSON not found in field map")
+            return
+        started = time.monotonic()
+        self._changed_during_build = set()
+        by_key: Dict[Key, Dict[int, Dict[str, Any]]] = {}
+        key_of: Dict[int, Key] = {}
+        scanned = 0
+        try:
+            with bitrix_lane(Lane.BULK), bitrix_caller("shift_index"):
+                async for item in bx_iter("crm.item.list", {"entityTypeId": SHIFT_ETID, "select": self._select()}):
+                    scanned += 1
+                    indexed = self._entry(item)
+                    if indexed is None:
+                        continue
+                    key, entry = indexed
+                    by_key.setdefault(key, {})[entry["id"]] = entry
+                    key_of[entry["id"]] = key
+            self._by_key, self._key_of = by_key, key_of
+            self.built_at = time.monotonic()
+            changed = self._changed_during_build
+        finally:
+            self._changed_during_build = None
+        # Изменения, пришедшие во время прохода, могли не попасть в снимок — перечитываем
+        for shift_id in changed:
+            self._schedule_refetch(shift_id)
+        self.stats["builds"] += 1
+        log.info(
+            "Shift index built: %d shifts scanned, %d indexed, %d keys in %.1fs",
+            scanned, len(key_of), len(by_key), time.monotonic() - started,
+        )
+
+    def _start_build(self) -> asyncio.Task:
+        if self._build_task is None or self._build_task.done():
+            self._build_task = detached_task(self._build_logged())
+        return self._build_task
+
+    async def _build_logged(self) -> None:
+        try:
+            await self.build()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats["build_failures"] += 1
+            self._retry_at = time.monotonic() + BUILD_RETRY_SECONDS
+            log.exception("Shift index build failed, next attempt in %.0fs", BUILD_RETRY_SECONDS)
+
+    # --- обновления ---
+
+    def on_change(self, event: ChangeEvent) -> None:
+        """Подписчик шины изменений (только смены)."""
+        if event.entity_type_id != SHIFT_ETID:
+            return
+        if self._changed_during_build is not None:
+            self._changed_during_build.add(event.item_id)
+        if event.action == "delete":
+            self._remove(event.item_id)
+            return
+        _, f_plan_json, _ = self.fields()
+        if event.item is not None and f_plan_json in event.item:
+            self._put(event.item)
+        else:
+            self._schedule_refetch(event.item_id)
+
+    def _schedule_refetch(self, shift_id: int) -> None:
+        previous = self._pending.get(shift_id)
+        task = detached_task(self._refetch(shift_id, previous))
+        self._pending[shift_id] = task
+
+        def done(t: asyncio.Task) -> None:
+            if self._pending.get(shift_id) is t:
+                del self._pending[shift_id]
+
+        task.add_done_callback(done)
+
+    async def _refetch(self, shift_id: int, previous: Optional[asyncio.Task]) -> None:
+        from app.services.http_client import BitrixError, bx
+
+        if previous is not None:
+            # Перечитывания одной смены по порядку: ответ постарше не затрёт новый
+            await asyncio.gather(previous, return_exceptions=True)
+        self.stats["refetches"] += 1
+        try:
+            # Полоса по умолчанию (INTERACTIVE): перечитывания ждёт поиск из хендлера
+            with bitrix_caller("shift_index"):
+                result = await bx("crm.item.get", {"entityTypeId": SHIFT_ETID, "id": shift_id}, cache=False)
+        except BitrixError as e:
+            message = str(e).lower().replace("_", " ")
+            if "not found" in message or "could not find" in message:
+                self._remove(shift_id)
+            else:
+                log.warning("Shift index: refetch of shift %s failed: %s", shift_id, e)
+            return
+        item = result.get("item") if isinstance(result, dict) else None
+        if isinstance(item, dict) and item.get("id"):
+            self._put(item)
+        else:
+            self._remove(shift_id)
+
+    # --- поиск ---
+
+    async def lookup(self, object_bitrix_id: int, target_date: date) -> Optional[List[Dict[str, Any]]]:
+        """Смены пары (объект, дата); None — индекс не готов, спрашивать портал."""
+        if not self.ready:
+            self.stats["misses"] += 1
+            return None
+        if self._pending:
+            await self._wait_pending()
+        now = time.monotonic()
+        if self.rebuild_seconds > 0 and now - self.built_at > self.rebuild_seconds and now >= self._retry_at:
+            self._start_build()
+        self.stats["lookups"] += 1
+        bucket = self._by_key.get((int(object_bitrix_id), target_date)) or {}
+        return [dict(entry) for entry in bucket.values()]
+
+    async def _wait_pending(self) -> None:
+        """Дождаться перечитываний, но не дольше остатка дедлайна вызывающего."""
+        budget = remaining()
+        _, still = await asyncio.wait(
+            list(self._pending.values()), timeout=None if budget is None else max(0.0, budget),
+        )
+        if still:
+            # Ответ без недочитанных смен лучше, чем таймаут всего хендлера
+            self.stats["refetch_timeouts"] += 1
+            log.warning("Shift index: %d refetches still pending, answering from the index", len(still))
+
+    def object_of(self, shift_id: int) -> Optional[int]:
+        """Объект смены по meta.object_bitrix_id её плана (None — смены нет в индексе)."""
+        key = self._key_of.get(int(shift_id))
+        return key[0] if key is not None else None
+
+    # --- жизненный цикл ---
+
+    def start(self) -> Optional[asyncio.Task]:
+        """Подписаться на изменения смен и построить индекс в фоне."""
+        if self._unsubscribe is None:
+            self._unsubscribe = self.bus.subscribe(self.on_change, entities=[SHIFT_ETID])
+            if self.poller is not None:
+                self.poller.want_fields(SHIFT_ETID, *self.fields())
+        return self._start_build()
+
+    async def stop(self) -> None:
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        tasks = [t for t in [self._build_task, *self._pending.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._build_task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats["shifts"] = len(self._key_of)
+        stats["keys"] = len(self._by_key)
+        stats["age_seconds"] = round(time.monotonic() - self.built_at, 1) if self.ready else -1
+        return stats
+
+
+def _build_index() -> ShiftIndex:
+    try:
+        rebuild = float(os.getenv("BITRIX_SHIFT_INDEX_REBUILD", str(6 * 3600)))
+    except ValueError:
+        rebuild = 6 * 3600.0
+    return ShiftIndex(rebuild_seconds=rebuild)
+
+
+# Общий индекс процесса (строится startup_shift_index)
+shift_index = _build_index()
+
+
+async def startup_shift_index() -> None:
+    if shift_index_enabled():
+        shift_index.start()
+    else:
+        log.info("Shift index disabled (BITRIX_SHIFT_INDEX=0)")
+
+
+async def shutdown_shift_index() -> None:
+    await shift_index.stop()
@@ -0,0 +1,77 @@
+"""Single-flight для одинаковых чтений из Bitrix24.
+
+Если несколько хендлеров или фоновых задач одновременно запрашивают одно и
+то же (тот же метод и тот же нормализованный payload), в сеть уходит один
+запрос, а все ожидающие получают его результат. Каждый ожидающий получает
+свою копию (как при чтении из bitrix_cache): lpa_data и w6_alerts
+нормализуют элементы на месте, и общий объект испортил бы ответ остальным.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+log = logging.getLogger("gpo.bitrix_singleflight")
+
+# Идемпотентные чтения, которые безопасно разделять между вызывающими
+SINGLEFLIGHT_METHODS = frozenset({
+    "crm.item.get",
+    "crm.item.list",
+    "crm.item.fields",
+    "crm.item.userfield.list",
+    "crm.type.list",
+    "disk.file.get",
+    "disk.file.getcontent",
+})
+
+
+def _normalize(value: Any, key: str = "") -> Any:
+    if isinstance(value, dict):
+        return {str(k): _normalize(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_normalize(v) for v in value]
+        # Порядок полей в select не влияет на ответ
+        if key == "select" and all(isinstance(v, str) for v in items):
+            return sorted(set(items))
+        return items
+    return value
+
+
+def request_key(method: str, payload: Dict[str, Any]) -> str:
+    """Ключ запроса: метод + payload с отсортированными ключами и select."""
+    body = json.dumps(_normalize(payload or {}), sort_keys=True, ensure_ascii=False, default=str)
+    return f"{method}:{body}"
+
+
+class SingleFlight:
+    """Разделяет выполнение одинаковых корутин, пока первая не завершилась."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "executed": 0, "shared": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executed"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.stats["shared"] += 1
+            log.debug("single-flight hit: %s", key[:120])
+        # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Помечаем исключение как полученное, даже если все ожидающие ушли
+            task.exception()
+
+    def inflight(self) -> int:
+        return len(self._inflight)
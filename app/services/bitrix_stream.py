@@ -0,0 +1,104 @@
+"""Инкрементальный разбор списочных ответов Bitrix24.
+
+``r.json()`` держит в памяти одновременно сырое тело ответа и всё дерево
+объектов: страница crm.item.list с ``select *`` (JSON плана/факта, файлы)
+весит мегабайты. ItemsStreamDecoder получает тело кусками по мере прихода
+из сети и отдаёт элементы ``result.<items_key>`` по одному, поэтому в памяти
+остаются только текущий кусок и недочитанный элемент.
+
+Декодер рассчитан на обычную форму ответа ``{"result": {"items": [...]},
+...}``. Если ответ выглядит иначе (ошибка, другой порядок ключей), он
+просто накапливает тело целиком и отдаёт его в close() — как r.json().
+"""
+
+import codecs
+import json
+import re
+from typing import Any, List, Optional
+
+# Длина начала ответа, по которой уже ясно, подходит ли он под потоковый разбор
+_PREFIX_PROBE = 256
+
+_PREFIX, _ITEMS, _TAIL, _RAW = "prefix", "items", "tail", "raw"
+
+
+class ItemsStreamDecoder:
+    """Разбор ``{"result": {"<items_key>": [...]}, ...}`` по кускам.
+
+    feed() возвращает элементы, полностью пришедшие к этому моменту;
+    close() — остаток ответа (time, next, total, error) как dict с пустым
+    списком элементов, а для непотокового ответа — весь ответ.
+    """
+
+    def __init__(self, items_key: str = "items"):
+        self.items_key = items_key
+        self._prefix_re = re.compile(r'\s*\{\s*"result"\s*:\s*\{\s*"%s"\s*:\s*\[' % re.escape(items_key))
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._state = _PREFIX
+        # С какой позиции буфера в прошлый раз не хватило данных на элемент
+        self._stalled_at: Optional[int] = None
+        self.items_total = 0
+        self.peak_buffer = 0
+
+    @property
+    def streaming(self) -> bool:
+        """Ответ разбирается потоково (иначе тело копится целиком)."""
+        return self._state in (_ITEMS, _TAIL)
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._buf += self._utf8.decode(chunk)
+        self.peak_buffer = max(self.peak_buffer, len(self._buf))
+        if self._state == _PREFIX:
+            m = self._prefix_re.match(self._buf)
+            if m:
+                self._buf = self._buf[m.end():]
+                self._state = _ITEMS
+            elif len(self._buf) >= _PREFIX_PROBE:
+                self._state = _RAW
+        if self._state != _ITEMS:
+            return []
+        return self._drain()
+
+    def _drain(self) -> List[Any]:
+        buf = self._buf
+        if self._stalled_at is not None and "}" not in buf[self._stalled_at:]:
+            # Недочитанный элемент ещё не мог закончиться — не разбираем его заново
+            return []
+        self._stalled_at = None
+        out: List[Any] = []
+        pos, n = 0, len(buf)
+        while True:
+            while pos < n and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= n:
+                break
+            if buf[pos] == "]":
+                self._state = _TAIL
+                pos += 1
+                break
+            try:
+                item, end = self._json.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                self._stalled_at = n - pos
+                break
+            if end >= n and not isinstance(item, (dict, list)):
+                # Скаляр мог оборваться на границе куска (число) — ждём следующий
+                self._stalled_at = n - pos
+                break
+            out.append(item)
+            pos = end
+        self._buf = buf[pos:]
+        self.items_total += len(out)
+        return out
+
+    def close(self) -> Any:
+        """Остаток ответа после элементов (или весь ответ для непотокового разбора)."""
+        self._buf += self._utf8.decode(b"", final=True)
+        if self._state == _ITEMS:
+            raise ValueError("Bitrix response ended inside result.%s" % self.items_key)
+        if self._state == _TAIL:
+            # Хвост начинается сразу после "]": дописываем открытое начало ответа
+            return json.loads('{"result":{"%s":[]' % self.items_key + self._buf)
+        return json.loads(self._buf) if self._buf.strip() else {}
@@ -0,0 +1,106 @@
+"""Адаптивные таймауты вызовов Bitrix24 и дедлайн взаимодействия с ботом.
+
+Вместо одного таймаута на всё (40 с в http_client, 60 с в bitrix, 30 с на
+скачивание фото) бюджет попытки считается по методу: перцентиль скользящего
+окна задержек успешных попыток (bitrix_metrics.attempt_percentile),
+умноженный на запас, в пределах [floor, ceiling]. Пока статистики мало,
+используется прежний таймаут по умолчанию. Тяжёлые методы (загрузка и
+скачивание файлов) получают собственные значения по умолчанию и потолок.
+
+Дедлайн — абсолютный момент (time.monotonic) в contextvar. Его выставляет
+middleware бота на каждое сообщение/callback; все вызовы Bitrix внутри
+хендлера (и порождённые им задачи) укорачивают таймаут до остатка дедлайна
+и не начинают новых попыток и пауз, если остатка не хватает.
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.bitrix_metrics import bitrix_metrics
+from app.utils.env import env_float, env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.bitrix_timeouts")
+
+# Методы, время которых зависит от размера файла, а не от портала
+HEAVY_METHODS = frozenset({
+    "disk.folder.uploadfile",
+    "disk.storage.uploadfile",
+    "disk.file.getcontent",
+    "disk.download",
+})
+
+# Меньше этого остатка дедлайна новую попытку не начинаем
+_MIN_ATTEMPT_SECONDS = 1.0
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("bitrix_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Ограничить блок (и порождённые в нём задачи) дедлайном через seconds секунд.
+
+    Вложенный дедлайн не может быть позже внешнего. None — без ограничения.
+    """
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        at = min(at, outer)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (None — дедлайна нет)."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return at - time.monotonic()
+
+
+def budget(method: str) -> float:
+    """Таймаут попытки метода по скользящим перцентилям, в пределах [floor, ceiling]."""
+    heavy = method in HEAVY_METHODS
+    default = env_float("BITRIX_TIMEOUT_HEAVY_DEFAULT" if heavy else "BITRIX_TIMEOUT_DEFAULT", 60 if heavy else 40)
+    floor = env_float("BITRIX_TIMEOUT_FLOOR", 5)
+    ceiling = env_float("BITRIX_TIMEOUT_HEAVY_CEILING" if heavy else "BITRIX_TIMEOUT_CEILING", 120 if heavy else 60)
+    p = bitrix_metrics.attempt_percentile(
+        method,
+        env_float("BITRIX_TIMEOUT_QUANTILE", 0.99),
+        env_int("BITRIX_TIMEOUT_MIN_SAMPLES", 20),
+    )
+    if p is None:
+        return min(max(default, floor), ceiling)
+    return min(max(p * env_float("BITRIX_TIMEOUT_FACTOR", 3), floor), ceiling)
+
+
+def attempt_timeout(method: str) -> Tuple[float, bool]:
+    """
+    Таймаут очередной попытки с учётом дедлайна.
+
+    Returns:
+        (таймаут, урезан_дедлайном); таймаут <= 0 — время вышло, попытку не начинать
+    """
+    own = budget(method)
+    left = remaining()
+    if left is not None and left < own:
+        return (left if left >= _MIN_ATTEMPT_SECONDS else 0.0), True
+    return own, False
+
+
+def can_wait(seconds: float) -> bool:
+    """Хватит ли остатка дедлайна на паузу и хотя бы минимальную попытку после неё."""
+    left = remaining()
+    return left is None or left - seconds > _MIN_ATTEMPT_SECONDS
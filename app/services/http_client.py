@@ -2,22 +2,69 @@
 
 import asyncio
 import httpx
+import importlib.util
+import logging
 import os
 import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from app.services.bitrix_batch import BATCHABLE_METHODS, BatchCoalescer, bx_batch, current_window
+from app.services.bitrix_breaker import bitrix_breakers, breaker_enabled
+from app.services.bitrix_cache import CACHED_METHODS, WRITE_METHODS, bitrix_cache, cache_enabled
+from app.services.bitrix_changes import publish_write
+from app.services.bitrix_metrics import bitrix_metrics
+from app.services.bitrix_ratelimit import bitrix_limiter
+from app.services.bitrix_select import select_stats
+from app.services.bitrix_singleflight import SINGLEFLIGHT_METHODS, SingleFlight, request_key
+from app.services.bitrix_stream import ItemsStreamDecoder
+from app.services.bitrix_timeouts import attempt_timeout, can_wait, remaining
+from app.utils.env import env_float, env_int
+
 # Загружаем переменные окружения из .env ПЕРЕД использованием
 load_dotenv()
 
 # Получаем BITRIX_WEBHOOK_URL после загрузки .env
 BITRIX = os.getenv("BITRIX_WEBHOOK_URL")
 
+log = logging.getLogger("gpo.http_client")
+
 
 class BitrixError(RuntimeError):
     """Ошибка при работе с Bitrix24 API."""
     pass
 
 
+class BitrixUnavailable(BitrixError):
+    """Breaker метода разомкнут: Bitrix недавно часто падал, запрос не отправлялся."""
+
+    def __init__(self, method: str, retry_after: float):
+        super().__init__(f"{method}: Bitrix temporarily unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.method = method
+        self.retry_after = retry_after
+
+
+class BitrixTimeout(BitrixError):
+    """Дедлайн взаимодействия исчерпан: Bitrix не ответил вовремя."""
+
+    def __init__(self, method: str):
+        super().__init__(f"{method}: Bitrix did not respond within the interaction deadline")
+        self.method = method
+
+
+async def acquire_slot(method: str) -> float:
+    """Токен лимитера, но не дольше остатка дедлайна (иначе BitrixTimeout)."""
+    left = remaining()
+    if left is None:
+        return await bitrix_limiter.acquire()
+    try:
+        return await asyncio.wait_for(bitrix_limiter.acquire(), max(0.0, left))
+    except asyncio.TimeoutError:
+        raise BitrixTimeout(method) from None
+
+
 def get_bitrix_url() -> str:
     """Получить BITRIX_WEBHOOK_URL с динамической загрузкой."""
     # Перезагружаем .env на случай, если он изменился
@@ -28,50 +75,638 @@ def get_bitrix_url() -> str:
     return url
 
 
-async def bx(method: str, payload: dict, *, retries: int = 3) -> dict:
+# --- Общий пул соединений -------------------------------------------------
+#
+# Один AsyncClient на процесс: keep-alive соединения переиспользуются между
+# вызовами bx / bx_get / bx_post, и каждый запрос больше не платит за новый
+# TCP+TLS handshake. Клиент создаётся лениво (скрипты и тесты работают без
+# явного старта), но в боте и aiohttp-приложении жизненным циклом управляют
+# startup_http_client() / shutdown_http_client().
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+_pool_stats: Dict[str, int] = {
+    "requests": 0,
+    "tcp_connects": 0,
+    "tls_handshakes": 0,
+}
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 включается, если не отключён в .env и установлен пакет h2."""
+    if os.getenv("BITRIX_HTTP2", "1").strip().lower() in ("0", "false", "no", "off"):
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log.info("HTTP/2 disabled: package 'h2' is not installed (pip install 'httpx[http2]')")
+        return False
+    return True
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=env_int("BITRIX_HTTP_MAX_CONNECTIONS", 20),
+        max_keepalive_connections=env_int("BITRIX_HTTP_MAX_KEEPALIVE", 10),
+        keepalive_expiry=env_float("BITRIX_HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+    http2 = _http2_enabled()
+    log.info(
+        "HTTP pool created: max_connections=%s keepalive=%s expiry=%.0fs http2=%s",
+        limits.max_connections,
+        limits.max_keepalive_connections,
+        limits.keepalive_expiry,
+        http2,
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2, timeout=60)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Вернуть общий AsyncClient, создав его при первом обращении.
+
+    Клиент привязан к event loop, в котором был создан: если скрипт вызывает
+    asyncio.run() несколько раз, для нового цикла создаётся новый клиент.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+
+async def startup_http_client() -> httpx.AsyncClient:
+    """Инициализация пула при старте приложения."""
+    return get_http_client()
+
+
+async def shutdown_http_client() -> None:
+    """Закрыть пул и вывести статистику переиспользования соединений."""
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    stats = pool_stats()
+    log.info(
+        "HTTP pool closed: requests=%s tcp_connects=%s tls_handshakes=%s handshakes_saved=%s",
+        stats["requests"],
+        stats["tcp_connects"],
+        stats["tls_handshakes"],
+        stats["handshakes_saved"],
+    )
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def pool_stats() -> Dict[str, int]:
+    """Счётчики пула: сколько запросов обошлось без нового соединения."""
+    stats = dict(_pool_stats)
+    stats["handshakes_saved"] = max(0, stats["requests"] - stats["tcp_connects"])
+    return stats
+
+
+async def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    """httpcore trace-хук: считаем реальные установки соединений."""
+    if event_name == "connection.connect_tcp.complete":
+        _pool_stats["tcp_connects"] += 1
+    elif event_name == "connection.start_tls.complete":
+        _pool_stats["tls_handshakes"] += 1
+
+
+async def http_request(method_http: str, url: str, **kw: Any) -> httpx.Response:
+    """Выполнить HTTP-запрос через общий пул соединений."""
+    client = get_http_client()
+    extensions = dict(kw.pop("extensions", None) or {})
+    extensions.setdefault("trace", _trace)
+    _pool_stats["requests"] += 1
+    return await client.request(method_http, url, extensions=extensions, **kw)
+
+
+@asynccontextmanager
+async def http_stream(method_http: str, url: str, **kw: Any) -> AsyncIterator[httpx.Response]:
+    """Потоковый HTTP-запрос через общий пул (тело читается по кускам)."""
+    client = get_http_client()
+    extensions = dict(kw.pop("extensions", None) or {})
+    extensions.setdefault("trace", _trace)
+    _pool_stats["requests"] += 1
+    async with client.stream(method_http, url, extensions=extensions, **kw) as r:
+        yield r
+
+
+async def bx(method: str, payload: dict, *, retries: int = 3, cache: bool = True) -> dict:
     """
     Надёжный клиент для Bitrix24 REST API с автоматическими ретраями.
-    
+
+    Чтения crm.item.get/list обслуживаются из короткоживущего кэша
+    (app.services.bitrix_cache), который сбрасывается записями через bx.
+    Одинаковые чтения, выполняющиеся одновременно, разделяют один запрос
+    (app.services.bitrix_singleflight), а разные чтения из BATCHABLE_METHODS
+    склеиваются в один запрос batch (app.services.bitrix_batch).
+
     Args:
         method: Метод Bitrix24 API (например, "crm.item.add")
         payload: Параметры запроса
         retries: Количество попыток при ошибках
-        
+        cache: False — не читать и не класть результат в кэш
+
     Returns:
         Результат из data["result"]
-        
+
     Raises:
         BitrixError: При ошибках API или после исчерпания попыток
     """
+    if method in WRITE_METHODS:
+        try:
+            result = await _dispatch(method, payload, retries)
+        finally:
+            bitrix_cache.invalidate_write(method, payload)
+        await publish_write(method, payload, result)
+        return result
+
+    cacheable = cache and method in CACHED_METHODS and cache_enabled()
+    if cacheable:
+        hit, value = bitrix_cache.get(method, payload)
+        if hit:
+            return value
+        generation = bitrix_cache.generation(payload)
+
+    if method in SINGLEFLIGHT_METHODS:
+        result = await _per_loop("singleflight", SingleFlight).do(
+            request_key(method, payload),
+            lambda: _dispatch(method, payload, retries),
+        )
+    else:
+        result = await _dispatch(method, payload, retries)
+
+    # Размер ответов с полным select — база для оценки экономии узких select
+    select_stats.observe_response(method, payload, result)
+    if cacheable:
+        bitrix_cache.put(method, payload, result, generation)
+    return result
+
+
+async def _dispatch(method: str, payload: dict, retries: int) -> Any:
+    window = current_window() if method in BATCHABLE_METHODS else None
+    if window is not None:
+        return await _per_loop("batch", lambda: BatchCoalescer(_call)).submit(method, payload, window, retries)
+    return await _call(method, payload, retries=retries)
+
+
+# --- Постраничное чтение -----------------------------------------------------
+
+BITRIX_PAGE_SIZE = 50
+
+
+def _page_items(result: Any, items_key: str) -> List[dict]:
+    if isinstance(result, dict):
+        items = result.get(items_key, [])
+    else:
+        items = result
+    return items if isinstance(items, list) else []
+
+
+class _StreamFallback(Exception):
+    """Страницу не удалось прочитать потоково, элементы ещё не отданы — читаем через bx."""
+
+
+class _StreamInterrupted(Exception):
+    """Поток оборвался после части элементов — страницу продолжаем с курсора."""
+
+
+def stream_enabled() -> bool:
+    return os.getenv("BITRIX_STREAM_JSON", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+async def _stream_page(method: str, payload: dict, items_key: str) -> AsyncIterator[List[dict]]:
+    """
+    Одна страница списочного метода с потоковым разбором ответа.
+
+    Элементы отдаются группами по мере прихода из сети (ItemsStreamDecoder),
+    без загрузки всего ответа в память. Лимитер, breaker, адаптивный таймаут
+    и метрики — как в _call; повторов здесь нет: до первого элемента ошибка
+    превращается в _StreamFallback (страница перечитывается через bx с
+    ретраями), после — в _StreamInterrupted.
+    """
+    url = f"{get_bitrix_url()}/{method}"
+    breaker = bitrix_breakers.get(method) if breaker_enabled() else None
+    if breaker is not None and not breaker.allow():
+        raise BitrixUnavailable(method, breaker.retry_after())
+
+    started = time.monotonic()
+    queue_wait = 0.0
+    bytes_out = bytes_in = 0
+    outcome = "exception"
+    yielded = 0
+    verdict = False
+    try:
+        queue_wait = await acquire_slot(method)
+        timeout, capped = attempt_timeout(method)
+        if timeout <= 0:
+            outcome = "deadline"
+            raise BitrixTimeout(method)
+        decoder = ItemsStreamDecoder(items_key)
+        try:
+            async with http_stream("POST", url, json=payload, timeout=timeout) as r:
+                bytes_out = len(r.request.content)
+                if r.status_code != 200:
+                    await r.aread()
+                    bytes_in = len(r.content)
+                    outcome = f"http_{r.status_code}"
+                    if r.status_code == 429:
+                        bitrix_limiter.on_throttled()
+                    elif r.status_code >= 500 and breaker is not None:
+                        breaker.record_failure()
+                        verdict = True
+                    raise _StreamFallback(outcome)
+                async for chunk in r.aiter_bytes():
+                    bytes_in += len(chunk)
+                    items = decoder.feed(chunk)
+                    if items:
+                        yielded += len(items)
+                        yield items
+            rest = decoder.close()
+        except httpx.TimeoutException:
+            if capped:
+                outcome = "deadline"
+                raise BitrixTimeout(method) from None
+            if breaker is not None:
+                breaker.record_failure()
+                verdict = True
+            raise (_StreamInterrupted if yielded else _StreamFallback)(method)
+        except (httpx.TransportError, ValueError):
+            if breaker is not None:
+                breaker.record_failure()
+                verdict = True
+            raise (_StreamInterrupted if yielded else _StreamFallback)(method)
+
+        if isinstance(rest, dict) and "error" in rest:
+            outcome = str(rest["error"])
+            if outcome == "QUERY_LIMIT_EXCEEDED":
+                bitrix_limiter.on_throttled()
+            raise (_StreamInterrupted if yielded else _StreamFallback)(outcome)
+
+        if breaker is not None:
+            breaker.record_success()
+            verdict = True
+        bitrix_limiter.on_success()
+        bitrix_metrics.observe_attempt(method, time.monotonic() - started - queue_wait)
+        outcome = "ok"
+        if not decoder.streaming:
+            # Ответ нестандартной формы — разобран целиком, как r.json()
+            items = _page_items(rest.get("result") if isinstance(rest, dict) else None, items_key)
+            if items:
+                yield items
+    finally:
+        if breaker is not None and not verdict:
+            breaker.release_probe()
+        bitrix_metrics.observe(
+            method,
+            status=outcome,
+            retries=0,
+            bytes_out=bytes_out,
+            bytes_in=bytes_in,
+            queue_wait=queue_wait,
+            latency=time.monotonic() - started,
+        )
+
+
+async def _page_groups(method: str, payload: dict, items_key: str) -> AsyncIterator[List[dict]]:
+    """Элементы страницы группами: потоково, а при отказе потока — через bx с ретраями."""
+    if stream_enabled():
+        try:
+            async for items in _stream_page(method, payload, items_key):
+                yield items
+            return
+        except _StreamFallback as e:
+            log.debug("Streaming %s fell back to bx: %s", method, e)
+    items = _page_items(await bx(method, payload, cache=False), items_key)
+    if items:
+        yield items
+
+
+async def _keyset_pages(
+    method: str,
+    payload: dict,
+    *,
+    descending: bool,
+    bounds: Tuple[Optional[int], Optional[int]] = (None, None),
+    items_key: str,
+) -> AsyncIterator[List[dict]]:
+    """
+    Страницы по ключу id: order id + фильтр >id/<id и start=-1 (без подсчёта total).
+
+    Элементы приходят группами по мере разбора ответа (см. _stream_page);
+    оборванная посреди страница дочитывается с последнего полученного id.
+    """
+    base_filter = dict(payload.get("filter") or {})
+    lo, hi = bounds
+    if lo is not None:
+        base_filter[">=id"] = lo
+    if hi is not None:
+        base_filter["<=id"] = hi
+    cursor: Optional[int] = None
+    interruptions = 0
+    while True:
+        page_filter = dict(base_filter)
+        if cursor is not None:
+            page_filter["<id" if descending else ">id"] = cursor
+        page_payload = {
+            **payload,
+            "filter": page_filter,
+            "order": {"id": "DESC" if descending else "ASC"},
+            "start": -1,
+        }
+        count = 0
+        try:
+            async for items in _page_groups(method, page_payload, items_key):
+                count += len(items)
+                cursor = int(items[-1]["id"])
+                yield items
+        except _StreamInterrupted as e:
+            interruptions += 1
+            if interruptions > 3:
+                raise BitrixError(f"{method}: response stream interrupted ({e})") from None
+            log.warning("Bitrix stream %s interrupted after %d items, resuming from id %s", method, count, cursor)
+            continue
+        if count < BITRIX_PAGE_SIZE:
+            return
+
+
+async def _id_range(method: str, payload: dict, items_key: str) -> Optional[Tuple[int, int]]:
+    """Минимальный и максимальный id выборки (две лёгкие страницы по 1 полю)."""
+    probe = {**payload, "select": ["id"], "start": -1}
+    async with bx_batch():
+        first, last = await asyncio.gather(
+            bx(method, {**probe, "order": {"id": "ASC"}}, cache=False),
+            bx(method, {**probe, "order": {"id": "DESC"}}, cache=False),
+        )
+    first_items, last_items = _page_items(first, items_key), _page_items(last, items_key)
+    if not first_items or not last_items:
+        return None
+    return int(first_items[0]["id"]), int(last_items[0]["id"])
+
+
+async def bx_iter(
+    method: str,
+    payload: dict,
+    *,
+    descending: bool = False,
+    shards: int = 1,
+    items_key: str = "items",
+) -> AsyncIterator[dict]:
+    """
+    Потоково перебрать все элементы списочного метода (crm.item.list).
+
+    Использует быстрый режим Bitrix24: сортировка по id, фильтр >id
+    (или <id при descending) и start=-1, поэтому портал не считает total.
+    Элементы отдаются по мере прихода страниц, а не одним большим списком.
+
+    Args:
+        method: Списочный метод (например, "crm.item.list")
+        payload: entityTypeId, filter, select; order/start будут заменены
+        descending: Идти от новых id к старым
+        shards: Сколько диапазонов id читать параллельно (порядок тогда не гарантирован)
+        items_key: Ключ списка в result
+    """
+    if shards <= 1:
+        async for items in _keyset_pages(method, payload, descending=descending, items_key=items_key):
+            for item in items:
+                yield item
+        return
+
+    id_range = await _id_range(method, payload, items_key)
+    if id_range is None:
+        return
+    lo, hi = id_range
+    step = max(1, (hi - lo + shards) // shards)
+    ranges = [(start, min(start + step - 1, hi)) for start in range(lo, hi + 1, step)]
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=len(ranges) * 2)
+    done = object()
+
+    async def worker(bounds: Tuple[int, int]) -> None:
+        cancelled = False
+        try:
+            async for items in _keyset_pages(
+                method, payload, descending=descending, bounds=bounds, items_key=items_key,
+            ):
+                await queue.put(items)
+        except asyncio.CancelledError:
+            # Потребитель ушёл и очередь никто не разбирает — метку не ставим
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                await queue.put(done)
+
+    tasks = [asyncio.create_task(worker(r)) for r in ranges]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            items = await queue.get()
+            if items is done:
+                remaining -= 1
+                continue
+            for item in items:
+                yield item
+        # Пробрасываем ошибку шарда, если была
+        for t in tasks:
+            t.result()
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Очереди склейки и single-flight живут в своём event loop (как и пул соединений)
+_loop_state: Dict[str, Any] = {}
+
+
+def _per_loop(name: str, factory: Callable[[], Any]) -> Any:
+    loop = asyncio.get_running_loop()
+    bound = _loop_state.get(name)
+    if bound is None or bound[0] is not loop:
+        bound = (loop, factory())
+        _loop_state[name] = bound
+    return bound[1]
+
+
+def _loop_stats(name: str, default: Dict[str, int]) -> Dict[str, int]:
+    bound = _loop_state.get(name)
+    return dict(bound[1].stats) if bound else dict(default)
+
+
+def batch_stats() -> Dict[str, int]:
+    """Сколько вызовов bx ушло в сеть отдельными запросами и пачками."""
+    return _loop_stats("batch", {"calls": 0, "requests": 0, "batches": 0})
+
+
+def singleflight_stats() -> Dict[str, int]:
+    """Сколько одинаковых чтений разделили один запрос."""
+    return _loop_stats("singleflight", {"calls": 0, "executed": 0, "shared": 0})
+
+
+# Идемпотентные чтения, которые можно хеджировать вторым запросом.
+# batch сюда входит потому, что коалесцер склеивает только чтения (BATCHABLE_METHODS).
+HEDGE_METHODS = SINGLEFLIGHT_METHODS | {"batch"}
+
+
+def _hedge_delay(method: str) -> Optional[float]:
+    """Через сколько секунд отправить второй запрос (None — не хеджировать)."""
+    if method not in HEDGE_METHODS:
+        return None
+    if os.getenv("BITRIX_HEDGE", "0").strip().lower() in ("0", "false", "no", "off", ""):
+        return None
+    p = bitrix_metrics.attempt_percentile(
+        method,
+        env_float("BITRIX_HEDGE_QUANTILE", 0.95),
+        env_int("BITRIX_HEDGE_MIN_SAMPLES", 20),
+    )
+    if p is None:
+        return None
+    return max(p, env_float("BITRIX_HEDGE_MIN_DELAY", 0.05))
+
+
+async def _send(method: str, url: str, payload: dict, timeout: float) -> httpx.Response:
+    """
+    POST в Bitrix; для чтений при BITRIX_HEDGE=1 — с хеджированием.
+
+    Если ответ не пришёл за p95 задержки метода, отправляется второй такой же
+    запрос (через лимитер), побеждает первый успешный, второй отменяется.
+    """
+    delay = _hedge_delay(method)
+    if delay is None:
+        return await http_request("POST", url, json=payload, timeout=timeout)
+
+    primary = asyncio.ensure_future(http_request("POST", url, json=payload, timeout=timeout))
+    hedge: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done:
+            await acquire_slot(method)
+        if primary.done():
+            return primary.result()
+        hedge = asyncio.ensure_future(http_request("POST", url, json=payload, timeout=timeout))
+        bitrix_metrics.observe_hedge(method, "fired")
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        bitrix_metrics.observe_hedge(method, "won")
+                    return task.result()
+        # оба запроса упали — отдаём ошибку основного
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _call(method: str, payload: dict, *, retries: int = 3) -> Any:
+    """Один HTTP-вызов метода Bitrix24 с ретраями на временных ошибках."""
     # Получаем URL динамически при каждом вызове
     bitrix_url = get_bitrix_url()
-    
+
     url = f"{bitrix_url}/{method}"
-    
+    breaker = bitrix_breakers.get(method) if breaker_enabled() else None
+
     backoff = 0.6
-    async with httpx.AsyncClient(timeout=40) as client:
+    started = time.monotonic()
+    queue_wait = 0.0
+    bytes_out = bytes_in = 0
+    outcome = "exception"
+    attempt = 1
+    try:
         for attempt in range(1, retries + 1):
-            r = await client.post(url, json=payload)
+            # Разомкнутый breaker: не ждём таймаутов деградировавшего портала
+            if breaker is not None and not breaker.allow():
+                outcome = "circuit_open"
+                raise BitrixUnavailable(method, breaker.retry_after())
+            outcome = "exception"
+            # Темп задаёт общий лимитер, а не случайные паузы после 429
+            try:
+                queue_wait += await acquire_slot(method)
+            except BaseException:
+                # Дедлайн или отмена в очереди лимитера — проба не состоялась
+                if breaker is not None:
+                    breaker.release_probe()
+                raise
+            # Бюджет попытки — по задержкам метода, урезанный остатком дедлайна
+            timeout, capped = attempt_timeout(method)
+            if timeout <= 0:
+                if breaker is not None:
+                    breaker.release_probe()
+                outcome = "deadline"
+                raise BitrixTimeout(method)
+            sent = time.monotonic()
+            try:
+                r = await _send(method, url, payload, timeout)
+            except httpx.TimeoutException:
+                if capped:
+                    # Не успели в дедлайн бота — это не отказ портала
+                    if breaker is not None:
+                        breaker.release_probe()
+                    outcome = "deadline"
+                    raise BitrixTimeout(method) from None
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            except httpx.TransportError:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.release_probe()
+                raise
+            bytes_out += len(r.request.content)
+            bytes_in += len(r.content)
             status = r.status_code
             data = {}
             try:
                 data = r.json()
             except Exception:
                 pass
-            
+
+            # 5xx — отказ портала; 429 — забота лимитера; ошибки приложения — портал жив
+            throttled = status == 429 or data.get("error") == "QUERY_LIMIT_EXCEEDED"
+            if breaker is not None:
+                if status >= 500:
+                    breaker.record_failure()
+                elif throttled:
+                    breaker.release_probe()
+                else:
+                    breaker.record_success()
+
             # успех
             if status == 200 and "error" not in data:
+                bitrix_limiter.on_success()
+                bitrix_metrics.observe_attempt(method, time.monotonic() - sent)
+                outcome = "ok"
                 return data.get("result", {})
-            
+
+            if throttled:
+                bitrix_limiter.on_throttled()
+            outcome = str(data.get("error") or f"http_{status}")
+
             # временные: 429/502/503/504 или «поспешные» 400 после свежего создания
             transient = status in (429, 502, 503, 504) or (status == 400 and attempt == 1)
-            if attempt < retries and transient:
-                await asyncio.sleep(backoff + random.uniform(0, 0.4))
+            pause = backoff + random.uniform(0, 0.4)
+            if attempt < retries and transient and can_wait(pause):
+                await asyncio.sleep(pause)
                 backoff *= 1.7
                 continue
-            
+
             # финальная ошибка
             err = data.get("error_description") or data.get("error") or f"HTTP {status}"
             raise BitrixError(f"{method}: {err}")
-
-
+    finally:
+        bitrix_metrics.observe(
+            method,
+            status=outcome,
+            retries=attempt - 1,
+            bytes_out=bytes_out,
+            bytes_in=bytes_in,
+            queue_wait=queue_wait,
+            latency=time.monotonic() - started,
+        )
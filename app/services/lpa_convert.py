@@ -0,0 +1,414 @@
+"""Конвертация DOCX → PDF через пул долгоживущих LibreOffice.
+
+lpa_pdf.docx_to_pdf на каждый ЛПА запускает холодный ``soffice --headless``:
+секунды на старт, а параллельные конвертации дерутся за общий профиль
+пользователя. Здесь держится пул из LPA_SOFFICE_POOL процессов soffice:
+
+* у каждого свой профиль (``-env:UserInstallation``) и свой именованный
+  канал (``--accept=pipe,...;urp;``); байты DOCX передаются через UNO
+  потоком (``private:stream``) и так же возвращается PDF — без повторного
+  старта офиса и без промежуточных файлов;
+* перед выдачей процесс проверяется (жив ли, отвечает ли Desktop), упавший
+  перезапускается;
+* после LPA_SOFFICE_RECYCLE документов процесс перезапускается в фоне —
+  LibreOffice со временем копит память;
+* ждать свободный процесс может не больше LPA_SOFFICE_QUEUE запросов,
+  остальные (и любые ошибки пула) идут старым путём — docx_to_pdf через
+  временный каталог.
+
+На диск попадает только итоговый PDF, записанный атомарно (write_atomic):
+читатель никогда не увидит недописанный файл.
+
+UNO (модуль ``uno`` из пакета python3-uno / LibreOffice) — необязательная
+зависимость: без него или без soffice пул выключен, и всё работает как
+раньше.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+from app.utils.env import env_float, env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.lpa_convert")
+
+PathLike = Union[str, Path]
+
+
+def soffice_binary() -> str:
+    return os.getenv("LPA_SOFFICE_BIN", "soffice")
+
+
+def soffice_profile_dir(name: str) -> Path:
+    """Отдельный каталог профиля LibreOffice (UserInstallation) для процесса или потока."""
+    return Path(tempfile.gettempdir()) / "gpo_soffice" / f"{name}_{os.getpid()}"
+
+
+def write_atomic(path: PathLike, data: bytes) -> Path:
+    """Записать файл целиком или не записать вовсе: временный файл рядом + os.replace."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def uno_available() -> bool:
+    try:
+        import uno  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PoolBusy(RuntimeError):
+    """Очередь к пулу заполнена — конвертировать старым путём."""
+
+
+class PoolUnavailable(RuntimeError):
+    """Пул выключен или не запущен."""
+
+
+class SofficeWorker:
+    """Один headless LibreOffice, управляемый по UNO через именованный канал.
+
+    Все методы блокирующие — пул вызывает их в своих потоках.
+    """
+
+    def __init__(self, index: int, *, binary: str, start_timeout: float = 30.0):
+        self.index = index
+        self.binary = binary
+        self.start_timeout = start_timeout
+        self.pipe = f"gpo_soffice_{os.getpid()}_{index}"
+        self.profile = soffice_profile_dir(f"worker_{index}")
+        self.documents = 0
+        self._proc: Optional[subprocess.Popen] = None
+        self._ctx: Any = None
+        self._desktop: Any = None
+
+    def start(self) -> None:
+        import uno
+
+        self.profile.mkdir(parents=True, exist_ok=True)
+        self._proc = subprocess.Popen(
+            [
+                self.binary, "--headless", "--invisible", "--nologo", "--norestore",
+                "--nodefault", "--nolockcheck",
+                f"--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext",
+                f"-env:UserInstallation={self.profile.as_uri()}",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            try:
+                ctx = resolver.resolve(f"uno:pipe,name={self.pipe};urp;StarOffice.ComponentContext")
+                break
+            except Exception as e:
+                if self._proc.poll() is not None:
+                    raise RuntimeError(f"soffice worker {self.index} exited with code {self._proc.returncode}") from e
+                if time.monotonic() > deadline:
+                    self.kill()
+                    raise RuntimeError(f"soffice worker {self.index} did not accept connections in {self.start_timeout}s") from e
+                time.sleep(0.2)
+        self._ctx = ctx
+        self._desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        self.documents = 0
+
+    def alive(self) -> bool:
+        if self._proc is None or self._proc.poll() is not None or self._desktop is None:
+            return False
+        try:
+            self._desktop.getFrames().getCount()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _props(**values: Any) -> tuple:
+        from com.sun.star.beans import PropertyValue
+
+        props = []
+        for name, value in values.items():
+            prop = PropertyValue()
+            prop.Name, prop.Value = name, value
+            props.append(prop)
+        return tuple(props)
+
+    def convert(self, docx: bytes) -> bytes:
+        """DOCX → PDF в памяти: документ читается из потока и пишется в поток."""
+        import uno
+        import unohelper
+        from com.sun.star.io import XOutputStream
+
+        class _Sink(unohelper.Base, XOutputStream):
+            def __init__(self):
+                self.buffer = bytearray()
+
+            def writeBytes(self, seq):
+                self.buffer += seq.value
+
+            def flush(self):
+                pass
+
+            def closeOutput(self):
+                pass
+
+        source = self._ctx.ServiceManager.createInstanceWithContext("com.sun.star.io.SequenceInputStream", self._ctx)
+        source.initialize((uno.ByteSequence(docx),))
+        doc = self._desktop.loadComponentFromURL(
+            "private:stream", "_blank", 0, self._props(InputStream=source, Hidden=True, ReadOnly=True),
+        )
+        if doc is None:
+            raise RuntimeError("soffice could not open the document")
+        sink = _Sink()
+        try:
+            doc.storeToURL("private:stream", self._props(FilterName="writer_pdf_Export", OutputStream=sink))
+        finally:
+            doc.close(True)
+        self.documents += 1
+        return bytes(sink.buffer)
+
+    def stop(self) -> None:
+        if self._desktop is not None:
+            try:
+                self._desktop.terminate()
+            except Exception:
+                pass
+        self._ctx = self._desktop = None
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+        self._proc = None
+
+    def kill(self) -> None:
+        """Жёсткая остановка: освобождает поток, зависший в вызове UNO."""
+        self._ctx = self._desktop = None
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+
+class SofficePool:
+    """Пул процессов LibreOffice для конвертации DOCX → PDF.
+
+    Args:
+        size: Количество процессов soffice
+        max_documents: Документов на процесс до перезапуска (0 — не перезапускать)
+        queue_limit: Сколько запросов может ждать свободный процесс
+        timeout: Предельное время конвертации одного документа, сек
+        worker_factory: Создание процесса по номеру (по умолчанию SofficeWorker)
+    """
+
+    def __init__(
+        self,
+        *,
+        size: int = 2,
+        max_documents: int = 50,
+        queue_limit: int = 8,
+        timeout: float = 60.0,
+        worker_factory: Optional[Callable[[int], Any]] = None,
+    ):
+        self.size = max(0, size)
+        self.max_documents = max_documents
+        self.queue_limit = max(0, queue_limit)
+        self.timeout = timeout
+        self.worker_factory = worker_factory or (lambda i: SofficeWorker(i, binary=soffice_binary()))
+        self._workers: List[Any] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._background: set = set()
+        self._waiting = 0
+        self.stats: Dict[str, float] = {
+            "conversions": 0, "failures": 0, "busy": 0, "restarts": 0, "recycles": 0, "seconds_total": 0.0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def _run(self, fn: Callable, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self) -> None:
+        """Запустить процессы; не поднявшиеся перезапускаются при первой выдаче."""
+        if self.started or self.size == 0:
+            return
+        # Запас потоков: зависший в UNO вызов держит поток, пока процесс не убит
+        self._executor = ThreadPoolExecutor(max_workers=self.size * 2, thread_name_prefix="soffice")
+        self._idle = asyncio.Queue()
+        self._workers = [self.worker_factory(i) for i in range(self.size)]
+        results = await asyncio.gather(*(self._run(w.start) for w in self._workers), return_exceptions=True)
+        for worker, result in zip(self._workers, results, strict=True):
+            if isinstance(result, Exception):
+                log.warning("soffice worker %s failed to start: %s", worker.index, result)
+            self._idle.put_nowait(worker)
+        log.info("soffice pool started: %d workers", self.size - sum(isinstance(r, Exception) for r in results))
+
+    async def convert(self, docx: bytes) -> bytes:
+        """Сконвертировать байты DOCX в байты PDF на свободном процессе.
+
+        Raises:
+            PoolUnavailable: пул не запущен
+            PoolBusy: очередь ожидания заполнена
+        """
+        if not self.started:
+            raise PoolUnavailable("soffice pool is not started")
+        if self._idle.empty() and self._waiting >= self.queue_limit:
+            self.stats["busy"] += 1
+            raise PoolBusy(f"{self._waiting} conversions already waiting for soffice")
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        started = time.perf_counter()
+        try:
+            if not await self._run(worker.alive):
+                self.stats["restarts"] += 1
+                log.warning("soffice worker %s is not responding, restarting", worker.index)
+                await self._run(worker.restart)
+            pdf = await asyncio.wait_for(self._run(worker.convert, docx), self.timeout)
+            if not pdf:
+                raise RuntimeError("soffice returned an empty PDF")
+        except BaseException:
+            # Убитый процесс перезапустится при следующей выдаче
+            self.stats["failures"] += 1
+            worker.kill()
+            self._idle.put_nowait(worker)
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats["conversions"] += 1
+        self.stats["seconds_total"] += elapsed
+        log.info("soffice worker %s converted %d bytes of DOCX in %.2fs", worker.index, len(docx), elapsed)
+
+        if self.max_documents and worker.documents >= self.max_documents:
+            task = asyncio.create_task(self._recycle(worker))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        else:
+            self._idle.put_nowait(worker)
+        return pdf
+
+    async def _recycle(self, worker: Any) -> None:
+        self.stats["recycles"] += 1
+        try:
+            await self._run(worker.restart)
+            log.info("soffice worker %s recycled after %d documents", worker.index, self.max_documents)
+        except Exception as e:
+            log.warning("soffice worker %s recycle failed: %s", worker.index, e)
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def stop(self) -> None:
+        if not self.started:
+            return
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await asyncio.gather(*(self._run(w.stop) for w in self._workers), return_exceptions=True)
+        self._executor.shutdown(wait=False)
+        self._workers, self._idle, self._executor = [], None, None
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats["seconds_total"] = round(stats["seconds_total"], 3)
+        stats["workers"] = len(self._workers)
+        stats["idle"] = self._idle.qsize() if self._idle is not None else 0
+        stats["waiting"] = self._waiting
+        return stats
+
+
+# Общий пул процесса (запускается startup_lpa_converter)
+soffice_pool = SofficePool(
+    size=env_int("LPA_SOFFICE_POOL", 2),
+    max_documents=env_int("LPA_SOFFICE_RECYCLE", 50),
+    queue_limit=env_int("LPA_SOFFICE_QUEUE", 8),
+    timeout=env_float("LPA_SOFFICE_TIMEOUT", 60.0),
+)
+
+
+def _convert_via_files(docx: bytes, output_pdf: Path) -> Optional[Path]:
+    """Старый путь (soffice на документ / docx2pdf) через временный каталог."""
+    from app.services.lpa_pdf import docx_to_pdf
+
+    with tempfile.TemporaryDirectory(prefix="gpo_lpa_") as tmp:
+        src = Path(tmp) / f"{output_pdf.stem}.docx"
+        src.write_bytes(docx)
+        pdf = docx_to_pdf(src, src.with_suffix(".pdf"), True)
+        if pdf is None or not pdf.exists():
+            return None
+        return write_atomic(output_pdf, pdf.read_bytes())
+
+
+async def convert_docx_bytes(docx: bytes, output_pdf: PathLike) -> Optional[Path]:
+    """DOCX (байты) → PDF в output_pdf: пул soffice, при недоступности или ошибке — старый путь в потоке.
+
+    Returns:
+        Путь к PDF или None, если сконвертировать не удалось
+    """
+    output_pdf = Path(output_pdf)
+    if soffice_pool.started:
+        try:
+            pdf = await soffice_pool.convert(docx)
+            return await asyncio.to_thread(write_atomic, output_pdf, pdf)
+        except PoolBusy as e:
+            log.warning("soffice pool busy (%s), converting with a separate soffice", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("soffice pool conversion of %s failed: %s, converting with a separate soffice", output_pdf.name, e)
+    return await asyncio.to_thread(_convert_via_files, docx, output_pdf)
+
+
+async def startup_lpa_converter() -> None:
+    if soffice_pool.size == 0:
+        log.info("soffice pool disabled (LPA_SOFFICE_POOL=0)")
+        return
+    if shutil.which(soffice_binary()) is None:
+        log.info("soffice pool disabled: %s not found", soffice_binary())
+        return
+    if not uno_available():
+        log.info("soffice pool disabled: python module 'uno' is not installed")
+        return
+    await soffice_pool.start()
+
+
+async def shutdown_lpa_converter() -> None:
+    await soffice_pool.stop()
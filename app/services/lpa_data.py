@@ -2,16 +2,21 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 from typing import Any, Dict, List, Optional, Tuple
 
 from app.services.http_client import bx
+from app.services.bitrix_batch import bx_batch
+from app.services.bitrix_mirror import bitrix_mirror
+from app.services.bitrix_select import bx_projected
 from app.services.bitrix_ids import (
     SHIFT_ETID,
     RESOURCE_ETID,
     TIMESHEET_ETID,
     OBJECT_ETID,
+    UF_OBJECT_ADDRESS,
 )
 from app.bitrix_field_map import upper_to_camel
 from app.services.shift_meta import shift_type_display_label
@@ -65,27 +70,33 @@ async def _extract_shift_photos(item: dict, shift_bitrix_id: int) -> List[Dict[s
         except (ValueError, TypeError):
             pass
     
-    # Для каждого ID получаем downloadUrl через disk.file.get
-    out = []
-    for fid in file_ids:
+    # Для каждого ID получаем downloadUrl через disk.file.get (одним batch)
+    async def _file_info(fid):
         try:
-            file_data = await bx("disk.file.get", {"id": fid})
-            if file_data:
-                download_url = (
-                    file_data.get("downloadUrl") or 
-                    file_data.get("DOWNLOAD_URL") or
-                    file_data.get("downloadUrlDirect") or
-                    file_data.get("DOWNLOAD_URL_DIRECT") or
-                    file_data.get("detailUrl") or
-                    file_data.get("DETAIL_URL")
-                )
-                if download_url:
-                    out.append({
-                        "id": fid,
-                        "url": download_url
-                    })
+            return await bx("disk.file.get", {"id": fid})
         except Exception as e:
             logger.warning(f"[LPA] Could not get file info for {fid}: {e}")
+            return None
+    
+    async with bx_batch():
+        files_data = await asyncio.gather(*(_file_info(fid) for fid in file_ids))
+    
+    out = []
+    for fid, file_data in zip(file_ids, files_data):
+        if file_data:
+            download_url = (
+                file_data.get("downloadUrl") or 
+                file_data.get("DOWNLOAD_URL") or
+                file_data.get("downloadUrlDirect") or
+                file_data.get("DOWNLOAD_URL_DIRECT") or
+                file_data.get("detailUrl") or
+                file_data.get("DETAIL_URL")
+            )
+            if download_url:
+                out.append({
+                    "id": fid,
+                    "url": download_url
+                })
     
     return out
 
@@ -114,16 +125,17 @@ def read_field(item: Dict[str, Any], field_name: str) -> Any:
 
 
 async def _fetch_shift_item(shift_id: int) -> Dict[str, Any]:
-    """Получает смену из Bitrix24 с полным select для избежания проблемы "Array"."""
+    """Получает смену из Bitrix24 (поля из реестра; при "Array" — полный select)."""
     if not shift_id:
         return {}
+    mirrored = await bitrix_mirror.get(SHIFT_ETID, shift_id)
+    if mirrored is not None:
+        return mirrored
     try:
-        # ВАЖНО: используем select с ["id", "*", "ufCrm%"] чтобы поле привязки не схлопывалось в "Array"
-        result = await bx("crm.item.get", {
+        result = await bx_projected("crm.item.get", {
             "entityTypeId": SHIFT_ETID,
             "id": shift_id,
-            "select": ["id", "*", "ufCrm%"]  # Получаем все поля, включая пользовательские
-        })
+        }, "lpa.shift")
         logger.info(f"[LPA] Bitrix shift get: {shift_id}")
         if isinstance(result, dict):
             item = result.get("item", result) or {}
@@ -141,12 +153,16 @@ async def _fetch_resources(shift_id: int) -> List[Dict[str, Any]]:
     if not shift_id:
         return resources
     
+    mirrored = await bitrix_mirror.by_shift(RESOURCE_ETID, shift_id)
+    if mirrored is not None:
+        logger.info(f"[LPA] Loaded {len(mirrored)} resources for shift {shift_id} from mirror")
+        return mirrored
+    
     try:
-        result = await bx("crm.item.list", {
+        result = await bx_projected("crm.item.list", {
             "entityTypeId": RESOURCE_ETID,
             "filter": {"ufCrm9UfShiftId": shift_id},
-            "select": ["id", "*", "ufCrm%"]
-        })
+        }, "lpa.resources")
         
         items = result.get("items", []) if isinstance(result, dict) else (result if isinstance(result, list) else [])
         resources = items if isinstance(items, list) else []
@@ -163,12 +179,16 @@ async def _fetch_timesheet(shift_id: int) -> List[Dict[str, Any]]:
     if not shift_id:
         return timesheets
     
+    mirrored = await bitrix_mirror.by_shift(TIMESHEET_ETID, shift_id)
+    if mirrored is not None:
+        logger.info(f"[LPA] Loaded {len(mirrored)} timesheet entries for shift {shift_id} from mirror")
+        return mirrored
+    
     try:
-        result = await bx("crm.item.list", {
+        result = await bx_projected("crm.item.list", {
             "entityTypeId": TIMESHEET_ETID,
             "filter": {"ufCrm11UfShiftId": shift_id},
-            "select": ["id", "*", "ufCrm%"]
-        })
+        }, "lpa.timesheet")
         
         items = result.get("items", []) if isinstance(result, dict) else (result if isinstance(result, list) else [])
         timesheets = items if isinstance(items, list) else []
@@ -179,6 +199,20 @@ async def _fetch_timesheet(shift_id: int) -> List[Dict[str, Any]]:
     return timesheets
 
 
+async def _fetch_object_item(object_id: int) -> Dict[str, Any]:
+    """Получает карточку объекта (название и адрес)."""
+    mirrored = await bitrix_mirror.get(OBJECT_ETID, object_id)
+    if mirrored is not None:
+        return mirrored
+    obj_data = await bx_projected("crm.item.get", {
+        "entityTypeId": OBJECT_ETID,
+        "id": object_id,
+    }, "lpa.object")
+    if isinstance(obj_data, dict):
+        return obj_data.get("item", obj_data) or {}
+    return {}
+
+
 def _parse_json_field(raw: Any) -> Dict[str, Any]:
     """Парсит JSON поле из Bitrix24.
     
@@ -537,8 +571,15 @@ async def collect_lpa_data(
     
     # Загружаем ресурсы и табель
     logger.info(f"[LPA] ===== LOADING RESOURCES AND TIMESHEET =====")
-    resources = await _fetch_resources(shift_bitrix_id) if shift_bitrix_id else []
-    timesheets = await _fetch_timesheet(shift_bitrix_id) if shift_bitrix_id else []
+    # Ресурсы, табель и фото независимы: запрашиваем параллельно, Bitrix получает их одним batch
+    resources, timesheets, photos_uf = [], [], []
+    if shift_bitrix_id:
+        async with bx_batch():
+            resources, timesheets, photos_uf = await asyncio.gather(
+                _fetch_resources(shift_bitrix_id),
+                _fetch_timesheet(shift_bitrix_id),
+                _extract_shift_photos(shift_item, shift_bitrix_id),
+            )
     logger.info(f"[LPA] ⚠️ RESOURCES FROM BITRIX24: count={len(resources)}")
     if resources:
         for i, r in enumerate(resources[:3], 1):
@@ -553,9 +594,6 @@ async def collect_lpa_data(
             logger.info(f"[LPA] ⚠️ TIMESHEET {i}: worker={worker}, hours={hours}")
     logger.info(f"[LPA] ===== END LOADING RESOURCES AND TIMESHEET =====")
     
-    # Загружаем фото из Bitrix24 поля
-    photos_uf = await _extract_shift_photos(shift_item, shift_bitrix_id) if shift_bitrix_id else []
-    
     # Fallback к fact_json.photos (telegram file_id), если UF пусто
     photos = photos_uf
     if not photos:
@@ -586,14 +624,13 @@ async def collect_lpa_data(
                 logger.info(f"[LPA] Got object_bitrix_id from plan_json.meta: {object_bitrix_id_from_meta}")
     
     # 2. Fallback: если object_name не найден в meta, но есть object_bitrix_id - получаем из Bitrix
+    # Карточка объекта нужна и для названия, и для адреса: запрашиваем её один раз
+    object_item: Optional[Dict[str, Any]] = None
     if object_name == "Не указан" and object_bitrix_id_from_meta:
         try:
-            obj_data = await bx("crm.item.get", {
-                "entityTypeId": OBJECT_ETID,
-                "id": int(object_bitrix_id_from_meta)
-            })
-            if obj_data:
-                obj_item = obj_data.get("item", obj_data) if isinstance(obj_data, dict) else obj_data
+            object_item = await _fetch_object_item(int(object_bitrix_id_from_meta))
+            if object_item:
+                obj_item = object_item
                 obj_title = obj_item.get("title") or obj_item.get("TITLE") or f"Объект #{object_bitrix_id_from_meta}"
                 object_name = obj_title
                 logger.info(f"[LPA] Got object_name from Bitrix24 via plan_json.meta.object_bitrix_id: {object_name}")
@@ -866,15 +903,13 @@ async def collect_lpa_data(
                 object_bitrix_id = meta_in_plan.get("object_bitrix_id")
                 if object_bitrix_id:
                     try:
-                        obj_data = await bx("crm.item.get", {
-                            "entityTypeId": OBJECT_ETID,
-                            "id": int(object_bitrix_id),
-                            "select": ["id", "title", "*", "ufCrm%"]
-                        })
-                        if obj_data:
-                            obj_item = obj_data.get("item", obj_data) if isinstance(obj_data, dict) else obj_data
+                        if object_item is None:
+                            object_item = await _fetch_object_item(int(object_bitrix_id))
+                        if object_item:
+                            obj_item = object_item
                             # Пробуем разные варианты названий поля адреса
                             object_address = (
+                                read_field(obj_item, UF_OBJECT_ADDRESS) or
                                 read_field(obj_item, "UF_ADDRESS") or
                                 read_field(obj_item, "UF_CRM_ADDRESS") or
                                 read_field(obj_item, "address") or
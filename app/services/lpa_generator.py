@@ -7,7 +7,9 @@ from datetime import datetime
 from dataclasses import dataclass
 
 from app.services.lpa_data import collect_lpa_data
-from app.services.lpa_pdf import render_lpa_docx, docx_to_pdf, LPAPlaceholderError
+from app.services.lpa_convert import convert_docx_bytes
+from app.services.lpa_pdf import LPAPlaceholderError, lpa_docx_path
+from app.services.lpa_render_pool import render_lpa_docx_bytes
 from app.services.shift_client import bitrix_update_shift_aggregates
 
 log = logging.getLogger("gpo.lpa_generator")
@@ -30,10 +32,10 @@ async def generate_lpa_for_shift(
     Единая точка генерации ЛПА.
     
     1) collect_lpa_data
-    2) render_lpa_docx
-    3) docx_to_pdf (если есть)
-    4) удаление временных файлов (tmpl_*, tmp_*, промежуточный docx)
-    5) вернуть путь к финальному PDF (или docx, если PDF недоступен)
+    2) render_lpa_docx_bytes (в пуле процессов, DOCX только в памяти)
+    3) convert_docx_bytes → PDF (атомарная запись)
+    4) удаление старых временных файлов (tmpl_*, tmp_*)
+    5) вернуть путь к финальному PDF
     
     Args:
         shift_bitrix_id: Bitrix ID смены
@@ -139,14 +141,13 @@ async def generate_lpa_for_shift(
         
         log.info(f"[LPA GENERATOR] Rendering DOCX: prefix={filename_prefix}, object={object_name}")
         
-        # 5. Рендерим DOCX
+        # 5. Рендерим DOCX в память (пул процессов: цикл событий бота не блокируется)
+        docx_name = lpa_docx_path(context, output_dir, filename_prefix)
         try:
-            docx_path = render_lpa_docx(
+            docx_bytes = await render_lpa_docx_bytes(
                 template_path=template_path,
-                data=context,  # Единый контекст
-                out_dir=output_dir,
-                filename_prefix=filename_prefix,
-                photos=photos,
+                data=context,  # Единый контекст (фото — в context["photos"])
+                name=docx_name.name,
                 max_photos_in_doc=5,
             )
         except LPAPlaceholderError as placeholder_err:
@@ -155,34 +156,22 @@ async def generate_lpa_for_shift(
             )
             raise
         
-        if not docx_path.exists():
-            log.error(f"[LPA GENERATOR] Generated DOCX file does not exist: {docx_path}")
-            raise FileNotFoundError(f"Generated DOCX file does not exist: {docx_path}")
+        log.info(f"[LPA GENERATOR] DOCX rendered in memory: {docx_name.name} (size={len(docx_bytes)} bytes)")
         
-        log.info(f"[LPA GENERATOR] DOCX rendered successfully: {docx_path} (size={docx_path.stat().st_size} bytes)")
-        
-        # 6. Конвертируем в PDF (в executor, чтобы не блокировать event loop)
-        log.info(f"[LPA GENERATOR] LPA: converting file {docx_path} to PDF (non-blocking)")
-        import asyncio
+        # 6. Конвертируем в PDF (пул soffice; без него — отдельный soffice в потоке).
+        # На диск пишется только итоговый PDF, атомарно
+        log.info(f"[LPA GENERATOR] LPA: converting {docx_name.name} to PDF (non-blocking)")
         import time
         start_time = time.time()
-        loop = asyncio.get_event_loop()
-        pdf_path = await loop.run_in_executor(None, docx_to_pdf, docx_path, None, True)
+        pdf_path = await convert_docx_bytes(docx_bytes, docx_name.with_suffix(".pdf"))
         conversion_time = time.time() - start_time
         log.info(f"[LPA GENERATOR] PDF conversion completed in {conversion_time:.2f} seconds (non-blocking)")
         
         if not pdf_path or not pdf_path.exists():
-            raise RuntimeError(f"PDF conversion failed for {docx_path}")
+            raise RuntimeError(f"PDF conversion failed for {docx_name.name}")
         
         log.info(f"[LPA GENERATOR] PDF generated successfully: {pdf_path} (size={pdf_path.stat().st_size} bytes)")
         
-        # Удаляем промежуточный DOCX после успешной конвертации
-        try:
-            docx_path.unlink()
-            log.debug(f"[LPA GENERATOR] Deleted intermediate DOCX: {docx_path}")
-        except Exception as e:
-            log.debug(f"[LPA GENERATOR] Could not delete DOCX: {e}")
-        
         # 7. Очищаем временные файлы
         _cleanup_temp_files(output_dir)
         
@@ -1,16 +1,17 @@
 # lpa_pdf.py
 import os
 import subprocess
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from io import BytesIO
-import requests
 import logging
 import zipfile
 import re
 
-from docxtpl import DocxTemplate
+
+from app.services.lpa_template import get_compiled
 from docx.shared import Inches, Cm
 
 log = logging.getLogger("gpo.lpa_pdf")
@@ -29,45 +30,22 @@ class LPAPlaceholderError(RuntimeError):
             f"Rendered DOCX still contains {len(placeholders)} placeholder(s): {preview}"
         )
 
+    def __reduce__(self):
+        # Ошибка приходит и из процесса рендера (lpa_render_pool) — args не совпадают с __init__
+        return (type(self), (self.placeholders, self.file_path))
+
 
 # ---- 0) извлечение плейсхолдеров из шаблона ----
 
 def debug_extract_placeholders(template_path: str) -> set:
     """Извлекает все плейсхолдеры вида {{...}} / {% ... %} из всех XML файла DOCX."""
     try:
-        from pathlib import Path
-        import zipfile
-        import re
-        
         tpl = Path(template_path)
         if not tpl.exists():
             log.warning(f"[LPA] Template not found for placeholder extraction: {tpl}")
             return set()
         
-        placeholders = set()
-        patterns = [
-            r"\{\{([^}]+)\}\}",
-            r"\{%\s*for\s+(\w+)\s+in\s+",
-            r"\{%\s*if\s+([^%]+)\s+%\}",
-        ]
-        
-        with zipfile.ZipFile(tpl, "r") as z:
-            for name in z.namelist():
-                if not name.startswith("word/") or not name.endswith(".xml"):
-                    continue
-                try:
-                    xml_text = z.read(name).decode("utf-8", errors="ignore")
-                except Exception:
-                    continue
-                
-                for pattern in patterns:
-                    for match in re.findall(pattern, xml_text):
-                        var_name = match.strip()
-                        if "|" in var_name:
-                            var_name = var_name.split("|", 1)[0].strip()
-                        if var_name and not var_name.startswith("%"):
-                            placeholders.add(var_name)
-        
+        placeholders = set(get_compiled(tpl).placeholders)
         log.info(f"[LPA] Extracted {len(placeholders)} placeholders from template {tpl.name}")
         return placeholders
     except Exception as e:
@@ -75,30 +53,34 @@ def debug_extract_placeholders(template_path: str) -> set:
         return set()
 
 
+def docx_bytes_placeholders(package: bytes, *, max_examples: int = 50) -> tuple[bool, int, List[str]]:
+    """Проверяет word/*.xml DOCX, уже лежащего в памяти, на {{...}} плейсхолдеры."""
+    count = 0
+    examples: List[str] = []
+    with zipfile.ZipFile(BytesIO(package), "r") as z:
+        for name in z.namelist():
+            if not name.startswith("word/") or not name.endswith(".xml"):
+                continue
+            try:
+                xml_text = z.read(name).decode("utf-8", errors="ignore")
+            except Exception:
+                continue
+            for match in PLACEHOLDER_PATTERN.finditer(xml_text):
+                count += 1
+                if len(examples) < max_examples:
+                    examples.append(match.group(0).replace("\n", ""))
+    return (count > 0, count, examples)
+
+
 def docx_has_placeholders(docx_path: Path, *, max_examples: int = 50) -> tuple[bool, int, List[str]]:
     """Проверяет все word/*.xml в DOCX на наличие {{...}} плейсхолдеров и возвращает список совпадений."""
     if not docx_path.exists():
         return False, 0, []
-    
-    count = 0
-    examples: List[str] = []
     try:
-        with zipfile.ZipFile(docx_path, "r") as z:
-            for name in z.namelist():
-                if not name.startswith("word/") or not name.endswith(".xml"):
-                    continue
-                try:
-                    xml_text = z.read(name).decode("utf-8", errors="ignore")
-                except Exception:
-                    continue
-                for match in PLACEHOLDER_PATTERN.finditer(xml_text):
-                    count += 1
-                    if len(examples) < max_examples:
-                        examples.append(match.group(0).replace("\n", ""))
+        return docx_bytes_placeholders(docx_path.read_bytes(), max_examples=max_examples)
     except Exception as err:
         log.warning(f"[LPA] Could not inspect DOCX for placeholders: {err}")
         return False, 0, []
-    return (count > 0, count, examples)
 
 # ---- 1) helpers: нормализация и нарезка под шаблон ----
 
@@ -236,17 +218,6 @@ def _flatten_for_template(data: dict) -> dict:
     return ctx
 
 
-def _download_image(url: str) -> Optional[bytes]:
-    """Скачивает изображение по URL."""
-    try:
-        r = requests.get(url, timeout=20)
-        if r.ok:
-            return r.content
-    except Exception as e:
-        log.warning(f"Error downloading image from {url}: {e}")
-    return None
-
-
 def _pil_thumb(data: bytes, max_w=800, max_h=600) -> BytesIO:
     """Создает миниатюру изображения."""
     try:
@@ -262,160 +233,103 @@ def _pil_thumb(data: bytes, max_w=800, max_h=600) -> BytesIO:
         return BytesIO(data)
 
 
-def attach_photos(doc, photos: List[Dict[str, Any]], max_photos_in_doc=5):
-    """Вставляет фото в документ.
-    
-    photos: список dict с ключами:
-      - "url" - URL изображения из Bitrix24
-      - "tg_file_id" - Telegram file_id (fallback)
+def fetch_photos(photos: List[Dict[str, Any]], max_photos_in_doc: int = 5) -> List[tuple]:
+    """Скачивает до max_photos_in_doc фото: список (подпись, байты) для insert_photos.
+
+    Синхронная обёртка над lpa_photos.prefetch_photos для render_lpa_docx и
+    утилит: свой поток, свой цикл событий и свой HTTP-клиент (общий пул бота
+    привязан к его циклу). Файлы диска без url здесь не разрешаются — в боте
+    фото скачивает render_lpa_docx_bytes.
     """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    import httpx
+
+    from app.services.lpa_photos import prefetch_photos
+
+    async def run() -> List[tuple]:
+        async with httpx.AsyncClient() as client:
+            return await prefetch_photos(photos, max_photos_in_doc, client=client, resolve_disk=False)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, run()).result()
+
+
+def insert_photos(doc, images: List[tuple], total_photos: int, max_photos_in_doc: int = 5) -> None:
+    """Вставляет уже скачанные фото (подпись, байты) в конец документа."""
     try:
         from PIL import Image
     except ImportError:
         log.warning("PIL not installed, skipping photo insertion")
         return
-    
-    added = 0
-    
+
     # Добавляем заголовок
     doc.add_paragraph("Фото смены:").bold = True
-    
-    for p in photos:
-        if added >= max_photos_in_doc:
-            break
-        
-        data = None
-        photo_name = f"Фото {added + 1}"
-        
-        # Пробуем скачать из Bitrix24 URL
-        if "url" in p:
-            url = p["url"]
-            data = _download_image(url)
-            photo_name = f"Фото {added + 1} (Bitrix24)"
-        
-        # Fallback к Telegram file_id
-        elif "tg_file_id" in p:
-            try:
-                import os
-                from dotenv import load_dotenv
-                load_dotenv()
-                
-                bot_token = os.getenv("BOT_TOKEN")
-                if not bot_token:
-                    log.warning("BOT_TOKEN not set, cannot download Telegram photo")
-                    continue
-                
-                file_id = p["tg_file_id"]
-                # Получаем путь к файлу
-                file_info_url = f"https://api.telegram.org/bot{bot_token}/getFile"
-                file_info_resp = requests.get(file_info_url, params={"file_id": file_id}, timeout=10)
-                if not file_info_resp.ok:
-                    log.warning(f"Could not get file info for Telegram file_id {file_id}")
-                    continue
-                
-                file_path = file_info_resp.json().get("result", {}).get("file_path")
-                if not file_path:
-                    log.warning(f"No file_path for Telegram file_id {file_id}")
-                    continue
-                
-                # Скачиваем файл
-                download_url = f"https://api.telegram.org/file/bot{bot_token}/{file_path}"
-                download_resp = requests.get(download_url, timeout=30)
-                if download_resp.ok:
-                    data = download_resp.content
-                    photo_name = f"Фото {added + 1} (Telegram)"
-                else:
-                    log.warning(f"Could not download Telegram file {file_id}")
-                    continue
-            except Exception as e:
-                log.warning(f"Error downloading Telegram photo {file_id}: {e}")
-                continue
-        
-        if not data:
-            continue
-        
-        # Проверяем, что data - это байты, а не строка
-        if isinstance(data, str):
-            log.warning(f"Photo data is string, not bytes. Skipping photo {added + 1}")
-            continue
-        
-        if not isinstance(data, bytes):
-            log.warning(f"Photo data is not bytes (type: {type(data)}). Skipping photo {added + 1}")
-            continue
-        
+
+    for photo_name, data in images:
         try:
             # Создаем миниатюру
             buff = _pil_thumb(data)
-            
+
             # Добавляем параграф
             para = doc.add_paragraph(photo_name)
             para.style = 'List Bullet'
-            
+
             # Вставляем изображение
             run = para.add_run()
             run.add_picture(buff, width=Inches(4.5))
-            
-            added += 1
-            
+
         except Exception as e:
-            log.error(f"Error inserting photo {added + 1}: {e}")
+            log.error(f"Error inserting photo {photo_name}: {e}")
             doc.add_paragraph(f"{photo_name} (ошибка вставки)")
-    
+
     # Если фото больше max_photos_in_doc, добавляем информацию
-    if len(photos) > max_photos_in_doc:
-        doc.add_paragraph(f"\nВсего фото: {len(photos)}. Остальные фото доступны в Bitrix24.")
+    if total_photos > max_photos_in_doc:
+        doc.add_paragraph(f"\nВсего фото: {total_photos}. Остальные фото доступны в Bitrix24.")
+
+
+def attach_photos(doc, photos: List[Dict[str, Any]], max_photos_in_doc=5):
+    """Скачивает и вставляет фото в документ.
+    
+    photos: список dict с ключами:
+      - "url" - URL изображения из Bitrix24
+      - "tg_file_id" - Telegram file_id (fallback)
+    """
+    insert_photos(doc, fetch_photos(photos, max_photos_in_doc), len(photos), max_photos_in_doc)
 
 # ---- 2) основной рендер DOCX ----
 
-def render_lpa_docx(
-    template_path,
-    data: Dict[str, Any],
-    out_dir,
-    filename_prefix: str = "LPA",
-    photos: Optional[List[tuple]] = None,
+def lpa_docx_path(data: Dict[str, Any], out_dir, filename_prefix: str = "LPA") -> Path:
+    """Путь итогового DOCX: {prefix}_{объект}_{дата}.docx в out_dir."""
+    obj = str(data.get("object_name", "Object")).strip().replace("/", "_")
+    date_str = str(data.get("date", "")).strip().replace(":", "_").replace("/", "_")
+    return Path(out_dir) / f"{filename_prefix}_{obj}_{date_str or 'report'}.docx"
+
+
+def render_docx_bytes(
+    template_path: str,
+    flattened_ctx: Dict[str, Any],
+    images: List[tuple],
+    total_photos: int,
+    name: str = "LPA.docx",
     max_photos_in_doc: int = 5,
-) -> Path:
-    """
-    data — единый словарь с ключами:
-      object_name, section, date, foreman,
-      tasks: List[{name, unit, plan, fact, executor, reason}],
-      tech/equipment: List[{name, hours, comment}],
-      timesheet: List[{name, hours, rate, sum}],
-      materials: List[{name, unit, qty, price, sum}],
-      plan_total, fact_total, efficiency, downtime_reason,
-      photos: List[{url, tg_file_id}]
-    photos: Optional[List[tuple]] - устаревший формат, используйте data["photos"]
-    max_photos_in_doc: максимальное количество фото для вставки в документ
-    Возвращает Path к сгенерированному DOCX.
+) -> bytes:
+    """Рендер шаблона в байты DOCX по готовому плоскому контексту и скачанным фото.
+
+    Вся CPU-работа рендера (doc.render, миниатюры PIL, проверка
+    плейсхолдеров) — без сети, без данных Bitrix и без диска, поэтому
+    функция выполняется и в отдельном процессе (lpa_render_pool).
+    name — имя документа для логов и LPAPlaceholderError (файл не пишется).
     """
-    # Приводим пути к Path
-    tpl = Path(template_path)
-    log.info(f"[LPA Render] template_path={tpl} exists={tpl.exists()}")
-    if not tpl.exists():
-        raise FileNotFoundError(f"Template not found: {tpl}")
-    
-    out_dir = Path(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    flattened_ctx = dict(flattened_ctx)
 
-    # Проверяем, что все необходимые поля присутствуют
-    object_name = data.get("object_name") or "Не указан"
-    tasks = data.get("tasks", [])
-    tech = data.get("tech", []) or data.get("equipment", [])
-    materials = data.get("materials", [])
-    timesheet = data.get("timesheet", [])
-    plan_total = data.get("plan_total", 0.0)
-    fact_total = data.get("fact_total", 0.0)
-    efficiency = data.get("efficiency", 0.0)
-    downtime_reason = data.get("downtime_reason", "") or ""
-    
-    # Преобразуем структурированные данные в плоский контекст для шаблона
-    # Шаблон ожидает пронумерованные плейсхолдеры: {{task1_name}}, {{task2_name}}, и т.д.
-    flattened_ctx = _flatten_for_template(data)
+    # Шаблон разобран один раз на процесс (lpa_template), здесь — только свой Document
+    compiled = get_compiled(template_path)
+    doc = compiled.new_document()
     
-    doc = DocxTemplate(str(tpl))
-    
-    # Извлекаем плейсхолдеры из шаблона
-    template_vars = debug_extract_placeholders(str(tpl))
+    # Плейсхолдеры шаблона
+    template_vars = set(compiled.placeholders)
     context_keys = set(flattened_ctx.keys())
     
     # Сопоставляем плейсхолдеры с контекстом
@@ -441,33 +355,20 @@ def render_lpa_docx(
     log.info(f"[LPA Render] doc.render() completed successfully")
     
     # Вставляем фото в конец документа (если есть)
-    # Используем data["photos"] (список dict с url/tg_file_id)
-    photos_list = data.get("photos", [])
-    if photos_list:
-        log.info(f"[LPA Render] Attaching {len(photos_list)} photos to document")
+    if total_photos:
+        log.info(f"[LPA Render] Attaching {len(images)} of {total_photos} photos to document")
         rendered_doc = getattr(doc, "docx", None) or doc.get_docx()
-        log.info(f"[LPA Render] Using rendered doc type: {type(rendered_doc)}")
-        attach_photos(rendered_doc, photos_list, max_photos_in_doc)
+        insert_photos(rendered_doc, images, total_photos, max_photos_in_doc)
         log.info(f"[LPA Render] Photos attached successfully")
 
-    # имя файла
-    obj = str(data.get("object_name", "Object")).strip().replace("/", "_")
-    date_str = str(data.get("date", "")).strip().replace(":", "_").replace("/", "_")
-    name = f"{filename_prefix}_{obj}_{date_str or 'report'}.docx"
-    out_docx = out_dir / name
-    
-    log.info(f"[LPA] Saving final DOCX to: {out_docx}")
-    doc.save(str(out_docx))
-    if out_docx.exists():
-        log.info(
-            f"[LPA] Final DOCX saved: {out_docx} (size={out_docx.stat().st_size} bytes)"
-        )
-    else:
-        log.warning(f"[LPA] Final DOCX was not saved: {out_docx}")
-    
-    has_placeholders, placeholder_count, placeholder_examples = docx_has_placeholders(out_docx)
+    buffer = BytesIO()
+    doc.save(buffer)
+    package = buffer.getvalue()
+    log.info(f"[LPA] DOCX rendered in memory: {name} (size={len(package)} bytes)")
+
+    has_placeholders, placeholder_count, placeholder_examples = docx_bytes_placeholders(package)
     log.info(
-        f"[LPA] Placeholder scan for {out_docx}: found={has_placeholders}, count={placeholder_count}"
+        f"[LPA] Placeholder scan for {name}: found={has_placeholders}, count={placeholder_count}"
     )
     if has_placeholders:
         if placeholder_examples:
@@ -481,12 +382,74 @@ def render_lpa_docx(
                 "[LPA Render] Final DOCX still has %s placeholders (no sample list available)",
                 placeholder_count,
             )
-        raise LPAPlaceholderError(placeholder_examples, out_docx)
+        raise LPAPlaceholderError(placeholder_examples, Path(name))
 
     log.info("[LPA Render] Final DOCX has no placeholders, safe to convert to PDF")
+    return package
+
+
+def render_docx_file(
+    template_path: str,
+    flattened_ctx: Dict[str, Any],
+    images: List[tuple],
+    total_photos: int,
+    out_docx: str,
+    max_photos_in_doc: int = 5,
+) -> Path:
+    """render_docx_bytes с записью результата в out_docx (для render_lpa_docx и утилит)."""
+    from app.services.lpa_convert import write_atomic
+
+    out_docx = Path(out_docx)
+    package = render_docx_bytes(template_path, flattened_ctx, images, total_photos, str(out_docx), max_photos_in_doc)
+    write_atomic(out_docx, package)
     log.info(f"[LPA Render] Returning file path: {out_docx}")
     return out_docx
 
+
+def render_lpa_docx(
+    template_path,
+    data: Dict[str, Any],
+    out_dir,
+    filename_prefix: str = "LPA",
+    photos: Optional[List[tuple]] = None,
+    max_photos_in_doc: int = 5,
+) -> Path:
+    """
+    data — единый словарь с ключами:
+      object_name, section, date, foreman,
+      tasks: List[{name, unit, plan, fact, executor, reason}],
+      tech/equipment: List[{name, hours, comment}],
+      timesheet: List[{name, hours, rate, sum}],
+      materials: List[{name, unit, qty, price, sum}],
+      plan_total, fact_total, efficiency, downtime_reason,
+      photos: List[{url, tg_file_id}]
+    photos: Optional[List[tuple]] - устаревший формат, используйте data["photos"]
+    max_photos_in_doc: максимальное количество фото для вставки в документ
+    Возвращает Path к сгенерированному DOCX.
+
+    Синхронный вариант с файлом; в боте — lpa_render_pool.render_lpa_docx_bytes (только в памяти).
+    """
+    # Приводим пути к Path
+    tpl = Path(template_path)
+    log.info(f"[LPA Render] template_path={tpl} exists={tpl.exists()}")
+    if not tpl.exists():
+        raise FileNotFoundError(f"Template not found: {tpl}")
+    
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Преобразуем структурированные данные в плоский контекст для шаблона
+    # Шаблон ожидает пронумерованные плейсхолдеры: {{task1_name}}, {{task2_name}}, и т.д.
+    flattened_ctx = _flatten_for_template(data)
+
+    # Используем data["photos"] (список dict с url/tg_file_id)
+    photos_list = data.get("photos", []) or []
+    images = fetch_photos(photos_list, max_photos_in_doc) if photos_list else []
+    return render_docx_file(
+        str(tpl), flattened_ctx, images, len(photos_list),
+        str(lpa_docx_path(data, out_dir, filename_prefix)), max_photos_in_doc,
+    )
+
 # ---- 3) конвертация DOCX→PDF ----
 
 def docx_to_pdf(input_docx, output_pdf=None, use_libreoffice: bool = True) -> Optional[Path]:
@@ -514,9 +477,16 @@ def docx_to_pdf(input_docx, output_pdf=None, use_libreoffice: bool = True) -> Op
     # Попытка A: LibreOffice headless (приоритет)
     if use_libreoffice:
         try:
+            from app.services.lpa_convert import soffice_binary, soffice_profile_dir
+
             out_dir = str(output_pdf.parent.resolve())
+            # Свой профиль на поток: параллельные soffice не делят один UserInstallation
+            profile = soffice_profile_dir(f"cli_{threading.get_ident()}")
             result = subprocess.run(
-                ["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, str(input_docx)],
+                [
+                    soffice_binary(), "--headless", f"-env:UserInstallation={profile.as_uri()}",
+                    "--convert-to", "pdf", "--outdir", out_dir, str(input_docx),
+                ],
                 check=False,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
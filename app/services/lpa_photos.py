@@ -0,0 +1,200 @@
+"""Предзагрузка фото смены для ЛПА.
+
+attach_photos раньше скачивал фото по одному блокирующим requests.get
+прямо во время рендера, а для Telegram file_id делал ещё и два запроса
+(getFile + файл) на фото. Здесь фото скачиваются до рендера, асинхронно:
+
+* не больше LPA_PHOTO_CONCURRENCY скачиваний одновременно, через общий пул
+  соединений http_client (или переданный клиент);
+* файлы Bitrix без готового downloadUrl разрешаются через disk.file.get,
+  Telegram file_id — через getFile, параллельно со скачиваниями;
+* тело читается потоком: фото больше LPA_PHOTO_MAX_BYTES пропускается, как
+  только это становится ясно (по Content-Length или по прочитанному), а
+  все фото вместе не превышают LPA_PHOTO_TOTAL_MAX_BYTES;
+* порядок сохраняется: берутся первые max_photos успешно скачанные фото,
+  неудачные заменяются следующими по списку.
+
+Рендер получает готовый список (подпись, байты) и в сеть не ходит.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from app.services.bitrix_timeouts import attempt_timeout
+from app.utils.env import env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.lpa_photos")
+
+TELEGRAM_API = "https://api.telegram.org"
+DOWNLOAD_URL_KEYS = (
+    "downloadUrl", "DOWNLOAD_URL", "downloadUrlDirect", "DOWNLOAD_URL_DIRECT", "detailUrl", "DETAIL_URL",
+)
+
+Photo = Tuple[str, bytes]
+
+
+PHOTO_CONCURRENCY = env_int("LPA_PHOTO_CONCURRENCY", 4)
+PHOTO_MAX_BYTES = env_int("LPA_PHOTO_MAX_BYTES", 10 * 1024 * 1024)
+PHOTO_TOTAL_MAX_BYTES = env_int("LPA_PHOTO_TOTAL_MAX_BYTES", 30 * 1024 * 1024)
+
+
+class PhotoTooLarge(Exception):
+    """Фото не укладывается в лимит на одно фото или в общий остаток."""
+
+
+class _Prefetch:
+    def __init__(
+        self,
+        *,
+        client: Optional[httpx.AsyncClient],
+        resolve_disk: bool,
+        concurrency: int,
+        max_bytes: int,
+        total_bytes: int,
+    ):
+        self.client = client
+        self.resolve_disk = resolve_disk
+        self.sem = asyncio.Semaphore(max(1, concurrency))
+        self.max_bytes = max_bytes
+        self.left = total_bytes
+
+    @asynccontextmanager
+    async def _stream(self, url: str, timeout: float) -> AsyncIterator[httpx.Response]:
+        if self.client is not None:
+            async with self.client.stream("GET", url, timeout=timeout) as r:
+                yield r
+        else:
+            from app.services.http_client import http_stream
+
+            async with http_stream("GET", url, timeout=timeout) as r:
+                yield r
+
+    async def _get_json(self, url: str, params: Dict[str, Any], timeout: float) -> Any:
+        if self.client is not None:
+            r = await self.client.get(url, params=params, timeout=timeout)
+        else:
+            from app.services.http_client import http_request
+
+            r = await http_request("GET", url, params=params, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    async def _download(self, url: str, timeout: float) -> Optional[bytes]:
+        """Скачать тело с учётом лимитов; None — ответ не 200."""
+        async with self._stream(url, timeout) as r:
+            if r.status_code != 200:
+                return None
+            length = int(r.headers.get("content-length") or 0)
+            if length > self.max_bytes or length > self.left:
+                raise PhotoTooLarge(f"{length} bytes announced")
+            body = bytearray()
+            try:
+                async for chunk in r.aiter_bytes():
+                    body += chunk
+                    self.left -= len(chunk)
+                    if len(body) > self.max_bytes or self.left < 0:
+                        raise PhotoTooLarge(f"more than {len(body)} bytes")
+            except BaseException:
+                # Недокачанное фото не расходует общий лимит
+                self.left += len(body)
+                raise
+            return bytes(body)
+
+    async def _bitrix_url(self, photo: Dict[str, Any]) -> Optional[str]:
+        if photo.get("url"):
+            return photo["url"]
+        if not (self.resolve_disk and photo.get("id")):
+            return None
+        from app.services.http_client import bx
+
+        info = await bx("disk.file.get", {"id": photo["id"]})
+        if isinstance(info, dict):
+            return next((info[k] for k in DOWNLOAD_URL_KEYS if info.get(k)), None)
+        return None
+
+    async def _telegram_url(self, file_id: str) -> Optional[str]:
+        token = os.getenv("BOT_TOKEN")
+        if not token:
+            log.warning("BOT_TOKEN not set, cannot download Telegram photo")
+            return None
+        data = await self._get_json(f"{TELEGRAM_API}/bot{token}/getFile", {"file_id": file_id}, 10)
+        file_path = (data or {}).get("result", {}).get("file_path")
+        if not file_path:
+            log.warning("No file_path for Telegram file_id %s", file_id)
+            return None
+        return f"{TELEGRAM_API}/file/bot{token}/{file_path}"
+
+    async def fetch(self, photo: Dict[str, Any]) -> Optional[Tuple[str, bytes]]:
+        """(источник, байты) одного фото или None."""
+        label = photo.get("id") or photo.get("tg_file_id") or "?"
+        async with self.sem:
+            try:
+                if photo.get("url") or photo.get("id"):
+                    source = "Bitrix24"
+                    url = await self._bitrix_url(photo)
+                    timeout, _ = attempt_timeout("disk.download")
+                    if timeout <= 0:
+                        log.warning("Deadline exhausted, skipping photo %s", label)
+                        return None
+                elif photo.get("tg_file_id"):
+                    source = "Telegram"
+                    url = await self._telegram_url(photo["tg_file_id"])
+                    timeout = 30
+                else:
+                    return None
+                if not url:
+                    return None
+                data = await self._download(url, timeout)
+            except asyncio.CancelledError:
+                raise
+            except PhotoTooLarge as e:
+                log.warning("Photo %s skipped: over the size limit (%s)", label, e)
+                return None
+            except Exception as e:
+                log.warning("Could not download photo %s: %s", label, e)
+                return None
+        if not data:
+            log.warning("Photo %s: download failed", label)
+            return None
+        return source, data
+
+
+async def prefetch_photos(
+    photos: List[Dict[str, Any]],
+    max_photos: int = 5,
+    *,
+    client: Optional[httpx.AsyncClient] = None,
+    resolve_disk: bool = True,
+    concurrency: int = PHOTO_CONCURRENCY,
+    max_bytes: int = PHOTO_MAX_BYTES,
+    total_bytes: int = PHOTO_TOTAL_MAX_BYTES,
+) -> List[Photo]:
+    """Скачать до max_photos фото смены: список (подпись, байты) для insert_photos.
+
+    Args:
+        photos: dict с "url" (downloadUrl Bitrix), "id" (файл диска Bitrix) или "tg_file_id"
+        max_photos: Сколько фото нужно документу
+        client: Свой HTTP-клиент (по умолчанию — общий пул http_client)
+        resolve_disk: Разрешать "id" без "url" через disk.file.get
+    """
+    job = _Prefetch(
+        client=client, resolve_disk=resolve_disk,
+        concurrency=concurrency, max_bytes=max_bytes, total_bytes=total_bytes,
+    )
+    fetched: List[Tuple[str, bytes]] = []
+    candidates = [p for p in photos if isinstance(p, dict)]
+    while candidates and len(fetched) < max_photos:
+        # Окно ровно на недостающие фото; неудачные добирают следующие по списку
+        window, candidates = candidates[:max_photos - len(fetched)], candidates[max_photos - len(fetched):]
+        results = await asyncio.gather(*(job.fetch(p) for p in window))
+        fetched += [r for r in results if r is not None]
+    log.info("[LPA] Prefetched %d of %d photos (%d bytes)", len(fetched), len(photos), sum(len(d) for _, d in fetched))
+    return [(f"Фото {n} ({source})", data) for n, (source, data) in enumerate(fetched, 1)]
@@ -0,0 +1,148 @@
+"""Рендер ЛПА в DOCX в отдельных процессах.
+
+render_lpa_docx целиком CPU-bound: загрузка шаблона, doc.render, миниатюры
+PIL, проверка плейсхолдеров. Вызванный в цикле событий, он замораживал бота
+для всех пользователей на время рендера. Здесь рендер уходит в пул
+процессов:
+
+* в родителе остаётся всё, что связано с сетью и Bitrix: плоский контекст
+  (_flatten_for_template) и скачивание фото (lpa_photos);
+* в процесс передаются только плоский контекст, байты фото и путь шаблона,
+  обратно — байты DOCX; всё пиклится дёшево, соединения и клиенты
+  процесса туда не попадают;
+* процессов LPA_RENDER_PROCESSES (по умолчанию — число ядер), одновременно
+  в пул отдаётся не больше LPA_RENDER_CONCURRENCY рендеров, остальные ждут
+  на семафоре в цикле событий;
+* LPA_RENDER_PROCESSES=0 — рендер в потоке (цикл событий всё равно свободен).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.env import env_int
+
+load_dotenv()
+
+log = logging.getLogger("gpo.lpa_render_pool")
+
+
+def _worker_init() -> None:
+    """Инициализация процесса рендера: логи в stderr, прогрев импортов и шаблона ЛПА."""
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s | %(levelname)-8s | %(processName)s %(name)s | %(message)s",
+    )
+    import app.services.lpa_pdf  # noqa: F401
+    from app.services.lpa_template import LPA_TEMPLATE, get_compiled
+
+    if LPA_TEMPLATE.exists():
+        get_compiled(LPA_TEMPLATE)
+
+
+class RenderPool:
+    """Пул процессов для render_docx_bytes.
+
+    Args:
+        processes: Количество процессов (0 — рендер в потоке)
+        concurrency: Сколько рендеров одновременно отдавать в пул
+    """
+
+    def __init__(self, *, processes: int, concurrency: Optional[int] = None):
+        self.processes = max(0, processes)
+        self.concurrency = max(1, concurrency or self.processes or 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self.stats: Dict[str, int] = {"renders": 0, "failures": 0, "pool_restarts": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: форк процесса с потоками и открытыми соединениями небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+            log.info("LPA render pool started: %d processes", self.processes)
+        return self._executor
+
+    async def run(self, fn, *args: Any) -> Any:
+        """Выполнить fn(*args) в процессе пула (fn и аргументы должны пиклиться)."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            if self.processes == 0:
+                return await asyncio.to_thread(fn, *args)
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self._pool(), fn, *args)
+            except BrokenProcessPool:
+                # Процесс умер (OOM, сигнал) — пул непригоден, пересоздаём и повторяем один раз
+                log.warning("LPA render pool is broken, restarting")
+                self.stats["pool_restarts"] += 1
+                self._reset()
+                result = await loop.run_in_executor(self._pool(), fn, *args)
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+            self.stats["renders"] += 1
+            return result
+
+    def _reset(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats["processes"] = self.processes if self._executor is not None else 0
+        return stats
+
+
+# Общий пул процесса (процессы поднимаются при первом рендере)
+render_pool = RenderPool(
+    processes=env_int("LPA_RENDER_PROCESSES", os.cpu_count() or 1),
+    concurrency=env_int("LPA_RENDER_CONCURRENCY", 0) or None,
+)
+
+
+async def render_lpa_docx_bytes(
+    template_path,
+    data: Dict[str, Any],
+    name: str = "LPA.docx",
+    max_photos_in_doc: int = 5,
+) -> bytes:
+    """Рендер ЛПА в байты DOCX без блокировки цикла событий: фото — prefetch_photos, рендер — в пуле процессов.
+
+    name — имя документа для логов и LPAPlaceholderError; на диск ничего не пишется.
+    """
+    from app.services.lpa_pdf import _flatten_for_template, render_docx_bytes
+    from app.services.lpa_photos import prefetch_photos
+
+    tpl = Path(template_path)
+    if not tpl.exists():
+        raise FileNotFoundError(f"Template not found: {tpl}")
+
+    flattened_ctx = _flatten_for_template(data)
+    photos: List[Dict[str, Any]] = data.get("photos", []) or []
+    # Фото скачиваются заранее и параллельно — рендер получает готовые байты
+    images = await prefetch_photos(photos, max_photos_in_doc) if photos else []
+    return await render_pool.run(
+        render_docx_bytes, str(tpl.resolve()), flattened_ctx, images, len(photos), name, max_photos_in_doc,
+    )
+
+
+async def shutdown_lpa_renderer() -> None:
+    await render_pool.stop()
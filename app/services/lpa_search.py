@@ -0,0 +1,220 @@
+"""Поиск последней закрытой смены объекта с фактом (для ЛПА).
+
+Раньше lpa_obj_pick перебирал 60 дней по одному запросу crm.item.list на
+день и для каждой смены с UF_OBJECT_LINK = "Array" делал ещё crm.item.get —
+до сотни последовательных запросов на одно нажатие кнопки. Здесь:
+
+1. Смены по привязке к объекту (фильтр UF_OBJECT_LINK), от новых id к
+   старым; если фильтр ничего не дал — последняя страница смен с разбором
+   привязки на нашей стороне (как и раньше).
+2. Если закрытой смены с фактом там нет — один запрос за весь диапазон дат
+   (фильтр по UF_DATE и UF_FACT_TOTAL > 0, страницы по id). Кандидаты
+   ранжируются как при переборе по дням: дата по убыванию, затем id по
+   убыванию. Объект смены без привязки определяется по индексу смен,
+   crm.item.get (не больше ENRICH_CONCURRENCY одновременно, окнами в
+   порядке ранга — дальше первого совпадения не читаем) и локальной БД.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.bitrix_field_map import resolve_code, upper_to_camel
+from app.services.bitrix_ids import SHIFT_ETID, UF_OBJECT_LINK
+from app.services.bitrix_select import _items_of, bx_projected, select_for
+from app.services.http_client import bx, bx_iter
+from app.services.shift_client import _normalize_date
+
+log = logging.getLogger("gpo.lpa_search")
+
+SEARCH_DAYS = 60
+ENRICH_CONCURRENCY = 5
+CONSUMER = "lpa.object_search"
+
+
+@dataclass(frozen=True)
+class ShiftCodes:
+    """Коды полей смены: UPPER (из маппинга) и camelCase."""
+
+    date: str
+    status: str
+    plan: str
+    fact: str
+    eff: str
+
+    @staticmethod
+    def camel(code: str) -> str:
+        return upper_to_camel(code) if code and code.startswith("UF_") else code
+
+    @classmethod
+    def resolve(cls) -> "ShiftCodes":
+        return cls(
+            date=resolve_code("Смена", "UF_DATE"),
+            status=resolve_code("Смена", "UF_STATUS"),
+            plan=resolve_code("Смена", "UF_PLAN_TOTAL"),
+            fact=resolve_code("Смена", "UF_FACT_TOTAL"),
+            eff=resolve_code("Смена", "UF_EFF_FINAL"),
+        )
+
+    def extra(self) -> List[str]:
+        return [self.camel(c) for c in (self.date, self.status, self.plan, self.fact, self.eff)]
+
+
+def _number(item: Dict[str, Any], code: str, legacy: str) -> float:
+    try:
+        return float(item.get(ShiftCodes.camel(code)) or item.get(code) or item.get(legacy) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def shift_totals(item: Dict[str, Any], codes: ShiftCodes) -> Dict[str, float]:
+    """plan_total / fact_total / eff_final смены (camelCase, UPPER или известный код)."""
+    return {
+        "plan_total": _number(item, codes.plan, "ufCrm7UfCrmPlanTotal"),
+        "fact_total": _number(item, codes.fact, "ufCrm7UfCrmFactTotal"),
+        "eff_final": _number(item, codes.eff, "ufCrm7UfCrmEffFinal"),
+    }
+
+
+def shift_status(item: Dict[str, Any], codes: ShiftCodes) -> str:
+    from app.services.w6_alerts import _get_field_value
+
+    try:
+        status = _get_field_value(item, ShiftCodes.camel(codes.status)) or _get_field_value(item, codes.status) or ""
+    except Exception:
+        return ""
+    return status.lower().strip() if isinstance(status, str) else status
+
+
+def is_closed_with_fact(item: Dict[str, Any], codes: ShiftCodes) -> bool:
+    """Есть факт и смена не открыта явно (пустой или любой другой статус — закрыта)."""
+    if not shift_totals(item, codes)["fact_total"]:
+        return False
+    return shift_status(item, codes) != "open"
+
+
+def object_id_from_link(value: Any) -> Optional[int]:
+    """ID объекта из UF_OBJECT_LINK: ["D_12"], "D_12", "12" (None — пусто или "Array")."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None or value == "" or (isinstance(value, str) and value.lower() == "array"):
+        return None
+    try:
+        if isinstance(value, str) and value.startswith("D_"):
+            return int(value[2:])
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _link_of(item: Dict[str, Any]) -> Any:
+    for name in (UF_OBJECT_LINK, upper_to_camel(UF_OBJECT_LINK), "ufCrm7UfCrmObject"):
+        value = item.get(name)
+        if value and not (isinstance(value, str) and value.lower() == "array"):
+            return value
+    return item.get(UF_OBJECT_LINK)
+
+
+async def _resolve_object(item: Dict[str, Any], sem: asyncio.Semaphore) -> Optional[int]:
+    """Объект смены: привязка → индекс смен → crm.item.get → локальная БД."""
+    from app.services.bitrix_shift_index import shift_index
+    from app.services.shift_repo import get_shift_by_bitrix_id
+
+    shift_id = int(item["id"])
+    link = _link_of(item)
+    object_id = object_id_from_link(link)
+    if object_id is None and isinstance(link, str) and link.lower() == "array":
+        object_id = shift_index.object_of(shift_id)
+        if object_id is None:
+            # Множественное поле схлопнулось — полная карточка смены
+            async with sem:
+                try:
+                    full = await bx("crm.item.get", {"entityTypeId": SHIFT_ETID, "id": shift_id})
+                    object_id = object_id_from_link(_link_of((full or {}).get("item", full) or {}))
+                except Exception as e:
+                    log.warning("[LPA] shift %s: crm.item.get for object link failed: %s", shift_id, e)
+    if object_id is None:
+        local = await get_shift_by_bitrix_id(shift_id)
+        if local and isinstance(local[1], dict):
+            object_id = local[1].get("object_id")
+    return object_id
+
+
+async def _by_object_link(obj_id: int, codes: ShiftCodes) -> Optional[Dict[str, Any]]:
+    res = await bx_projected("crm.item.list", {
+        "entityTypeId": SHIFT_ETID,
+        "filter": {UF_OBJECT_LINK: f"D_{obj_id}"},
+        "order": {"id": "desc"},
+    }, CONSUMER, *codes.extra())
+    items = _items_of(res)
+    if items:
+        log.info("[LPA] %d shifts linked to object %s", len(items), obj_id)
+    else:
+        # Фильтр по привязке не сработал — последняя страница смен, привязку разбираем сами
+        res = await bx_projected("crm.item.list", {
+            "entityTypeId": SHIFT_ETID,
+            "order": {"id": "desc"},
+        }, CONSUMER, *codes.extra())
+        items = [i for i in _items_of(res) if object_id_from_link(_link_of(i)) == obj_id]
+        log.info("[LPA] %d recent shifts matched object %s by link", len(items), obj_id)
+    return next((i for i in items if is_closed_with_fact(i, codes)), None)
+
+
+async def _by_date_range(
+    obj_id: int, codes: ShiftCodes, days: int, concurrency: int, today: date,
+) -> Optional[Dict[str, Any]]:
+    date_camel = ShiftCodes.camel(codes.date)
+    payload = {
+        "entityTypeId": SHIFT_ETID,
+        "filter": {
+            f">={date_camel}": (today - timedelta(days=days - 1)).isoformat() + "T00:00:00",
+            f"<={date_camel}": today.isoformat() + "T23:59:59",
+            f">{ShiftCodes.camel(codes.fact)}": 0,
+        },
+        "select": select_for(CONSUMER, *codes.extra()),
+    }
+    candidates = [i async for i in bx_iter("crm.item.list", payload) if is_closed_with_fact(i, codes)]
+    # Тот же порядок, что у перебора по дням: новые даты первыми, внутри дня — новые id
+    candidates.sort(
+        key=lambda i: (_normalize_date(i.get(date_camel) or i.get(codes.date)) or date.min, int(i["id"])),
+        reverse=True,
+    )
+    log.info("[LPA] %d shifts with fact in the last %d days", len(candidates), days)
+
+    sem = asyncio.Semaphore(concurrency)
+    for start in range(0, len(candidates), concurrency):
+        window = candidates[start:start + concurrency]
+        objects = await asyncio.gather(*(_resolve_object(i, sem) for i in window))
+        for item, object_id in zip(window, objects, strict=True):
+            if object_id is not None and int(object_id) == obj_id:
+                return item
+    return None
+
+
+async def find_closed_shift(
+    obj_id: int,
+    *,
+    days: int = SEARCH_DAYS,
+    concurrency: int = ENRICH_CONCURRENCY,
+    codes: Optional[ShiftCodes] = None,
+    today: Optional[date] = None,
+) -> Optional[Dict[str, Any]]:
+    """Последняя закрытая смена объекта с фактом (элемент crm.item.list) или None.
+
+    Args:
+        obj_id: Bitrix ID объекта
+        days: Глубина поиска по дате смены, дней (включая сегодня)
+        concurrency: Сколько смен одновременно дочитывать для определения объекта
+        codes: Коды полей смены (по умолчанию — из маппинга)
+        today: Последний день диапазона (по умолчанию — сегодня)
+    """
+    codes = codes or ShiftCodes.resolve()
+    try:
+        item = await _by_object_link(obj_id, codes)
+        if item is not None:
+            return item
+    except Exception as e:
+        log.error("[LPA] Error in direct object search: %s", e, exc_info=True)
+    return await _by_date_range(obj_id, codes, days, max(1, concurrency), today or date.today())
@@ -0,0 +1,166 @@
+"""Скомпилированный шаблон ЛПА (DOCX + Jinja), общий для всех рендеров.
+
+Раньше каждый рендер заново открывал lpa_template.docx через DocxTemplate,
+прогонял XML через patch_xml, компилировал его в Jinja и ещё раз
+распаковывал архив ради поиска плейсхолдеров (debug_extract_placeholders).
+Здесь шаблон разбирается один раз:
+
+* байты пакета — из них каждый рендер собирает свой Document в памяти;
+* множество плейсхолдеров из всех word/*.xml;
+* XML тела, колонтитулов и сносок после patch_xml — и скомпилированные
+  по ним шаблоны Jinja.
+
+Кэш — на процесс (в том числе на каждый процесс lpa_render_pool), ключ —
+путь, mtime и размер файла: изменённый шаблон перечитывается при
+следующем рендере без перезапуска.
+"""
+
+import logging
+import re
+import threading
+import zipfile
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Optional, Tuple, Union
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment, Template
+
+log = logging.getLogger("gpo.lpa_template")
+
+LPA_TEMPLATE = Path(__file__).resolve().parent.parent / "templates" / "pdf" / "lpa_template.docx"
+
+PLACEHOLDER_PATTERNS = (
+    re.compile(r"\{\{([^}]+)\}\}"),
+    re.compile(r"\{%\s*for\s+(\w+)\s+in\s+"),
+    re.compile(r"\{%\s*if\s+([^%]+)\s+%\}"),
+)
+
+
+def scan_placeholders(package: bytes) -> set:
+    """Имена переменных {{...}} / {% for %} / {% if %} из всех word/*.xml пакета DOCX."""
+    placeholders = set()
+    with zipfile.ZipFile(BytesIO(package), "r") as z:
+        for name in z.namelist():
+            if not name.startswith("word/") or not name.endswith(".xml"):
+                continue
+            try:
+                xml_text = z.read(name).decode("utf-8", errors="ignore")
+            except Exception:
+                continue
+            for pattern in PLACEHOLDER_PATTERNS:
+                for match in pattern.findall(xml_text):
+                    var_name = match.strip()
+                    if "|" in var_name:
+                        var_name = var_name.split("|", 1)[0].strip()
+                    if var_name and not var_name.startswith("%"):
+                        placeholders.add(var_name)
+    return placeholders
+
+
+class _CompiledEnvironment(Environment):
+    """Environment, отдающий готовые шаблоны Jinja по исходному XML части."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.compiled: Dict[str, Template] = {}
+
+    def compile_part(self, src_xml: str) -> None:
+        # Тот же XML, что render_xml_part передаёт в from_string
+        source = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+        self.compiled[source] = super().from_string(source)
+
+    def from_string(self, source, globals=None, template_class=None):
+        template = self.compiled.get(source) if globals is None and template_class is None else None
+        return template if template is not None else super().from_string(source, globals, template_class)
+
+
+@dataclass
+class CompiledTemplate:
+    """Разобранный шаблон: пакет, плейсхолдеры, XML частей после patch_xml."""
+
+    path: str
+    mtime_ns: int
+    size: int
+    package: bytes
+    placeholders: FrozenSet[str]
+    body_xml: str
+    # partname колонтитула → (кодировка, XML после patch_xml)
+    parts: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    env: _CompiledEnvironment = field(default_factory=_CompiledEnvironment)
+
+    def new_document(self) -> "CompiledDocxTemplate":
+        return CompiledDocxTemplate(self)
+
+
+class CompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate поверх CompiledTemplate: без patch_xml и компиляции Jinja на рендер."""
+
+    def __init__(self, compiled: CompiledTemplate):
+        super().__init__(BytesIO(compiled.package))
+        self.compiled = compiled
+
+    def render(self, context: Dict[str, Any], jinja_env: Optional[Environment] = None, autoescape: bool = False) -> None:
+        if jinja_env is None and not autoescape:
+            jinja_env = self.compiled.env
+        super().render(context, jinja_env, autoescape)
+
+    def build_xml(self, context, jinja_env=None):
+        return self.render_xml_part(self.compiled.body_xml, self.docx._part, context, jinja_env)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for relKey, part in self.get_headers_footers(uri):
+            cached = self.compiled.parts.get(str(part.partname))
+            if cached is None:
+                xml = self.get_part_xml(part)
+                encoding, xml = self.get_headers_footers_encoding(xml), self.patch_xml(xml)
+            else:
+                encoding, xml = cached
+            yield relKey, self.render_xml_part(xml, part, context, jinja_env).encode(encoding)
+
+
+def compile_template(path: Union[str, Path]) -> CompiledTemplate:
+    path = Path(path)
+    stat = path.stat()
+    package = path.read_bytes()
+    tpl = DocxTemplate(BytesIO(package))
+    tpl.init_docx()
+    compiled = CompiledTemplate(
+        path=str(path),
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        package=package,
+        placeholders=frozenset(scan_placeholders(package)),
+        body_xml=tpl.patch_xml(tpl.get_xml()),
+    )
+    compiled.env.compile_part(compiled.body_xml)
+    for uri in (DocxTemplate.HEADER_URI, DocxTemplate.FOOTER_URI):
+        for _, part in tpl.get_headers_footers(uri):
+            xml = tpl.get_part_xml(part)
+            patched = tpl.patch_xml(xml)
+            compiled.parts[str(part.partname)] = (tpl.get_headers_footers_encoding(xml), patched)
+            compiled.env.compile_part(patched)
+    log.info(
+        "LPA template compiled: %s (%d placeholders, %d header/footer parts)",
+        path.name, len(compiled.placeholders), len(compiled.parts),
+    )
+    return compiled
+
+
+_cache: Dict[str, CompiledTemplate] = {}
+_lock = threading.Lock()
+
+
+def get_compiled(path: Union[str, Path] = LPA_TEMPLATE) -> CompiledTemplate:
+    """Скомпилированный шаблон из кэша; перекомпилируется, если файл изменился."""
+    key = str(Path(path).resolve())
+    stat = Path(key).stat()
+    cached = _cache.get(key)
+    if cached is not None and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size):
+        return cached
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None or (cached.mtime_ns, cached.size) != (stat.st_mtime_ns, stat.st_size):
+            cached = _cache[key] = compile_template(key)
+        return cached
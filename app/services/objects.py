@@ -1,4 +1,4 @@
-from .bitrix import bx_get
+from .http_client import bx_iter
 from app.services.bitrix_ids import OBJECT_ETID
 from app.bitrix_field_map import resolve_code, upper_to_camel
 import logging
@@ -22,11 +22,9 @@ async def fetch_all_objects():
     if uf_code_camel:
         select_fields.append(uf_code_camel)
     
-    data = await bx_get("crm.item.list", entityTypeId=OBJECT_ETID, **{"select[]": select_fields}, start=0)
-    items = data["result"]["items"]
-    
+    # Все страницы (а не только первые 50): быстрый проход по ключу id
     objs = []
-    for i in items:
+    async for i in bx_iter("crm.item.list", {"entityTypeId": OBJECT_ETID, "select": select_fields}):
         bitrix_id = int(i["id"])
         title = i.get("title", f"Объект #{bitrix_id}")
         # Получаем код объекта (может быть в разных форматах)
@@ -3,9 +3,9 @@
 import json
 import logging
 from datetime import date, datetime
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 from app.services.bitrix import bx_post
-from app.services.http_client import bx as bx_http
+from app.services.http_client import BitrixError, bx_iter
 from app.services.bitrix_ids import SHIFT_ETID, UF_DATE, UF_TYPE, UF_PLAN_TOTAL
 from app.bitrix_field_map import resolve_code, upper_to_camel
 from app.services.objects import fetch_all_objects
@@ -17,6 +17,9 @@ from app.services.shift_meta import (
 
 log = logging.getLogger("gpo.shift_client")
 
+# Сколько последних смен просматривать, если портал не поддержал фильтр по дате
+FALLBACK_SCAN_LIMIT = 200
+
 
 def _shift_field_camel(logical_code: str) -> Optional[str]:
     """Возвращает camelCase код поля смены."""
@@ -76,6 +79,162 @@ def _score_shift(item: Dict[str, Any], f_plan_json_camel: str, f_plan_total_came
     return (priority, shift_id)
 
 
+def _plan_meta_object_id(plan_json_raw: Any) -> Optional[int]:
+    """meta.object_bitrix_id из UF_PLAN_JSON (строка, словарь или список из одного элемента)."""
+    plan = plan_json_raw
+    if isinstance(plan, list):
+        plan = plan[0] if plan else None
+    if isinstance(plan, str):
+        try:
+            plan = json.loads(plan) if plan.strip() else None
+        except ValueError:
+            return None
+    if not isinstance(plan, dict):
+        return None
+    meta = plan.get("meta") or {}
+    try:
+        return int(meta.get("object_bitrix_id")) if isinstance(meta, dict) and meta.get("object_bitrix_id") else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def _scan_shift_candidates(
+    object_bitrix_id: int,
+    target_date: date,
+    f_date_camel: str,
+    f_plan_json_camel: str,
+    select_fields: List[str],
+) -> List[Dict[str, Any]]:
+    """Смены пары (объект, дата) прямым запросом к порталу (без индекса)."""
+    # Все смены за день: фильтр по дате на стороне портала, страницы по ключу id
+    day_from = target_date.isoformat() + "T00:00:00"
+    day_to = target_date.isoformat() + "T23:59:59"
+    try:
+        items = [it async for it in bx_iter("crm.item.list", {
+            "entityTypeId": SHIFT_ETID,
+            "filter": {f">={f_date_camel}": day_from, f"<={f_date_camel}": day_to},
+            "select": select_fields,
+        })]
+    except BitrixError as e:
+        # Фильтр по UF-дате не поддержан порталом — только последние смены, от новых к старым:
+        # полный проход по всем сменам на интерактивном пути недопустим
+        log.warning(f"[SHIFT] date filter failed ({e}), scanning last {FALLBACK_SCAN_LIMIT} shifts")
+        items = []
+        async for it in bx_iter("crm.item.list", {
+            "entityTypeId": SHIFT_ETID,
+            "select": select_fields,
+        }, descending=True):
+            items.append(it)
+            if len(items) >= FALLBACK_SCAN_LIMIT:
+                break
+    
+    log.info(f"[SHIFT] raw items: {len(items)}")
+    
+    # Фильтруем смены по plan_json.meta.object_bitrix_id и дате
+    candidates = []
+    items_with_plan = 0
+    items_with_meta = 0
+    
+    for it in items:
+        shift_id = it.get("id")
+        if not shift_id:
+            continue
+        
+        raw_date = it.get(f_date_camel)
+        norm_date = _normalize_date(raw_date)
+        
+        plan_json_raw = it.get(f_plan_json_camel)
+        if not plan_json_raw:
+            log.debug(f"[SHIFT] skip id={shift_id} no plan_json")
+            continue
+        
+        items_with_plan += 1
+        
+        # Обрабатываем разные форматы: строка или уже распарсенный объект
+        plan = None
+        try:
+            if isinstance(plan_json_raw, str):
+                plan = json.loads(plan_json_raw)
+            elif isinstance(plan_json_raw, dict):
+                # Bitrix уже вернул распарсенный JSON как словарь
+                plan = plan_json_raw
+            elif isinstance(plan_json_raw, list):
+                # Bitrix вернул список - возможно, это массив с одним элементом-словарём
+                # Пробуем взять первый элемент, если он словарь
+                if plan_json_raw and len(plan_json_raw) > 0:
+                    first_elem = plan_json_raw[0]
+                    if isinstance(first_elem, dict):
+                        plan = first_elem
+                        log.debug(f"[SHIFT] id={shift_id} plan_json was list, using first element (keys: {list(plan.keys())[:5]})")
+                    elif isinstance(first_elem, str):
+                        # Возможно, это список строк - пробуем распарсить первую
+                        try:
+                            plan = json.loads(first_elem)
+                            log.debug(f"[SHIFT] id={shift_id} plan_json was list of strings, parsed first")
+                        except:
+                            log.debug(f"[SHIFT] skip id={shift_id} plan_json is list but first element is not parseable: {type(first_elem)}")
+                            continue
+                    else:
+                        log.debug(f"[SHIFT] skip id={shift_id} plan_json is list but first element is not dict/string: {type(first_elem)}")
+                        continue
+                else:
+                    log.debug(f"[SHIFT] skip id={shift_id} plan_json is empty list")
+                    continue
+            else:
+                log.debug(f"[SHIFT] skip id={shift_id} plan_json has unexpected type: {type(plan_json_raw)}")
+                continue
+        except Exception as e:
+            log.debug(f"[SHIFT] bad plan_json id={shift_id}: {e}")
+            continue
+        
+        # Проверяем, что plan - это словарь (не список)
+        if not plan or not isinstance(plan, dict):
+            log.debug(f"[SHIFT] skip id={shift_id} plan is not dict after parsing: {type(plan)}")
+            continue
+        
+        meta = plan.get("meta") or {}
+        meta_object_id = meta.get("object_bitrix_id")
+        
+        if not meta_object_id:
+            items_with_meta += 1
+            # Логируем первые несколько для отладки
+            if items_with_meta <= 5:
+                log.info(f"[SHIFT] skip id={shift_id} no meta.object_bitrix_id (meta keys: {list(meta.keys())}, plan keys: {list(plan.keys())})")
+                # Для отладки: показываем структуру plan
+                if items_with_meta == 1 and shift_id:
+                    log.info(f"[SHIFT] DEBUG: plan structure for id={shift_id}: {list(plan.keys())[:10]}")
+                    if meta:
+                        log.info(f"[SHIFT] DEBUG: meta structure for id={shift_id}: {meta}")
+                    else:
+                        log.info(f"[SHIFT] DEBUG: meta is empty for id={shift_id}")
+            else:
+                log.debug(f"[SHIFT] skip id={shift_id} no meta.object_bitrix_id (meta keys: {list(meta.keys())})")
+            continue
+        
+        # Сравниваем по объекту и дате
+        try:
+            meta_obj_int = int(meta_object_id)
+            target_obj_int = int(object_bitrix_id)
+            if meta_obj_int != target_obj_int:
+                log.debug(f"[SHIFT] skip id={shift_id} meta.object_id={meta_obj_int}!={target_obj_int}")
+                continue
+        except (ValueError, TypeError) as e:
+            log.debug(f"[SHIFT] skip id={shift_id} invalid meta.object_bitrix_id: {meta_object_id} ({e})")
+            continue
+        
+        if norm_date != target_date:
+            log.debug(f"[SHIFT] skip id={shift_id} date={norm_date}!={target_date}")
+            continue
+        
+        log.info(f"[SHIFT] MATCH id={shift_id} object={meta_object_id} date={norm_date}")
+        
+        candidates.append(it)
+    
+    log.info(f"[SHIFT] Filtering stats: items_with_plan={items_with_plan}, items_with_meta={items_with_meta}, candidates={len(candidates)}")
+    log.info(f"[SHIFT] candidates for object={object_bitrix_id} date={target_date}: {[c.get('id') for c in candidates]}")
+    return candidates
+
+
 async def bitrix_get_shift_for_object_and_date(
     object_bitrix_id: int,
     target_date: date,
@@ -103,6 +262,9 @@ async def bitrix_get_shift_for_object_and_date(
     Returns:
         Tuple[Optional[int], Optional[Dict]]: (Bitrix ID смены, метаданные) или (None, None)
     """
+    from app.services.bitrix_mirror import bitrix_mirror
+    from app.services.bitrix_shift_index import shift_index
+
     log.info(f"[SHIFT] search object={object_bitrix_id} date={target_date} create_if_not_exists={create_if_not_exists}")
     
     try:
@@ -118,152 +280,28 @@ async def bitrix_get_shift_for_object_and_date(
             log.error(f"[SHIFT] Required fields not found: UF_DATE={f_date}, UF_PLAN_JSON={f_plan_json}")
             return None, None
         
-        # Получаем последние смены для фильтрации
-        log.info(f"[SHIFT] Fetching last 200 shifts for filtering by plan_json.meta")
-        
         select_fields = ["id", f_date_camel, f_plan_json_camel]
         if f_plan_total_camel:
             select_fields.append(f_plan_total_camel)
         
         try:
-            shifts_resp = await bx_http("crm.item.list", {
-                "entityTypeId": SHIFT_ETID,
-                "order": {"id": "desc"},
-                "limit": 200,
-                "select": select_fields,
-            })
-            
-            items = shifts_resp.get("items", shifts_resp) if isinstance(shifts_resp, dict) else (shifts_resp if isinstance(shifts_resp, list) else [])
-            
-            log.info(f"[SHIFT] raw items: {len(items)}")
-            
-            # Логируем первые несколько смен для отладки
-            if items:
-                sample_ids = [it.get("id") for it in items[:5]]
-                log.info(f"[SHIFT] sample item ids: {sample_ids}")
-                # Проверяем, есть ли среди них смена с plan_json
-                for sample in items[:5]:
-                    sid = sample.get("id")
-                    pj = sample.get(f_plan_json_camel)
-                    if pj:
-                        try:
-                            # Обрабатываем разные форматы
-                            if isinstance(pj, str):
-                                p = json.loads(pj)
-                            elif isinstance(pj, dict):
-                                p = pj
-                            elif isinstance(pj, list) and pj and isinstance(pj[0], dict):
-                                p = pj[0]
-                            else:
-                                continue
-                            m = p.get("meta", {})
-                            log.info(f"[SHIFT] sample id={sid} has plan_json, meta keys: {list(m.keys())}, plan keys: {list(p.keys())}")
-                        except Exception as e:
-                            log.debug(f"[SHIFT] error parsing sample id={sid}: {e}")
-                            pass
-            
-            # Фильтруем смены по plan_json.meta.object_bitrix_id и дате
-            candidates = []
-            items_with_plan = 0
-            items_with_meta = 0
-            
-            for it in items:
-                shift_id = it.get("id")
-                if not shift_id:
-                    continue
-                
-                raw_date = it.get(f_date_camel)
-                norm_date = _normalize_date(raw_date)
-                
-                plan_json_raw = it.get(f_plan_json_camel)
-                if not plan_json_raw:
-                    log.debug(f"[SHIFT] skip id={shift_id} no plan_json")
-                    continue
-                
-                items_with_plan += 1
-                
-                # Обрабатываем разные форматы: строка или уже распарсенный объект
-                plan = None
-                try:
-                    if isinstance(plan_json_raw, str):
-                        plan = json.loads(plan_json_raw)
-                    elif isinstance(plan_json_raw, dict):
-                        # Bitrix уже вернул распарсенный JSON как словарь
-                        plan = plan_json_raw
-                    elif isinstance(plan_json_raw, list):
-                        # Bitrix вернул список - возможно, это массив с одним элементом-словарём
-                        # Пробуем взять первый элемент, если он словарь
-                        if plan_json_raw and len(plan_json_raw) > 0:
-                            first_elem = plan_json_raw[0]
-                            if isinstance(first_elem, dict):
-                                plan = first_elem
-                                log.debug(f"[SHIFT] id={shift_id} plan_json was list, using first element (keys: {list(plan.keys())[:5]})")
-                            elif isinstance(first_elem, str):
-                                # Возможно, это список строк - пробуем распарсить первую
-                                try:
-                                    plan = json.loads(first_elem)
-                                    log.debug(f"[SHIFT] id={shift_id} plan_json was list of strings, parsed first")
-                                except:
-                                    log.debug(f"[SHIFT] skip id={shift_id} plan_json is list but first element is not parseable: {type(first_elem)}")
-                                    continue
-                            else:
-                                log.debug(f"[SHIFT] skip id={shift_id} plan_json is list but first element is not dict/string: {type(first_elem)}")
-                                continue
-                        else:
-                            log.debug(f"[SHIFT] skip id={shift_id} plan_json is empty list")
-                            continue
-                    else:
-                        log.debug(f"[SHIFT] skip id={shift_id} plan_json has unexpected type: {type(plan_json_raw)}")
-                        continue
-                except Exception as e:
-                    log.debug(f"[SHIFT] bad plan_json id={shift_id}: {e}")
-                    continue
-                
-                # Проверяем, что plan - это словарь (не список)
-                if not plan or not isinstance(plan, dict):
-                    log.debug(f"[SHIFT] skip id={shift_id} plan is not dict after parsing: {type(plan)}")
-                    continue
-                
-                meta = plan.get("meta") or {}
-                meta_object_id = meta.get("object_bitrix_id")
-                
-                if not meta_object_id:
-                    items_with_meta += 1
-                    # Логируем первые несколько для отладки
-                    if items_with_meta <= 5:
-                        log.info(f"[SHIFT] skip id={shift_id} no meta.object_bitrix_id (meta keys: {list(meta.keys())}, plan keys: {list(plan.keys())})")
-                        # Для отладки: показываем структуру plan
-                        if items_with_meta == 1 and shift_id:
-                            log.info(f"[SHIFT] DEBUG: plan structure for id={shift_id}: {list(plan.keys())[:10]}")
-                            if meta:
-                                log.info(f"[SHIFT] DEBUG: meta structure for id={shift_id}: {meta}")
-                            else:
-                                log.info(f"[SHIFT] DEBUG: meta is empty for id={shift_id}")
-                    else:
-                        log.debug(f"[SHIFT] skip id={shift_id} no meta.object_bitrix_id (meta keys: {list(meta.keys())})")
-                    continue
-                
-                # Сравниваем по объекту и дате
-                try:
-                    meta_obj_int = int(meta_object_id)
-                    target_obj_int = int(object_bitrix_id)
-                    if meta_obj_int != target_obj_int:
-                        log.debug(f"[SHIFT] skip id={shift_id} meta.object_id={meta_obj_int}!={target_obj_int}")
-                        continue
-                except (ValueError, TypeError) as e:
-                    log.debug(f"[SHIFT] skip id={shift_id} invalid meta.object_bitrix_id: {meta_object_id} ({e})")
-                    continue
-                
-                if norm_date != target_date:
-                    log.debug(f"[SHIFT] skip id={shift_id} date={norm_date}!={target_date}")
-                    continue
-                
-                log.info(f"[SHIFT] MATCH id={shift_id} object={meta_object_id} date={norm_date}")
-                
-                candidates.append(it)
-            
-            log.info(f"[SHIFT] Filtering stats: items_with_plan={items_with_plan}, items_with_meta={items_with_meta}, candidates={len(candidates)}")
-            log.info(f"[SHIFT] candidates for object={object_bitrix_id} date={target_date}: {[c.get('id') for c in candidates]}")
+            candidates = await shift_index.lookup(object_bitrix_id, target_date)
+            if candidates is not None:
+                log.info(f"[SHIFT] index candidates for object={object_bitrix_id} date={target_date}: {[c.get('id') for c in candidates]}")
+            else:
+                candidates = await bitrix_mirror.shifts_on(target_date, object_bitrix_id)
+                if candidates is not None:
+                    # Объект в зеркале может быть взят из привязки — кандидат только по meta плана
+                    candidates = [
+                        c for c in candidates
+                        if _plan_meta_object_id(c.get(f_plan_json_camel)) == int(object_bitrix_id)
+                    ]
+                    log.info(f"[SHIFT] mirror candidates for object={object_bitrix_id} date={target_date}: {[c.get('id') for c in candidates]}")
+            if candidates is None:
+                # Ни индекса, ни свежего зеркала — прямой запрос к порталу
+                candidates = await _scan_shift_candidates(
+                    object_bitrix_id, target_date, f_date_camel, f_plan_json_camel, select_fields,
+                )
             
             # Если кандидатов нет
             if not candidates:
@@ -1,8 +1,19 @@
-from contextlib import contextmanager
-from datetime import datetime, date
-from typing import Dict, Any, List, Optional
+"""Локальные смены (таблица shifts) для потоков бота.
 
-from app.db import SessionLocal
+Все функции асинхронные и работают через async_session (общий пул
+async_engine из app.db): хендлеры aiogram не блокируют цикл событий на
+запросах к БД.
+"""
+
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.db import async_session
 from app.models import Shift, ShiftType, ShiftStatus
 from app.services.lpa_utils import (
     build_plan_json_from_raw,
@@ -10,19 +21,17 @@ from app.services.lpa_utils import (
     build_fact_json_from_raw,
 )
 
-@contextmanager
-def session_scope():
-    s = SessionLocal()
-    try:
-        yield s
-        s.commit()
-    except:
-        s.rollback()
-        raise
-    finally:
-        s.close()
-
-def save_plan(object_id: int, date_key: str, plan: dict, created_by: int = 1, **extra_fields) -> int:
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    async with async_session() as s:
+        try:
+            yield s
+            await s.commit()
+        except:
+            await s.rollback()
+            raise
+
+async def save_plan(object_id: int, date_key: str, plan: dict, created_by: int = 1, **extra_fields) -> int:
     import logging
 
     log = logging.getLogger("gpo.shift_repo")
@@ -57,7 +66,7 @@ def save_plan(object_id: int, date_key: str, plan: dict, created_by: int = 1, **
         plan_json.get("total_plan"),
     )
 
-    with session_scope() as s:
+    async with session_scope() as s:
         sh = Shift(
             object_id=object_id,
             date=d,
@@ -67,22 +76,24 @@ def save_plan(object_id: int, date_key: str, plan: dict, created_by: int = 1, **
             created_by=created_by,
         )
         s.add(sh)
-        s.flush()
+        await s.flush()
         log.info(f"[save_plan] Saved shift_id={sh.id}")
         return sh.id
 
-def get_last_open_shift(object_id: int) -> tuple[int, dict] | None:
+async def get_last_open_shift(object_id: int) -> tuple[int, dict] | None:
     """Получить последнюю открытую смену для объекта.
     
     Returns:
         (shift_id, plan) - где plan это словарь {работа: количество}
     """
     try:
-        with session_scope() as s:
+        async with session_scope() as s:
             # Используем только поля, которые точно есть в БД (без bitrix_id в SELECT)
-            sh = s.query(Shift.id, Shift.object_id, Shift.status, Shift.plan_json)\
-                     .filter(Shift.object_id==object_id, Shift.status==ShiftStatus.OPEN)\
-                     .order_by(Shift.id.desc()).first()
+            sh = (await s.execute(
+                select(Shift.id, Shift.object_id, Shift.status, Shift.plan_json)
+                .where(Shift.object_id == object_id, Shift.status == ShiftStatus.OPEN)
+                .order_by(Shift.id.desc()).limit(1)
+            )).first()
             if not sh:
                 return None
             
@@ -90,14 +101,17 @@ def get_last_open_shift(object_id: int) -> tuple[int, dict] | None:
             if not plan_json.get("tasks"):
                 plan_json = build_plan_json_from_raw(plan_json or {})
             return (sh.id, plan_json)
-    except Exception as e:
+    except Exception:
         # Если ошибка из-за отсутствия колонки bitrix_id, пробуем без явного SELECT
         import logging
         log = logging.getLogger("gpo.shift_repo")
         try:
-            with session_scope() as s:
-                sh = s.query(Shift).filter(Shift.object_id==object_id, Shift.status==ShiftStatus.OPEN)\
-                         .order_by(Shift.id.desc()).first()
+            async with session_scope() as s:
+                sh = (await s.execute(
+                    select(Shift)
+                    .where(Shift.object_id == object_id, Shift.status == ShiftStatus.OPEN)
+                    .order_by(Shift.id.desc()).limit(1)
+                )).scalars().first()
                 if not sh:
                     return None
                 
@@ -109,29 +123,49 @@ def get_last_open_shift(object_id: int) -> tuple[int, dict] | None:
             log.error(f"Error in get_last_open_shift: {e2}", exc_info=True)
             return None
 
-def get_shift_by_bitrix_id(bitrix_id: int) -> tuple[int, dict] | None:
+async def get_shift_by_bitrix_id(bitrix_id: int) -> tuple[int, dict] | None:
     """Получить смену по bitrix_id из локальной БД.
     
     Returns:
-        (shift_id, {"object_id": int, ...}) или None
+        (shift_id, {"object_id", "object_name", "date", "type", "status", "eff_final", "plan_json", "fact_json"}) или None
     """
     try:
-        with session_scope() as s:
-            sh = s.query(Shift).filter(Shift.bitrix_id == bitrix_id).first()
+        async with session_scope() as s:
+            sh = (await s.execute(
+                select(Shift).options(selectinload(Shift.object))
+                .where(Shift.bitrix_id == bitrix_id).limit(1)
+            )).scalars().first()
             if not sh:
                 return None
-            return (sh.id, {"object_id": sh.object_id})
+            return (sh.id, {
+                "object_id": sh.object_id,
+                "object_name": sh.object.name if sh.object else None,
+                "date": sh.date,
+                "type": sh.type.value if sh.type else None,
+                "status": sh.status.value if sh.status else None,
+                "eff_final": sh.eff_final,
+                "plan_json": sh.plan_json or {},
+                "fact_json": sh.fact_json or {},
+            })
     except Exception as e:
         import logging
         log = logging.getLogger("gpo.shift_repo")
         log.debug(f"Error in get_shift_by_bitrix_id: {e}")
         return None
 
-def get_last_closed_shift(object_id: int) -> tuple[int, dict] | None:
+async def get_shift_bitrix_id(shift_id: int) -> Optional[int]:
+    """bitrix_id локальной смены (None — смены нет или она не выгружена в Bitrix24)."""
+    async with session_scope() as s:
+        return (await s.execute(select(Shift.bitrix_id).where(Shift.id == shift_id))).scalar_one_or_none()
+
+async def get_last_closed_shift(object_id: int) -> tuple[int, dict] | None:
     """Получить последнюю закрытую смену для объекта."""
-    with session_scope() as s:
-        sh = s.query(Shift).filter(Shift.object_id==object_id, Shift.status==ShiftStatus.CLOSED)\
-                 .order_by(Shift.id.desc()).first()
+    async with session_scope() as s:
+        sh = (await s.execute(
+            select(Shift).options(selectinload(Shift.object))
+            .where(Shift.object_id == object_id, Shift.status == ShiftStatus.CLOSED)
+            .order_by(Shift.id.desc()).limit(1)
+        )).scalars().first()
         if not sh:
             return None
         
@@ -184,7 +218,7 @@ def get_last_closed_shift(object_id: int) -> tuple[int, dict] | None:
             "status": sh.status.value if sh.status else None
         })
 
-def save_fact(
+async def save_fact(
     shift_id: int,
     fact: dict,
     eff_raw: float,
@@ -195,8 +229,8 @@ def save_fact(
     photos: Optional[List[str]] = None,
 ) -> None:
     """Сохранить факты смены. Не закрывает смену, только сохраняет данные."""
-    with session_scope() as s:
-        sh = s.get(Shift, shift_id)
+    async with session_scope() as s:
+        sh = await s.get(Shift, shift_id)
         if not sh:
             return
 
@@ -1,6 +1,7 @@
 # app/services/w6_alerts.py
 
 import os
+import asyncio
 import json
 import math
 import datetime as dt
@@ -9,6 +10,10 @@ from pathlib import Path
 
 from app.bitrix_field_map import resolve_code
 from app.services.http_client import bx, BitrixError
+from app.services.bitrix_batch import bx_batch
+from app.services.bitrix_ids import SHIFT_ETID
+from app.services.bitrix_mirror import bitrix_mirror
+from app.services.bitrix_select import bx_projected
 from dotenv import load_dotenv
 
 log = logging.getLogger("gpo.w6_alerts")
@@ -47,6 +52,11 @@ async def list_shifts_by_date(date: dt.date) -> list[dict]:
     fld_date = resolve_code("Смена", "UF_DATE")
     fld_date_camel = upper_to_camel(fld_date)  # Используем camelCase для Bitrix24 API
     
+    mirrored = await bitrix_mirror.shifts_on(date) if ENTITY_SHIFT == SHIFT_ETID else None
+    if mirrored is not None:
+        log.info(f"Found {len(mirrored)} shifts for {date} in mirror")
+        return mirrored
+    
     day_from = dt.datetime.combine(date, dt.time.min).isoformat()
     day_to = dt.datetime.combine(date, dt.time.max).isoformat()
     
@@ -56,11 +66,10 @@ async def list_shifts_by_date(date: dt.date) -> list[dict]:
         filter_dict[f">={fld_date_camel}"] = day_from
         filter_dict[f"<={fld_date_camel}"] = day_to
         
-        res = await bx("crm.item.list", {
+        res = await bx_projected("crm.item.list", {
             "entityTypeId": ENTITY_SHIFT,
             "filter": filter_dict,
-            "select": ["id", "title", fld_date_camel, "*", "ufCrm%"]
-        })
+        }, "w6.shifts", fld_date_camel)
         
         items = res.get("items", res) if isinstance(res, dict) else (res if isinstance(res, list) else [])
         if items:
@@ -72,12 +81,11 @@ async def list_shifts_by_date(date: dt.date) -> list[dict]:
         pass
     
     # 2) fallback: последние 50 записей и ручная фильтрация по дате
-    res2 = await bx("crm.item.list", {
+    res2 = await bx_projected("crm.item.list", {
         "entityTypeId": ENTITY_SHIFT,
         "order": {"id": "desc"},
         "limit": 50,
-        "select": ["id", "title", fld_date_camel, "*", "ufCrm%"]
-    })
+    }, "w6.shifts", fld_date_camel)
     
     items2 = res2.get("items", res2) if isinstance(res2, dict) else (res2 if isinstance(res2, list) else [])
     
@@ -111,6 +119,10 @@ async def list_resources_by_shift(shift_id: int) -> list[dict]:
     fld = resolve_code("Ресурс", "UF_SHIFT_ID")
     fld_camel = upper_to_camel(fld)  # Используем camelCase для фильтра
     
+    mirrored = await bitrix_mirror.by_shift(ENTITY_RESOURCE, shift_id)
+    if mirrored is not None:
+        return mirrored
+    
     try:
         res = await bx("crm.item.list", {
             "entityTypeId": ENTITY_RESOURCE,
@@ -142,6 +154,10 @@ async def list_timesheets_by_shift(shift_id: int) -> list[dict]:
     fld = resolve_code("Табель", "UF_SHIFT_ID")
     fld_camel = upper_to_camel(fld)  # Используем camelCase для фильтра
     
+    mirrored = await bitrix_mirror.by_shift(ENTITY_TIMESHEET, shift_id)
+    if mirrored is not None:
+        return mirrored
+    
     try:
         res = await bx("crm.item.list", {
             "entityTypeId": ENTITY_TIMESHEET,
@@ -300,6 +316,7 @@ async def build_daily_report(date: dt.date, filter_objects: set[int] | None = No
             except:
                 pass
     
+    selected = []
     for s in shifts:
         sid = s["id"]
         
@@ -329,8 +346,17 @@ async def build_daily_report(date: dt.date, filter_objects: set[int] | None = No
                     log.debug(f"Could not parse object_id from shift {sid}, field {f_object}, value: {object_link}")
                     pass
         
-        resources = await list_resources_by_shift(sid)
-        timesheets = await list_timesheets_by_shift(sid)
+        selected.append(s)
+    
+    # Ресурсы и табели всех смен запрашиваем параллельно: bx склеивает их в batch по 50 команд
+    async with bx_batch():
+        resources_all, timesheets_all = await asyncio.gather(
+            asyncio.gather(*(list_resources_by_shift(s["id"]) for s in selected)),
+            asyncio.gather(*(list_timesheets_by_shift(s["id"]) for s in selected)),
+        )
+    
+    for s, resources, timesheets in zip(selected, resources_all, timesheets_all):
+        sid = s["id"]
         
         # Читаем план и факт из JSON-полей (приоритет над агрегатами)
         from app.services.lpa_data import _parse_json_field as parse_json_field
@@ -6,6 +6,8 @@ from datetime import date, datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from app.services.bitrix_metrics import run_as_caller
+from app.services.bitrix_ratelimit import Lane, run_in_lane
 from app.services.w6_alerts import build_daily_report, list_subscribers
 from app.telegram.bot import gpo_bot
 
@@ -47,6 +49,8 @@ class W6Scheduler:
         self.scheduler.shutdown()
         log.info("W6 Scheduler stopped")
 
+    @run_in_lane(Lane.REPORT)
+    @run_as_caller("w6")
     async def send_morning_report(self):
         """Отправка утренней сводки за вчера."""
         try:
@@ -72,6 +76,8 @@ class W6Scheduler:
         except Exception as e:
             log.error(f"Error in send_morning_report: {e}", exc_info=True)
 
+    @run_in_lane(Lane.REPORT)
+    @run_as_caller("w6")
     async def send_evening_report(self):
         """Отправка вечерней сводки за сегодня."""
         try:
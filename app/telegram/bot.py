@@ -11,6 +11,7 @@ from .flow_resources import router as resources_router
 from .flow_timesheet import router as timesheet_router
 from .flow_w6 import router as w6_router
 from .router_root import router as root_router
+from .utils_tg import tag_router
 from app.handlers.authz import router as authz_router
 from app.handlers.debug import router as debug_router
 from app.handlers.w6_handlers import router as w6_handlers_router
@@ -44,6 +45,19 @@ settings = get_settings()
 gpo_bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher(storage=MemoryStorage())
 
+# Метки потоков для метрик Bitrix (caller в /metrics)
+for _router, _tag in (
+    (plan_router, "plan"),
+    (report_router, "report"),
+    (lpa_router, "lpa"),
+    (resources_router, "resources"),
+    (timesheet_router, "timesheet"),
+    (w6_router, "w6"),
+    (w6_handlers_router, "w6"),
+    (insights_router, "insights"),
+):
+    tag_router(_router, _tag)
+
 # Роутеры меню (первыми для перехвата /start)
 dp.include_router(menu_router)  # Новое меню с клавиатурой (ролевое меню) - ПЕРВЫМ для /start
 
@@ -76,6 +90,12 @@ else:
 if __name__ == "__main__":
     import asyncio
     from app.scheduler import setup_scheduler
+    from app.services.bitrix_changes import shutdown_change_feed, startup_change_feed
+    from app.services.bitrix_mirror import shutdown_bitrix_mirror, startup_bitrix_mirror
+    from app.services.bitrix_shift_index import shutdown_shift_index, startup_shift_index
+    from app.services.http_client import shutdown_http_client, startup_http_client
+    from app.services.lpa_convert import shutdown_lpa_converter, startup_lpa_converter
+    from app.services.lpa_render_pool import shutdown_lpa_renderer
     
     # Функция отправки для планировщика
     async def _bot_send(chat_id: int, text: str):
@@ -99,6 +119,17 @@ if __name__ == "__main__":
         else:
             log.warning("BITRIX_WEBHOOK_URL не установлен в .env")
         
+        # Общий пул HTTP-соединений к Bitrix24 (keep-alive между запросами)
+        await startup_http_client()
+        # Лента изменений Bitrix: кэш и индексы обновляются по updatedTime
+        await startup_change_feed()
+        # Индекс смен (объект, дата) для поиска смены без запросов к порталу
+        await startup_shift_index()
+        # Зеркало смарт-процессов в БД (BITRIX_MIRROR=1) для отчётов и ЛПА
+        await startup_bitrix_mirror()
+        # Пул LibreOffice для конвертации ЛПА в PDF
+        await startup_lpa_converter()
+        
         # Настраиваем планировщик (запускается автоматически при setup_scheduler)
         scheduler = setup_scheduler(_bot_send)
         log.info("Планировщик настроен")
@@ -125,6 +156,12 @@ if __name__ == "__main__":
             # Останавливаем планировщик при выходе
             log.info("Остановка планировщика...")
             scheduler.shutdown()
+            await shutdown_lpa_renderer()
+            await shutdown_lpa_converter()
+            await shutdown_bitrix_mirror()
+            await shutdown_shift_index()
+            await shutdown_change_feed()
+            await shutdown_http_client()
     
     # Альтернативный вариант с runner (aiogram 3.x):
     # from aiogram import Bot, Dispatcher
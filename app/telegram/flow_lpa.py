@@ -14,6 +14,7 @@ import logging
 from app.services.objects import fetch_all_objects
 from app.services.shift_repo import get_last_closed_shift
 from app.services.lpa_data import collect_lpa_data
+from app.services.lpa_search import ShiftCodes, find_closed_shift, shift_status, shift_totals
 from app.services.lpa_pdf import LPAPlaceholderError
 from app.telegram.objects_ui import page_kb
 from app.services.shift_client import bitrix_update_shift_aggregates
@@ -226,6 +227,134 @@ async def lpa_obj_page(cq: CallbackQuery, state: FSMContext):
     await state.update_data(page=page)
 
 
+async def _bitrix_shift_data(item: dict, obj_id: int, codes: ShiftCodes) -> tuple[dict, int]:
+    """shift_data для закрытой смены из Bitrix24: детали из локальной БД или JSON плана/факта.
+
+    Returns:
+        (shift_data, shift_id) — shift_id локальный, если смена есть в БД, иначе Bitrix ID
+    """
+    import json
+    from app.bitrix_field_map import resolve_code, upper_to_camel
+    from app.services.shift_repo import get_shift_by_bitrix_id
+
+    bitrix_shift_id = item.get("id")
+    totals = shift_totals(item, codes)
+    plan_total, fact_total, eff_final = totals["plan_total"], totals["fact_total"], totals["eff_final"]
+    item_status = shift_status(item, codes)
+    
+    logger.info(f"✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
+    log.info(f"[LPA] ✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
+    
+    # Получаем дату смены
+    shift_date_str = item.get(ShiftCodes.camel(codes.date)) or item.get(codes.date)
+    shift_date = "Не указана"
+    if shift_date_str:
+        try:
+            if isinstance(shift_date_str, str):
+                shift_date_obj = datetime.fromisoformat(shift_date_str.replace("Z", "+00:00")).date()
+            else:
+                shift_date_obj = shift_date_str
+            shift_date = shift_date_obj.strftime("%d.%m.%Y")
+        except Exception:
+            shift_date = "Не указана"
+    
+    # Получаем название объекта: objs это список кортежей (id, title)
+    objs = await fetch_all_objects()
+    obj_name = next((title for oid, title in objs if oid == obj_id), f"Объект #{obj_id}")
+    
+    summary = {
+        "plan": {
+            "plan_total": plan_total,
+            "object_name": obj_name,  # Используем актуальное название из выбранного объекта
+            "date": shift_date,
+        },
+        "fact": {"fact_total": fact_total},
+        "efficiency": eff_final,
+        "date": shift_date,
+        "type": "day",
+        "status": item_status if item_status else "closed"
+    }
+    
+    # Пытаемся получить детальные данные из локальной БД
+    local_shift = await get_shift_by_bitrix_id(bitrix_shift_id)
+    if local_shift:
+        local_shift_id, sh = local_shift
+        if sh["object_id"] == obj_id:
+            object_name_local = sh["object_name"] or obj_name
+            formatted_date_local = sh["date"].strftime("%d.%m.%Y") if sh["date"] else shift_date
+            plan_data_full = sh["plan_json"]
+            fact_data_full = sh["fact_json"]
+            logger.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
+            log.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
+            return {
+                "plan": {
+                    **plan_data_full,
+                    "object_name": object_name_local,
+                    "date": formatted_date_local,
+                    "section": plan_data_full.get("section", "Не указан"),
+                    "foreman": plan_data_full.get("foreman", "Не указан"),
+                    "shift_type": sh["type"] or "day"
+                },
+                "fact": fact_data_full,
+                "efficiency": sh["eff_final"] or eff_final,
+                "date": formatted_date_local,
+                "type": sh["type"] or "day",
+                "status": sh["status"] or "closed"
+            }, local_shift_id
+        # Объект не совпадает, используем данные из Bitrix24
+        return summary, bitrix_shift_id
+    
+    # Не нашли в локальной БД, пробуем получить детальные данные из Bitrix24 (JSON)
+    logger.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
+    log.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
+    
+    f_plan_json = resolve_code("Смена", "UF_PLAN_JSON")
+    f_fact_json = resolve_code("Смена", "UF_FACT_JSON")
+    plan_json_str = (item.get(upper_to_camel(f_plan_json)) or item.get(f_plan_json)) if f_plan_json else None
+    fact_json_str = (item.get(upper_to_camel(f_fact_json)) or item.get(f_fact_json)) if f_fact_json else None
+    
+    plan_data_from_json = {}
+    fact_data_from_json = {}
+    if plan_json_str:
+        try:
+            plan_data_from_json = json.loads(plan_json_str) if isinstance(plan_json_str, str) else plan_json_str
+            logger.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
+            log.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
+        except Exception as e:
+            logger.warning(f"[LPA] Could not parse plan_json from Bitrix24: {e}")
+    if fact_json_str:
+        try:
+            fact_data_from_json = json.loads(fact_json_str) if isinstance(fact_json_str, str) else fact_json_str
+            logger.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
+            log.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
+        except Exception as e:
+            logger.warning(f"[LPA] Could not parse fact_json from Bitrix24: {e}")
+    
+    if not (plan_data_from_json or fact_data_from_json):
+        # Используем только итоговые данные из Bitrix24
+        logger.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
+        log.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
+        return summary, bitrix_shift_id
+    
+    logger.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
+    log.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
+    return {
+        "plan": {
+            **plan_data_from_json,
+            "object_name": obj_name,  # Всегда используем актуальное название из выбранного объекта
+            "date": plan_data_from_json.get("date") or shift_date,
+            "section": plan_data_from_json.get("section", "Не указан"),
+            "foreman": plan_data_from_json.get("foreman", "Не указан"),
+            "shift_type": plan_data_from_json.get("shift_type", "day")
+        },
+        "fact": fact_data_from_json if fact_data_from_json else {"fact_total": fact_total},
+        "efficiency": eff_final,
+        "date": plan_data_from_json.get("date") or shift_date,
+        "type": "day",
+        "status": item_status if item_status else "closed"
+    }, bitrix_shift_id
+
+
 @router.callback_query(F.data.startswith("lpaobj:") & ~F.data.contains(":page:"))
 async def lpa_obj_pick(cq: CallbackQuery, state: FSMContext):
     """Выбор объекта для ЛПА."""
@@ -238,11 +367,7 @@ async def lpa_obj_pick(cq: CallbackQuery, state: FSMContext):
     log.info(f"[LPA] User {user_id} selected object {obj_id} for LPA generation")
     
     # ПРИОРИТЕТ: Сначала ищем закрытую смену в локальной БД (там есть детальные данные из чата)
-    from datetime import date, timedelta
-    from app.services.http_client import bx
-    from app.services.bitrix_ids import SHIFT_ETID, UF_OBJECT_LINK, UF_STATUS
     from app.bitrix_field_map import resolve_code, upper_to_camel
-    from app.services.w6_alerts import _get_field_value
     # get_last_closed_shift уже импортирован в начале файла
     
     shift_data = None
@@ -253,7 +378,7 @@ async def lpa_obj_pick(cq: CallbackQuery, state: FSMContext):
     logger.info(f"[LPA] ===== START: Searching for closed shift in LOCAL DB for object {obj_id} =====")
     log.info(f"[LPA] ===== START: Searching for closed shift in LOCAL DB for object {obj_id} =====")
     print(f"[LPA] Ищем закрытую смену для объекта {obj_id} в локальной БД...")
-    result = get_last_closed_shift(obj_id)
+    result = await get_last_closed_shift(obj_id)
     if result:
         shift_id, shift_data = result
         logger.info(f"✅ Found closed shift in LOCAL DB: {shift_id}")
@@ -281,15 +406,12 @@ async def lpa_obj_pick(cq: CallbackQuery, state: FSMContext):
             print(f"[LPA] Факт: {type(fact_data_check)}")
         
         # Получаем bitrix_id для загрузки фото и проверки данных в Bitrix24
-        from app.db import session_scope
-        from app.models import Shift
+        from app.services.shift_repo import get_shift_bitrix_id
         bitrix_shift_id = None
         try:
-            with session_scope() as s:
-                sh = s.get(Shift, shift_id)
-                if sh and sh.bitrix_id:
-                    bitrix_shift_id = sh.bitrix_id
-                    logger.info(f"[LPA] Got bitrix_id={bitrix_shift_id} for local shift {shift_id}")
+            bitrix_shift_id = await get_shift_bitrix_id(shift_id)
+            if bitrix_shift_id:
+                logger.info(f"[LPA] Got bitrix_id={bitrix_shift_id} for local shift {shift_id}")
         except Exception as e:
             logger.warning(f"[LPA] Could not get bitrix_id: {e}")
         
@@ -421,756 +543,18 @@ async def lpa_obj_pick(cq: CallbackQuery, state: FSMContext):
                 logger.warning(f"[LPA] Could not get data from Bitrix24: {e}")
                 log.warning(f"[LPA] Could not get data from Bitrix24: {e}")
     
-    # Если не нашли в локальной БД, тогда ищем в Bitrix24
-    
     # Если не нашли в локальной БД, ищем в Bitrix24 (но там только итоговые данные)
     if not shift_data:
         logger.info(f"[LPA] Not found in local DB, searching in Bitrix24...")
         log.info(f"[LPA] Not found in local DB, searching in Bitrix24...")
         
-        # Ищем смены с фактическими данными в Bitrix24 за последние 60 дней
-        today = date.today()
-        
-        logger.info(f"[LPA] ===== Searching for closed shifts with fact data for object {obj_id} in Bitrix24 (last 60 days) =====")
-        log.info(f"[LPA] ===== Searching for closed shifts with fact data for object {obj_id} in Bitrix24 (last 60 days) =====")
-        print(f"[LPA] ===== Searching for closed shifts in Bitrix24 for object {obj_id} =====")
-        
         try:
-            logger.info(f"[LPA] Inside try block, starting Bitrix24 search")
-            log.info(f"[LPA] Inside try block, starting Bitrix24 search")
-            
-            # Получаем коды полей один раз
-            f_date = resolve_code("Смена", "UF_DATE")
-            f_date_camel = upper_to_camel(f_date)
-            f_plan_code = resolve_code("Смена", "UF_PLAN_TOTAL")
-            f_fact_code = resolve_code("Смена", "UF_FACT_TOTAL")
-            f_eff_code = resolve_code("Смена", "UF_EFF_FINAL")
-            f_status_code = resolve_code("Смена", "UF_STATUS")
-            f_status_camel = upper_to_camel(f_status_code)
-            f_fact_camel = upper_to_camel(f_fact_code)
-            f_plan_camel = upper_to_camel(f_plan_code)
-            f_eff_camel = upper_to_camel(f_eff_code)
-            
-            # СНАЧАЛА пробуем найти смены напрямую по объекту (более эффективно)
-            # Ищем смены с привязкой к объекту за последние 60 дней
-            logger.info(f"[LPA] Trying direct search by object {obj_id} in Bitrix24")
-            log.info(f"[LPA] Trying direct search by object {obj_id} in Bitrix24")
-            
-            # Формируем фильтр по объекту (пробуем разные форматы)
-            obj_filter_values = [
-                f"D_{obj_id}",  # Формат "D_1046"
-                str(obj_id),    # Просто число
-            ]
-            
-            # Пробуем найти смены напрямую по объекту (используем фильтр)
-            try:
-                # Пробуем использовать фильтр по объекту напрямую
-                # Bitrix24 может требовать формат "D_1046" для фильтрации
-                obj_filter_value = f"D_{obj_id}"
-                
-                # Пробуем найти смены с фильтром по объекту
-                shifts_res = await bx("crm.item.list", {
-                    "entityTypeId": SHIFT_ETID,
-                    "filter": {
-                        UF_OBJECT_LINK: obj_filter_value
-                    },
-                    "select": ["id", f_date_camel, UF_OBJECT_LINK, f_status_camel, f_plan_camel, f_fact_camel, f_eff_camel, "*"],
-                    "order": {"id": "desc"},
-                    "limit": 200
-                })
-                
-                items = shifts_res.get("items", []) if isinstance(shifts_res, dict) else (shifts_res if isinstance(shifts_res, list) else [])
-                
-                # Если фильтр сработал и нашли смены, считаем что они уже отфильтрованы
-                if items:
-                    logger.info(f"[LPA] Found {len(items)} shifts for object {obj_id} using filter")
-                    log.info(f"[LPA] Found {len(items)} shifts for object {obj_id} using filter")
-                    matching_items = items  # Уже отфильтрованы Bitrix24
-                else:
-                    # Если фильтр не сработал, пробуем без фильтра (старый метод)
-                    logger.info(f"[LPA] Filter by object didn't work, trying without filter")
-                    log.info(f"[LPA] Filter by object didn't work, trying without filter")
-                    shifts_res = await bx("crm.item.list", {
-                        "entityTypeId": SHIFT_ETID,
-                        "select": ["id", f_date_camel, UF_OBJECT_LINK, f_status_camel, f_plan_camel, f_fact_camel, f_eff_camel, "*"],
-                        "order": {"id": "desc"},
-                        "limit": 200  # Увеличиваем лимит для поиска по объекту
-                    })
-                    
-                    items = shifts_res.get("items", []) if isinstance(shifts_res, dict) else (shifts_res if isinstance(shifts_res, list) else [])
-                    logger.info(f"[LPA] Found {len(items)} total shifts in Bitrix24, filtering by object {obj_id}")
-                    log.info(f"[LPA] Found {len(items)} total shifts in Bitrix24, filtering by object {obj_id}")
-                    
-                    # Фильтруем по объекту вручную
-                    matching_items = []
-                    logger.info(f"[LPA] Filtering {len(items)} shifts by object {obj_id}")
-                    log.info(f"[LPA] Filtering {len(items)} shifts by object {obj_id}")
-                    
-                    for idx, item in enumerate(items):
-                        shift_id_item = item.get("id", "unknown")
-                        obj_link = item.get(UF_OBJECT_LINK)
-                        
-                        if idx < 5:  # Логируем первые 5 смен для диагностики
-                            logger.info(f"[LPA] Shift {shift_id_item}: UF_OBJECT_LINK = {obj_link} (type: {type(obj_link).__name__})")
-                            log.info(f"[LPA] Shift {shift_id_item}: UF_OBJECT_LINK = {obj_link} (type: {type(obj_link).__name__})")
-                        
-                        if not obj_link:
-                            if idx < 5:
-                                logger.debug(f"[LPA] Shift {shift_id_item}: no UF_OBJECT_LINK, skipping")
-                            continue
-                        
-                        # Bitrix24 может возвращать "Array" как строку, если поле множественное
-                        # Пробуем получить реальное значение через другие поля или методы
-                        obj_str = None
-                        
-                        # Пробуем разные варианты получения привязки
-                        if isinstance(obj_link, list) and len(obj_link) > 0:
-                            obj_str = obj_link[0]
-                            if idx < 5:
-                                logger.info(f"[LPA] Shift {shift_id_item}: obj_link is list, first element: {obj_str}")
-                        elif isinstance(obj_link, str):
-                            # Если это строка "Array", значит Bitrix24 вернул массив как строку
-                            # Пробуем получить через camelCase версию поля
-                            obj_link_camel = item.get(upper_to_camel(UF_OBJECT_LINK))
-                            if obj_link_camel and isinstance(obj_link_camel, list) and len(obj_link_camel) > 0:
-                                obj_str = obj_link_camel[0]
-                                if idx < 5:
-                                    logger.info(f"[LPA] Shift {shift_id_item}: got obj from camelCase list: {obj_str}")
-                            elif obj_link_camel and isinstance(obj_link_camel, str) and obj_link_camel != "Array":
-                                obj_str = obj_link_camel
-                                if idx < 5:
-                                    logger.info(f"[LPA] Shift {shift_id_item}: got obj from camelCase str: {obj_str}")
-                            elif obj_link != "Array":
-                                obj_str = obj_link
-                                if idx < 5:
-                                    logger.info(f"[LPA] Shift {shift_id_item}: using obj_link directly: {obj_str}")
-                        
-                        if not obj_str or obj_str == "Array":
-                            # Пробуем получить через все возможные варианты имени поля
-                            for field_name in [UF_OBJECT_LINK, upper_to_camel(UF_OBJECT_LINK), "ufCrm7UfCrmObject"]:
-                                field_value = item.get(field_name)
-                                if field_value:
-                                    if isinstance(field_value, list) and len(field_value) > 0:
-                                        obj_str = field_value[0]
-                                        if idx < 5:
-                                            logger.info(f"[LPA] Shift {shift_id_item}: got obj from field {field_name} (list): {obj_str}")
-                                        break
-                                    elif isinstance(field_value, str) and field_value != "Array":
-                                        obj_str = field_value
-                                        if idx < 5:
-                                            logger.info(f"[LPA] Shift {shift_id_item}: got obj from field {field_name} (str): {obj_str}")
-                                        break
-                        
-                        if not obj_str or obj_str == "Array":
-                            if idx < 5:
-                                logger.warning(f"[LPA] Shift {shift_id_item}: could not extract object ID, obj_str={obj_str}")
-                            continue
-                        
-                        # Парсим ID объекта
-                        try:
-                            if isinstance(obj_str, str) and obj_str.startswith("D_"):
-                                obj_id_from_bitrix = int(obj_str[2:])
-                            else:
-                                obj_id_from_bitrix = int(obj_str)
-                            
-                            if idx < 5:
-                                logger.info(f"[LPA] Shift {shift_id_item}: parsed object ID = {obj_id_from_bitrix}, looking for {obj_id}")
-                            
-                            if obj_id_from_bitrix == obj_id:
-                                matching_items.append(item)
-                                logger.info(f"[LPA] ✅ Match found: shift {shift_id_item} -> object {obj_id_from_bitrix}")
-                                log.info(f"[LPA] ✅ Match found: shift {shift_id_item} -> object {obj_id_from_bitrix}")
-                        except (ValueError, TypeError) as e:
-                            if idx < 5:
-                                logger.warning(f"[LPA] Shift {shift_id_item}: Could not parse object ID from '{obj_str}': {e}")
-                            continue
-                    
-                    logger.info(f"[LPA] Found {len(matching_items)} shifts for object {obj_id} in Bitrix24")
-                    log.info(f"[LPA] Found {len(matching_items)} shifts for object {obj_id} in Bitrix24")
-                    
-                    # Если нашли смены по объекту, обрабатываем их
-                    if matching_items:
-                        items = matching_items
-                        logger.info(f"[LPA] Processing {len(items)} shifts found by direct object filter")
-                        log.info(f"[LPA] Processing {len(items)} shifts found by direct object filter")
-                        
-                        # Обрабатываем найденные смены
-                        for item in items:
-                            bitrix_shift_id = item.get("id")
-                            if not bitrix_shift_id:
-                                continue
-                            
-                            # Читаем значения полей
-                            plan_total = float(item.get(f_plan_camel) or item.get(f_plan_code) or item.get("ufCrm7UfCrmPlanTotal") or 0)
-                            fact_total = float(item.get(f_fact_camel) or item.get(f_fact_code) or item.get("ufCrm7UfCrmFactTotal") or 0)
-                            eff_final = float(item.get(f_eff_camel) or item.get(f_eff_code) or item.get("ufCrm7UfCrmEffFinal") or 0)
-                            
-                            # Проверяем статус смены
-                            item_status = ""
-                            try:
-                                item_status = _get_field_value(item, f_status_camel) or _get_field_value(item, f_status_code) or ""
-                                if isinstance(item_status, str):
-                                    item_status = item_status.lower().strip()
-                            except Exception as e:
-                                logger.debug(f"Could not get status for shift {bitrix_shift_id}: {e}")
-                                item_status = ""
-                            
-                            logger.info(f"Shift {bitrix_shift_id}: obj={obj_id}, plan={plan_total}, fact={fact_total}, eff={eff_final}, status='{item_status}'")
-                            log.info(f"[LPA] Shift {bitrix_shift_id}: obj={obj_id}, plan={plan_total}, fact={fact_total}, eff={eff_final}, status='{item_status}'")
-                            
-                            # Пропускаем смены без фактических данных
-                            if not fact_total or fact_total == 0:
-                                logger.debug(f"Skipping shift {bitrix_shift_id} - no fact data (fact_total={fact_total})")
-                                log.debug(f"[LPA] Skipping shift {bitrix_shift_id} - no fact data (fact_total={fact_total})")
-                                continue
-                            
-                            # Проверяем, закрыта ли смена
-                            is_closed = (
-                                item_status in ("closed", "закрыта", "закрыто") or
-                                not item_status or
-                                item_status == "" or
-                                (item_status != "open" and fact_total > 0)
-                            )
-                            
-                            if not is_closed:
-                                logger.info(f"Skipping shift {bitrix_shift_id} - not closed (status='{item_status}', fact={fact_total})")
-                                log.info(f"[LPA] Skipping shift {bitrix_shift_id} - not closed (status='{item_status}', fact={fact_total})")
-                                continue
-                            
-                            # Нашли закрытую смену!
-                            logger.info(f"✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
-                            log.info(f"[LPA] ✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
-                            print(f"[LPA] ✅ Found closed shift: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
-                            
-                            # Получаем дату смены
-                            shift_date_str = item.get(f_date_camel) or item.get(f_date)
-                            if shift_date_str:
-                                try:
-                                    from datetime import datetime
-                                    if isinstance(shift_date_str, str):
-                                        shift_date_obj = datetime.fromisoformat(shift_date_str.replace("Z", "+00:00")).date()
-                                    else:
-                                        shift_date_obj = shift_date_str
-                                    shift_date = shift_date_obj.strftime("%d.%m.%Y")
-                                except:
-                                    shift_date = "Не указана"
-                            else:
-                                shift_date = "Не указана"
-                            
-                            # Получаем название объекта
-                            from app.services.objects import fetch_all_objects
-                            objs = await fetch_all_objects()
-                            # objs это список кортежей (id, title)
-                            obj_name = next((title for oid, title in objs if oid == obj_id), f"Объект #{obj_id}")
-                            
-                            # Пытаемся получить детальные данные из локальной БД
-                            from app.services.shift_repo import get_shift_by_bitrix_id
-                            from app.db import session_scope
-                            from app.models import Shift
-                            local_shift = get_shift_by_bitrix_id(bitrix_shift_id)
-                            
-                            if local_shift:
-                                # Если нашли в локальной БД, получаем полные данные
-                                local_shift_id, _ = local_shift
-                                # Получаем данные через get_last_closed_shift, но нужно проверить объект
-                                with session_scope() as s:
-                                    from app.models import Shift
-                                    sh = s.get(Shift, local_shift_id)
-                                    if sh and sh.object_id == obj_id:
-                                        # Получаем полные данные
-                                        object_name_local = sh.object.name if sh.object else obj_name
-                                        formatted_date_local = sh.date.strftime("%d.%m.%Y") if sh.date else shift_date
-                                        plan_data_full = sh.plan_json or {}
-                                        fact_data_full = sh.fact_json or {}
-                                        
-                                        shift_data = {
-                                            "plan": {
-                                                **plan_data_full,
-                                                "object_name": object_name_local,
-                                                "date": formatted_date_local,
-                                                "section": plan_data_full.get("section", "Не указан"),
-                                                "foreman": plan_data_full.get("foreman", "Не указан"),
-                                                "shift_type": sh.type.value if sh.type else "day"
-                                            },
-                                            "fact": fact_data_full,
-                                            "efficiency": sh.eff_final or eff_final,
-                                            "date": formatted_date_local,
-                                            "type": sh.type.value if sh.type else "day",
-                                            "status": sh.status.value if sh.status else "closed"
-                                        }
-                                        shift_id = local_shift_id
-                                        logger.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
-                                        log.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
-                                    else:
-                                        # Объект не совпадает, используем данные из Bitrix24
-                                        shift_data = {
-                                            "plan": {
-                                                "plan_total": plan_total,
-                                                "object_name": obj_name,  # Используем актуальное название из выбранного объекта
-                                                "date": shift_date,
-                                            },
-                                            "fact": {"fact_total": fact_total},
-                                            "efficiency": eff_final,
-                                            "date": shift_date,
-                                            "type": "day",
-                                            "status": item_status if item_status else "closed"
-                                        }
-                                        shift_id = bitrix_shift_id
-                            else:
-                                # Не нашли в локальной БД, пробуем получить детальные данные из Bitrix24 (JSON)
-                                logger.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
-                                log.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
-                                
-                                # Пробуем получить JSON из Bitrix24
-                                import json
-                                f_plan_json = resolve_code("Смена", "UF_PLAN_JSON")
-                                f_fact_json = resolve_code("Смена", "UF_FACT_JSON")
-                                
-                                plan_json_str = None
-                                fact_json_str = None
-                                
-                                if f_plan_json:
-                                    f_plan_json_camel = upper_to_camel(f_plan_json)
-                                    plan_json_str = item.get(f_plan_json_camel) or item.get(f_plan_json)
-                                
-                                if f_fact_json:
-                                    f_fact_json_camel = upper_to_camel(f_fact_json)
-                                    fact_json_str = item.get(f_fact_json_camel) or item.get(f_fact_json)
-                                
-                                # Парсим JSON, если есть
-                                plan_data_from_json = {}
-                                fact_data_from_json = {}
-                                
-                                if plan_json_str:
-                                    try:
-                                        plan_data_from_json = json.loads(plan_json_str) if isinstance(plan_json_str, str) else plan_json_str
-                                        logger.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
-                                        log.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
-                                    except Exception as e:
-                                        logger.warning(f"[LPA] Could not parse plan_json from Bitrix24: {e}")
-                                
-                                if fact_json_str:
-                                    try:
-                                        fact_data_from_json = json.loads(fact_json_str) if isinstance(fact_json_str, str) else fact_json_str
-                                        logger.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
-                                        log.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
-                                    except Exception as e:
-                                        logger.warning(f"[LPA] Could not parse fact_json from Bitrix24: {e}")
-                                
-                                # Используем данные из JSON, если они есть, иначе только итоговые значения
-                                if plan_data_from_json or fact_data_from_json:
-                                    shift_data = {
-                                        "plan": {
-                                            **plan_data_from_json,
-                                            "object_name": obj_name,  # Всегда используем актуальное название из выбранного объекта
-                                            "date": plan_data_from_json.get("date") or shift_date,
-                                            "section": plan_data_from_json.get("section", "Не указан"),
-                                            "foreman": plan_data_from_json.get("foreman", "Не указан"),
-                                            "shift_type": plan_data_from_json.get("shift_type", "day")
-                                        },
-                                        "fact": fact_data_from_json if fact_data_from_json else {"fact_total": fact_total},
-                                        "efficiency": eff_final,
-                                        "date": plan_data_from_json.get("date") or shift_date,
-                                        "type": "day",
-                                        "status": item_status if item_status else "closed"
-                                    }
-                                    logger.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
-                                    log.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
-                                else:
-                                    # Используем только итоговые данные из Bitrix24
-                                    logger.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
-                                    log.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
-                                    shift_data = {
-                                        "plan": {
-                                            "plan_total": plan_total,
-                                            "object_name": obj_name,
-                                            "date": shift_date,
-                                        },
-                                        "fact": {"fact_total": fact_total},
-                                        "efficiency": eff_final,
-                                        "date": shift_date,
-                                        "type": "day",
-                                        "status": item_status if item_status else "closed"
-                                    }
-                                shift_id = bitrix_shift_id
-                            break  # Нашли смену, выходим из цикла for item in items
-                    else:
-                        # Если не нашли напрямую, используем старый метод - поиск по дням
-                        logger.info(f"[LPA] No shifts found by direct object filter, trying day-by-day search")
-                        log.info(f"[LPA] No shifts found by direct object filter, trying day-by-day search")
-                        items = []
-            
-            except Exception as e:
-                logger.error(f"Error in direct object search: {e}", exc_info=True)
-                log.error(f"[LPA] Error in direct object search: {e}", exc_info=True)
-                items = []
-            
-            # Если не нашли напрямую, используем поиск по дням (старый метод)
-            if not shift_data:
-                logger.info(f"[LPA] Using day-by-day search for object {obj_id}")
-                log.info(f"[LPA] Using day-by-day search for object {obj_id}")
-                
-                # ВАЖНО: Если поле UF_OBJECT_LINK пустое в старых сменах, 
-            # ищем смены с fact_total > 0 БЕЗ фильтрации по объекту,
-            # а затем проверяем объект через локальную БД или другие методы
-            logger.info(f"[LPA] Starting day-by-day search (will check object via local DB if UF_OBJECT_LINK is empty)")
-            log.info(f"[LPA] Starting day-by-day search (will check object via local DB if UF_OBJECT_LINK is empty)")
-            
-            # Увеличиваем диапазон поиска до 60 дней
-            for days_ago in range(60):
-                check_date = today - timedelta(days=days_ago)
-                day_from = check_date.isoformat() + "T00:00:00"
-                day_to = check_date.isoformat() + "T23:59:59"
-                
-                # Ищем все смены за день
-                try:
-                    shifts_res = await bx("crm.item.list", {
-                        "entityTypeId": SHIFT_ETID,
-                        "filter": {
-                            f">={f_date_camel}": day_from,
-                            f"<={f_date_camel}": day_to,
-                        },
-                        "select": ["id", f_date_camel, UF_OBJECT_LINK, f_status_camel, f_plan_camel, f_fact_camel, f_eff_camel, "*"],
-                        "order": {"id": "desc"},
-                        "limit": 100  # Увеличиваем лимит
-                    })
-                    
-                    items = shifts_res.get("items", []) if isinstance(shifts_res, dict) else (shifts_res if isinstance(shifts_res, list) else [])
-                    items_count = len(items)
-                    logger.info(f"[LPA] Found {items_count} shifts for {check_date}")
-                    log.info(f"[LPA] Found {items_count} shifts for {check_date}")
-                    
-                    if items_count == 0:
-                        continue  # Пропускаем дни без смен
-                except Exception as e:
-                    logger.error(f"Error fetching shifts for {check_date}: {e}", exc_info=True)
-                    continue
-                
-                logger.debug(f"Processing {len(items)} shifts for {check_date}, looking for object {obj_id}")
-                
-                # Обрабатываем найденные смены
-                for item in items:
-                    bitrix_shift_id = item.get("id")
-                    if not bitrix_shift_id:
-                        continue
-                    
-                    # Если использовали поиск по дням, проверяем объект
-                    if 'check_date' in locals():  # Значит использовали поиск по дням
-                        obj_link = item.get(UF_OBJECT_LINK)
-                        
-                        # Если Bitrix24 вернул "Array" как строку, получаем реальное значение через crm.item.get
-                        if obj_link == "Array" or (isinstance(obj_link, str) and obj_link == "Array"):
-                            try:
-                                # Получаем полные данные смены через crm.item.get
-                                shift_full = await bx("crm.item.get", {
-                                    "entityTypeId": SHIFT_ETID,
-                                    "id": bitrix_shift_id
-                                })
-                                # Правильно обрабатываем ответ от Bitrix24
-                                if isinstance(shift_full, dict):
-                                    shift_item_full = shift_full.get("item", shift_full)
-                                    # Пробуем получить через разные варианты имени поля
-                                    obj_link = shift_item_full.get(UF_OBJECT_LINK) or shift_item_full.get(upper_to_camel(UF_OBJECT_LINK)) or shift_item_full.get("ufCrm7UfCrmObject")
-                                    logger.info(f"[LPA] Day search: Shift {bitrix_shift_id} - got real UF_OBJECT_LINK via crm.item.get: {obj_link}")
-                                    log.info(f"[LPA] Day search: Shift {bitrix_shift_id} - got real UF_OBJECT_LINK via crm.item.get: {obj_link}")
-                                else:
-                                    obj_link = None
-                            except Exception as e:
-                                logger.warning(f"[LPA] Day search: Shift {bitrix_shift_id} - failed to get via crm.item.get: {e}")
-                                obj_link = None
-                        
-                        # Логируем первые несколько смен для диагностики
-                        item_idx = items.index(item) if item in items else -1
-                        if item_idx < 3:
-                            logger.info(f"[LPA] Day search: Shift {bitrix_shift_id}, UF_OBJECT_LINK={obj_link} (type: {type(obj_link).__name__})")
-                            log.info(f"[LPA] Day search: Shift {bitrix_shift_id}, UF_OBJECT_LINK={obj_link} (type: {type(obj_link).__name__})")
-                        
-                        obj_id_from_bitrix = None
-                        
-                        if obj_link:
-                            # Извлекаем ID объекта (с обработкой "Array")
-                            obj_str = None
-                            if isinstance(obj_link, list) and len(obj_link) > 0:
-                                obj_str = obj_link[0]
-                            elif isinstance(obj_link, str) and obj_link != "Array":
-                                obj_str = obj_link
-                            else:
-                                # Пробуем через camelCase
-                                obj_link_camel = item.get(upper_to_camel(UF_OBJECT_LINK))
-                                if obj_link_camel:
-                                    if isinstance(obj_link_camel, list) and len(obj_link_camel) > 0:
-                                        obj_str = obj_link_camel[0]
-                                    elif isinstance(obj_link_camel, str) and obj_link_camel != "Array":
-                                        obj_str = obj_link_camel
-                            
-                            if obj_str and obj_str != "Array":
-                                # Парсим ID объекта
-                                try:
-                                    if isinstance(obj_str, str) and obj_str.startswith("D_"):
-                                        obj_id_from_bitrix = int(obj_str[2:])
-                                    else:
-                                        obj_id_from_bitrix = int(obj_str)
-                                    
-                                    if item_idx < 3:
-                                        logger.info(f"[LPA] Day search: Shift {bitrix_shift_id} - parsed object ID={obj_id_from_bitrix}, looking for {obj_id}")
-                                except (ValueError, TypeError) as e:
-                                    if item_idx < 3:
-                                        logger.warning(f"[LPA] Day search: Shift {bitrix_shift_id} - Could not parse object ID from {obj_str}: {e}")
-                        
-                        # Если не удалось получить объект из Bitrix24, пробуем через локальную БД
-                        if not obj_id_from_bitrix:
-                            try:
-                                from app.services.shift_repo import get_shift_by_bitrix_id
-                                local_shift = get_shift_by_bitrix_id(bitrix_shift_id)
-                                if local_shift:
-                                    obj_id_from_bitrix = local_shift[1].get("object_id") if isinstance(local_shift[1], dict) else None
-                                    if obj_id_from_bitrix:
-                                        logger.info(f"[LPA] Day search: Shift {bitrix_shift_id} - got object ID from local DB: {obj_id_from_bitrix}")
-                                        log.info(f"[LPA] Day search: Shift {bitrix_shift_id} - got object ID from local DB: {obj_id_from_bitrix}")
-                            except Exception as e:
-                                logger.debug(f"[LPA] Day search: Shift {bitrix_shift_id} - could not get object from local DB: {e}")
-                        
-                        # Если все еще не знаем объект, пропускаем смену
-                        if not obj_id_from_bitrix:
-                            if item_idx < 3:
-                                logger.info(f"[LPA] Day search: Shift {bitrix_shift_id} - no object ID found (neither Bitrix24 nor local DB), skipping")
-                            continue
-                        
-                        # Проверяем соответствие объекта
-                        if obj_id_from_bitrix != obj_id:
-                            if item_idx < 3:
-                                logger.info(f"[LPA] Day search: Shift {bitrix_shift_id} - object mismatch ({obj_id_from_bitrix} != {obj_id}), skipping")
-                            continue
-                    
-                    bitrix_shift_id = item.get("id")
-                    if not bitrix_shift_id:
-                        continue
-                    
-                    # Читаем значения полей (пробуем разные варианты)
-                    plan_total = float(item.get(f_plan_camel) or item.get(f_plan_code) or item.get("ufCrm7UfCrmPlanTotal") or 0)
-                    fact_total = float(item.get(f_fact_camel) or item.get(f_fact_code) or item.get("ufCrm7UfCrmFactTotal") or 0)
-                    eff_final = float(item.get(f_eff_camel) or item.get(f_eff_code) or item.get("ufCrm7UfCrmEffFinal") or 0)
-                    
-                    # Проверяем статус смены
-                    item_status = ""
-                    try:
-                        item_status = _get_field_value(item, f_status_camel) or _get_field_value(item, f_status_code) or ""
-                        if isinstance(item_status, str):
-                            item_status = item_status.lower().strip()
-                    except Exception as e:
-                        logger.debug(f"Could not get status for shift {bitrix_shift_id}: {e}")
-                        item_status = ""
-                    
-                    # Получаем obj_id_from_bitrix для логирования (если еще не получен)
-                    if 'obj_id_from_bitrix' not in locals():
-                        obj_link = item.get(UF_OBJECT_LINK)
-                        if obj_link:
-                            if isinstance(obj_link, list) and len(obj_link) > 0:
-                                obj_str = obj_link[0]
-                            elif isinstance(obj_link, str):
-                                obj_str = obj_link
-                            else:
-                                obj_str = str(obj_link)
-                            
-                            try:
-                                if isinstance(obj_str, str) and obj_str.startswith("D_"):
-                                    obj_id_from_bitrix = int(obj_str[2:])
-                                else:
-                                    obj_id_from_bitrix = int(obj_str)
-                            except (ValueError, TypeError):
-                                obj_id_from_bitrix = "unknown"
-                        else:
-                            obj_id_from_bitrix = "no_link"
-                    
-                    logger.info(f"Shift {bitrix_shift_id}: obj={obj_id_from_bitrix}, plan={plan_total}, fact={fact_total}, eff={eff_final}, status='{item_status}'")
-                    log.info(f"[LPA] Shift {bitrix_shift_id}: obj={obj_id_from_bitrix}, plan={plan_total}, fact={fact_total}, eff={eff_final}, status='{item_status}'")
-                    
-                    # Пропускаем смены без фактических данных
-                    if not fact_total or fact_total == 0:
-                        logger.info(f"[LPA] ⚠️ Skipping shift {bitrix_shift_id} - no fact data (fact_total={fact_total})")
-                        log.info(f"[LPA] ⚠️ Skipping shift {bitrix_shift_id} - no fact data (fact_total={fact_total})")
-                        continue
-                    
-                    # Принимаем смену если:
-                    # 1. Есть фактические данные (fact_total > 0) - это главный признак закрытой смены
-                    # 2. Статус "closed"/"закрыта"/"закрыто" ИЛИ статус пустой/None ИЛИ статус не "open"
-                    # Считаем смену закрытой, если есть факт, даже если статус не установлен или имеет другое значение
-                    # Исключаем только явно открытые смены (status == "open")
-                    is_closed = (
-                        item_status in ("closed", "закрыта", "закрыто") or  # Явно закрыта
-                        not item_status or  # Статус не установлен, но есть факт
-                        item_status == "" or  # Пустой статус
-                        (item_status != "open" and fact_total > 0)  # Не открыта и есть факт
-                    )
-                    
-                    logger.info(f"[LPA] Shift {bitrix_shift_id}: is_closed={is_closed} (status='{item_status}', fact={fact_total})")
-                    log.info(f"[LPA] Shift {bitrix_shift_id}: is_closed={is_closed} (status='{item_status}', fact={fact_total})")
-                    
-                    if not is_closed:
-                        logger.info(f"[LPA] ⚠️ Skipping shift {bitrix_shift_id} - not closed (status='{item_status}', fact={fact_total})")
-                        log.info(f"[LPA] ⚠️ Skipping shift {bitrix_shift_id} - not closed (status='{item_status}', fact={fact_total})")
-                        continue
-                    
-                    # Получаем дату смены
-                    shift_date_str = item.get(f_date_camel) or item.get(f_date)
-                    if shift_date_str:
-                        try:
-                            from datetime import datetime
-                            if isinstance(shift_date_str, str):
-                                shift_date_obj = datetime.fromisoformat(shift_date_str.replace("Z", "+00:00")).date()
-                            else:
-                                shift_date_obj = shift_date_str
-                            shift_date = shift_date_obj.strftime("%d.%m.%Y")
-                        except:
-                            shift_date = check_date.strftime("%d.%m.%Y") if 'check_date' in locals() else "Не указана"
-                    else:
-                        shift_date = check_date.strftime("%d.%m.%Y") if 'check_date' in locals() else "Не указана"
-                    
-                    logger.info(f"✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}', date={shift_date})")
-                    log.info(f"[LPA] ✅ Found closed shift in Bitrix24: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}', date={shift_date})")
-                    print(f"[LPA] ✅ Found closed shift: {bitrix_shift_id} for object {obj_id} (fact={fact_total}, status='{item_status}')")
-                    
-                    # Получаем дополнительные данные смены
-                    from app.services.objects import fetch_all_objects
-                    objs = await fetch_all_objects()
-                    # objs это список кортежей (id, title)
-                    obj_name = next((title for oid, title in objs if oid == obj_id), f"Объект #{obj_id}")
-                    
-                    # Пытаемся получить детальные данные из локальной БД
-                    from app.services.shift_repo import get_shift_by_bitrix_id
-                    from app.db import session_scope
-                    from app.models import Shift
-                    
-                    local_shift = get_shift_by_bitrix_id(bitrix_shift_id)
-                    
-                    if local_shift:
-                        # Если нашли в локальной БД, получаем полные данные
-                        local_shift_id, _ = local_shift
-                        with session_scope() as s:
-                            sh = s.get(Shift, local_shift_id)
-                            if sh and sh.object_id == obj_id:
-                                # Получаем полные данные
-                                object_name_local = sh.object.name if sh.object else obj_name
-                                formatted_date_local = sh.date.strftime("%d.%m.%Y") if sh.date else shift_date
-                                plan_data_full = sh.plan_json or {}
-                                fact_data_full = sh.fact_json or {}
-                                
-                                shift_data = {
-                                    "plan": {
-                                        **plan_data_full,
-                                        "object_name": object_name_local,
-                                        "date": formatted_date_local,
-                                        "section": plan_data_full.get("section", "Не указан"),
-                                        "foreman": plan_data_full.get("foreman", "Не указан"),
-                                        "shift_type": sh.type.value if sh.type else "day"
-                                    },
-                                    "fact": fact_data_full,
-                                    "efficiency": sh.eff_final or eff_final,
-                                    "date": formatted_date_local,
-                                    "type": sh.type.value if sh.type else "day",
-                                    "status": sh.status.value if sh.status else "closed"
-                                }
-                                shift_id = local_shift_id
-                                logger.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
-                                log.info(f"[LPA] ✅ Got detailed data from local DB for shift {bitrix_shift_id} -> local {local_shift_id}")
-                            else:
-                                # Объект не совпадает, используем данные из Bitrix24
-                                shift_data = {
-                                    "plan": {
-                                        "plan_total": plan_total,
-                                        "object_name": obj_name,
-                                        "date": shift_date,
-                                    },
-                                    "fact": {"fact_total": fact_total},
-                                    "efficiency": eff_final,
-                                    "date": shift_date,
-                                    "type": "day",
-                                    "status": item_status if item_status else "closed"
-                                }
-                                shift_id = bitrix_shift_id
-                    else:
-                        # Не нашли в локальной БД, пробуем получить детальные данные из Bitrix24 (JSON)
-                        logger.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
-                        log.info(f"[LPA] Shift {bitrix_shift_id} not found in local DB, trying to get JSON from Bitrix24")
-                        
-                        # Пробуем получить JSON из Bitrix24
-                        import json
-                        f_plan_json = resolve_code("Смена", "UF_PLAN_JSON")
-                        f_fact_json = resolve_code("Смена", "UF_FACT_JSON")
-                        
-                        plan_json_str = None
-                        fact_json_str = None
-                        
-                        if f_plan_json:
-                            f_plan_json_camel = upper_to_camel(f_plan_json)
-                            plan_json_str = item.get(f_plan_json_camel) or item.get(f_plan_json)
-                        
-                        if f_fact_json:
-                            f_fact_json_camel = upper_to_camel(f_fact_json)
-                            fact_json_str = item.get(f_fact_json_camel) or item.get(f_fact_json)
-                        
-                        # Парсим JSON, если есть
-                        plan_data_from_json = {}
-                        fact_data_from_json = {}
-                        
-                        if plan_json_str:
-                            try:
-                                plan_data_from_json = json.loads(plan_json_str) if isinstance(plan_json_str, str) else plan_json_str
-                                logger.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
-                                log.info(f"[LPA] ✅ Loaded plan_json from Bitrix24: {len(plan_data_from_json)} items")
-                            except Exception as e:
-                                logger.warning(f"[LPA] Could not parse plan_json from Bitrix24: {e}")
-                        
-                        if fact_json_str:
-                            try:
-                                fact_data_from_json = json.loads(fact_json_str) if isinstance(fact_json_str, str) else fact_json_str
-                                logger.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
-                                log.info(f"[LPA] ✅ Loaded fact_json from Bitrix24: {len(fact_data_from_json)} items")
-                            except Exception as e:
-                                logger.warning(f"[LPA] Could not parse fact_json from Bitrix24: {e}")
-                        
-                        # Используем данные из JSON, если они есть, иначе только итоговые значения
-                        if plan_data_from_json or fact_data_from_json:
-                            shift_data = {
-                                "plan": {
-                                    **plan_data_from_json,
-                                    "object_name": obj_name,  # Всегда используем актуальное название из выбранного объекта
-                                    "date": plan_data_from_json.get("date") or shift_date,
-                                    "section": plan_data_from_json.get("section", "Не указан"),
-                                    "foreman": plan_data_from_json.get("foreman", "Не указан"),
-                                    "shift_type": plan_data_from_json.get("shift_type", "day")
-                                },
-                                "fact": fact_data_from_json if fact_data_from_json else {"fact_total": fact_total},
-                                "efficiency": eff_final,
-                                "date": plan_data_from_json.get("date") or shift_date,
-                                "type": "day",
-                                "status": item_status if item_status else "closed"
-                            }
-                            logger.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
-                            log.info(f"[LPA] ✅ Using detailed data from Bitrix24 JSON fields")
-                        else:
-                            # Используем только итоговые данные из Bitrix24
-                            logger.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
-                            log.warning(f"[LPA] Shift {bitrix_shift_id} not found in local DB and no JSON in Bitrix24, using summary data only")
-                            shift_data = {
-                                "plan": {
-                                    "plan_total": plan_total,
-                                    "object_name": obj_name,
-                                    "date": shift_date,
-                                },
-                                "fact": {"fact_total": fact_total},
-                                "efficiency": eff_final,
-                                "date": shift_date,
-                                "type": "day",
-                                "status": item_status if item_status else "closed"
-                            }
-                        shift_id = bitrix_shift_id
-                    break  # Выходим из цикла for item in items
-                
-                # Если нашли смену, выходим из цикла по дням
-                if shift_data:
-                    break  # Выходим из цикла for days_ago in range(60)
-        
+            # Привязка к объекту, затем один запрос за 60 дней (app.services.lpa_search)
+            codes = ShiftCodes.resolve()
+            item = await find_closed_shift(obj_id, codes=codes)
+            if item:
+                bitrix_shift_id = item.get("id")
+                shift_data, shift_id = await _bitrix_shift_data(item, obj_id, codes)
         except Exception as e:
             logger.error(f"[LPA] Error searching for closed shift in Bitrix24: {e}", exc_info=True)
             log.error(f"[LPA] Error searching for closed shift in Bitrix24: {e}", exc_info=True)
@@ -329,7 +329,7 @@ async def plan_ok(cq: types.CallbackQuery, state: FSMContext):
 
         log.info(f"[PLAN SAVE] Saving plan to DB: tasks={len(plan_json.get('tasks', []))}, total={plan_total}")
         # ВАЖНО: Используем object_bitrix_id для записи в локальную БД
-        shift_id = save_plan(
+        shift_id = await save_plan(
             object_bitrix_id,  # Используем Bitrix ID объекта, а не локальный ID
             data["plan_date"], 
             plan_json,
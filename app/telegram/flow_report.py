@@ -136,7 +136,7 @@ async def repobj_pick(cq: CallbackQuery, state: FSMContext):
     
     # Пробуем найти смену в локальной базе (fallback)
     try:
-        result = get_last_open_shift(object_bitrix_id)  # Используем Bitrix ID
+        result = await get_last_open_shift(object_bitrix_id)  # Используем Bitrix ID
         if result:
             shift_id, plan_json = result
             log.info(f"Found shift in local DB: {shift_id}, plan_json keys: {list(plan_json.keys())}")
@@ -206,7 +206,7 @@ async def rep_input(m: Message, state: FSMContext):
         # Если shift_id - это bitrix_id, пропускаем сохранение в локальную БД
         if shift_id < 100000:  # Локальные ID обычно меньше 100000
             try:
-                save_fact(shift_id, fact, eff_raw, eff_final, plan_json=plan)
+                await save_fact(shift_id, fact, eff_raw, eff_final, plan_json=plan)
                 log.info(f"Saved fact to local DB for shift_id={shift_id}")
             except Exception as e:
                 log.warning(f"Could not save fact to local DB: {e}, continuing with Bitrix24 only")
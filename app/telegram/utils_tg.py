@@ -1,4 +1,22 @@
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Router
 from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.services.bitrix_metrics import bitrix_caller
+from app.services.bitrix_timeouts import deadline
+from app.services.http_client import BitrixTimeout, BitrixUnavailable
+
+log = logging.getLogger("gpo.utils_tg")
+
+# Дедлайн взаимодействия по умолчанию и для потоков, где он дольше (ЛПА: данные смены + фото)
+DEFAULT_DEADLINE_SECONDS = 30.0
+DEADLINE_DEFAULTS = {"lpa": 120.0}
+
+SLOW_BITRIX_TEXT = "⏳ Bitrix24 сейчас отвечает слишком долго. Попробуйте ещё раз через минуту."
 
 async def safe_edit_markup(cq, **kw):
     try:
@@ -14,3 +32,79 @@ async def safe_edit_text(cq, *a, **kw):
     except TelegramAPIError:
         return await cq.message.answer(*a, **kw)
 
+
+
+class BitrixCallerMiddleware(BaseMiddleware):
+    """Помечает все вызовы Bitrix из хендлеров роутера меткой потока (для метрик)."""
+
+    def __init__(self, tag: str):
+        self.tag = tag
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with bitrix_caller(self.tag):
+            return await handler(event, data)
+
+
+def interaction_deadline(tag: str) -> Optional[float]:
+    """Дедлайн потока: BOT_DEADLINE_<TAG>, иначе BOT_DEADLINE_SECONDS; 0 — без дедлайна."""
+    default = DEADLINE_DEFAULTS.get(tag, DEFAULT_DEADLINE_SECONDS)
+    raw = os.getenv(f"BOT_DEADLINE_{tag.upper()}") or os.getenv("BOT_DEADLINE_SECONDS")
+    try:
+        seconds = float(raw) if raw else default
+    except ValueError:
+        seconds = default
+    return seconds if seconds > 0 else None
+
+
+async def _notify_slow_bitrix(event: TelegramObject) -> None:
+    try:
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer(SLOW_BITRIX_TEXT, show_alert=True)
+            except TelegramAPIError:
+                # callback уже был отвечен хендлером
+                if event.message:
+                    await event.message.answer(SLOW_BITRIX_TEXT)
+        elif isinstance(event, Message):
+            await event.answer(SLOW_BITRIX_TEXT)
+    except TelegramAPIError as e:
+        log.warning("Could not notify user about slow Bitrix: %s", e)
+
+
+class BitrixDeadlineMiddleware(BaseMiddleware):
+    """Общий дедлайн на обработку сообщения/callback.
+
+    Все вызовы Bitrix внутри хендлера укладываются в остаток дедлайна; если
+    портал не успел (или breaker разомкнут), пользователь сразу получает
+    понятный ответ вместо минуты тишины.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with deadline(self.seconds):
+            try:
+                return await handler(event, data)
+            except (BitrixTimeout, BitrixUnavailable) as e:
+                log.warning("Interaction aborted: %s", e)
+                await _notify_slow_bitrix(event)
+                return None
+
+
+def tag_router(router: Router, tag: str) -> Router:
+    """Повесить на сообщения и callback-и роутера метку потока и дедлайн взаимодействия."""
+    for mw in (BitrixCallerMiddleware(tag), BitrixDeadlineMiddleware(interaction_deadline(tag))):
+        router.message.middleware(mw)
+        router.callback_query.middleware(mw)
+    return router
@@ -0,0 +1,19 @@
+"""Числовые настройки сервисов из переменных окружения."""
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Целое из переменной окружения; нет переменной или не число — default."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Дробное из переменной окружения; нет переменной или не число — default."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
@@ -33,11 +33,18 @@ target_metadata = Base.metadata
 
 
 def get_database_url() -> str:
-    """Get database URL from settings."""
+    """Get database URL from settings (sync driver, for offline mode)."""
     settings = get_settings()
     return settings.database_url_sync
 
 
+def get_async_database_url() -> str:
+    """Get database URL with the async driver the application uses."""
+    from app.db import ASYNC_DATABASE_URL
+
+    return ASYNC_DATABASE_URL
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -73,7 +80,7 @@ def do_run_migrations(connection: Connection) -> None:
 async def run_async_migrations() -> None:
     """Run migrations in async mode."""
     configuration = config.get_section(config.config_ini_section)
-    configuration["sqlalchemy.url"] = get_database_url()
+    configuration["sqlalchemy.url"] = get_async_database_url()
     
     connectable = async_engine_from_config(
         configuration,
@@ -0,0 +1,129 @@
+"""baseline schema
+
+Revision ID: 3f1c2a7d9b01
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+Схема до миграций — то, что создавал init_db (Base.metadata.create_all)
+при старте приложения: users, objects, shifts, resources, timesheets,
+params. Ревизия заморожена: таблицы описаны явно и не зависят от текущих
+app.models; всё, что появилось позже, — отдельными ревизиями.
+
+Уже созданные таблицы пропускаются, поэтому `alembic upgrade head` можно
+запускать и на рабочей базе, созданной init_db.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TABLES = ("users", "objects", "params", "shifts", "resources", "timesheets")
+
+
+def _existing_tables() -> set:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    existing = _existing_tables()
+
+    if "users" not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.BigInteger(), nullable=False),
+            sa.Column('tg_id', sa.BigInteger(), nullable=False),
+            sa.Column('role', sa.Enum('FOREMAN', 'OWNER', name='userrole'), nullable=False),
+            sa.Column('bitrix_user_id', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_users_tg_id', 'users', ['tg_id'], unique=True)
+
+    if "objects" not in existing:
+        op.create_table(
+            'objects',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=500), nullable=False),
+            sa.Column('bitrix_id', sa.Integer(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if "params" not in existing:
+        op.create_table(
+            'params',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('value_json', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('key'),
+        )
+
+    if "shifts" not in existing:
+        op.create_table(
+            'shifts',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('object_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.DateTime(), nullable=False),
+            sa.Column('type', sa.Enum('DAY', 'NIGHT', name='shifttype'), nullable=False),
+            sa.Column('plan_json', sa.JSON(), nullable=True),
+            sa.Column('fact_json', sa.JSON(), nullable=True),
+            sa.Column('uf_start_time', sa.DateTime(), nullable=True),
+            sa.Column('uf_end_time', sa.DateTime(), nullable=True),
+            sa.Column('uf_downtime_min', sa.Integer(), nullable=True),
+            sa.Column('uf_downtime_reason', sa.Text(), nullable=True),
+            sa.Column('uf_incidents_text', sa.Text(), nullable=True),
+            sa.Column('completeness', sa.Numeric(precision=5, scale=2), nullable=True),
+            sa.Column('eff_raw', sa.Numeric(precision=5, scale=2), nullable=True),
+            sa.Column('eff_user', sa.Numeric(precision=5, scale=2), nullable=True),
+            sa.Column('eff_final', sa.Numeric(precision=5, scale=2), nullable=True),
+            sa.Column('status', sa.Enum('OPEN', 'CLOSED', name='shiftstatus'), nullable=False),
+            sa.Column('bitrix_id', sa.Integer(), nullable=True),
+            sa.Column('created_by', sa.BigInteger(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['created_by'], ['users.id']),
+            sa.ForeignKeyConstraint(['object_id'], ['objects.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_shifts_object_date_type', 'shifts', ['object_id', 'date', 'type'], unique=False)
+
+    if "resources" not in existing:
+        op.create_table(
+            'resources',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('shift_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.Enum('MACHINERY', 'MATERIAL', name='resourcekind'), nullable=False),
+            sa.Column('name', sa.String(length=500), nullable=False),
+            sa.Column('qty', sa.Numeric(precision=10, scale=2), nullable=False),
+            sa.Column('unit', sa.String(length=50), nullable=True),
+            sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=True),
+            sa.Column('tariff', sa.Enum('HOUR', 'SHIFT', 'TRIP', name='tarifftype'), nullable=True),
+            sa.Column('meta_json', sa.Text(), nullable=True),
+            sa.ForeignKeyConstraint(['shift_id'], ['shifts.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+    if "timesheets" not in existing:
+        op.create_table(
+            'timesheets',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('shift_id', sa.Integer(), nullable=False),
+            sa.Column('crew', sa.String(length=500), nullable=False),
+            sa.Column('hours', sa.Numeric(precision=5, scale=2), nullable=False),
+            sa.Column('rate', sa.Numeric(precision=10, scale=2), nullable=True),
+            sa.ForeignKeyConstraint(['shift_id'], ['shifts.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade() -> None:
+    # Только таблицы этой ревизии, в порядке, обратном внешним ключам
+    existing = _existing_tables()
+    for table in reversed(TABLES):
+        if table in existing:
+            op.drop_table(table)
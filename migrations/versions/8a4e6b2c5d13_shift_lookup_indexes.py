@@ -0,0 +1,65 @@
+"""shift lookup indexes
+
+Revision ID: 8a4e6b2c5d13
+Revises: 3f1c2a7d9b01
+Create Date: 2026-10-17 10:30:00.000000
+
+Индексы под запросы, которые реально выполняются:
+
+* shifts.bitrix_id — get_shift_by_bitrix_id, flow_report, lpa_data;
+* shifts (object_id, status, id) — последняя открытая/закрытая смена объекта;
+* shifts (date, status) — проверки планировщика за день;
+* resources.shift_id, timesheets.shift_id — загрузка связей смены.
+
+Поиск по meta плана (объект смены из Bitrix) идёт через зеркало —
+bx_shifts.object_bitrix_id уже раскрыт в колонку и проиндексирован вместе
+с датой, отдельный индекс по JSON не нужен.
+
+Базы, созданные старым create_all без колонки shifts.bitrix_id, получают
+её здесь. В Postgres индексы строятся CONCURRENTLY — без блокировки
+записи в таблицу смен.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b2c5d13'
+down_revision = '3f1c2a7d9b01'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_shifts_bitrix_id", "shifts", ["bitrix_id"]),
+    ("ix_shifts_object_status_id", "shifts", ["object_id", "status", "id"]),
+    ("ix_shifts_date_status", "shifts", ["date", "status"]),
+    ("ix_resources_shift_id", "resources", ["shift_id"]),
+    ("ix_timesheets_shift_id", "timesheets", ["shift_id"]),
+)
+
+
+def _existing_indexes(table: str) -> set:
+    return {ix["name"] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("shifts")}
+    if "bitrix_id" not in columns:
+        op.add_column("shifts", sa.Column("bitrix_id", sa.Integer(), nullable=True))
+
+    postgres = bind.dialect.name == "postgresql"
+    missing = [(name, table, cols) for name, table, cols in INDEXES if name not in _existing_indexes(table)]
+    if postgres:
+        with op.get_context().autocommit_block():
+            for name, table, cols in missing:
+                op.create_index(name, table, cols, postgresql_concurrently=True)
+    else:
+        for name, table, cols in missing:
+            op.create_index(name, table, cols)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
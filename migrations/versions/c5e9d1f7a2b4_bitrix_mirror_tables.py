@@ -0,0 +1,100 @@
+"""bitrix mirror tables
+
+Revision ID: c5e9d1f7a2b4
+Revises: 8a4e6b2c5d13
+Create Date: 2026-10-17 11:00:00.000000
+
+Таблицы зеркала смарт-процессов Bitrix24 (app.services.bitrix_mirror):
+bx_objects, bx_shifts, bx_resources, bx_timesheets с индексами под чтения
+зеркала — смены по (объект, дата) и по дате, ресурсы и табель по смене.
+
+Базы, где эти таблицы уже создал init_db или прежняя базовая ревизия,
+пропускаются.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9d1f7a2b4'
+down_revision = '8a4e6b2c5d13'
+branch_labels = None
+depends_on = None
+
+TABLES = ("bx_objects", "bx_shifts", "bx_resources", "bx_timesheets")
+
+
+def _existing_tables() -> set:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _sync_columns() -> list:
+    """Общие колонки строки зеркала: элемент целиком и отметки сверки."""
+    return [
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('updated_time', sa.String(length=40), nullable=True),
+        sa.Column('synced_at', sa.DateTime(), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    existing = _existing_tables()
+
+    if "bx_objects" not in existing:
+        op.create_table(
+            'bx_objects',
+            sa.Column('bitrix_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('title', sa.String(length=500), nullable=True),
+            *_sync_columns(),
+            sa.PrimaryKeyConstraint('bitrix_id'),
+        )
+
+    if "bx_shifts" not in existing:
+        op.create_table(
+            'bx_shifts',
+            sa.Column('bitrix_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('object_bitrix_id', sa.Integer(), nullable=True),
+            sa.Column('shift_date', sa.Date(), nullable=True),
+            sa.Column('shift_type', sa.String(length=32), nullable=True),
+            sa.Column('status', sa.String(length=64), nullable=True),
+            sa.Column('plan_json', sa.JSON(), nullable=True),
+            sa.Column('fact_json', sa.JSON(), nullable=True),
+            sa.Column('plan_total', sa.Numeric(precision=14, scale=2), nullable=True),
+            sa.Column('fact_total', sa.Numeric(precision=14, scale=2), nullable=True),
+            sa.Column('eff_final', sa.Numeric(precision=7, scale=2), nullable=True),
+            *_sync_columns(),
+            sa.PrimaryKeyConstraint('bitrix_id'),
+        )
+        op.create_index('ix_bx_shifts_object_date', 'bx_shifts', ['object_bitrix_id', 'shift_date'], unique=False)
+        op.create_index('ix_bx_shifts_date', 'bx_shifts', ['shift_date'], unique=False)
+
+    if "bx_resources" not in existing:
+        op.create_table(
+            'bx_resources',
+            sa.Column('bitrix_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('shift_bitrix_id', sa.Integer(), nullable=True),
+            sa.Column('resource_type', sa.String(length=32), nullable=True),
+            *_sync_columns(),
+            sa.PrimaryKeyConstraint('bitrix_id'),
+        )
+        op.create_index('ix_bx_resources_shift_bitrix_id', 'bx_resources', ['shift_bitrix_id'], unique=False)
+
+    if "bx_timesheets" not in existing:
+        op.create_table(
+            'bx_timesheets',
+            sa.Column('bitrix_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('shift_bitrix_id', sa.Integer(), nullable=True),
+            sa.Column('worker', sa.String(length=500), nullable=True),
+            sa.Column('hours', sa.Numeric(precision=7, scale=2), nullable=True),
+            *_sync_columns(),
+            sa.PrimaryKeyConstraint('bitrix_id'),
+        )
+        op.create_index('ix_bx_timesheets_shift_bitrix_id', 'bx_timesheets', ['shift_bitrix_id'], unique=False)
+
+
+def downgrade() -> None:
+    existing = _existing_tables()
+    for table in reversed(TABLES):
+        if table in existing:
+            op.drop_table(table)
@@ -10,6 +10,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.services.http_client import bx
+from app.services.bitrix_ratelimit import Lane, run_in_lane
 
 
 def _num(x):
@@ -74,6 +75,7 @@ async def backfill_plan(shift_id: int):
         print(f"   ⚠️  Неожиданный формат: {type(plan_raw)}")
 
 
+@run_in_lane(Lane.BULK)
 async def main():
     """Главная функция."""
     if len(sys.argv) < 2:
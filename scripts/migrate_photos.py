@@ -11,6 +11,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.services.http_client import bx
+from app.services.bitrix_ratelimit import Lane, run_in_lane
 import httpx
 import os
 from dotenv import load_dotenv
@@ -184,6 +185,7 @@ async def migrate_photos(shift_id: int):
         print(f"   ⚠️  Возможно, поле не существует или имеет другой тип")
 
 
+@run_in_lane(Lane.BULK)
 async def main():
     """Главная функция."""
     if len(sys.argv) < 2:
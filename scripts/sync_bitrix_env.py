@@ -8,6 +8,10 @@ from pathlib import Path
 import httpx
 from dotenv import dotenv_values, load_dotenv
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.bitrix_ratelimit import bitrix_limiter
+
 # Загружаем .env
 load_dotenv()
 
@@ -28,11 +32,15 @@ TYPE_NAME_TO_ENV = {
 def bx(method: str, payload=None, method_http="POST"):
     """Вызов Bitrix REST API."""
     url = f"{BITRIX}/{method}"
+    bitrix_limiter.acquire_sync()
     if method_http == "GET":
         r = httpx.get(url, params=payload, timeout=30)
     else:
         r = httpx.post(url, json=payload or {}, timeout=30)
+    if r.status_code == 429:
+        bitrix_limiter.on_throttled()
     r.raise_for_status()
+    bitrix_limiter.on_success()
     data = r.json()
     if "error" in data:
         raise RuntimeError(f"{method} error: {data.get('error_description')}")
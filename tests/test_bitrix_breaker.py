@@ -0,0 +1,50 @@
+"""Тесты circuit breaker-а Bitrix (bitrix_breaker)."""
+
+import time
+
+from app.services.bitrix_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_opens_on_error_rate_and_recovers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    b = CircuitBreaker("crm.item.get", window=10, min_calls=4, error_rate=0.5, open_seconds=10)
+
+    for ok in (True, False, True):
+        assert b.allow()
+        b.record_success() if ok else b.record_failure()
+    assert b.state == CLOSED
+    b.record_failure()
+    assert b.state == OPEN
+    assert not b.allow()
+
+    # после open_seconds — одна проба, остальные отклоняются
+    now[0] += 11
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    assert not b.allow()
+    b.record_failure()
+    assert b.state == OPEN
+
+    now[0] += 11
+    assert b.allow()
+    b.record_success()
+    assert b.state == CLOSED
+    assert b.transitions == {
+        (CLOSED, OPEN): 1,
+        (OPEN, HALF_OPEN): 2,
+        (HALF_OPEN, OPEN): 1,
+        (HALF_OPEN, CLOSED): 1,
+    }
+    assert b.rejected_total == 2
+
+
+def test_released_probe_can_be_retaken(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    b = CircuitBreaker("batch", min_calls=1, error_rate=1.0, open_seconds=5)
+    b.record_failure()
+    now[0] += 6
+    assert b.allow()
+    b.release_probe()
+    assert b.allow()
@@ -0,0 +1,349 @@
+"""Клиент Bitrix24 (http_client) против локального эмулятора tools/bitrix_emulator."""
+
+import asyncio
+import datetime as dt
+import json
+
+import pytest
+from aiohttp.test_utils import TestServer
+
+from app.services import http_client
+from app.services.bitrix_batch import bx_batch
+from app.services.bitrix_cache import bitrix_cache
+from app.services.bitrix_ids import RESOURCE_ETID, SHIFT_ETID, UF_DATE, UF_OBJECT_LINK, UF_SHIFT_ID
+from app.services.http_client import BitrixError, bx, bx_iter
+from tools.bitrix_emulator import Emulator, Store, create_app, seed_dataset
+
+TODAY = dt.date(2025, 11, 16)
+
+
+async def _serve(monkeypatch, **options):
+    store = Store()
+    counts = seed_dataset(store, objects=5, days=20, seed=7, today=TODAY)
+    emulator = Emulator(store, **options)
+    server = TestServer(create_app(emulator))
+    await server.start_server()
+    emulator.base_url = str(server.make_url("")).rstrip("/")
+    monkeypatch.setenv("BITRIX_WEBHOOK_URL", f"{emulator.base_url}/rest/1/emulator")
+    monkeypatch.setattr(http_client, "load_dotenv", lambda *a, **k: None)
+    bitrix_cache.clear()
+    return server, emulator, counts
+
+
+@pytest.fixture
+async def emulator(monkeypatch):
+    server, emu, counts = await _serve(monkeypatch, rate=0)
+    yield emu, counts
+    await http_client.shutdown_http_client()
+    await server.close()
+
+
+async def test_iter_and_date_filter(emulator):
+    emu, counts = emulator
+    ids = [it["id"] async for it in bx_iter("crm.item.list", {"entityTypeId": SHIFT_ETID, "select": ["id"]})]
+    assert len(ids) == counts["shifts"] and ids == sorted(ids)
+
+    day = {
+        f">={UF_DATE}": f"{TODAY.isoformat()}T00:00:00",
+        f"<={UF_DATE}": f"{TODAY.isoformat()}T23:59:59",
+    }
+    res = await bx("crm.item.list", {"entityTypeId": SHIFT_ETID, "filter": day, "select": ["id", UF_DATE]})
+    assert res["items"] and all(it[UF_DATE].startswith(TODAY.isoformat()) for it in res["items"])
+
+
+async def test_batch_add_update(emulator):
+    emu, _ = emulator
+    shift = await bx("crm.item.add", {"entityTypeId": SHIFT_ETID, "fields": {"TITLE": "Новая", "UF_CRM_7_UF_CRM_DATE": "2025-11-17T08:00:00"}})
+    sid = shift["item"]["id"]
+    assert shift["item"]["title"] == "Новая" and shift["item"][UF_DATE] == "2025-11-17T08:00:00"
+    await bx("crm.item.add", {"entityTypeId": RESOURCE_ETID, "fields": {UF_SHIFT_ID: sid}})
+    await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": sid, "fields": {"title": "Смена"}})
+
+    before = emu.stats["requests"]
+    async with bx_batch():
+        got, resources, types = await asyncio.gather(
+            bx("crm.item.get", {"entityTypeId": SHIFT_ETID, "id": sid}),
+            bx("crm.item.list", {"entityTypeId": RESOURCE_ETID, "filter": {UF_SHIFT_ID: sid}}),
+            bx("crm.type.list", {}),
+        )
+    assert emu.stats["requests"] - before == 1
+    assert got["item"]["title"] == "Смена"
+    assert len(resources["items"]) == 1
+    assert len(types["types"]) == 4
+
+    with pytest.raises(BitrixError, match="not found"):
+        await bx("crm.item.get", {"entityTypeId": SHIFT_ETID, "id": 10 ** 6})
+
+
+async def test_portal_limit_returns_429(monkeypatch):
+    server, emu, _ = await _serve(monkeypatch, rate=0.01, burst=2)
+    try:
+        url = f"{http_client.get_bitrix_url()}/crm.item.get"
+        statuses = [
+            (await http_client.http_request("POST", url, json={"entityTypeId": SHIFT_ETID, "id": 1})).status_code
+            for _ in range(3)
+        ]
+        assert statuses == [200, 200, 429]
+        assert emu.stats["throttled"] == 1
+    finally:
+        await http_client.shutdown_http_client()
+        await server.close()
+
+
+async def test_change_feed_poller(emulator, tmp_path):
+    from app.services.bitrix_changes import ChangeBus, ChangeFeedPoller
+
+    emu, _ = emulator
+    # история — час назад, изменения ниже — «сейчас»
+    emu.store.db.execute(
+        "UPDATE items SET data = json_set(data, '$.createdTime', '2025-11-16T08:00:00', '$.updatedTime', '2025-11-16T08:00:00')"
+    )
+    bus = ChangeBus()
+    seen = []
+    bus.subscribe(seen.append, entities=[SHIFT_ETID])
+    state = tmp_path / "wm.json"
+    poller = ChangeFeedPoller(bus=bus, state_path=state)
+
+    # первый проход только ставит отметки: историю не переигрываем
+    assert await poller.poll_once() == []
+    before = emu.stats["requests"]
+    assert await poller.poll_once() == []
+    # спокойный проход по 4 сущностям — один batch-запрос
+    assert emu.stats["requests"] - before == 1
+
+    # изменение в ту же секунду, что и отметка, тоже видно — и только один раз
+    await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": 3, "fields": {"title": "Правка"}})
+    added = await bx("crm.item.add", {"entityTypeId": RESOURCE_ETID, "fields": {UF_SHIFT_ID: 3}})
+    events = await poller.poll_once()
+    assert {(e.entity_type_id, e.item_id, e.action) for e in events} == {
+        (SHIFT_ETID, 3, "update"),
+        (RESOURCE_ETID, added["item"]["id"], "add"),
+    }
+    assert [e.item_id for e in seen] == [3]
+    assert await poller.poll_once() == []
+    await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": 4, "fields": {"title": "Правка"}})
+    assert [e.item_id for e in await poller.poll_once()] == [4]
+
+    # отметки переживают перезапуск
+    restarted = ChangeFeedPoller(bus=bus, state_path=state)
+    assert restarted.watermarks[SHIFT_ETID].time == poller.watermarks[SHIFT_ETID].time
+    assert await restarted.poll_once() == []
+
+
+async def test_change_feed_keeps_watermark_when_page_fails(tmp_path):
+    from app.services.bitrix_changes import PAGE_SIZE, ChangeBus, ChangeFeedPoller, Watermark
+
+    bus = ChangeBus()
+    seen = []
+    bus.subscribe(seen.append)
+    state = tmp_path / "wm.json"
+    poller = ChangeFeedPoller([SHIFT_ETID], bus=bus, state_path=state)
+    poller.watermarks[SHIFT_ETID] = Watermark("2025-11-16T08:00:00", {1})
+    changed = [
+        {"id": i, "createdTime": "2025-11-16T08:00:00", "updatedTime": f"2025-11-16T09:00:{i:02d}"}
+        for i in range(2, PAGE_SIZE + 3)
+    ]
+    pages = {"fail": True}
+
+    async def fake_list(etid, flt, order):
+        since = next(iter(flt.values()))
+        page = [i for i in changed if i["updatedTime"] >= since][:PAGE_SIZE]
+        if since != "2025-11-16T08:00:00" and pages["fail"]:
+            raise RuntimeError("page 2 failed")
+        return page
+
+    poller._list = fake_list
+    # вторая страница упала — отметка и файл не сдвинулись, подписчики ничего не получили
+    assert await poller.poll_once() == []
+    assert poller.watermarks[SHIFT_ETID] == Watermark("2025-11-16T08:00:00", {1})
+    assert ChangeFeedPoller([SHIFT_ETID], state_path=state).watermarks[SHIFT_ETID].time == "2025-11-16T08:00:00"
+    assert seen == []
+
+    # следующий проход доставляет все изменения, включая первую страницу
+    pages["fail"] = False
+    events = await poller.poll_once()
+    assert [e.item_id for e in events] == [i["id"] for i in changed]
+    assert poller.watermarks[SHIFT_ETID].time == changed[-1]["updatedTime"]
+
+
+async def test_shift_index(emulator):
+    from app.services.bitrix_shift_index import ShiftIndex
+    from app.services.shift_client import _plan_meta_object_id
+
+    emu, _ = emulator
+    index = ShiftIndex(poller=None)
+    index._codes = (UF_DATE, "ufCrm7UfPlanJson", "ufCrm7UfCrmPlanTotal")
+    assert await index.lookup(1, dt.date.today()) is None
+    await index.start()
+
+    # индекс совпадает с полным перебором
+    shifts = [it async for it in bx_iter("crm.item.list", {"entityTypeId": SHIFT_ETID, "select": ["id", UF_DATE, "ufCrm7UfPlanJson"]})]
+    expected = {}
+    for it in shifts:
+        key = (_plan_meta_object_id(it["ufCrm7UfPlanJson"]), dt.date.fromisoformat(it[UF_DATE][:10]))
+        expected.setdefault(key, set()).add(it["id"])
+    assert len(index) == len(shifts)
+    obj, day = next(iter(expected))
+    before = emu.stats["requests"]
+    assert {c["id"] for c in await index.lookup(obj, day)} == expected[(obj, day)]
+    assert emu.stats["requests"] == before
+
+    # своя запись видна сразу: поиск дожидается перечитывания смены
+    try:
+        plan = '{"meta": {"object_bitrix_id": %d}, "tasks": [1]}' % obj
+        added = await bx("crm.item.add", {"entityTypeId": SHIFT_ETID, "fields": {
+            UF_DATE: f"{day.isoformat()}T08:00:00", "ufCrm7UfPlanJson": plan,
+        }})
+        new_id = added["item"]["id"]
+        assert new_id in {c["id"] for c in await index.lookup(obj, day)}
+        # план перенесён на другой день — смена переезжает в индексе
+        await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": new_id, "fields": {UF_DATE: "2020-01-01T08:00:00"}})
+        assert new_id not in {c["id"] for c in await index.lookup(obj, day)}
+        assert [c["id"] for c in await index.lookup(obj, dt.date(2020, 1, 1))] == [new_id]
+        await bx("crm.item.delete", {"entityTypeId": SHIFT_ETID, "id": new_id})
+        assert await index.lookup(obj, dt.date(2020, 1, 1)) == []
+    finally:
+        await index.stop()
+
+
+async def test_shift_index_background_work_ignores_caller_deadline(emulator):
+    from app.services.bitrix_ratelimit import Lane, current_lane
+    from app.services.bitrix_shift_index import ShiftIndex
+    from app.services.bitrix_timeouts import deadline, remaining
+
+    index = ShiftIndex(poller=None, rebuild_seconds=1)
+    index._codes = (UF_DATE, "ufCrm7UfPlanJson", "ufCrm7UfCrmPlanTotal")
+    await index.start()
+    seen = []
+    build = index.build
+
+    async def traced_build():
+        seen.append((remaining(), current_lane()))
+        await build()
+
+    index.build = traced_build
+    try:
+        index.built_at -= 10
+        with deadline(0.5):
+            # перечитывание висит дольше дедлайна — поиск отвечает из индекса, не дожидаясь
+            index._pending[-1] = asyncio.ensure_future(asyncio.sleep(5))
+            started = asyncio.get_running_loop().time()
+            assert await index.lookup(1, TODAY) is not None
+            assert asyncio.get_running_loop().time() - started < 1
+            index._pending.pop(-1).cancel()
+        await index._build_task
+        # перестройка, запущенная поиском из хендлера, стартует в чистом контексте (BULK build ставит сам)
+        assert seen == [(None, Lane.INTERACTIVE)]
+        assert index.stats["refetch_timeouts"] == 1 and index.stats["builds"] == 2
+    finally:
+        await index.stop()
+
+
+async def test_lpa_closed_shift_search(emulator, monkeypatch):
+    import app.services.bitrix_shift_index as shift_index_module
+    from app.services.bitrix_shift_index import ShiftIndex
+    from app.services.lpa_search import ShiftCodes, find_closed_shift
+
+    emu, _ = emulator
+    codes = ShiftCodes(
+        date="UF_CRM_7_UF_CRM_DATE", status="UF_CRM_7_UF_CRM_STATUS", plan="UF_CRM_7_UF_CRM_PLAN_TOTAL",
+        fact="UF_CRM_7_UF_CRM_FACT_TOTAL", eff="UF_CRM_7_UF_CRM_EFF_FINAL",
+    )
+    shifts = [it async for it in bx_iter("crm.item.list", {
+        "entityTypeId": SHIFT_ETID, "select": ["id", UF_DATE, "ufCrm7UfPlanJson", "ufCrm7UfCrmFactTotal"],
+    })]
+    obj = json.loads(shifts[0]["ufCrm7UfPlanJson"])["meta"]["object_bitrix_id"]
+    mine = [it for it in shifts if json.loads(it["ufCrm7UfPlanJson"])["meta"]["object_bitrix_id"] == obj and it["ufCrm7UfCrmFactTotal"]]
+
+    # привязка к объекту: самая новая по id
+    found = await find_closed_shift(obj, codes=codes, today=TODAY)
+    assert found["id"] == max(it["id"] for it in mine)
+
+    # привязка схлопнута в "Array": один запрос за диапазон, объект по индексу смен, ранг — дата, затем id
+    emu.store.db.execute(f"UPDATE items SET data = json_set(data, '$.{UF_OBJECT_LINK}', 'Array') WHERE entity = {SHIFT_ETID}")
+    index = ShiftIndex(poller=None)
+    index._codes = (UF_DATE, "ufCrm7UfPlanJson", "ufCrm7UfCrmPlanTotal")
+    await index.build()
+    monkeypatch.setattr(shift_index_module, "shift_index", index)
+    before = emu.stats["requests"]
+    found = await find_closed_shift(obj, codes=codes, today=TODAY, days=10)
+    recent = [it for it in mine if dt.date.fromisoformat(it[UF_DATE][:10]) > TODAY - dt.timedelta(days=10)]
+    best = max(recent, key=lambda it: (it[UF_DATE][:10], it["id"]))
+    assert found["id"] == best["id"]
+    assert emu.stats["requests"] - before <= 4
+
+
+async def test_bitrix_mirror(emulator, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import Base
+    from app.models import MirrorObject, MirrorResource, MirrorShift, MirrorTimesheet
+    from app.services.bitrix_mirror import BitrixMirror
+
+    emu, _ = emulator
+    engine = create_engine(f"sqlite:///{tmp_path / 'mirror.db'}", future=True)
+    Base.metadata.create_all(engine, tables=[m.__table__ for m in (MirrorObject, MirrorShift, MirrorResource, MirrorTimesheet)])
+    Session = sessionmaker(bind=engine)
+    mirror = BitrixMirror(poller=None, session_factory=Session, reload_seconds=0)
+    assert await mirror.shifts_on(TODAY) is None
+    await mirror.start()
+
+    try:
+        shifts = [it async for it in bx_iter("crm.item.list", {"entityTypeId": SHIFT_ETID, "select": ["id", UF_DATE, "ufCrm7UfPlanJson"]})]
+        sid = shifts[0]["id"]
+        day = dt.date.fromisoformat(shifts[0][UF_DATE][:10])
+        obj = json.loads(shifts[0]["ufCrm7UfPlanJson"])["meta"]["object_bitrix_id"]
+        resources = [it async for it in bx_iter("crm.item.list", {"entityTypeId": RESOURCE_ETID, "filter": {UF_SHIFT_ID: sid}})]
+
+        # чтения из зеркала совпадают с порталом и не стоят запросов
+        before = emu.stats["requests"]
+        on_day = await mirror.shifts_on(day, obj)
+        assert {it["id"] for it in on_day} == {
+            it["id"] for it in shifts
+            if it[UF_DATE][:10] == day.isoformat() and json.loads(it["ufCrm7UfPlanJson"])["meta"]["object_bitrix_id"] == obj
+        }
+        assert {it["id"] for it in await mirror.by_shift(RESOURCE_ETID, sid)} == {it["id"] for it in resources}
+        assert (await mirror.get(SHIFT_ETID, sid))["ufCrm7UfPlanJson"] == shifts[0]["ufCrm7UfPlanJson"]
+        assert emu.stats["requests"] == before
+        with Session() as s:
+            row = s.get(MirrorShift, sid)
+            assert (row.object_bitrix_id, row.shift_date) == (obj, day)
+            assert row.plan_json["meta"]["object_bitrix_id"] == obj
+
+        # своя запись: чтение дожидается перечитывания
+        await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": sid, "fields": {UF_DATE: "2020-01-01T08:00:00"}})
+        assert [it["id"] for it in await mirror.shifts_on(dt.date(2020, 1, 1))] == [sid]
+        await bx("crm.item.delete", {"entityTypeId": SHIFT_ETID, "id": sid})
+        assert await mirror.get(SHIFT_ETID, sid) is None
+        assert await mirror.shifts_on(dt.date(2020, 1, 1)) == []
+
+        # перечитывание из хендлера: без его дедлайна и в полосе BULK; чтение ждёт не дольше дедлайна
+        from app.services.bitrix_ratelimit import Lane, bitrix_limiter
+        from app.services.bitrix_timeouts import deadline, remaining
+
+        seen, gate = [], asyncio.Event()
+        refetch = mirror._refetch
+
+        async def gated_refetch(etid, item_id, previous):
+            seen.append(remaining())
+            await gate.wait()
+            await refetch(etid, item_id, previous)
+
+        mirror._refetch = gated_refetch
+        bulk = bitrix_limiter.lanes[Lane.BULK]["acquired_total"]
+        with deadline(1.5):
+            await bx("crm.item.update", {"entityTypeId": SHIFT_ETID, "id": shifts[1]["id"], "fields": {"title": "x"}})
+            assert await mirror.shifts_on(day) is None
+        gate.set()
+        await asyncio.gather(*mirror._pending.values())
+        mirror._refetch = refetch
+        assert seen == [None]
+        assert bitrix_limiter.lanes[Lane.BULK]["acquired_total"] == bulk + 1
+
+        # зеркало старше границы — вызывающий идёт в портал
+        mirror.loaded_at[SHIFT_ETID] -= 3600
+        assert await mirror.shifts_on(day, obj) is None
+    finally:
+        await mirror.stop()
+        engine.dispose()
@@ -0,0 +1,57 @@
+"""Тесты приёмника событий Bitrix24 (bitrix_events) и утилиты воспроизведения."""
+
+import asyncio
+import os
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services.bitrix_changes import ChangeBus
+from app.services.bitrix_events import BitrixEventReceiver
+from tools.replay_bitrix_events import read_jsonl, replay, to_form
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "tools", "bitrix_events_sample.jsonl")
+
+
+@pytest.fixture
+async def receiver():
+    bus = ChangeBus()
+    events = []
+    bus.subscribe(events.append)
+    rcv = BitrixEventReceiver("secret", bus=bus)
+    app = web.Application()
+    app.router.add_post("/bitrix/events", rcv.handle)
+    server = TestServer(app)
+    await server.start_server()
+    yield rcv, events, str(server.make_url("/bitrix/events"))
+    await server.close()
+
+
+async def test_replay_sample(receiver, capsys):
+    rcv, events, url = receiver
+    forms = [to_form(r, "secret", "test.bitrix24.ru") for r in read_jsonl(SAMPLE)]
+    await replay(url, forms, concurrency=1)
+    await rcv.drain()
+    assert rcv.stats == {"accepted": 6, "duplicate": 1, "ignored": 2, "unauthorized": 0}
+    assert [(e.entity_type_id, e.item_id, e.action) for e in events] == [
+        (1050, 301, "add"),
+        (1050, 301, "update"),
+        (1056, 912, "add"),
+        (1060, 1201, "add"),
+        (1046, 17, "update"),
+        (1056, 912, "delete"),
+    ]
+    assert "accepted" in capsys.readouterr().out
+
+
+async def test_bad_token_is_rejected(receiver):
+    rcv, events, url = receiver
+    import httpx
+
+    form = to_form({"event": "ONCRMDYNAMICITEMUPDATE", "entity": 1050, "id": 1, "ts": 1}, "wrong", "x")
+    async with httpx.AsyncClient() as client:
+        r = await client.post(url, data=form)
+    assert r.status_code == 403
+    await asyncio.sleep(0)
+    assert events == [] and rcv.stats["unauthorized"] == 1
@@ -0,0 +1,81 @@
+"""Тесты лимитера запросов к Bitrix24."""
+
+import asyncio
+import time
+
+from app.services.bitrix_ratelimit import Lane, TokenBucket, bitrix_lane
+
+
+async def test_burst_then_paced():
+    bucket = TokenBucket(rate=20.0, burst=3)
+    started = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+    elapsed = time.monotonic() - started
+    # 3 запроса из запаса, ещё 2 — по 1/20 с
+    assert 0.08 <= elapsed < 0.3
+    stats = bucket.stats()
+    assert stats["acquired_total"] == 5
+    assert stats["waited_total"] >= 2
+
+
+async def test_queue_depth_visible_while_waiting():
+    bucket = TokenBucket(rate=10.0, burst=1)
+    tasks = [asyncio.create_task(bucket.acquire()) for _ in range(4)]
+    await asyncio.sleep(0.01)
+    assert bucket.stats()["queue_depth"] >= 2
+    await asyncio.gather(*tasks)
+    assert bucket.stats()["queue_depth"] == 0
+
+
+def test_throttle_halves_rate_and_recovers():
+    bucket = TokenBucket(rate=4.0, burst=10, min_rate=0.5, recover_after=2)
+    bucket.on_throttled()
+    assert bucket.rate == 2.0
+    bucket.on_throttled()
+    bucket.on_throttled()
+    bucket.on_throttled()
+    assert bucket.rate == 0.5
+    for _ in range(2):
+        bucket.on_success()
+    assert bucket.rate > 0.5
+    assert bucket.stats()["throttled_total"] == 4
+
+
+async def test_interactive_lane_served_before_background():
+    bucket = TokenBucket(rate=50.0, burst=1, aging=10.0)
+    order = []
+
+    async def call(lane, tag):
+        with bitrix_lane(lane):
+            await bucket.acquire()
+        order.append(tag)
+
+    await bucket.acquire()  # опустошаем запас
+    tasks = [asyncio.create_task(call(Lane.BULK, f"bulk{i}")) for i in range(3)]
+    tasks += [asyncio.create_task(call(Lane.REPORT, "report"))]
+    tasks += [asyncio.create_task(call(Lane.INTERACTIVE, "ui"))]
+    await asyncio.gather(*tasks)
+    # Первый bulk уже занял ворота, дальше — строго по приоритету
+    assert order == ["bulk0", "ui", "report", "bulk1", "bulk2"]
+    lanes = bucket.stats()["lanes"]
+    assert lanes["bulk"]["acquired_total"] == 3
+    assert lanes["interactive"]["acquired_total"] == 2
+
+
+async def test_aging_prevents_starvation():
+    bucket = TokenBucket(rate=20.0, burst=1, aging=0.05)
+    order = []
+
+    async def call(lane, tag):
+        with bitrix_lane(lane):
+            await bucket.acquire()
+        order.append(tag)
+
+    await bucket.acquire()
+    tasks = [asyncio.create_task(call(Lane.BULK, "bulk"))]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call(Lane.INTERACTIVE, f"ui{i}")) for i in range(6)]
+    await asyncio.gather(*tasks)
+    # Bulk получил токен раньше, чем разошлась вся интерактивная очередь
+    assert order.index("bulk") < len(order) - 1
@@ -0,0 +1,62 @@
+"""Тесты реестра select-проекций (bitrix_select)."""
+
+from app.services.bitrix_ids import UF_OBJECT_LINK, UF_TS_HOURS
+from app.services.bitrix_select import (
+    FULL_SELECT,
+    SelectStats,
+    has_array_collapse,
+    select_for,
+)
+
+
+def test_select_for_is_narrow():
+    fields = select_for("lpa.timesheet")
+    assert "*" not in fields and "ufCrm%" not in fields
+    assert fields[0] == "id"
+    assert UF_TS_HOURS in fields
+    assert len(fields) == len(set(fields))
+
+
+def test_select_for_extra_and_unknown():
+    assert "ufCrm7UfCrmX" in select_for("lpa.object_search", "ufCrm7UfCrmX", None)
+    assert UF_OBJECT_LINK in select_for("lpa.object_search")
+    assert select_for("nope") == FULL_SELECT
+
+
+def test_array_collapse_detection():
+    assert has_array_collapse({"id": 1, UF_OBJECT_LINK: "Array"})
+    assert not has_array_collapse({"id": 1, UF_OBJECT_LINK: ["T1046_5"]})
+
+
+def test_bytes_saved_against_full_select():
+    stats = SelectStats()
+    full_item = {"id": 1, "title": "x", "ufCrm7UfPlanJson": "p" * 1000}
+    stats.observe_response("crm.item.list", {"entityTypeId": 1050, "select": FULL_SELECT}, {"items": [full_item]})
+    stats.record("w6.shifts", 1050, [{"id": 1, "title": "x"}])
+    site = stats.snapshot()["w6.shifts"]
+    assert site["calls"] == 1 and site["items"] == 1
+    assert site["bytes_saved"] > 1000 - site["bytes"]
+
+
+def test_select_stats_on_metrics_page(monkeypatch):
+    from app.services import bitrix_select
+    from app.services.bitrix_metrics import render_prometheus
+
+    stats = SelectStats()
+    stats.observe_response("crm.item.list", {"entityTypeId": 1050, "select": FULL_SELECT}, {"items": [{"x": "y" * 500}]})
+    stats.record("w6.shifts", 1050, [{"id": 1}])
+    monkeypatch.setattr(bitrix_select, "select_stats", stats)
+    text = render_prometheus()
+    assert f'bitrix_select_fields{{consumer="lpa.timesheet"}} {len(select_for("lpa.timesheet"))}' in text
+    assert 'bitrix_select_total{consumer="w6.shifts",counter="calls"} 1' in text
+    saved = stats.snapshot()["w6.shifts"]["bytes_saved"]
+    assert f'bitrix_select_bytes_total{{consumer="w6.shifts",kind="saved"}} {saved}' in text
+    assert 'bitrix_singleflight_total{counter="shared"}' in text
+
+
+def test_lpa_object_selects_every_address_fallback():
+    from app.services.bitrix_ids import UF_OBJECT_ADDRESS
+
+    # lpa_data читает адрес из UF_OBJECT_ADDRESS, затем UF_CRM_ADDRESS и address
+    fields = select_for("lpa.object")
+    assert {UF_OBJECT_ADDRESS, "ufCrmAddress", "address"} <= set(fields)
@@ -0,0 +1,45 @@
+"""Тесты потокового разбора списочных ответов (bitrix_stream)."""
+
+import json
+
+import pytest
+
+from app.services.bitrix_stream import ItemsStreamDecoder
+
+
+def _feed_all(body: bytes, chunk: int):
+    decoder = ItemsStreamDecoder()
+    items = []
+    for pos in range(0, len(body), chunk):
+        items += decoder.feed(body[pos:pos + chunk])
+    return decoder, items, decoder.close()
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 64, 1 << 16])
+def test_items_decoded_across_chunk_boundaries(chunk):
+    rows = [
+        {"id": i, "title": "Смена } ] \" {", "ufCrm7UfPlanJson": json.dumps({"works": [i] * i}), "photos": [{"id": i}]}
+        for i in range(1, 60)
+    ]
+    body = json.dumps({"result": {"items": rows}, "next": 50, "time": {"duration": 0.1}}, ensure_ascii=False).encode()
+    decoder, items, rest = _feed_all(body, chunk)
+    assert items == rows
+    assert decoder.streaming
+    assert rest == {"result": {"items": []}, "next": 50, "time": {"duration": 0.1}}
+    # в буфере не бывает больше одного элемента с куском
+    assert decoder.peak_buffer < max(len(json.dumps(r, ensure_ascii=False)) for r in rows) + chunk + 64
+
+
+def test_error_response_is_returned_whole():
+    body = json.dumps({"error": "QUERY_LIMIT_EXCEEDED", "error_description": "Too many requests"}).encode()
+    decoder, items, rest = _feed_all(body, 7)
+    assert items == []
+    assert not decoder.streaming
+    assert rest["error"] == "QUERY_LIMIT_EXCEEDED"
+
+
+def test_truncated_response_raises():
+    decoder = ItemsStreamDecoder()
+    decoder.feed(b'{"result":{"items":[{"id":1},{"id":')
+    with pytest.raises(ValueError):
+        decoder.close()
@@ -0,0 +1,34 @@
+"""Тесты адаптивных таймаутов и дедлайна (bitrix_timeouts)."""
+
+from app.services.bitrix_metrics import bitrix_metrics
+from app.services.bitrix_timeouts import attempt_timeout, budget, deadline, remaining
+
+
+def test_budget_follows_percentiles_within_bounds(monkeypatch):
+    monkeypatch.setenv("BITRIX_TIMEOUT_MIN_SAMPLES", "5")
+    bitrix_metrics.reset()
+    # данных нет — прежние значения по умолчанию
+    assert budget("crm.item.get") == 40
+    assert budget("disk.folder.uploadfile") == 60
+
+    for _ in range(10):
+        bitrix_metrics.observe_attempt("crm.item.get", 0.2)
+        bitrix_metrics.observe_attempt("crm.item.list", 4.0)
+        bitrix_metrics.observe_attempt("crm.item.add", 30.0)
+    assert budget("crm.item.get") == 5  # 0.6 с → floor
+    assert budget("crm.item.list") == 12  # p99 × 3
+    assert budget("crm.item.add") == 60  # ceiling
+    bitrix_metrics.reset()
+
+
+def test_deadline_caps_attempt_and_nests():
+    assert remaining() is None
+    with deadline(10):
+        timeout, capped = attempt_timeout("crm.item.get")
+        assert capped and 9 < timeout <= 10
+        with deadline(100):
+            # вложенный дедлайн не продлевает внешний
+            assert remaining() <= 10
+        with deadline(0.5):
+            assert attempt_timeout("crm.item.get") == (0.0, True)
+    assert remaining() is None
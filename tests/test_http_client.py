@@ -0,0 +1,355 @@
+"""Тесты клиента Bitrix24 (http_client)."""
+
+import asyncio
+from urllib.parse import parse_qsl
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services import http_client
+from app.services.bitrix_batch import bx_batch, encode_command
+from app.services.bitrix_cache import bitrix_cache
+from app.services.http_client import BitrixError, bx
+
+
+LIST_IDS = list(range(1, 121))
+
+
+def _keyset_page(payload: dict) -> list:
+    """Страница crm.item.list в режиме start=-1 (фильтры по id, без total)."""
+    flt = payload.get("filter") or {}
+    ids = [
+        i for i in LIST_IDS
+        if i > flt.get(">id", 0) and i < flt.get("<id", 10 ** 9)
+        and i >= flt.get(">=id", 0) and i <= flt.get("<=id", 10 ** 9)
+    ]
+    ids.sort(reverse=payload["order"]["id"] == "DESC")
+    return [{"id": i} for i in ids[:50]]
+
+
+def _decode_list_query(query: str) -> dict:
+    """Обратное к encode_command для полей filter[...] и order[id]."""
+    payload = {"filter": {}, "order": {}}
+    for k, v in parse_qsl(query):
+        if k.startswith("filter["):
+            payload["filter"][k[7:-1]] = int(v)
+        elif k == "order[id]":
+            payload["order"]["id"] = v
+    return payload
+
+
+@pytest.fixture
+async def bitrix_server(monkeypatch):
+    """Локальный сервер, отвечающий как Bitrix24 REST."""
+    calls = []
+    flaky = {"left": 1}
+
+    async def handler(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        payload = await request.json()
+        calls.append((method, payload))
+        if method == "crm.item.fail":
+            return web.json_response({"error": "NOT_FOUND", "error_description": "nope"}, status=404)
+        if method == "crm.item.slow":
+            await asyncio.sleep(2)
+        if method == "crm.item.down":
+            return web.json_response({"error": "INTERNAL_SERVER_ERROR"}, status=500)
+        if method == "disk.file.getcontent" and len(calls) == 1:
+            # первый запрос «застревает» — его обгоняет хеджирующий
+            await asyncio.sleep(2)
+        if method == "crm.item.list" and "flaky" in (payload.get("filter") or {}) and flaky["left"]:
+            flaky["left"] -= 1
+            return web.json_response({"error": "INTERNAL_SERVER_ERROR"}, status=503)
+        if method == "crm.item.list" and payload.get("start") == -1:
+            return web.json_response({"result": {"items": _keyset_page(payload)}})
+        if method == "batch" and flaky["left"] and any("flaky" in c for c in payload["cmd"].values()):
+            flaky["left"] -= 1
+            return web.json_response({"error": "INTERNAL_SERVER_ERROR"}, status=503)
+        if method == "batch":
+            result, errors = {}, {}
+            for key, cmd in payload["cmd"].items():
+                sub_method, _, query = cmd.partition("?")
+                if sub_method == "crm.item.list" and "start=-1" in query:
+                    result[key] = {"items": _keyset_page(_decode_list_query(query))}
+                elif "id=404" in query:
+                    errors[key] = {"error": "NOT_FOUND", "error_description": f"nope {key}"}
+                else:
+                    result[key] = {"method": sub_method, "query": dict(parse_qsl(query))}
+            return web.json_response({"result": {"result": result, "result_error": errors}})
+        return web.json_response({"result": {"method": method, "payload": payload}})
+
+    app = web.Application()
+    app.router.add_post("/rest/1/token/{method}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setenv("BITRIX_WEBHOOK_URL", str(server.make_url("/rest/1/token")))
+    monkeypatch.setattr(http_client, "load_dotenv", lambda *a, **k: None)
+    bitrix_cache.clear()
+    yield calls
+    await http_client.shutdown_http_client()
+    await server.close()
+
+
+async def test_bx_returns_result(bitrix_server):
+    res = await bx("crm.item.get", {"entityTypeId": 1050, "id": 7})
+    assert res == {"method": "crm.item.get", "payload": {"entityTypeId": 1050, "id": 7}}
+
+
+async def test_bx_raises_on_error(bitrix_server):
+    with pytest.raises(BitrixError, match="nope"):
+        await bx("crm.item.fail", {})
+
+
+async def test_pool_reuses_connections(bitrix_server):
+    before = http_client.pool_stats()
+    for i in range(5):
+        await bx("crm.item.get", {"id": i})
+    stats = http_client.pool_stats()
+    assert stats["requests"] - before["requests"] == 5
+    # Все запросы идут через одно keep-alive соединение
+    assert stats["tcp_connects"] - before["tcp_connects"] == 1
+
+
+def test_encode_command_nested():
+    cmd = encode_command("crm.item.list", {
+        "entityTypeId": 1050,
+        "filter": {">=ufCrm7UfCrmDate": "2025-11-16T00:00:00"},
+        "select": ["id", "ufCrm%"],
+    })
+    method, _, query = cmd.partition("?")
+    assert method == "crm.item.list"
+    assert dict(parse_qsl(query)) == {
+        "entityTypeId": "1050",
+        "filter[>=ufCrm7UfCrmDate]": "2025-11-16T00:00:00",
+        "select[0]": "id",
+        "select[1]": "ufCrm%",
+    }
+
+
+async def test_concurrent_reads_share_one_batch(bitrix_server):
+    async with bx_batch():
+        results = await asyncio.gather(
+            bx("crm.item.get", {"entityTypeId": 1050, "id": 1}),
+            bx("disk.file.get", {"id": 2}),
+            bx("crm.item.get", {"id": 404}),
+            return_exceptions=True,
+        )
+    assert [m for m, _ in bitrix_server] == ["batch"]
+    assert results[0] == {"method": "crm.item.get", "query": {"entityTypeId": "1050", "id": "1"}}
+    assert results[1] == {"method": "disk.file.get", "query": {"id": "2"}}
+    assert isinstance(results[2], BitrixError) and "nope c2" in str(results[2])
+
+
+async def test_batch_splits_by_50_commands(bitrix_server):
+    async with bx_batch():
+        results = await asyncio.gather(*(bx("crm.item.get", {"id": i}) for i in range(120)))
+    assert [m for m, _ in bitrix_server] == ["batch", "batch", "batch"]
+    assert [r["query"]["id"] for r in results] == [str(i) for i in range(120)]
+
+
+async def test_batch_keeps_per_call_retries(bitrix_server):
+    async with bx_batch():
+        results = await asyncio.gather(
+            bx("crm.item.get", {"id": 1, "flaky": 1}, retries=2),
+            bx("crm.item.get", {"id": 2}, retries=1),
+        )
+    # 503 на batch повторяется так же, как повторился бы отдельный вызов
+    assert [m for m, _ in bitrix_server] == ["batch", "batch"]
+    assert [r["query"]["id"] for r in results] == ["1", "2"]
+
+
+async def test_reads_outside_scope_are_not_delayed(bitrix_server):
+    await asyncio.gather(bx("crm.item.get", {"id": 1}), bx("disk.file.get", {"id": 2}))
+    assert sorted(m for m, _ in bitrix_server) == ["crm.item.get", "disk.file.get"]
+
+
+async def test_writes_are_not_batched(bitrix_server):
+    async with bx_batch():
+        await asyncio.gather(
+            bx("crm.item.update", {"id": 1}),
+            bx("crm.item.update", {"id": 2}),
+        )
+    assert [m for m, _ in bitrix_server] == ["crm.item.update", "crm.item.update"]
+
+
+async def test_identical_reads_share_one_request(bitrix_server):
+    payload_a = {"entityTypeId": 1050, "id": 5, "select": ["id", "ufCrm%"]}
+    payload_b = {"select": ["ufCrm%", "id"], "id": 5, "entityTypeId": 1050}
+    results = await asyncio.gather(
+        bx("crm.item.get", payload_a),
+        bx("crm.item.get", payload_b),
+        bx("crm.item.get", payload_a),
+    )
+    assert len(bitrix_server) == 1
+    assert results[0] == results[1] == results[2]
+    # У каждого ожидающего своя копия: правка одного не видна остальным
+    results[0]["payload"]["id"] = 0
+    assert results[1]["payload"]["id"] == results[2]["payload"]["id"] == 5
+    assert results[1] is not results[2]
+    stats = http_client.singleflight_stats()
+    assert stats["shared"] >= 2
+
+
+async def test_cached_read_and_write_invalidation(bitrix_server):
+    get = {"entityTypeId": 1050, "id": 9}
+    other = {"entityTypeId": 1050, "id": 10}
+    await bx("crm.item.get", get)
+    await bx("crm.item.get", other)
+    await bx("crm.item.get", get)
+    assert [p["id"] for _, p in bitrix_server] == [9, 10]
+
+    await bx("crm.item.update", {"entityTypeId": 1050, "id": 9, "fields": {}})
+    await bx("crm.item.get", get)
+    await bx("crm.item.get", other)
+    # Сброшена только карточка изменённой смены
+    assert [p["id"] for _, p in bitrix_server] == [9, 10, 9, 9]
+
+
+async def test_cache_returns_copies(bitrix_server):
+    first = await bx("crm.item.list", {"entityTypeId": 1046})
+    first["payload"]["mutated"] = True
+    second = await bx("crm.item.list", {"entityTypeId": 1046})
+    assert "mutated" not in second["payload"]
+    assert len(bitrix_server) == 1
+
+
+async def test_bx_iter_streams_all_pages(bitrix_server):
+    ids = [it["id"] async for it in http_client.bx_iter("crm.item.list", {"entityTypeId": 1046})]
+    assert ids == LIST_IDS
+    # 50 + 50 + 20: последняя неполная страница завершает проход
+    assert len(bitrix_server) == 3
+    assert all(p["start"] == -1 for _, p in bitrix_server)
+
+    desc = [it["id"] async for it in http_client.bx_iter("crm.item.list", {}, descending=True)]
+    assert desc == LIST_IDS[::-1]
+
+
+async def test_bx_iter_falls_back_when_stream_fails(bitrix_server):
+    ids = [it["id"] async for it in http_client.bx_iter("crm.item.list", {"filter": {"flaky": 1}})]
+    assert ids == LIST_IDS
+    # первая страница: 503 в потоковом чтении, затем та же страница через bx
+    assert len(bitrix_server) == 4
+    assert bitrix_server[0][1] == bitrix_server[1][1]
+
+
+async def test_bx_iter_shards(bitrix_server):
+    ids = [it["id"] async for it in http_client.bx_iter("crm.item.list", {}, shards=4)]
+    assert sorted(ids) == LIST_IDS
+
+
+async def test_bx_iter_shards_stop_cleanly_on_early_exit(bitrix_server):
+    from contextlib import aclosing
+
+    async with aclosing(http_client.bx_iter("crm.item.list", {}, shards=2)) as it:
+        async for _ in it:
+            # шарды успевают заполнить очередь и встать на put
+            await asyncio.sleep(0.2)
+            break
+    workers = [t for t in asyncio.all_tasks() if "bx_iter.<locals>.worker" in t.get_coro().__qualname__]
+    assert workers == []
+
+
+async def test_calls_are_recorded_in_metrics(bitrix_server):
+    from app.services.bitrix_metrics import bitrix_caller, bitrix_metrics, render_prometheus
+
+    bitrix_metrics.reset()
+    with bitrix_caller("lpa"):
+        await bx("crm.item.get", {"entityTypeId": 1050, "id": 1})
+        with pytest.raises(BitrixError):
+            await bx("crm.item.fail", {})
+    assert bitrix_metrics.requests[("crm.item.get", "lpa", "ok")] == 1
+    assert bitrix_metrics.requests[("crm.item.fail", "lpa", "NOT_FOUND")] == 1
+    assert bitrix_metrics.bytes_in[("crm.item.get", "lpa")] > 0
+    assert bitrix_metrics.latency[("crm.item.get", "lpa")].count == 1
+
+    text = render_prometheus()
+    assert 'bitrix_requests_total{method="crm.item.get",caller="lpa",status="ok"} 1' in text
+    assert 'bitrix_request_duration_seconds_bucket{method="crm.item.get",caller="lpa",le="+Inf"} 1' in text
+    assert "# TYPE bitrix_limiter_lane_wait_seconds_total counter" in text
+    assert 'bitrix_limiter_lane_max_wait_seconds{lane="interactive"}' in text
+
+
+async def test_breaker_fails_fast_when_open(bitrix_server, monkeypatch):
+    from app.services.bitrix_breaker import BreakerRegistry
+    from app.services.bitrix_metrics import render_prometheus
+
+    breakers = BreakerRegistry(window=4, min_calls=2, error_rate=0.5, open_seconds=60)
+    monkeypatch.setattr(http_client, "bitrix_breakers", breakers)
+    monkeypatch.setattr("app.services.bitrix_breaker.bitrix_breakers", breakers)
+    for _ in range(2):
+        with pytest.raises(BitrixError, match="INTERNAL_SERVER_ERROR"):
+            await bx("crm.item.down", {}, retries=1)
+    with pytest.raises(http_client.BitrixUnavailable):
+        await bx("crm.item.down", {}, retries=1)
+    # третий вызов до сервера не дошёл
+    assert len(bitrix_server) == 2
+    # ошибки приложения (404 NOT_FOUND) breaker не размыкают
+    for _ in range(3):
+        with pytest.raises(BitrixError, match="nope"):
+            await bx("crm.item.fail", {}, retries=1)
+    assert breakers.get("crm.item.fail").state == "closed"
+
+    text = render_prometheus()
+    assert 'bitrix_breaker_state{method="crm.item.down"} 2' in text
+    assert 'bitrix_breaker_transitions_total{method="crm.item.down",from="closed",to="open"} 1' in text
+
+
+async def test_slow_read_is_hedged(bitrix_server, monkeypatch):
+    from app.services.bitrix_metrics import bitrix_metrics
+
+    bitrix_metrics.reset()
+    monkeypatch.setenv("BITRIX_HEDGE", "1")
+    for _ in range(20):
+        bitrix_metrics.observe_attempt("disk.file.getcontent", 0.01)
+    res = await asyncio.wait_for(bx("disk.file.getcontent", {"id": 5}), 1.5)
+    assert res["method"] == "disk.file.getcontent"
+    assert len(bitrix_server) == 2
+    assert bitrix_metrics.hedges[("disk.file.getcontent", "fired")] == 1
+    assert bitrix_metrics.hedges[("disk.file.getcontent", "won")] == 1
+
+
+async def test_deadline_turns_slow_call_into_quick_error(bitrix_server):
+    import time
+
+    from app.services.bitrix_breaker import bitrix_breakers
+    from app.services.bitrix_timeouts import deadline
+
+    started = time.monotonic()
+    with deadline(1.3):
+        with pytest.raises(http_client.BitrixTimeout):
+            await bx("crm.item.slow", {})
+    assert time.monotonic() - started < 1.8
+    # нехватка времени у бота — не отказ портала
+    assert bitrix_breakers.get("crm.item.slow").state == "closed"
+
+
+async def test_half_open_probe_is_returned_when_limiter_wait_fails(bitrix_server, monkeypatch):
+    from app.services.bitrix_breaker import HALF_OPEN, BreakerRegistry
+    from app.services.bitrix_timeouts import deadline
+
+    breakers = BreakerRegistry(min_calls=1, error_rate=1.0, open_seconds=0)
+    monkeypatch.setattr(http_client, "bitrix_breakers", breakers)
+    breaker = breakers.get("crm.item.update")
+    breaker.record_failure()
+
+    # дедлайн истёк в очереди лимитера — до портала не дошли
+    with deadline(0):
+        with pytest.raises(http_client.BitrixTimeout):
+            await http_client._call("crm.item.update", {})
+    assert breaker.state == HALF_OPEN
+    assert breaker._probes == 0
+
+    # отмена во время ожидания токена
+    async def stuck(method):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(http_client, "acquire_slot", stuck)
+    task = asyncio.create_task(http_client._call("crm.item.update", {}))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker._probes == 0
+    assert breaker.allow()
+    assert bitrix_server == []
@@ -0,0 +1,101 @@
+"""Пул LibreOffice (lpa_convert.SofficePool): выдача, перезапуск, очередь.
+
+Процессы soffice подменены воркером, который «конвертирует» приписыванием
+заголовка к байтам, — проверяется логика пула, а не LibreOffice.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.services import lpa_convert
+from app.services.lpa_convert import PoolBusy, SofficePool, convert_docx_bytes
+
+
+class CopyWorker:
+    def __init__(self, index, gate=None):
+        self.index = index
+        self.gate = gate
+        self.documents = 0
+        self.starts = 0
+        self.healthy = False
+
+    def start(self):
+        self.starts += 1
+        self.documents = 0
+        self.healthy = True
+
+    def alive(self):
+        return self.healthy
+
+    def convert(self, docx):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.documents += 1
+        return b"%PDF-" + docx
+
+    def restart(self):
+        self.start()
+
+    def stop(self):
+        self.healthy = False
+
+    def kill(self):
+        self.healthy = False
+
+
+@pytest.fixture
+def docx():
+    return b"docx"
+
+
+async def test_recycle_and_restart(docx):
+    workers = []
+    pool = SofficePool(size=1, max_documents=2, worker_factory=lambda i: workers.append(CopyWorker(i)) or workers[-1])
+    await pool.start()
+    try:
+        for _ in range(3):
+            assert await pool.convert(docx) == b"%PDF-docx"
+        await asyncio.sleep(0.05)
+        # После двух документов процесс перезапущен в фоне
+        assert workers[0].starts == 2 and pool.stats["recycles"] == 1
+
+        workers[0].healthy = False
+        await pool.convert(docx)
+        assert workers[0].starts == 3 and pool.stats["restarts"] == 1
+    finally:
+        await pool.stop()
+
+
+async def test_bounded_queue(docx):
+    gate = threading.Event()
+    pool = SofficePool(size=1, queue_limit=1, worker_factory=lambda i: CopyWorker(i, gate))
+    await pool.start()
+    try:
+        first = asyncio.create_task(pool.convert(docx))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(pool.convert(docx))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolBusy):
+            await pool.convert(docx)
+        gate.set()
+        await asyncio.gather(first, queued)
+        assert pool.snapshot()["conversions"] == 2 and pool.stats["busy"] == 1
+    finally:
+        await pool.stop()
+
+
+async def test_only_final_pdf_touches_disk(docx, tmp_path, monkeypatch):
+    pool = SofficePool(size=1, worker_factory=CopyWorker)
+    monkeypatch.setattr(lpa_convert, "soffice_pool", pool)
+    await pool.start()
+    try:
+        out = tmp_path / "pdf" / "LPA_1.pdf"
+        out.parent.mkdir()
+        out.write_bytes(b"old")
+        assert await convert_docx_bytes(docx, out) == out
+        assert out.read_bytes() == b"%PDF-docx"
+        assert [p.name for p in out.parent.iterdir()] == ["LPA_1.pdf"]
+    finally:
+        await pool.stop()
@@ -0,0 +1,50 @@
+"""Предзагрузка фото ЛПА (lpa_photos.prefetch_photos) на httpx.MockTransport."""
+
+import asyncio
+
+import httpx
+
+from app.services.lpa_photos import prefetch_photos
+
+
+def _client(sizes, calls=None):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if calls is not None:
+            calls.append(request.url.path)
+        if request.url.path.endswith("/getFile"):
+            file_id = request.url.params["file_id"]
+            return httpx.Response(200, json={"ok": True, "result": {"file_path": f"photos/{file_id}.jpg"}})
+        name = request.url.path.rsplit("/", 1)[-1].split(".")[0]
+        if name not in sizes:
+            return httpx.Response(404)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=b"x" * sizes[name])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_order_limits_and_replacement(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "123:abc")
+    photos = [
+        {"url": "https://portal.example/disk/a"},
+        {"url": "https://portal.example/disk/missing"},
+        {"tg_file_id": "t1"},
+        {"url": "https://portal.example/disk/huge"},
+        {"url": "https://portal.example/disk/b"},
+        {"url": "https://portal.example/disk/c"},
+    ]
+    calls = []
+    async with _client({"a": 100, "t1": 200, "huge": 5000, "b": 300, "c": 400}, calls) as client:
+        got = await prefetch_photos(photos, 3, client=client, max_bytes=1000)
+    # Недоступное и слишком большое фото заменены следующими по списку, порядок сохранён
+    assert [(name, len(data)) for name, data in got] == [
+        ("Фото 1 (Bitrix24)", 100), ("Фото 2 (Telegram)", 200), ("Фото 3 (Bitrix24)", 300),
+    ]
+    assert "/bot123:abc/getFile" in calls and "/disk/c" not in calls
+
+
+async def test_total_byte_budget():
+    photos = [{"url": f"https://portal.example/disk/p{i}"} for i in range(4)]
+    async with _client({f"p{i}": 400 for i in range(4)}) as client:
+        got = await prefetch_photos(photos, 4, client=client, concurrency=1, total_bytes=1000)
+    assert [len(data) for _, data in got] == [400, 400]
@@ -0,0 +1,93 @@
+"""Рендер ЛПА: скомпилированный шаблон (lpa_template) и пул процессов (lpa_render_pool)."""
+
+import os
+import pickle
+import shutil
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+from docx import Document
+from docxtpl import DocxTemplate
+
+from app.services.lpa_pdf import LPAPlaceholderError, _flatten_for_template, render_docx_bytes
+from app.services.lpa_render_pool import RenderPool, render_lpa_docx_bytes
+from app.services.lpa_template import get_compiled
+
+TEMPLATE = Path(__file__).resolve().parent.parent / "app" / "templates" / "pdf" / "lpa_template.docx"
+DATA = {
+    "object_name": "Объект 7",
+    "date": "16.11.2025",
+    "tasks": [{"name": "Земляные работы", "unit": "м3", "plan": 120, "fact": 110}],
+    "plan_total": 120,
+    "fact_total": 110,
+    "efficiency": 91.7,
+}
+
+
+def _jpeg() -> bytes:
+    from PIL import Image
+
+    out = BytesIO()
+    Image.new("RGB", (1600, 1200), (200, 120, 40)).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def _text(package: bytes) -> str:
+    doc = Document(BytesIO(package))
+    cells = [c.text for t in doc.tables for r in t.rows for c in r.cells]
+    return "\n".join([p.text for p in doc.paragraphs] + cells)
+
+
+async def test_render_in_process(tmp_path, monkeypatch):
+    pool = RenderPool(processes=1)
+    monkeypatch.setattr("app.services.lpa_render_pool.render_pool", pool)
+    monkeypatch.chdir(tmp_path)
+    try:
+        package = await render_lpa_docx_bytes(TEMPLATE, DATA, name="LPA_1.docx")
+        assert "Земляные работы" in _text(package)
+
+        # В процесс уходят только плоский контекст и байты фото, обратно — байты DOCX
+        package = await pool.run(
+            render_docx_bytes, str(TEMPLATE), _flatten_for_template(DATA), [("Фото 1", _jpeg())], 7, "photos.docx",
+        )
+        text = _text(package)
+        assert "Фото 1" in text and "Всего фото: 7" in text
+        assert pool.snapshot()["renders"] == 2
+        # Рендер ничего не пишет на диск
+        assert list(tmp_path.iterdir()) == []
+    finally:
+        await pool.stop()
+
+
+def test_placeholder_error_survives_pickling(tmp_path):
+    err = pickle.loads(pickle.dumps(LPAPlaceholderError(["{{x}}"], tmp_path / "a.docx")))
+    assert err.placeholders == ["{{x}}"] and err.file_path == tmp_path / "a.docx"
+
+
+def _xml_parts(doc) -> dict:
+    out = BytesIO()
+    doc.save(out)
+    with zipfile.ZipFile(out) as z:
+        return {n: z.read(n) for n in z.namelist() if n.endswith(".xml")}
+
+
+def test_compiled_template_matches_docxtpl_and_reloads(tmp_path):
+    tpl = tmp_path / "lpa.docx"
+    shutil.copyfile(TEMPLATE, tpl)
+    compiled = get_compiled(tpl)
+    assert get_compiled(tpl) is compiled
+    assert {"object_name", "task1_name", "plan_total"} <= compiled.placeholders
+
+    ctx = dict.fromkeys(compiled.placeholders, "")
+    ctx.update(_flatten_for_template(DATA))
+    plain = DocxTemplate(str(tpl))
+    plain.render(ctx)
+    cached = compiled.new_document()
+    cached.render(ctx)
+    assert _xml_parts(cached) == _xml_parts(plain)
+
+    # Файл изменился — следующий рендер берёт новую версию
+    stat = tpl.stat()
+    os.utime(tpl, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert get_compiled(tpl) is not compiled
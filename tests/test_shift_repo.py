@@ -0,0 +1,58 @@
+"""Асинхронный репозиторий локальных смен (shift_repo) на aiosqlite."""
+
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base
+from app.models import Object, Shift, ShiftStatus
+from app.services import shift_repo
+
+
+@pytest.fixture
+async def repo(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'shifts.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(shift_repo, "async_session", sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    yield shift_repo
+    await engine.dispose()
+
+
+async def test_plan_round_trip(repo):
+    plan = {"tasks": [{"name": "Земляные работы", "unit": "м3", "plan": 120}]}
+    shift_id = await repo.save_plan(7, "today", plan, object_name="Объект 7")
+    found = await repo.get_last_open_shift(7)
+    assert found[0] == shift_id
+    assert found[1]["tasks"][0]["plan"] == 120
+    assert await repo.get_last_open_shift(8) is None
+
+    async with repo.session_scope() as s:
+        s.add(Object(id=7, name="Объект 7"))
+        sh = await s.get(Shift, shift_id)
+        sh.bitrix_id, sh.status = 501, ShiftStatus.CLOSED
+    local_id, meta = await repo.get_shift_by_bitrix_id(501)
+    assert (local_id, meta["object_id"], meta["object_name"], meta["status"]) == (shift_id, 7, "Объект 7", "closed")
+    assert await repo.get_shift_bitrix_id(shift_id) == 501
+
+    await repo.save_fact(shift_id, {"Земляные работы": 110}, 91.7, 91.7, plan_json=found[1])
+    closed_id, data = await repo.get_last_closed_shift(7)
+    assert closed_id == shift_id and data["plan"]["object_name"] == "Объект 7"
+
+
+async def test_queries_do_not_block_the_loop(repo):
+    # Пока идут запросы к БД, цикл событий обслуживает другие задачи
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.gather(*(repo.save_plan(i, "today", {"tasks": [{"name": "Щебень", "unit": "т", "plan": 1}]}) for i in range(20)))
+    task.cancel()
+    assert ticks > 20
@@ -0,0 +1,132 @@
+"""Бенчмарк конвертации ЛПА DOCX → PDF: soffice на каждый документ против пула.
+
+* ``cold`` — lpa_pdf.docx_to_pdf: отдельный ``soffice --headless --convert-to``
+  на каждый документ (как было);
+* ``pool`` — lpa_convert.SofficePool: долгоживущие процессы LibreOffice по UNO,
+  DOCX и PDF передаются потоком байтов.
+
+Документ по умолчанию — шаблон ЛПА, заполненный тестовыми данными
+(render_lpa_docx). Для пула нужны soffice и python-модуль uno.
+
+Запуск::
+
+    python tools/bench_lpa_convert.py --docs 20 --concurrency 2
+    python tools/bench_lpa_convert.py --docx output/pdf/LPA_1.docx --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("BOT_TOKEN", "bench")
+
+from app.services.lpa_convert import SofficePool, soffice_binary, uno_available, write_atomic  # noqa: E402
+from app.services.lpa_pdf import docx_to_pdf, render_lpa_docx  # noqa: E402
+
+TEMPLATE = Path("app/templates/pdf/lpa_template.docx")
+SAMPLE = {
+    "object_name": "Объект бенчмарка",
+    "section": "Участок 1",
+    "date": "16.11.2025",
+    "foreman": "Иванов И.И.",
+    "tasks": [
+        {"name": f"Работа {i}", "unit": "м3", "plan": 10 + i, "fact": 9 + i, "executor": "Бригада", "reason": ""}
+        for i in range(15)
+    ],
+    "plan_total": 255,
+    "fact_total": 240,
+    "efficiency": 94.1,
+}
+
+
+def sample_docx(workdir: Path) -> Path:
+    return render_lpa_docx(TEMPLATE, dict(SAMPLE), workdir, filename_prefix="bench")
+
+
+def copies(src: Path, workdir: Path, n: int, label: str) -> List[Path]:
+    paths = []
+    for i in range(n):
+        dst = workdir / f"{label}_{i}.docx"
+        shutil.copyfile(src, dst)
+        paths.append(dst)
+    return paths
+
+
+def report(label: str, timings: List[float], wall: float) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+    print(
+        f"  {label:<5} docs={len(timings):<4} p50={statistics.median(timings):7.2f}s  "
+        f"p95={p95:7.2f}s  wall={wall:7.2f}s  ({len(timings) / wall:.2f} docs/s)"
+    )
+
+
+async def run_cold(docs: List[Path], concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+    timings: List[float] = []
+
+    async def one(path: Path) -> None:
+        async with sem:
+            started = time.perf_counter()
+            if await asyncio.to_thread(docx_to_pdf, path, None, True) is None:
+                raise RuntimeError(f"conversion failed: {path}")
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in docs))
+    report("cold", timings, time.perf_counter() - started)
+
+
+async def run_pool(docs: List[Path], concurrency: int, workers: int) -> None:
+    pool = SofficePool(size=workers, max_documents=0, queue_limit=len(docs))
+    started = time.perf_counter()
+    await pool.start()
+    print(f"  pool started in {time.perf_counter() - started:.2f}s ({workers} workers)")
+    sem = asyncio.Semaphore(concurrency)
+    timings: List[float] = []
+
+    async def one(path: Path) -> None:
+        async with sem:
+            started = time.perf_counter()
+            write_atomic(path.with_suffix(".pdf"), await pool.convert(path.read_bytes()))
+            timings.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(p) for p in docs))
+        report("pool", timings, time.perf_counter() - started)
+    finally:
+        await pool.stop()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docx", help="DOCX для конвертации (по умолчанию — шаблон ЛПА с тестовыми данными)")
+    parser.add_argument("--docs", type=int, default=10, help="Документов на прогон")
+    parser.add_argument("--concurrency", type=int, default=2, help="Одновременных конвертаций")
+    parser.add_argument("--workers", type=int, default=2, help="Процессов soffice в пуле")
+    args = parser.parse_args()
+
+    if shutil.which(soffice_binary()) is None:
+        sys.exit(f"{soffice_binary()} not found (LPA_SOFFICE_BIN)")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        src = Path(args.docx) if args.docx else sample_docx(workdir)
+        print(f"document: {src} ({src.stat().st_size} bytes)")
+        await run_cold(copies(src, workdir, args.docs, "cold"), args.concurrency)
+        if uno_available():
+            await run_pool(copies(src, workdir, args.docs, "pool"), args.concurrency, args.workers)
+        else:
+            print("  pool  skipped: python module 'uno' is not installed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Бенчмарк: потоковый разбор crm.item.list против r.json().
+
+Генерирует синтетические ответы Bitrix24 (элементы смен с JSON плана/факта
+и описаниями файлов, как при ``select *``) и сравнивает пиковую память и
+время двух путей:
+
+* ``json``   — как httpx: всё тело в памяти (r.content) + json.loads целиком;
+* ``stream`` — ItemsStreamDecoder по кускам из сети, элемент обрабатывается
+  и отпускается.
+
+Запуск::
+
+    python tools/bench_stream_json.py --items 50 200 1000 --plan-kb 8
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.bitrix_stream import ItemsStreamDecoder  # noqa: E402
+
+
+def synthetic_response(items: int, plan_kb: int, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    works = max(1, plan_kb * 1024 // 120)
+
+    def plan() -> str:
+        return json.dumps({
+            "works": [
+                {"name": f"Работа {rnd.randint(1, 999)}", "unit": "м3", "plan": rnd.randint(1, 500), "price": rnd.random() * 1e4}
+                for _ in range(works)
+            ],
+            "meta": {"object_bitrix_id": rnd.randint(1, 300), "section": "Участок «Север»"},
+        }, ensure_ascii=False)
+
+    rows = [
+        {
+            "id": 1000 + i,
+            "title": f"Смена #{1000 + i}",
+            "stageId": "DT1050_12:NEW",
+            "ufCrm7UfCrmDate": "2025-11-16T00:00:00+03:00",
+            "ufCrm7UfPlanJson": plan(),
+            "ufCrm7UfFactJson": plan(),
+            "ufCrm7UfShiftPhotos": [
+                {"id": rnd.randint(1, 10 ** 6), "url": f"/disk/downloadFile/{i}/?ncc=1&filename=photo_{k}.jpg"}
+                for k in range(5)
+            ],
+        }
+        for i in range(items)
+    ]
+    return json.dumps(
+        {"result": {"items": rows}, "time": {"start": 1731700000.1, "finish": 1731700000.9, "duration": 0.8}},
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+
+def _consume(item: dict) -> int:
+    # «Обработка» элемента: как потребители, читаем пару полей
+    return len(item.get("ufCrm7UfPlanJson") or "")
+
+
+def bench_json(body: bytes) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = json.loads(body)
+    total = sum(_consume(i) for i in data["result"]["items"])
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # r.content живёт, пока жив ответ: тело + дерево объектов
+    return elapsed, peak + len(body), total
+
+
+def bench_stream(body: bytes, chunk: int) -> tuple:
+    view = memoryview(body)
+    tracemalloc.start()
+    started = time.perf_counter()
+    decoder = ItemsStreamDecoder()
+    total = 0
+    for pos in range(0, len(body), chunk):
+        for item in decoder.feed(bytes(view[pos:pos + chunk])):
+            total += _consume(item)
+    decoder.close()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--plan-kb", type=int, default=8, help="Размер JSON плана/факта на элемент, КБ")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="Размер куска из сети, КБ")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'items':>6} {'body MB':>8} {'json ms':>8} {'json MB':>8} {'stream ms':>10} {'stream MB':>10}")
+    for n in args.items:
+        body = synthetic_response(n, args.plan_kb)
+        j = min((bench_json(body) for _ in range(args.repeat)), key=lambda r: r[0])
+        s = min((bench_stream(body, args.chunk_kb * 1024) for _ in range(args.repeat)), key=lambda r: r[0])
+        assert j[2] == s[2], "stream and json paths disagree"
+        mb = 1024 * 1024
+        print(
+            f"{n:>6} {len(body) / mb:>8.2f} {j[0] * 1000:>8.1f} {j[1] / mb:>8.2f} "
+            f"{s[0] * 1000:>10.1f} {s[1] / mb:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
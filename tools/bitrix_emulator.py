@@ -0,0 +1,658 @@
+"""Локальный эмулятор Bitrix24 REST (aiohttp + SQLite).
+
+Поддерживает подмножество методов, которым пользуется бот:
+crm.item.add/get/list/update/delete и crm.item.fields для смарт-процессов
+1046/1050/1056/1060 (filter, order, select, limit, start, режим start=-1),
+batch, disk.file.get/getcontent, crm.type.list и crm.item.userfield.list.
+
+Задержка ответа, «дырявое ведро» портала с ответами 429 и случайные 429
+настраиваются, набор данных генерируется детерминированно по seed.
+
+Запуск:
+    python tools/bitrix_emulator.py --port 8765 --latency-ms 80 --seed 42
+
+и в .env (или окружении бота/бенчмарка):
+    BITRIX_WEBHOOK_URL=http://127.0.0.1:8765/rest/1/emulator
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.bitrix_ids import (  # noqa: E402
+    OBJECT_ETID,
+    RESOURCE_ETID,
+    SHIFT_ETID,
+    TIMESHEET_ETID,
+    UF_DATE,
+    UF_EFF_FINAL,
+    UF_EFF_RAW,
+    UF_EQUIP_HOURS,
+    UF_EQUIP_RATE,
+    UF_EQUIP_RATE_TYPE,
+    UF_EQUIP_TYPE,
+    UF_FACT_TOTAL,
+    UF_MAT_PRICE,
+    UF_MAT_QTY,
+    UF_MAT_TYPE,
+    UF_MAT_UNIT,
+    UF_OBJECT_ADDRESS,
+    UF_OBJECT_CODE,
+    UF_OBJECT_LINK,
+    UF_PDF_FILE,
+    UF_PLAN_TOTAL,
+    UF_RES_COMMENT,
+    UF_RESOURCE_TYPE,
+    UF_SHIFT_ID,
+    UF_STATUS,
+    UF_TS_COMMENT,
+    UF_TS_HOURS,
+    UF_TS_RATE,
+    UF_TS_SHIFT_ID,
+    UF_TS_WORKER,
+    UF_TYPE,
+)
+
+PAGE_SIZE = 50
+BATCH_MAX = 50
+
+TYPES = {
+    OBJECT_ETID: "Объект",
+    SHIFT_ETID: "Смена",
+    RESOURCE_ETID: "Ресурс",
+    TIMESHEET_ETID: "Табель",
+}
+
+# Пользовательские поля по смарт-процессам: camelCase-код, подпись, тип
+USERFIELDS: Dict[int, List[Tuple[str, str, str]]] = {
+    OBJECT_ETID: [
+        (UF_OBJECT_ADDRESS, "Адрес", "string"),
+        (UF_OBJECT_CODE, "Код/ID", "string"),
+    ],
+    SHIFT_ETID: [
+        (UF_DATE, "Дата", "datetime"),
+        (UF_TYPE, "Тип Смены", "enumeration"),
+        (UF_OBJECT_LINK, "Объект", "crm"),
+        (UF_PLAN_TOTAL, "Плановый объем", "double"),
+        (UF_FACT_TOTAL, "Фактический объём", "double"),
+        (UF_EFF_RAW, "Коэффициент эффективности", "double"),
+        (UF_EFF_FINAL, "Итоговая эффективность", "double"),
+        (UF_STATUS, "Статус", "enumeration"),
+        (UF_PDF_FILE, "Файл PDF", "file"),
+        ("ufCrm7UfPlanJson", "План работ (JSON)", "string"),
+        ("ufCrm7UfFactJson", "Факт работ (JSON)", "string"),
+        ("ufCrm7UfShiftPhotos", "Фото смены", "file"),
+    ],
+    RESOURCE_ETID: [
+        (UF_SHIFT_ID, "Смена (ID)", "integer"),
+        (UF_RESOURCE_TYPE, "Тип ресурса", "enumeration"),
+        (UF_EQUIP_TYPE, "Тип техники", "string"),
+        (UF_EQUIP_HOURS, "Машино-часы", "double"),
+        (UF_EQUIP_RATE_TYPE, "Тип тарифа", "enumeration"),
+        (UF_EQUIP_RATE, "Ставка", "double"),
+        (UF_MAT_TYPE, "Материал", "string"),
+        (UF_MAT_QTY, "Кол-во", "double"),
+        (UF_MAT_UNIT, "Ед. изм.", "string"),
+        (UF_MAT_PRICE, "Цена за ед.", "double"),
+        (UF_RES_COMMENT, "Комментарий к ресурсу", "string"),
+    ],
+    TIMESHEET_ETID: [
+        (UF_TS_SHIFT_ID, "Смена (ID)", "integer"),
+        (UF_TS_WORKER, "Сотрудник/бригада", "string"),
+        (UF_TS_HOURS, "Часы", "double"),
+        (UF_TS_RATE, "Ставка", "double"),
+        (UF_TS_COMMENT, "Комментарий к табелю", "string"),
+    ],
+}
+
+# Префиксы операций фильтра crm.item.list (длинные — первыми)
+_FILTER_OPS = (">=", "<=", "!=", "!@", ">", "<", "=", "!", "@", "%")
+
+
+class BitrixApiError(Exception):
+    def __init__(self, code: str, description: str, status: int = 400):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.status = status
+
+
+def camel_to_upper(code: str) -> str:
+    """ufCrm7UfCrmDate → UF_CRM_7_UF_CRM_DATE."""
+    return re.sub(r"(?<!^)(?=[A-Z])|(?<=[a-z])(?=\d)", "_", code).upper()
+
+
+def field_key(key: str) -> str:
+    """Ключ поля из fields в camelCase, как его хранит и отдаёт crm.item.*."""
+    if not key or (not key.isupper() and "_" not in key):
+        return key
+    parts = [p for p in key.lower().split("_") if p]
+    if not parts:
+        return key
+    out = parts[0]
+    for p in parts[1:]:
+        out += p if p.isdigit() else p.capitalize()
+    return out
+
+
+def decode_query(query: str) -> Dict[str, Any]:
+    """Разобрать строку в формате PHP http_build_query во вложенный dict."""
+    root: Dict[str, Any] = {}
+    for raw_key, value in parse_qsl(query, keep_blank_values=True):
+        base, _, rest = raw_key.partition("[")
+        parts = [base] + (re.findall(r"\[([^\]]*)\]", "[" + rest) if rest else [])
+        node = root
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if part == "":
+                part = str(len(node))
+            if last:
+                node[part] = value
+            else:
+                node = node.setdefault(part, {})
+    return _listify(root)
+
+
+def _listify(value: Any) -> Any:
+    if isinstance(value, dict):
+        value = {k: _listify(v) for k, v in value.items()}
+        if value and all(k.isdigit() for k in value):
+            return [value[k] for k in sorted(value, key=int)]
+    return value
+
+
+def _coerce(value: Any) -> Any:
+    """Числа из query-строки приводим к int/float, как их хранит JSON."""
+    if isinstance(value, list):
+        return [_coerce(v) for v in value]
+    if isinstance(value, str) and re.fullmatch(r"-?\d+", value):
+        return int(value)
+    if isinstance(value, str) and re.fullmatch(r"-?\d+\.\d+", value):
+        return float(value)
+    return value
+
+
+def _int(value: Any, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BitrixApiError("INVALID_ARG_VALUE", f"Parameter '{name}' must be integer") from None
+
+
+class Store:
+    """Элементы смарт-процессов и файлы диска в SQLite."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                entity INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (entity, id)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                content BLOB NOT NULL
+            );
+            """
+        )
+
+    # --- элементы ---
+
+    def _check_entity(self, entity: Any) -> int:
+        etid = _int(entity, "entityTypeId")
+        if etid not in TYPES:
+            raise BitrixApiError("NOT_FOUND", f"Smart process {etid} not found")
+        return etid
+
+    def add(self, entity: Any, fields: Dict[str, Any]) -> Dict[str, Any]:
+        etid = self._check_entity(entity)
+        row = self.db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM items WHERE entity = ?", (etid,)).fetchone()
+        now = datetime.now().replace(microsecond=0).isoformat()
+        item = {"id": row[0], "title": "", "entityTypeId": etid, "createdTime": now, "updatedTime": now}
+        item.update({field_key(k): v for k, v in (fields or {}).items()})
+        item["id"] = row[0]
+        self.db.execute("INSERT INTO items (entity, id, data) VALUES (?, ?, ?)", (etid, item["id"], json.dumps(item, ensure_ascii=False)))
+        return item
+
+    def get(self, entity: Any, item_id: Any) -> Dict[str, Any]:
+        etid = self._check_entity(entity)
+        row = self.db.execute("SELECT data FROM items WHERE entity = ? AND id = ?", (etid, _int(item_id, "id"))).fetchone()
+        if row is None:
+            raise BitrixApiError("NOT_FOUND", "Element not found")
+        return json.loads(row[0])
+
+    def update(self, entity: Any, item_id: Any, fields: Dict[str, Any]) -> Dict[str, Any]:
+        item = self.get(entity, item_id)
+        item.update({field_key(k): v for k, v in (fields or {}).items()})
+        item["updatedTime"] = datetime.now().replace(microsecond=0).isoformat()
+        self.db.execute(
+            "UPDATE items SET data = ? WHERE entity = ? AND id = ?",
+            (json.dumps(item, ensure_ascii=False), item["entityTypeId"], item["id"]),
+        )
+        return item
+
+    def delete(self, entity: Any, item_id: Any) -> None:
+        item = self.get(entity, item_id)
+        self.db.execute("DELETE FROM items WHERE entity = ? AND id = ?", (item["entityTypeId"], item["id"]))
+
+    def list(
+        self,
+        entity: Any,
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        order: Optional[Dict[str, str]] = None,
+        limit: int = PAGE_SIZE,
+        start: int = 0,
+        count: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        etid = self._check_entity(entity)
+        where, params = ["entity = ?"], [etid]
+        for key, value in (filter or {}).items():
+            clause, clause_params = _filter_clause(key, _coerce(value))
+            where.append(clause)
+            params.extend(clause_params)
+        order_sql = []
+        for field, direction in (order or {"id": "ASC"}).items():
+            direction = "DESC" if str(direction).upper() == "DESC" else "ASC"
+            order_sql.append(f"{_column(field)} {direction}")
+        if not any(o.startswith("id ") for o in order_sql):
+            order_sql.append("id ASC")
+        sql_where = " AND ".join(where)
+        total = None
+        if count:
+            total = self.db.execute(f"SELECT COUNT(*) FROM items WHERE {sql_where}", params).fetchone()[0]
+        rows = self.db.execute(
+            f"SELECT data FROM items WHERE {sql_where} ORDER BY {', '.join(order_sql)} LIMIT ? OFFSET ?",
+            params + [limit, max(start, 0)],
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows], total
+
+    # --- файлы ---
+
+    def add_file(self, name: str, content: bytes) -> int:
+        cur = self.db.execute("INSERT INTO files (name, content) VALUES (?, ?)", (name, content))
+        return cur.lastrowid
+
+    def file(self, file_id: Any) -> Tuple[int, str, bytes]:
+        row = self.db.execute("SELECT id, name, content FROM files WHERE id = ?", (_int(file_id, "id"),)).fetchone()
+        if row is None:
+            raise BitrixApiError("ERROR_NOT_FOUND", "Could not find entity with id", status=404)
+        return row[0], row[1], row[2]
+
+
+def _column(field: str) -> str:
+    if field.lower() == "id":
+        return "id"
+    if not re.fullmatch(r"[A-Za-z0-9_]+", field):
+        raise BitrixApiError("INVALID_ARG_VALUE", f"Invalid field '{field}'")
+    return f"json_extract(data, '$.{field}')"
+
+
+def _filter_clause(key: str, value: Any) -> Tuple[str, List[Any]]:
+    op = next((o for o in _FILTER_OPS if key.startswith(o)), "")
+    field = key[len(op):]
+    col = _column(field)
+    if op in ("", "=", "@", "!", "!=", "!@"):
+        values = value if isinstance(value, list) else [value]
+        marks = ", ".join("?" for _ in values)
+        if field.lower() == "id":
+            match = f"id IN ({marks})"
+            params = list(values)
+        else:
+            # Множественное поле совпадает, если любой его элемент равен значению
+            match = (
+                f"({col} IN ({marks}) OR (json_type(data, '$.{field}') = 'array' AND EXISTS "
+                f"(SELECT 1 FROM json_each(data, '$.{field}') WHERE value IN ({marks}))))"
+            )
+            params = list(values) + list(values)
+        if op.startswith("!"):
+            return f"NOT {match}", params
+        return match, params
+    if op == "%":
+        return f"{col} LIKE ?", [f"%{value}%"]
+    return f"{col} {op} ?", [value]
+
+
+def project(item: Dict[str, Any], select: Optional[List[str]]) -> Dict[str, Any]:
+    """Оставить в элементе только поля из select ("*" — стандартные, "ufCrm%" — все UF)."""
+    if not select:
+        return item
+    out: Dict[str, Any] = {"id": item["id"]}
+    for field in select:
+        if field == "*":
+            out.update({k: v for k, v in item.items() if not k.startswith("uf")})
+        elif field.endswith("%"):
+            prefix = field[:-1]
+            out.update({k: v for k, v in item.items() if k.startswith(prefix)})
+        elif field in item:
+            out[field] = item[field]
+    return out
+
+
+class Emulator:
+    """Обработчик REST-методов поверх Store с задержкой и инъекцией 429."""
+
+    def __init__(
+        self,
+        store: Store,
+        *,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate: float = 0.0,
+        burst: float = 50.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.store = store
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.rate = rate
+        self.burst = burst
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._level = 0.0
+        self._updated = time.monotonic()
+        self.base_url = ""
+        self.stats: Dict[str, int] = {"requests": 0, "throttled": 0, "commands": 0}
+
+    # --- лимит портала ---
+
+    def _throttled(self) -> bool:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return True
+        if self.rate <= 0:
+            return False
+        now = time.monotonic()
+        self._level = max(0.0, self._level - (now - self._updated) * self.rate)
+        self._updated = now
+        if self._level + 1 > self.burst:
+            return True
+        self._level += 1
+        return False
+
+    # --- методы ---
+
+    def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполнить метод; вернуть тело ответа без обёртки time."""
+        self.stats["commands"] += 1
+        handler = getattr(self, "m_" + method.replace(".", "_"), None)
+        if handler is None:
+            raise BitrixApiError("ERROR_METHOD_NOT_FOUND", "Method not found!", status=404)
+        return handler(params)
+
+    def m_crm_item_add(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        return {"result": {"item": self.store.add(p.get("entityTypeId"), p.get("fields") or {})}}
+
+    def m_crm_item_get(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        item = self.store.get(p.get("entityTypeId"), p.get("id"))
+        return {"result": {"item": project(item, p.get("select"))}}
+
+    def m_crm_item_update(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        return {"result": {"item": self.store.update(p.get("entityTypeId"), p.get("id"), p.get("fields") or {})}}
+
+    def m_crm_item_delete(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        self.store.delete(p.get("entityTypeId"), p.get("id"))
+        return {"result": []}
+
+    def m_crm_item_list(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        start = _int(p.get("start", 0) or 0, "start")
+        limit = PAGE_SIZE
+        if p.get("limit") not in (None, ""):
+            limit = max(1, min(PAGE_SIZE, _int(p["limit"], "limit")))
+        filter_ = p.get("filter") or {}
+        if not isinstance(filter_, dict):
+            raise BitrixApiError("INVALID_ARG_VALUE", "filter must be an object")
+        items, total = self.store.list(
+            p.get("entityTypeId"),
+            filter=filter_,
+            order=p.get("order") or None,
+            limit=limit,
+            start=start,
+            count=start != -1,
+        )
+        body: Dict[str, Any] = {"result": {"items": [project(i, p.get("select")) for i in items]}}
+        if total is not None:
+            body["total"] = total
+            if start + len(items) < total:
+                body["next"] = start + len(items)
+        return body
+
+    def m_crm_item_fields(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        etid = self.store._check_entity(p.get("entityTypeId"))
+        fields = {
+            "id": {"type": "integer", "title": "ID", "upperName": "ID"},
+            "title": {"type": "string", "title": "Название", "upperName": "TITLE"},
+        }
+        for code, label, utype in USERFIELDS[etid]:
+            fields[code] = {"type": utype, "title": label, "upperName": camel_to_upper(code)}
+        return {"result": {"fields": fields}}
+
+    def m_crm_item_userfield_list(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        etid = self.store._check_entity(p.get("entityTypeId"))
+        return {"result": {"userFields": [
+            {"FIELD_NAME": camel_to_upper(code), "EDIT_FORM_LABEL": label, "LIST_COLUMN_LABEL": label, "USER_TYPE_ID": utype}
+            for code, label, utype in USERFIELDS[etid]
+        ]}}
+
+    def m_crm_type_list(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        types = [{"id": i + 1, "entityTypeId": etid, "title": title} for i, (etid, title) in enumerate(TYPES.items())]
+        return {"result": {"types": types}, "total": len(types)}
+
+    def m_disk_file_get(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        file_id, name, content = self.store.file(p.get("id"))
+        return {"result": {
+            "ID": file_id,
+            "NAME": name,
+            "SIZE": len(content),
+            "DOWNLOAD_URL": f"{self.base_url}/disk/download/{file_id}",
+        }}
+
+    def m_disk_file_getcontent(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        _, name, content = self.store.file(p.get("id"))
+        return {"result": {"name": name, "data": base64.b64encode(content).decode("ascii")}}
+
+    def m_batch(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        cmd = p.get("cmd") or {}
+        if len(cmd) > BATCH_MAX:
+            raise BitrixApiError("INVALID_ARG_VALUE", f"Max batch length exceeded {BATCH_MAX}")
+        result, errors, totals, nexts = {}, {}, {}, {}
+        for key, line in cmd.items():
+            sub_method, _, query = str(line).partition("?")
+            try:
+                body = self.call(sub_method, decode_query(query))
+            except BitrixApiError as e:
+                errors[key] = {"error": e.code, "error_description": e.description}
+                if str(p.get("halt", 0)) not in ("0", "", "false"):
+                    break
+                continue
+            result[key] = body.get("result")
+            if "total" in body:
+                totals[key] = body["total"]
+            if "next" in body:
+                nexts[key] = body["next"]
+        return {"result": {
+            "result": result, "result_error": errors, "result_total": totals,
+            "result_next": nexts, "result_time": {},
+        }}
+
+    # --- HTTP ---
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        method = request.match_info["tail"].rsplit("/", 1)[-1].removesuffix(".json")
+        started = time.monotonic()
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if self._throttled():
+            self.stats["throttled"] += 1
+            return web.json_response(
+                {"error": "QUERY_LIMIT_EXCEEDED", "error_description": "Too many requests"}, status=429,
+            )
+        params: Dict[str, Any] = decode_query(request.query_string)
+        if request.method == "POST" and request.can_read_body:
+            raw = await request.read()
+            if request.content_type == "application/json":
+                params.update(json.loads(raw or b"{}"))
+            else:
+                params.update(decode_query(raw.decode("utf-8")))
+        try:
+            body = self.call(method, params)
+        except BitrixApiError as e:
+            return web.json_response({"error": e.code, "error_description": e.description}, status=e.status)
+        body["time"] = {"start": started, "finish": time.monotonic(), "duration": time.monotonic() - started}
+        return web.json_response(body)
+
+    async def download(self, request: web.Request) -> web.Response:
+        try:
+            _, name, content = self.store.file(request.match_info["file_id"])
+        except BitrixApiError:
+            raise web.HTTPNotFound() from None
+        return web.Response(body=content, headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+# --- набор данных ---
+
+_WORKS = [("Земляные работы", "м3"), ("Бетонирование", "м3"), ("Монтаж опалубки", "м2"), ("Армирование", "т"), ("Кладка", "м3")]
+_EQUIP = ["Экскаватор", "Автокран", "Бульдозер", "Самосвал"]
+_MATERIALS = [("Бетон М300", "м3", 5200.0), ("Арматура А500", "т", 61000.0), ("Песок", "м3", 900.0)]
+_WORKERS = ["Бригада Иванова", "Бригада Петрова", "Сидоров А.", "Кузнецов В."]
+
+
+def seed_dataset(store: Store, *, objects: int = 10, days: int = 30, seed: int = 42, today: Optional[date] = None) -> Dict[str, int]:
+    """Заполнить хранилище детерминированными объектами, сменами, ресурсами и табелем."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    counts = {"objects": 0, "shifts": 0, "resources": 0, "timesheets": 0, "files": 0}
+    photo = base64.b64decode(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+    )
+    object_ids = []
+    for n in range(1, objects + 1):
+        obj = store.add(OBJECT_ETID, {
+            "title": f"Объект {n}",
+            UF_OBJECT_CODE: f"OBJ-{n:03d}",
+            UF_OBJECT_ADDRESS: f"г. Москва, ул. Строителей, д. {n}",
+        })
+        object_ids.append((obj["id"], obj["title"]))
+        counts["objects"] += 1
+
+    for day_offset in range(days, -1, -1):
+        day = today - timedelta(days=day_offset)
+        for obj_id, obj_title in object_ids:
+            if rng.random() < 0.4:
+                continue
+            tasks = [
+                {"name": name, "unit": unit, "plan": float(rng.randint(5, 60)), "executor": rng.choice(_WORKERS)}
+                for name, unit in rng.sample(_WORKS, rng.randint(1, 3))
+            ]
+            facts = [dict(t, fact=round(t["plan"] * rng.uniform(0.6, 1.1), 1)) for t in tasks]
+            total_plan = sum(t["plan"] for t in tasks)
+            total_fact = round(sum(t["fact"] for t in facts), 1)
+            plan_json = {
+                "meta": {"object_bitrix_id": obj_id, "object_name": obj_title, "date": day.isoformat()},
+                "tasks": tasks,
+                "total_plan": total_plan,
+            }
+            fact_json = {"tasks": facts, "total_fact": total_fact, "downtime_reason": ""}
+            fields: Dict[str, Any] = {
+                "title": f"Смена {obj_title} {day:%d.%m.%Y}",
+                UF_DATE: f"{day.isoformat()}T08:00:00",
+                UF_TYPE: "day",
+                UF_OBJECT_LINK: [f"D_{obj_id}"],
+                UF_PLAN_TOTAL: total_plan,
+                UF_FACT_TOTAL: total_fact,
+                UF_EFF_FINAL: round(total_fact / total_plan * 100, 1) if total_plan else 0,
+                "ufCrm7UfPlanJson": json.dumps(plan_json, ensure_ascii=False),
+                "ufCrm7UfFactJson": json.dumps(fact_json, ensure_ascii=False),
+            }
+            if rng.random() < 0.3:
+                fields["ufCrm7UfShiftPhotos"] = store.add_file(f"photo_{day:%Y%m%d}_{obj_id}.png", photo)
+                counts["files"] += 1
+            shift = store.add(SHIFT_ETID, fields)
+            counts["shifts"] += 1
+
+            for _ in range(rng.randint(0, 3)):
+                if rng.random() < 0.5:
+                    store.add(RESOURCE_ETID, {
+                        UF_SHIFT_ID: shift["id"], UF_RESOURCE_TYPE: "EQUIP",
+                        UF_EQUIP_TYPE: rng.choice(_EQUIP), UF_EQUIP_HOURS: float(rng.randint(1, 10)),
+                        UF_EQUIP_RATE: 3500.0, UF_RES_COMMENT: "",
+                    })
+                else:
+                    mat, unit, price = rng.choice(_MATERIALS)
+                    store.add(RESOURCE_ETID, {
+                        UF_SHIFT_ID: shift["id"], UF_RESOURCE_TYPE: "MAT",
+                        UF_MAT_TYPE: mat, UF_MAT_UNIT: unit, UF_MAT_QTY: float(rng.randint(1, 20)), UF_MAT_PRICE: price,
+                    })
+                counts["resources"] += 1
+            for worker in rng.sample(_WORKERS, rng.randint(1, 3)):
+                store.add(TIMESHEET_ETID, {
+                    UF_TS_SHIFT_ID: shift["id"], UF_TS_WORKER: worker,
+                    UF_TS_HOURS: float(rng.choice([4, 8, 10, 12])), UF_TS_RATE: 450.0,
+                })
+                counts["timesheets"] += 1
+    store.db.commit()
+    return counts
+
+
+def create_app(emulator: Emulator) -> web.Application:
+    app = web.Application(client_max_size=32 * 1024 ** 2)
+    app.router.add_route("*", "/rest/{tail:.+}", emulator.handle)
+    app.router.add_get("/disk/download/{file_id}", emulator.download)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальный эмулятор Bitrix24 REST")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=":memory:", help="Файл SQLite (по умолчанию в памяти)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Задержка каждого ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Случайная добавка к задержке")
+    parser.add_argument("--rate", type=float, default=2.0, help="Лимит портала, запросов в секунду (0 — без лимита)")
+    parser.add_argument("--burst", type=float, default=50.0, help="Ёмкость «ведра» портала")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля случайных ответов 429")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--objects", type=int, default=10, help="Сколько объектов сгенерировать (0 — без данных)")
+    parser.add_argument("--days", type=int, default=30, help="За сколько дней сгенерировать смены")
+    args = parser.parse_args()
+
+    store = Store(args.db)
+    if args.objects and not store.db.execute("SELECT 1 FROM items LIMIT 1").fetchone():
+        counts = seed_dataset(store, objects=args.objects, days=args.days, seed=args.seed)
+        print("Seeded:", ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+    emulator = Emulator(
+        store,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate=args.rate,
+        burst=args.burst,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    emulator.base_url = f"http://{args.host}:{args.port}"
+    print(f"BITRIX_WEBHOOK_URL={emulator.base_url}/rest/1/emulator")
+    web.run_app(create_app(emulator), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -70,7 +70,7 @@ async def check_lpa_ready():
         obj_id = obj.get("id")
         obj_name = obj.get("name", f"Объект #{obj_id}")
         
-        result = get_last_closed_shift(obj_id)
+        result = await get_last_closed_shift(obj_id)
         if result:
             shift_id, shift_data = result
             fact_total = sum(shift_data.get("fact", {}).values()) if shift_data.get("fact") else 0
@@ -0,0 +1,124 @@
+"""Воспроизведение событий Bitrix24 против приёмника /bitrix/events.
+
+Отправляет формы событий ONCRMDYNAMICITEM* так же, как их шлёт портал
+(application/x-www-form-urlencoded, поля data[FIELDS][...] и auth[...]), и
+печатает итоги приёмника (accepted/duplicate/ignored/unauthorized) и
+задержку ответа.
+
+Источник событий — JSONL-файл (строка — либо готовая форма, либо краткая
+запись {"event": "...", "entity": 1050, "id": 12, "ts": 1731700000}) или
+синтетический поток с повторами::
+
+    python tools/replay_bitrix_events.py tools/bitrix_events_sample.jsonl --token secret
+    python tools/replay_bitrix_events.py --synthetic 500 --dup-rate 0.2 --token secret
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+import httpx
+
+ENTITIES = (1046, 1050, 1056, 1060)
+EVENTS = ("ONCRMDYNAMICITEMADD", "ONCRMDYNAMICITEMUPDATE", "ONCRMDYNAMICITEMDELETE")
+
+
+def to_form(record: Dict[str, Any], token: str, domain: str) -> Dict[str, str]:
+    """Краткую запись превратить в форму события Bitrix (готовую форму — дополнить auth)."""
+    if "event" in record and "data[FIELDS][ID]" in record:
+        form = {k: str(v) for k, v in record.items()}
+    else:
+        form = {
+            "event": record["event"],
+            "data[FIELDS][ID]": str(record["id"]),
+            "data[FIELDS][ENTITY_TYPE_ID]": str(record["entity"]),
+            "ts": str(record.get("ts") or int(time.time())),
+        }
+    form.setdefault("auth[application_token]", token)
+    form.setdefault("auth[domain]", domain)
+    return form
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic(n: int, dup_rate: float, seed: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    out: List[Dict[str, Any]] = []
+    ts = int(time.time())
+    for _ in range(n):
+        if out and rnd.random() < dup_rate:
+            out.append(dict(rnd.choice(out)))
+            continue
+        ts += rnd.randint(0, 2)
+        out.append({
+            "event": rnd.choices(EVENTS, weights=(2, 7, 1))[0],
+            "entity": rnd.choice(ENTITIES),
+            "id": rnd.randint(1, 500),
+            "ts": ts,
+        })
+    return out
+
+
+async def replay(url: str, forms: Iterable[Dict[str, str]], concurrency: int) -> None:
+    results: Counter = Counter()
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        async def send(form: Dict[str, str]) -> None:
+            async with sem:
+                started = time.perf_counter()
+                try:
+                    r = await client.post(url, data=form)
+                    status = r.json().get("status", f"http_{r.status_code}")
+                except (httpx.HTTPError, ValueError) as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                results[status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(f) for f in forms))
+        elapsed = time.perf_counter() - started
+
+    total = sum(results.values())
+    print(f"events: {total} in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f}/s)")
+    for status, n in results.most_common():
+        print(f"  {status:<14} {n}")
+    if latencies:
+        ordered = sorted(latencies)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        print(f"latency ms: p50={statistics.median(ordered) * 1000:.1f} p95={p95 * 1000:.1f} max={ordered[-1] * 1000:.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="JSONL-файл событий")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/bitrix/events")
+    parser.add_argument("--token", required=True, help="application_token (BITRIX_EVENT_TOKEN приёмника)")
+    parser.add_argument("--domain", default="example.bitrix24.ru")
+    parser.add_argument("--synthetic", type=int, default=0, help="Сгенерировать N событий вместо файла")
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="Доля повторов в синтетическом потоке")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        records = synthetic(args.synthetic, args.dup_rate, args.seed)
+    elif args.source:
+        records = read_jsonl(args.source)
+    else:
+        parser.error("укажите JSONL-файл или --synthetic N")
+    forms = [to_form(r, args.token, args.domain) for r in records]
+    asyncio.run(replay(args.url, forms, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()